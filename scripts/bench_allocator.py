@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""Channel allocator benchmark: solving a fleet's channel choice, cold and warm.
+
+Builds ``--campaigns`` campaigns with 300 random live channels each and
+``--accounts`` accounts selecting 1-6 of them, then times ``choose`` for the
+whole fleet twice. ``cold`` ranks every distinct selection; ``warm`` repeats
+within the same minute and should be a dictionary lookup per account::
+
+    python scripts/bench_allocator.py --accounts 5000 --out allocator.json
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from src.allocator import WatchAllocator
+from src.catalog import Campaign
+
+NOW = 1_700_000_000.0
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Time WatchAllocator.choose for a fleet, cold vs memoised")
+    ap.add_argument("--accounts", type=int, default=5000)
+    ap.add_argument("--campaigns", type=int, default=20)
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--out", type=str, default="", help="Write results JSON here")
+    args = ap.parse_args()
+
+    rng = random.Random(args.seed)
+    alloc = WatchAllocator()
+    camps = [
+        Campaign(f"c{i}", f"c{i}", "Game", (), NOW + rng.uniform(3600, 7 * 86400)) for i in range(args.campaigns)
+    ]
+    for c in camps:
+        alloc.update(c.id, [(f"ch{n}", str(n), rng.randrange(10000), rng.random() < 0.8)
+                            for n in rng.sample(range(2000), 300)], NOW)
+    accounts = []
+    for _ in range(args.accounts):
+        sel = rng.sample(camps, rng.randint(1, min(6, len(camps))))
+        accounts.append((sel, frozenset(c.id for c in sel if rng.random() < 0.2)))
+
+    res = {"accounts": args.accounts, "campaigns": args.campaigns}
+    for phase in ("cold", "warm"):
+        t0 = time.perf_counter()
+        for sel, done in accounts:
+            alloc.choose(sel, done, NOW)
+        res[f"{phase}_s"] = round(time.perf_counter() - t0, 4)
+    text = json.dumps(res, indent=2)
+    print(text)
+    if args.out:
+        Path(args.out).write_text(text, encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
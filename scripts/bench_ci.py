@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""Integrity refreshes per worker restart, with and without persisted device ids.
+
+Models a backend that accepts a Client-Integrity token only from the device
+it was issued to. The browser stub issues tokens for the device it runs as,
+which is what ``fetch_ci`` does with the ``unique_id`` cookie. Each account
+restarts ``--restarts`` times, ``--gap-h`` virtual hours apart, and makes
+``--calls`` GQL calls after each start.
+
+``before`` is the old behavior: a new device id on every start, so the
+stored token no longer matches. ``after`` reuses the device id and session
+ids from ``ci/<login>.json``. The script reports CI refreshes and session
+rotations for both::
+
+    python scripts/bench_ci.py --accounts 50 --restarts 10 --gap-h 2 --out ci.json
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import sys
+import tempfile
+from pathlib import Path
+from typing import Any, Dict
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from src import client_integrity, twitch_api
+from src.clock import VirtualClock
+from src.metrics import CI_REFRESHES, SESSION_ROTATIONS
+from src.twitch_api import TwitchAPI
+
+
+class Resp:
+    def __init__(self, status: int, body: Dict[str, Any]):
+        self.status = status
+        self._body = body
+
+    async def json(self):
+        return self._body
+
+    async def text(self):
+        return json.dumps(self._body)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return None
+
+
+class DeviceBoundSession:
+    """GQL, который принимает CI только от устройства, которому он выдан."""
+
+    closed = False
+
+    def post(self, url, data=None, proxy=None, headers=None):
+        if headers.get("Client-Integrity") != f"ci:{headers.get('X-Device-Id')}":
+            return Resp(400, {"error": "failed integrity check"})
+        return Resp(200, {"data": {}})
+
+
+async def fake_fetch_ci(login: str, proxy: str = "", device_id: str = "", **kw: Any):
+    return "cv", f"ci:{device_id}"
+
+
+async def run(mode: str, args, tmp: Path) -> Dict[str, Any]:
+    client_integrity.CI_DIR = tmp / mode
+    client_integrity.CI_DIR.mkdir()
+    saved = twitch_api.load_ids
+    if mode == "before":
+        twitch_api.load_ids = lambda login: {}
+    clock = VirtualClock()
+    refreshes = CI_REFRESHES.value("ok")
+    rotations = SESSION_ROTATIONS.value("ttl")
+    try:
+        for _ in range(args.restarts):
+            for i in range(args.accounts):
+                login = f"acc{i:04d}"
+                # как load_accounts: CI из файла, если не истёк
+                cv, ci = client_integrity.load_ci(login, now=clock.time())
+                api = TwitchAPI("token", login=login, client_version=cv, client_integrity=ci, clock=clock)
+                api.session = DeviceBoundSession()
+                for _ in range(args.calls):
+                    await api.gql("Inventory", {})
+            await clock.advance(args.gap_h * 3600)
+    finally:
+        twitch_api.load_ids = saved
+    starts = args.accounts * args.restarts
+    ci_refreshes = int(CI_REFRESHES.value("ok") - refreshes)
+    return {
+        "starts": starts,
+        "ci_refreshes": ci_refreshes,
+        "ci_refreshes_per_start": round(ci_refreshes / starts, 3),
+        "session_rotations": int(SESSION_ROTATIONS.value("ttl") - rotations),
+    }
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="CI refreshes per restart: fresh vs persisted device ids")
+    ap.add_argument("--accounts", type=int, default=50)
+    ap.add_argument("--restarts", type=int, default=10)
+    ap.add_argument("--calls", type=int, default=3, help="GQL calls after each start")
+    ap.add_argument("--gap-h", type=float, default=2.0, help="Virtual hours between restarts")
+    ap.add_argument("--out", type=str, default="", help="Write results JSON here")
+    args = ap.parse_args()
+
+    twitch_api.fetch_ci = fake_fetch_ci
+    with tempfile.TemporaryDirectory() as tmp:
+        client_integrity.COOKIES_DIR = Path(tmp)
+        res = {mode: asyncio.run(run(mode, args, Path(tmp))) for mode in ("before", "after")}
+    text = json.dumps(res, indent=2)
+    print(text)
+    if args.out:
+        Path(args.out).write_text(text, encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
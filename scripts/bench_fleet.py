@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""Fleet load benchmark: N run_account workers against the local fake Twitch.
+
+The fake backend runs in a subprocess so CPU and RSS numbers below belong to
+the miner only. Results are written as JSON for tracking regressions::
+
+    python scripts/bench_fleet.py --accounts 500 --duration 60 --tick 2 --out bench.json
+
+``beacon_jitter_ms`` is how late minute-watched beacons start against their
+schedule. With ``--inventory-latency-ms`` Inventory answers slowly; beacons
+must keep their timing anyway::
+
+    python scripts/bench_fleet.py --accounts 2000 --tick 5 --inventory-latency-ms 3000
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import List
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import aiohttp
+
+from src import metrics, miner, twitch_api
+from src.fake_twitch import point_api_at
+
+
+def rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def pct(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    v = sorted(values)
+    return v[min(len(v) - 1, int(round(q * (len(v) - 1))))]
+
+
+def start_fake(args) -> tuple[subprocess.Popen, str]:
+    cmd = [
+        sys.executable, "-m", "src.fake_twitch", "--port", "0",
+        "--latency-ms", str(args.latency_ms),
+        "--latency-jitter-ms", str(args.latency_ms / 2),
+        "--inventory-latency-ms", str(args.inventory_latency_ms),
+        "--rate-429", str(args.rate_429),
+        "--rate-5xx", str(args.rate_5xx),
+        "--rate-integrity", str(args.rate_integrity),
+        "--burst-every", str(args.burst_every),
+        "--burst-len", str(args.burst_len),
+        "--required-minutes", str(args.required_minutes),
+        "--seed", "1",
+    ]
+    proc = subprocess.Popen(cmd, cwd=ROOT, stdout=subprocess.PIPE, text=True)
+    line = proc.stdout.readline().strip() if proc.stdout else ""
+    if not line.startswith("fake twitch on "):
+        proc.kill()
+        raise SystemExit(f"fake server failed to start: {line!r}")
+    return proc, line.rsplit(" ", 1)[-1]
+
+
+async def run_bench(args, url: str) -> dict:
+    point_api_at(url)
+    # cookies/CI не нужны: токен = логин, integrity «обновляется» мгновенно
+    miner.auth_token_from_cookies = lambda login: login
+
+    async def fake_fetch_ci(login, proxy="", **kw):
+        return "bench-cv", "bench-ci"
+
+    twitch_api.fetch_ci = fake_fetch_ci
+    twitch_api.save_ci = twitch_api.save_ids = lambda *a, **kw: None
+
+    queue: asyncio.Queue = asyncio.Queue()
+    stop = asyncio.Event()
+    counts = {"claimed": 0, "errors": 0, "events": 0}
+
+    async def drain():
+        while True:
+            _login, kind, _p = await queue.get()
+            counts["events"] += 1
+            if kind == "claimed":
+                counts["claimed"] += 1
+            elif kind == "error":
+                counts["errors"] += 1
+
+    lags: List[float] = []
+    jitter: List[float] = []
+    observe = metrics.BEACON_JITTER.observe
+
+    def record_jitter(value, *labels):
+        jitter.append(value)
+        observe(value, *labels)
+
+    metrics.BEACON_JITTER.observe = record_jitter
+
+    async def lag_sampler(interval=0.05):
+        loop = asyncio.get_running_loop()
+        while True:
+            t0 = loop.time()
+            await asyncio.sleep(interval)
+            lags.append(max(0.0, loop.time() - t0 - interval))
+
+    drainer = asyncio.ensure_future(drain())
+    sampler = asyncio.ensure_future(lag_sampler())
+    rss0 = rss_bytes()
+    cpu0 = time.process_time()
+    t0 = time.perf_counter()
+    workers = [
+        asyncio.ensure_future(
+            miner.run_account(
+                f"bench{i:05d}", None, queue, stop,
+                client_version="bench-cv", client_integrity="bench-ci",
+                tick_interval=args.tick,
+                # как при запуске волнами (rampup): тики разнесены по интервалу
+                tick_phase=i / args.accounts,
+            )
+        )
+        for i in range(args.accounts)
+    ]
+    await asyncio.sleep(args.duration)
+    rss1 = rss_bytes()
+    wall = time.perf_counter() - t0
+    cpu = time.process_time() - cpu0
+    stop.set()
+    await asyncio.wait(workers, timeout=args.tick + 10)
+    sampler.cancel()
+    drainer.cancel()
+
+    async with aiohttp.ClientSession() as s:
+        async with s.get(f"{url}/_stats") as r:
+            stats = await r.json()
+
+    ttc = stats.get("time_to_claim", [])
+    return {
+        "accounts": args.accounts,
+        "duration_s": round(wall, 2),
+        "tick_s": args.tick,
+        "requests_total": stats["requests_total"],
+        "requests_per_s": round(stats["requests_total"] / wall, 1),
+        "requests": stats["requests"],
+        "cpu_s": round(cpu, 2),
+        "cpu_pct": round(100 * cpu / wall, 1),
+        "rss_base_mb": round(rss0 / 2**20, 1),
+        "rss_mb": round(rss1 / 2**20, 1),
+        "rss_per_account_kb": round((rss1 - rss0) / max(1, args.accounts) / 1024, 1),
+        "loop_lag_ms": {
+            "p50": round(pct(lags, 0.5) * 1000, 2),
+            "p95": round(pct(lags, 0.95) * 1000, 2),
+            "max": round(max(lags, default=0.0) * 1000, 2),
+        },
+        "beacon_jitter_ms": {
+            "n": len(jitter),
+            "p50": round(pct(jitter, 0.5) * 1000, 2),
+            "p99": round(pct(jitter, 0.99) * 1000, 2),
+            "max": round(max(jitter, default=0.0) * 1000, 2),
+        },
+        "time_to_claim_s": {
+            "n": len(ttc),
+            "p50": round(pct(ttc, 0.5), 2),
+            "p95": round(pct(ttc, 0.95), 2),
+        },
+        "claims": stats["claims_total"],
+        "wasted_claims": stats["wasted_claims"],
+        "worker_errors": counts["errors"],
+        "fake": stats["config"],
+    }
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Benchmark run_account workers against a fake Twitch")
+    ap.add_argument("--accounts", type=int, default=200)
+    ap.add_argument("--duration", type=float, default=30.0, help="Seconds to run")
+    ap.add_argument("--tick", type=float, default=1.0, help="Worker tick interval, s")
+    ap.add_argument("--latency-ms", type=float, default=50.0)
+    ap.add_argument("--inventory-latency-ms", type=float, default=0.0, help="Extra delay on Inventory answers")
+    ap.add_argument("--rate-429", type=float, default=0.0)
+    ap.add_argument("--rate-5xx", type=float, default=0.0)
+    ap.add_argument("--rate-integrity", type=float, default=0.0)
+    ap.add_argument("--burst-every", type=float, default=0.0)
+    ap.add_argument("--burst-len", type=float, default=0.0)
+    ap.add_argument("--required-minutes", type=int, default=5)
+    ap.add_argument("--out", type=str, default="", help="Write results JSON here")
+    args = ap.parse_args()
+
+    proc, url = start_fake(args)
+    try:
+        res = asyncio.run(run_bench(args, url))
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+    text = json.dumps(res, indent=2)
+    print(text)
+    if args.out:
+        Path(args.out).write_text(text, encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
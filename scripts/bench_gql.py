@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""GQL request-building microbenchmark: calls per CPU second on one core.
+
+``before`` reproduces the old per-call path: a fresh headers dict and a
+nested payload dict that the session serializes with ``json.dumps`` (what
+aiohttp does for ``json=``). ``after`` is the current path: the account's
+cached header block and the per-operation body template with only the
+variables serialized. Two levels are measured:
+
+* ``build`` — headers + body alone, no event loop;
+* ``gql`` — full ``TwitchAPI.gql`` through the default middleware chain
+  against a null session that answers instantly.
+
+Results are written as JSON for tracking regressions::
+
+    python scripts/bench_gql.py --calls 200000 --out gql.json
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from src import gql_middleware as mw
+from src.gql_middleware import GqlCall
+from src.ops import OpsRegistry
+from src.twitch_api import GQL, TwitchAPI
+
+# типичный вызов воркера: контекст сессии на канале
+OPERATION = "DropCurrentSessionContext"
+VARIABLES = {"channelLogin": "somestreamer", "channelID": "123456789"}
+HASHES = {OPERATION: "4d06b702d25d652afb9ef835d2a550031f1cf762b193523a92166f40ea3d142b"}
+
+
+def legacy_headers_dict(api: TwitchAPI) -> Dict[str, str]:
+    h = {
+        "Client-ID": api.client_id,
+        "Authorization": f"OAuth {api.auth}",
+        "Content-Type": "application/json",
+        "X-Device-Id": api.x_device_id,
+        "Client-Session-Id": api.client_session_id,
+        "Playback-Session-Id": api.playback_session_id,
+    }
+    if api.client_version:
+        h["Client-Version"] = api.client_version
+    if api.client_integrity:
+        h["Client-Integrity"] = api.client_integrity
+    return h
+
+
+async def legacy_headers(call: GqlCall, nxt: mw.Handler) -> Any:
+    call.headers = legacy_headers_dict(call.api)
+    return await nxt(call)
+
+
+_dumps = json.dumps
+
+
+class NullResp:
+    status = 200
+    _data = {"data": {"ok": True}}
+
+    async def json(self):
+        return self._data
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return None
+
+
+class NullSession:
+    """Отвечает сразу; ``json=`` сериализует так же, как aiohttp."""
+
+    closed = False
+    sent = 0
+
+    def post(self, url, json=None, data=None, proxy=None, headers=None):
+        if json is not None:
+            data = _dumps(json).encode("utf-8")
+        self.sent += len(data)
+        return NullResp()
+
+
+class LegacyAPI(TwitchAPI):
+    async def _send(self, call: GqlCall) -> Any:
+        async with self.session.post(GQL, json=call.payload(), proxy=self.proxy, headers=call.headers) as r:
+            return await r.json()
+
+
+def make_api(cls, ops: OpsRegistry) -> TwitchAPI:
+    middlewares = None
+    if cls is LegacyAPI:
+        middlewares = tuple(legacy_headers if m is mw.headers else m for m in mw.DEFAULT_MIDDLEWARES)
+    api = cls(
+        "token", login="bench", client_version="cv", client_integrity="ci",
+        ops=ops, middlewares=middlewares, ci_expires_at=float("inf"),
+    )
+    api.session = NullSession()
+    return api
+
+
+def per_core(fn: Callable[[], None], calls: int) -> float:
+    """Вызовов в секунду процессорного времени (один поток — одно ядро)."""
+    t0 = time.process_time()
+    fn()
+    return round(calls / max(time.process_time() - t0, 1e-9))
+
+
+def bench_build(api: TwitchAPI, calls: int, legacy: bool) -> float:
+    call = GqlCall(api, OPERATION, VARIABLES)
+    call.operation, call.hash = api.ops.resolve(OPERATION)
+    session = api.session
+
+    def old() -> None:
+        for _ in range(calls):
+            session.post(GQL, json=call.payload(), headers=legacy_headers_dict(api))
+
+    def new() -> None:
+        for _ in range(calls):
+            session.post(GQL, data=call.body(), headers=api.gql_headers())
+
+    return per_core(old if legacy else new, calls)
+
+
+def bench_gql(api: TwitchAPI, calls: int) -> float:
+    async def loop() -> None:
+        for _ in range(calls):
+            await api.gql(OPERATION, VARIABLES)
+
+    return per_core(lambda: asyncio.run(loop()), calls)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Calls per CPU second for GQL request building, old vs templates")
+    ap.add_argument("--calls", type=int, default=100_000)
+    ap.add_argument("--ops", type=str, default="", help="ops.json to resolve hashes from (default: a temp one)")
+    ap.add_argument("--out", type=str, default="", help="Write results JSON here")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(args.ops) if args.ops else Path(tmp) / "ops.json"
+        if not args.ops:
+            path.write_text(json.dumps(HASHES), encoding="utf-8")
+        ops = OpsRegistry(path)
+        old, new = make_api(LegacyAPI, ops), make_api(TwitchAPI, ops)
+        # прогрев обоих путей: кэши шаблонов, реестра, метрик
+        for api, legacy in ((old, True), (new, False)):
+            bench_build(api, 1000, legacy)
+            bench_gql(api, 1000)
+        res = {
+            "calls": args.calls,
+            "build": {
+                "before": bench_build(old, args.calls, legacy=True),
+                "after": bench_build(new, args.calls, legacy=False),
+            },
+            "gql": {
+                "before": bench_gql(old, args.calls),
+                "after": bench_gql(new, args.calls),
+            },
+        }
+    for level in ("build", "gql"):
+        r = res[level]
+        r["speedup"] = round(r["after"] / max(r["before"], 1), 2)
+    text = json.dumps(res, indent=2)
+    print(text)
+    if args.out:
+        Path(args.out).write_text(text, encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""Startup benchmark: import time of the entry modules and time to first frame.
+
+Import times come from ``python -X importtime`` in a fresh interpreter, so
+nothing is cached between runs. ``heavy`` lists the slow stacks (aiohttp,
+Playwright, QtWebEngine) that got loaded by the import; the GUI should load
+them only when a worker starts or an onboarding button is pressed.
+
+Time to first frame starts a real ``MainWindow`` (offscreen) and stops the
+clock on the first event-loop turn after ``show()``. The exit code is 1 when
+it misses ``--target``. Results are written as JSON for tracking regressions::
+
+    python scripts/bench_import.py --accounts accounts.txt --out startup.json
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+ROOT = Path(__file__).resolve().parent.parent
+
+MODULES = ("src.main", "src.gui")
+HEAVY = ("aiohttp", "playwright", "pyotp", "PySide6.QtWebEngineWidgets", "PySide6.QtWebEngineCore")
+# окно должно появиться быстрее, чем за столько секунд
+TARGET_FIRST_FRAME_S = 1.5
+
+FIRST_FRAME = """
+import sys, time
+t0 = time.perf_counter()
+from pathlib import Path
+from PySide6.QtCore import QTimer
+from PySide6.QtWidgets import QApplication
+from src.gui import MainWindow
+
+app = QApplication(sys.argv)
+win = MainWindow(Path(sys.argv[1]))
+win.show()
+
+def frame():
+    print(f"FRAME {time.perf_counter() - t0:.4f}", flush=True)
+    app.quit()
+
+QTimer.singleShot(0, frame)
+app.exec()
+"""
+
+
+def import_times(module: str, runs: int) -> Dict[str, object]:
+    """Лучшее из ``runs`` время импорта ``module`` и 10 самых дорогих зависимостей."""
+    best: Optional[Dict[str, object]] = None
+    for _ in range(runs):
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            cwd=ROOT, capture_output=True, text=True,
+        )
+        if proc.returncode != 0:
+            err = proc.stderr.strip().splitlines()
+            return {"error": err[-1] if err else f"exit {proc.returncode}"}
+        rows: List[tuple] = []
+        for line in proc.stderr.splitlines():
+            if not line.startswith("import time:") or "self [us]" in line:
+                continue
+            _self, cumulative, name = line[len("import time:"):].split("|")
+            rows.append((int(cumulative), name.rstrip(), int(_self)))
+        total = next((c for c, n, _s in rows if n.strip() == module), 0)
+        names = {n.strip() for _c, n, _s in rows}
+        res = {
+            "total_ms": round(total / 1000, 1),
+            "top": [
+                {"module": n.strip(), "cumulative_ms": round(c / 1000, 1)}
+                for c, n, _s in sorted(rows, reverse=True)[1:11]
+            ],
+            "heavy": sorted(h for h in HEAVY if h in names),
+        }
+        if best is None or res["total_ms"] < best["total_ms"]:
+            best = res
+    return best or {}
+
+
+def first_frame(accounts: Path, runs: int) -> Dict[str, object]:
+    env = dict(os.environ, QT_QPA_PLATFORM=os.environ.get("QT_QPA_PLATFORM", "offscreen"))
+    times: List[float] = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        proc = subprocess.Popen(
+            [sys.executable, "-c", FIRST_FRAME, str(accounts)],
+            cwd=ROOT, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+        )
+        out, err = proc.communicate(timeout=120)
+        line = next((ln for ln in out.splitlines() if ln.startswith("FRAME ")), "")
+        if not line:
+            err_lines = err.strip().splitlines()
+            return {"error": err_lines[-1] if err_lines else f"exit {proc.returncode}"}
+        # с момента запуска процесса: интерпретатор + импорты + окно
+        times.append(time.perf_counter() - t0)
+    return {"best_s": round(min(times), 3), "runs_s": [round(t, 3) for t in times]}
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Import-time and time-to-first-frame benchmark")
+    ap.add_argument("--modules", nargs="*", default=list(MODULES))
+    ap.add_argument("--accounts", type=str, default="", help="Accounts file for the first-frame run")
+    ap.add_argument("--runs", type=int, default=3)
+    ap.add_argument("--target", type=float, default=TARGET_FIRST_FRAME_S, help="First-frame budget, s")
+    ap.add_argument("--out", type=str, default="", help="Write results JSON here")
+    args = ap.parse_args()
+
+    res: Dict[str, object] = {"imports": {m: import_times(m, args.runs) for m in args.modules}}
+    ok = True
+    if args.accounts:
+        frame = first_frame(Path(args.accounts).resolve(), args.runs)
+        frame["target_s"] = args.target
+        ok = "best_s" in frame and frame["best_s"] <= args.target
+        res["first_frame"] = frame
+    text = json.dumps(res, indent=2)
+    print(text)
+    if args.out:
+        Path(args.out).write_text(text, encoding="utf-8")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""Metrics hot-path microbenchmark: cost of one Counter.inc + Histogram.observe.
+
+Every GQL call records a counter and a latency histogram, so this pair runs
+once per request. Against a network round trip of tens of milliseconds the
+cost should stay in the low microseconds; ``--max-us`` turns the result into
+a pass/fail check for CI::
+
+    python scripts/bench_metrics.py --calls 1000000 --max-us 20 --out metrics.json
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from src.metrics import Counter, Histogram
+
+
+def bench(calls: int) -> float:
+    """Микросекунд процессорного времени на пару inc + observe."""
+    c = Counter("bench_total", "", ("operation", "result"))
+    h = Histogram("bench_seconds", "", ("operation",))
+    t0 = time.process_time()
+    for _ in range(calls):
+        c.inc("Inventory", "ok")
+        h.observe(0.2, "Inventory")
+    return (time.process_time() - t0) / calls * 1e6
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="CPU cost of the metrics hot path per GQL call")
+    ap.add_argument("--calls", type=int, default=200_000)
+    ap.add_argument("--max-us", type=float, default=0.0, help="Exit 1 if a call costs more (0 — report only)")
+    ap.add_argument("--out", type=str, default="", help="Write results JSON here")
+    args = ap.parse_args()
+
+    bench(1000)  # прогрев
+    res = {"calls": args.calls, "per_call_us": round(bench(args.calls), 3)}
+    text = json.dumps(res, indent=2)
+    print(text)
+    if args.out:
+        Path(args.out).write_text(text, encoding="utf-8")
+    if args.max_us and res["per_call_us"] > args.max_us:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""Cluster check on one machine: a coordinator, N agent processes, a fake Twitch.
+
+The coordinator runs in this process; every agent is a separate
+``HeadlessRunner`` process whose workers talk to the local fake backend.
+Proxies only label the shards here (workers connect directly). After all
+accounts run, one agent is killed with SIGKILL and the script measures how
+long its shards take to run again elsewhere::
+
+    python scripts/cluster_local.py --agents 3 --accounts 300 --proxies 30 --out cluster.json
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from src.cluster import Coordinator
+from src.types import Account
+
+AGENT = """
+import asyncio, logging, sys
+from src import headless, miner, twitch_api
+from src.cluster import Agent
+from src.fake_twitch import point_api_at
+from src.headless import HeadlessRunner
+
+url, coordinator, agent_id, tick, interval = sys.argv[1:6]
+logging.basicConfig(level=logging.WARNING)
+point_api_at(url)
+miner.auth_token_from_cookies = lambda login: login
+
+async def fake_fetch_ci(login, proxy="", **kw):
+    return "local-cv", "local-ci"
+
+twitch_api.fetch_ci = fake_fetch_ci
+twitch_api.save_ci = twitch_api.save_ids = lambda *a, **kw: None
+run_account = headless.run_account
+# прокси здесь — только метка шарда
+headless.run_account = lambda login, proxy, *a, **kw: run_account(login, None, *a, **kw)
+
+runner = HeadlessRunner(None, tick_interval=float(tick), ramp_rate=0)
+asyncio.run(Agent(runner, coordinator, agent_id=agent_id, interval=float(interval)).run())
+"""
+
+
+def start_fake() -> tuple[subprocess.Popen, str]:
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "src.fake_twitch", "--port", "0", "--latency-ms", "20", "--seed", "1"],
+        cwd=ROOT, stdout=subprocess.PIPE, text=True,
+    )
+    line = proc.stdout.readline().strip() if proc.stdout else ""
+    if not line.startswith("fake twitch on "):
+        proc.kill()
+        raise SystemExit(f"fake server failed to start: {line!r}")
+    return proc, line.rsplit(" ", 1)[-1]
+
+
+async def wait_running(coord: Coordinator, total: int, timeout: float, gone: str = "") -> float:
+    """Сколько секунд до момента, когда все аккаунты крутятся у владельцев; -1 — не дождались."""
+    t0 = time.perf_counter()
+    while time.perf_counter() - t0 < timeout:
+        if gone not in coord.agents and coord.running() >= total:
+            return round(time.perf_counter() - t0, 2)
+        await asyncio.sleep(0.2)
+    return -1.0
+
+
+async def run(args, url: str) -> Dict[str, object]:
+    accounts = [
+        Account(f"acc{i:05d}", f"local{i:05d}", proxy=f"http://proxy{i % args.proxies}.local:3128")
+        for i in range(args.accounts)
+    ]
+    coord = Coordinator(accounts, port=0, lease_ttl=args.lease_ttl)
+    # агенты стартуют вместе с координатором — ждать отчётов уже работающих некого
+    coord._recovery_until = 0.0
+    await coord.start()
+    addr = f"127.0.0.1:{coord.port}"
+    procs: List[subprocess.Popen] = []
+    with tempfile.TemporaryDirectory() as tmp:
+        # state/ агентов — во временном каталоге; ops.json они получают от координатора
+        env = dict(os.environ, PYTHONPATH=str(ROOT))
+        for i in range(args.agents):
+            procs.append(subprocess.Popen(
+                [sys.executable, "-c", AGENT, url, addr, f"agent{i}", str(args.tick), str(args.lease_ttl / 4)],
+                cwd=tmp, env=env, stdout=subprocess.DEVNULL, stderr=open(Path(tmp) / f"agent{i}.log", "w"),
+            ))
+        try:
+            started = await wait_running(coord, args.accounts, args.timeout)
+            spread = {r["id"]: r["accounts"] for r in coord.agent_rows()}
+            victim = procs[0]
+            victim.send_signal(signal.SIGKILL)
+            victim.wait()
+            # шарды убитого уходят живым агентам, когда истечёт его аренда
+            recovered = await wait_running(coord, args.accounts, args.lease_ttl * 3 + args.timeout, gone="agent0")
+            return {
+                "agents": args.agents,
+                "accounts": args.accounts,
+                "proxies": args.proxies,
+                "lease_ttl_s": args.lease_ttl,
+                "all_running_s": started,
+                "spread": spread,
+                "killed": "agent0",
+                "recovered_s": recovered,
+                "spread_after": {r["id"]: r["accounts"] for r in coord.agent_rows()},
+                "events": coord.fleet.totals(),
+            }
+        finally:
+            for p in procs:
+                if p.poll() is None:
+                    p.send_signal(signal.SIGTERM)
+            for p in procs:
+                try:
+                    p.wait(timeout=15)
+                except subprocess.TimeoutExpired:
+                    p.kill()
+            await coord.close()
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Coordinator + N local agent processes against a fake Twitch")
+    ap.add_argument("--agents", type=int, default=3)
+    ap.add_argument("--accounts", type=int, default=300)
+    ap.add_argument("--proxies", type=int, default=30)
+    ap.add_argument("--tick", type=float, default=5.0, help="Worker tick interval, s")
+    ap.add_argument("--lease-ttl", type=float, default=6.0, help="Lease TTL, s (heartbeat is a quarter of it)")
+    ap.add_argument("--timeout", type=float, default=60.0, help="Give up waiting after this many seconds")
+    ap.add_argument("--out", type=str, default="", help="Write results JSON here")
+    args = ap.parse_args()
+
+    proc, url = start_fake()
+    try:
+        res = asyncio.run(run(args, url))
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+    text = json.dumps(res, indent=2)
+    print(text)
+    if args.out:
+        Path(args.out).write_text(text, encoding="utf-8")
+    sys.exit(0 if res["all_running_s"] >= 0 and res["recovered_s"] >= 0 else 1)
+
+
+if __name__ == "__main__":
+    main()
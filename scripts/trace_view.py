@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""Convert a JSONL span trace into a timeline and print the slowest phase per account."""
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src.tracing import load_events, slowest_phases
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Inspect miner trace (written with --trace)")
+    ap.add_argument("trace", help="Path to JSONL trace file")
+    ap.add_argument(
+        "--out",
+        help="Write Chrome trace JSON (open in chrome://tracing or ui.perfetto.dev)",
+    )
+    ap.add_argument("--top", type=int, default=20, help="Accounts to list, slowest first")
+    args = ap.parse_args()
+
+    events = load_events(Path(args.trace))
+    if args.out:
+        # подписываем «дорожки» логинами аккаунтов
+        names = {}
+        for ev in events:
+            login = (ev.get("args") or {}).get("login")
+            if login:
+                names[(ev["pid"], ev["tid"])] = login
+        meta = [
+            {"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": login}}
+            for (pid, tid), login in names.items()
+        ]
+        Path(args.out).write_text(json.dumps({"traceEvents": meta + events}), encoding="utf-8")
+        print(f"timeline: {args.out} ({len(events)} spans)")
+
+    slow = slowest_phases(events)
+    rows = sorted(slow.items(), key=lambda kv: kv[1]["avg_ms"], reverse=True)[: args.top]
+    print(f"{'login':<24} {'phase':<16} {'avg ms':>10} {'max ms':>10} {'n':>6}")
+    for login, r in rows:
+        print(f"{login:<24} {r['phase']:<16} {r['avg_ms']:>10.1f} {r['max_ms']:>10.1f} {r['count']:>6}")
+
+
+if __name__ == "__main__":
+    main()
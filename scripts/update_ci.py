@@ -1,33 +1,255 @@
 #!/usr/bin/env python3
-"""Fetch Client-Version and Client-Integrity for accounts."""
+"""Fetch Client-Version and Client-Integrity for accounts.
+
+Batch pre-warm for the whole fleet: accounts whose ``ci/<login>.json`` is
+still valid for longer than ``--min-valid-h`` are skipped, the rest are
+captured ``--concurrency`` at a time in one shared headless browser (each
+capture in its own context with the account's proxy). Work is interleaved
+across proxies and at most ``--per-proxy`` captures share a proxy at once.
+Tokens are written atomically as soon as each capture finishes.
+
+Every capture reports its wall time; the summary table adds counts per
+result and the peak RSS of this process plus the browser (sampled from
+/proc; unavailable elsewhere)::
+
+    python scripts/update_ci.py --accounts accounts.txt --concurrency 8 --out ci_timings.json
+"""
 from __future__ import annotations
 
 import argparse
+import asyncio
 import json
+import os
+import sys
+import time
+import uuid
+from collections import defaultdict, deque
 from pathlib import Path
-import asyncio
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
 
 from src.accounts import load_accounts
-from src.client_integrity import fetch_ci, save_ci
+from src.client_integrity import (
+    CI_TIMEOUT,
+    capture_ci,
+    ci_expires_at,
+    launch_browser,
+    load_cookies,
+    load_ids,
+    save_ci,
+)
+from src.types import Account
+
+PROC = Path("/proc")
+# как часто смотреть RSS дерева процессов во время захвата
+RSS_INTERVAL = 0.1
+
+
+def tree_rss(pid: Optional[int] = None) -> int:
+    """Суммарный RSS процесса и всех его потомков (браузер, node-драйвер), байты; 0 без /proc."""
+    root = os.getpid() if pid is None else pid
+    children: Dict[int, List[int]] = {}
+    rss: Dict[int, int] = {}
+    for d in PROC.glob("[0-9]*"):
+        try:
+            stat = (d / "stat").read_text()
+            statm = (d / "statm").read_text().split()
+        except OSError:
+            continue
+        # поле comm в скобках может содержать пробелы — считаем после последней ')'
+        ppid = int(stat.rsplit(")", 1)[1].split()[1])
+        children.setdefault(ppid, []).append(int(d.name))
+        rss[int(d.name)] = int(statm[1]) * os.sysconf("SC_PAGE_SIZE")
+    total, stack = 0, [root]
+    while stack:
+        p = stack.pop()
+        total += rss.get(p, 0)
+        stack.extend(children.get(p, ()))
+    return total
+
+
+class PeakRss:
+    """Пиковый ``tree_rss`` за время блока ``async with``."""
+
+    def __init__(self, interval: float = RSS_INTERVAL):
+        self.interval = interval
+        self.peak = 0
+        self._task: Optional[asyncio.Task] = None
+
+    async def _sample(self) -> None:
+        while True:
+            self.peak = max(self.peak, tree_rss())
+            await asyncio.sleep(self.interval)
+
+    async def __aenter__(self) -> "PeakRss":
+        self._task = asyncio.ensure_future(self._sample())
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        if self._task is not None:
+            self._task.cancel()
+        self.peak = max(self.peak, tree_rss())
+
+
+def _mb(n: int) -> str:
+    return f"{n / 2**20:.0f} MB" if n else "n/a"
 
 
-async def _process(accounts):
+def plan(
+    accounts: Sequence[Account], margin_s: float, force: bool = False, now: Optional[float] = None
+) -> Tuple[List[Account], List[Account]]:
+    """(что обновлять, что пропустить): свежие токены с запасом больше ``margin_s`` не трогаем."""
+    now = time.time() if now is None else now
+    todo: List[Account] = []
+    fresh: List[Account] = []
     for acc in accounts:
-        cv, ci = await fetch_ci(acc.login, acc.proxy)
+        if not force and ci_expires_at(acc.login) - now > margin_s:
+            fresh.append(acc)
+        else:
+            todo.append(acc)
+    return todo, fresh
+
+
+def by_proxy(accounts: Sequence[Account]) -> List[Account]:
+    """Очередь вперемешку по прокси: соседние захваты идут через разные прокси."""
+    groups: Dict[str, deque] = defaultdict(deque)
+    for acc in sorted(accounts, key=lambda a: (a.proxy, a.login)):
+        groups[acc.proxy].append(acc)
+    out: List[Account] = []
+    queues = list(groups.values())
+    while queues:
+        for q in queues:
+            out.append(q.popleft())
+        queues = [q for q in queues if q]
+    return out
+
+
+class Batch:
+    """Общий браузер и ограничения параллельности на весь прогон."""
+
+    def __init__(self, pw: Any, concurrency: int, per_proxy: int, timeout: float):
+        self.pw = pw
+        self.timeout = timeout
+        self.concurrency = max(1, concurrency)
+        self.per_proxy = max(1, per_proxy)
+        self.browser: Any = None
+        self._launch = asyncio.Lock()
+        self._proxies: Dict[str, asyncio.Semaphore] = defaultdict(lambda: asyncio.Semaphore(self.per_proxy))
+
+    async def _browser(self) -> Any:
+        # упавший браузер поднимаем один раз на всех, а не в каждом воркере
+        async with self._launch:
+            if self.browser is None or not self.browser.is_connected():
+                self.browser = await launch_browser(self.pw)
+            return self.browser
+
+    async def capture(self, acc: Account) -> Dict[str, Any]:
+        """Один аккаунт; любая ошибка — ``failed`` с причиной, остальные захваты идут дальше."""
+        res: Dict[str, Any] = {"login": acc.login, "proxy": acc.proxy, "status": "failed", "wall_s": 0.0}
+        try:
+            # токен берём под тот же device id, с которым ходит воркер
+            ids = load_ids(acc.login)
+            if "device_id" not in ids:
+                ids.update(device_id=uuid.uuid4().hex, session_started_at=time.time())
+            cookies = load_cookies(acc.login, ids["device_id"])
+        except Exception as exc:
+            res["reason"] = f"cookies: {type(exc).__name__}: {exc}"
+            return res
+        if cookies is None:
+            res["reason"] = "no cookies"
+            return res
+        async with self._proxies[acc.proxy]:
+            t0 = time.perf_counter()
+            try:
+                cv, ci = await capture_ci(await self._browser(), cookies, acc.proxy, self.timeout)
+            except Exception as exc:
+                cv, ci = "", ""
+                res["reason"] = f"{type(exc).__name__}: {exc}"
+            res["wall_s"] = round(time.perf_counter() - t0, 2)
         if cv and ci:
-            save_ci(acc.login, cv, ci)
-            print(f"{acc.login}: Client-Version={cv} Client-Integrity={ci}")
+            try:
+                save_ci(acc.login, cv, ci, ids=ids)
+            except Exception as exc:
+                res["reason"] = f"save: {type(exc).__name__}: {exc}"
+                return res
+            res["status"] = "ok"
+        else:
+            res.setdefault("reason", "no header")
+        return res
+
+    async def run(self, accounts: Sequence[Account]) -> List[Dict[str, Any]]:
+        queue = deque(by_proxy(accounts))
+        results: List[Dict[str, Any]] = []
+
+        async def worker() -> None:
+            while queue:
+                res = await self.capture(queue.popleft())
+                results.append(res)
+                line = f"{res['login']}: {res['status']} in {res['wall_s']:.1f} s"
+                print(line + (f" ({res['reason']})" if res.get("reason") else ""), flush=True)
+
+        try:
+            await asyncio.gather(*(worker() for _ in range(min(self.concurrency, len(queue)))))
+        finally:
+            if self.browser is not None:
+                await self.browser.close()
+        return results
+
+
+async def prewarm(
+    accounts: Sequence[Account], concurrency: int, per_proxy: int, timeout: float
+) -> Tuple[List[Dict[str, Any]], int]:
+    """Результаты захватов и пиковый RSS за прогон."""
+    if not accounts:
+        return [], 0
+    # Import playwright lazily: skip-only runs work without it
+    from playwright.async_api import async_playwright
+
+    async with PeakRss() as rss, async_playwright() as pw:
+        results = await Batch(pw, concurrency, per_proxy, timeout).run(accounts)
+    return results, rss.peak
+
+
+def summary(results: Sequence[Dict[str, Any]], elapsed: float, peak_rss: int, concurrency: int) -> str:
+    rows = [f"{'result':<8} {'count':>6} {'median_s':>9} {'max_s':>7}"]
+    for status in ("ok", "failed", "skipped"):
+        walls = sorted(r["wall_s"] for r in results if r["status"] == status)
+        if status == "skipped" or not walls:
+            rows.append(f"{status:<8} {len(walls):>6} {'-':>9} {'-':>7}")
         else:
-            print(f"{acc.login}: failed to capture headers")
+            rows.append(f"{status:<8} {len(walls):>6} {walls[len(walls) // 2]:>9.1f} {walls[-1]:>7.1f}")
+    rows.append(
+        f"{len(results)} accounts in {elapsed:.1f} s, concurrency {concurrency}, peak RSS {_mb(peak_rss)}"
+    )
+    return "\n".join(rows)
 
 
 def main() -> None:
     ap = argparse.ArgumentParser(description="Update Client-Version and Client-Integrity")
     ap.add_argument("--accounts", required=True, help="Path to CSV or TXT accounts file")
+    ap.add_argument("--concurrency", type=int, default=4, help="Captures running at once in the shared browser")
+    ap.add_argument("--per-proxy", type=int, default=1, help="Captures sharing one proxy at once")
+    ap.add_argument("--min-valid-h", type=float, default=2.0,
+                    help="Skip accounts whose token stays valid longer than this many hours")
+    ap.add_argument("--force", action="store_true", help="Refresh every account, even fresh ones")
+    ap.add_argument("--timeout", type=float, default=CI_TIMEOUT, help="Per-capture timeout, s")
+    ap.add_argument("--out", type=str, default="", help="Write per-account results JSON here")
     args = ap.parse_args()
 
     accounts = load_accounts(Path(args.accounts))
-    asyncio.run(_process(accounts))
+    todo, fresh = plan(accounts, args.min_valid_h * 3600, args.force)
+    t0 = time.perf_counter()
+    results, peak = asyncio.run(prewarm(todo, args.concurrency, args.per_proxy, args.timeout))
+    results += [{"login": a.login, "proxy": a.proxy, "status": "skipped", "wall_s": 0.0} for a in fresh]
+    print(summary(results, time.perf_counter() - t0, peak, args.concurrency))
+    if args.out:
+        out = Path(args.out)
+        tmp = out.with_suffix(".tmp")
+        tmp.write_text(json.dumps(results, indent=2), encoding="utf-8")
+        tmp.replace(out)
+    sys.exit(1 if any(r["status"] == "failed" for r in results) else 0)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,193 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+import sys
+from typing import Any, Awaitable, Callable, Dict, FrozenSet, Iterable, List, Optional, Sequence, Tuple
+
+from .catalog import Campaign
+from .claims import is_claimed
+
+# список живых каналов кампании общий для всех аккаунтов и живёт столько секунд
+CHANNELS_TTL = 300.0
+# кампании, которые кончаются раньше чем через URGENT_WINDOW, весят до 2x
+URGENT_WINDOW = 6 * 3600.0
+# сколько лучших каналов возвращает rank()
+RANK_LIMIT = 10
+
+Fetch = Callable[[str], Awaitable[List[Tuple[str, str, int, bool]]]]
+
+
+class ChannelInfo:
+    __slots__ = ("login", "id", "viewers", "live")
+
+    def __init__(self, login: str, id: str, viewers: int, live: bool):
+        self.login = sys.intern(login)
+        self.id = sys.intern(id)
+        self.viewers = viewers
+        self.live = live
+
+    def __repr__(self) -> str:  # pragma: no cover - отладка
+        return f"ChannelInfo({self.login!r}, {self.id!r}, {self.viewers}, {self.live})"
+
+
+class Choice:
+    """Channel picked for an account and the campaigns watching it advances."""
+
+    __slots__ = ("channel", "campaigns", "score")
+
+    def __init__(self, channel: ChannelInfo, campaigns: Tuple[str, ...], score: float):
+        self.channel = channel
+        self.campaigns = campaigns
+        self.score = score
+
+
+def campaign_weight(camp: Campaign, now: float) -> float:
+    """1.0 для обычной кампании, до 2.0 для почти закончившейся, 0 — если уже кончилась."""
+    if not camp.ends_at:
+        return 1.0
+    left = camp.ends_at - now
+    if left <= 0:
+        return 0.0
+    if left >= URGENT_WINDOW:
+        return 1.0
+    # линейно от 1x до 2x за последние URGENT_WINDOW секунд
+    return 2.0 - left / URGENT_WINDOW
+
+
+class WatchAllocator:
+    """Scores channels for an account across all its selected campaigns.
+
+    A channel allowlisted for several selected, unfinished campaigns advances
+    all of them at once, so its score is the sum of those campaigns' weights
+    (campaigns ending soon weigh more); only live channels with a numeric id
+    qualify, viewers break ties. Live channel lists are shared process-wide
+    and fetched single-flight, and solutions are memoised per (selection,
+    finished set), so re-solving thousands of accounts that watch the same
+    campaigns costs a dictionary lookup each.
+    """
+
+    def __init__(self, ttl: float = CHANNELS_TTL):
+        self.ttl = ttl
+        self._channels: Dict[str, Tuple[float, Tuple[ChannelInfo, ...]]] = {}
+        # только живые каналы с числовым id — их и считаем при ранжировании
+        self._eligible: Dict[str, Tuple[ChannelInfo, ...]] = {}
+        self._eligible_ids: Dict[str, FrozenSet[str]] = {}
+        self._inflight: Dict[str, "asyncio.Future[Tuple[ChannelInfo, ...]]"] = {}
+        self._solved: Dict[Tuple[Tuple[str, ...], FrozenSet[str]], List[Choice]] = {}
+        self._minute = -1
+
+    # ── live channels per campaign ───────────────────────────────────────────
+    def update(self, campaign_id: str, channels: Iterable[Tuple[str, str, int, bool]], now: float) -> None:
+        infos = tuple(
+            ChannelInfo(str(login), str(cid), int(viewers or 0), bool(live))
+            for login, cid, viewers, live in channels
+        )
+        self._channels[campaign_id] = (now, infos)
+        eligible = tuple(ch for ch in infos if ch.live and ch.id.isdigit())
+        self._eligible[campaign_id] = eligible
+        self._eligible_ids[campaign_id] = frozenset(ch.id for ch in eligible)
+        self._solved.clear()
+
+    def channels(self, campaign_id: str) -> Tuple[ChannelInfo, ...]:
+        entry = self._channels.get(campaign_id)
+        return entry[1] if entry else ()
+
+    def stale(self, campaign_id: str, now: float) -> bool:
+        entry = self._channels.get(campaign_id)
+        return entry is None or now - entry[0] >= self.ttl
+
+    def invalidate(self, campaign_id: str) -> None:
+        self._eligible.pop(campaign_id, None)
+        self._eligible_ids.pop(campaign_id, None)
+        if self._channels.pop(campaign_id, None) is not None:
+            self._solved.clear()
+
+    async def refresh(self, campaign_ids: Sequence[str], fetch: Fetch, now: float) -> None:
+        """Обновить устаревшие списки каналов; один запрос на кампанию на весь процесс."""
+        waits = []
+        for cid in campaign_ids:
+            if not self.stale(cid, now):
+                continue
+            fut = self._inflight.get(cid)
+            if fut is None:
+                fut = asyncio.ensure_future(self._fetch(cid, fetch, now))
+                self._inflight[cid] = fut
+            waits.append(asyncio.shield(fut))
+        if waits:
+            await asyncio.gather(*waits, return_exceptions=True)
+
+    async def _fetch(self, campaign_id: str, fetch: Fetch, now: float) -> Tuple[ChannelInfo, ...]:
+        try:
+            self.update(campaign_id, await fetch(campaign_id), now)
+        finally:
+            self._inflight.pop(campaign_id, None)
+        return self.channels(campaign_id)
+
+    # ── scoring ──────────────────────────────────────────────────────────────
+    def rank(
+        self,
+        campaigns: Sequence[Campaign],
+        done: FrozenSet[str] = frozenset(),
+        now: float = 0.0,
+        limit: int = RANK_LIMIT,
+    ) -> List[Choice]:
+        """Лучшие ``limit`` каналов: сколько выбранных незавершённых кампаний продвигает просмотр."""
+        minute = int(now // 60)
+        if minute != self._minute:
+            # веса зависят от времени до конца кампаний — пересчитываем раз в минуту
+            self._solved.clear()
+            self._minute = minute
+        key = (tuple(c.id for c in campaigns), done)
+        cached = self._solved.get(key)
+        if cached is not None:
+            return cached
+        weighted = [(c.id, campaign_weight(c, now)) for c in campaigns if c.id not in done]
+        weighted = [(cid, w) for cid, w in weighted if w > 0]
+        scores: Dict[str, float] = {}
+        info: Dict[str, ChannelInfo] = {}
+        get = scores.get
+        for cid, w in weighted:
+            for ch in self._eligible.get(cid, ()):
+                scores[ch.id] = get(ch.id, 0.0) + w
+                info[ch.id] = ch
+        # полная сортировка не нужна: берём top-N, кампании считаем только для них
+        top = heapq.nlargest(limit, scores, key=lambda chid: (scores[chid], info[chid].viewers))
+        ids = self._eligible_ids
+        ranked = [
+            Choice(info[chid], tuple(cid for cid, _w in weighted if chid in ids.get(cid, ())), scores[chid])
+            for chid in top
+        ]
+        self._solved[key] = ranked
+        return ranked
+
+    def choose(
+        self, campaigns: Sequence[Campaign], done: FrozenSet[str] = frozenset(), now: float = 0.0
+    ) -> Optional[Choice]:
+        ranked = self.rank(campaigns, done, now)
+        return ranked[0] if ranked else None
+
+
+_allocator = WatchAllocator()
+
+
+def get_allocator() -> WatchAllocator:
+    return _allocator
+
+
+def finished_campaigns(inv: Any, claimed: Dict[str, str]) -> FrozenSet[str]:
+    """Кампании из Inventory, у которых все тайм-бейзд дропы уже заклеймлены."""
+    out = set()
+    try:
+        inv_node = ((inv or {}).get("data") or {}).get("currentUser") or {}
+        camps = (inv_node.get("inventory") or {}).get("dropCampaignsInProgress") or []
+        for camp in camps:
+            drops = camp.get("timeBasedDrops") or []
+            if drops and all(
+                is_claimed(d) or str(d.get("dropInstanceID") or "") in claimed for d in drops
+            ):
+                out.add(str(camp.get("id") or ""))
+    except AttributeError:
+        pass
+    out.discard("")
+    return frozenset(out)
@@ -1,21 +1,23 @@
 from __future__ import annotations
-from typing import List, Dict
+from typing import List, Sequence
 from PySide6.QtWidgets import QDialog, QVBoxLayout, QListWidget, QListWidgetItem, QDialogButtonBox
 from PySide6.QtCore import Qt
 
+from .catalog import Campaign
+
 
 class CampaignSettingsDialog(QDialog):
-    def __init__(self, campaigns: List[Dict[str, str]], selected: List[str], parent=None):
+    def __init__(self, campaigns: Sequence[Campaign], selected: List[str], parent=None):
         super().__init__(parent)
         self.setWindowTitle("Campaigns")
         v = QVBoxLayout(self)
         self.list = QListWidget()
         for c in campaigns:
-            text = f"{c.get('name', c.get('id'))} ({c.get('game', '-')})"
+            text = f"{c.name or c.id} ({c.game or '-'})"
             item = QListWidgetItem(text)
-            item.setData(Qt.UserRole, c.get("id"))
+            item.setData(Qt.UserRole, c.id)
             item.setFlags(item.flags() | Qt.ItemIsUserCheckable)
-            item.setCheckState(Qt.Checked if c.get("id") in selected else Qt.Unchecked)
+            item.setCheckState(Qt.Checked if c.id in selected else Qt.Unchecked)
             self.list.addItem(item)
         v.addWidget(self.list)
         bb = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+import sys
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+
+def _s(value: Any) -> str:
+    return sys.intern(str(value or ""))
+
+
+@dataclass(frozen=True, slots=True)
+class Campaign:
+    """Immutable campaign entry shared by every worker that sees it."""
+
+    id: str
+    name: str
+    game: str
+    channels: Tuple[str, ...] = ()
+    # конец кампании (unix time), 0 — неизвестен
+    ends_at: float = 0.0
+
+
+class CampaignCatalog:
+    """Process-wide campaign catalogue.
+
+    Workers parse their own dashboard responses, but the result is folded into
+    one shared set of ``Campaign`` objects with interned strings: 10k accounts
+    watching the same campaign hold 10k references, not 10k copies. The whole
+    list is shared too, keyed by the tuple of campaign ids.
+    """
+
+    def __init__(self) -> None:
+        self._by_id: Dict[str, Campaign] = {}
+        self._lists: Dict[Tuple[str, ...], Tuple[Campaign, ...]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def get(self, cid: str) -> Optional[Campaign]:
+        return self._by_id.get(cid)
+
+    def _one(self, raw: Dict[str, Any]) -> Campaign:
+        cid = _s(raw.get("id"))
+        channels = tuple(_s(n) for n in raw.get("channels") or () if n)
+        ends_at = float(raw.get("ends_at") or 0.0)
+        old = self._by_id.get(cid)
+        if old is not None:
+            # неполный ответ не затирает известное; более полный — обновляет запись
+            channels = channels or old.channels
+            ends_at = ends_at or old.ends_at
+            if old.channels == channels and old.ends_at == ends_at:
+                return old
+        camp = Campaign(cid, _s(raw.get("name") or cid), _s(raw.get("game") or "—"), channels, ends_at)
+        self._by_id[cid] = camp
+        return camp
+
+    def intern(self, campaigns: Iterable[Dict[str, Any]]) -> Tuple[Campaign, ...]:
+        """Словари из ``_parse_campaigns_from_dashboard`` -> общий кортеж ``Campaign``."""
+        with self._lock:
+            camps = tuple(self._one(c) for c in campaigns)
+            key = tuple(c.id for c in camps)
+            shared = self._lists.get(key)
+            if shared is None or any(a is not b for a, b in zip(shared, camps)):
+                self._lists[key] = shared = camps
+            return shared
+
+    def lookup(self, ids: Iterable[str]) -> Tuple[Campaign, ...]:
+        """Кампании по id — общий кортеж, если такой список уже собирался; неизвестные id пропускаются."""
+        key = tuple(ids)
+        with self._lock:
+            shared = self._lists.get(key)
+            if shared is not None and all(c is self._by_id.get(c.id) for c in shared):
+                return shared
+            return tuple(c for c in map(self._by_id.get, key) if c is not None)
+
+    def all(self) -> Tuple[Campaign, ...]:
+        with self._lock:
+            return tuple(self._by_id.values())
+
+    def merge(self, campaigns: Iterable[Dict[str, Any]]) -> Tuple[Campaign, ...]:
+        """Влить записи с другого узла (без общего кортежа-списка, как в ``intern``)."""
+        with self._lock:
+            return tuple(self._one(c) for c in campaigns)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._by_id.clear()
+            self._lists.clear()
+
+
+_catalog = CampaignCatalog()
+
+
+def get_catalog() -> CampaignCatalog:
+    return _catalog
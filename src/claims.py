@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Dict, List, Optional, Tuple
+
+from .clock import SYSTEM_CLOCK, Clock
+from .metrics import CLAIM_LATENCY, WASTED_CLAIMS, record_claim
+from .tracing import span
+
+# сколько последних dropInstanceID помнит журнал аккаунта
+LEDGER_SIZE = 256
+# повтор неудачного клейма: 60 с, 120 с, ... не чаще раза в час
+RETRY_BASE = 60.0
+RETRY_MAX = 3600.0
+
+CLAIM_OK = ("ELIGIBLE_FOR_ALL", "ELIGIBLE_FOR_SOME")
+ALREADY_CLAIMED = "DROP_INSTANCE_ALREADY_CLAIMED"
+
+_DROP_KEYS = {"requiredMinutesWatched", "currentMinutesWatched", "dropInstanceID"}
+
+
+def time_based_drops(inv: Any) -> List[Dict[str, Any]]:
+    """Все тайм-бейзд дропы из ответа Inventory (узлы с required/current/dropInstanceID)."""
+    out: List[Dict[str, Any]] = []
+
+    def walk(obj: Any) -> None:
+        if isinstance(obj, dict):
+            if _DROP_KEYS <= obj.keys():
+                out.append(obj)
+                return
+            for v in obj.values():
+                walk(v)
+        elif isinstance(obj, list):
+            for v in obj:
+                walk(v)
+
+    walk(inv)
+    return out
+
+
+def drop_name(drop: Dict[str, Any]) -> str:
+    return drop.get("name") or (drop.get("benefit") or {}).get("name") or drop.get("id") or ""
+
+
+def is_complete(drop: Dict[str, Any]) -> bool:
+    req = int(drop.get("requiredMinutesWatched") or 0)
+    cur = int(drop.get("currentMinutesWatched") or 0)
+    return bool(req) and cur >= req and bool(drop.get("dropInstanceID"))
+
+
+def is_claimed(drop: Dict[str, Any]) -> bool:
+    return bool(drop.get("isClaimed") or (drop.get("self") or {}).get("isClaimed"))
+
+
+class ClaimLedger:
+    """Local claim journal of one account.
+
+    ``claimed`` maps dropInstanceID to the claim time and is persisted with
+    the account state, so a restart never re-sends a claim. Failed claims are
+    retried with exponential backoff instead of on every tick.
+    """
+
+    def __init__(self, claimed: Optional[Dict[str, str]] = None, clock: Clock = SYSTEM_CLOCK):
+        self.claimed: Dict[str, str] = claimed if claimed is not None else {}
+        self.clock = clock
+        self._failures: Dict[str, Tuple[int, float]] = {}
+        self._first_seen: Dict[str, float] = {}
+
+    def pending(self, drops: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Дропы, которые пора клеймить: завершены, не заклеймлены, не на паузе после ошибки."""
+        now = self.clock.monotonic()
+        out: List[Dict[str, Any]] = []
+        for d in drops:
+            if not is_complete(d) or is_claimed(d):
+                continue
+            did = str(d["dropInstanceID"])
+            if did in self.claimed:
+                continue
+            self._first_seen.setdefault(did, now)
+            fail = self._failures.get(did)
+            if fail and now < fail[1]:
+                continue
+            out.append(d)
+        return out
+
+    def mark_claimed(self, did: str, at: str) -> None:
+        self.claimed[did] = at
+        self._failures.pop(did, None)
+        first = self._first_seen.pop(did, None)
+        if first is not None:
+            CLAIM_LATENCY.observe(self.clock.monotonic() - first)
+        while len(self.claimed) > LEDGER_SIZE:
+            self.claimed.pop(next(iter(self.claimed)))
+
+    def mark_failed(self, did: str) -> float:
+        n = self._failures.get(did, (0, 0.0))[0] + 1
+        delay = min(RETRY_MAX, RETRY_BASE * 2 ** (n - 1))
+        self._failures[did] = (n, self.clock.monotonic() + delay)
+        return delay
+
+
+def _claim_status(resp: Any) -> str:
+    data = (resp or {}).get("data") if isinstance(resp, dict) else None
+    return str(((data or {}).get("claimDropRewards") or {}).get("status") or "")
+
+
+async def claim_all(
+    api: Any, drops: List[Dict[str, Any]], ledger: ClaimLedger
+) -> List[Tuple[Dict[str, Any], Optional[str]]]:
+    """Клеймим все готовые дропы параллельно; [(drop, None | текст ошибки)] — по успешным и нет.
+
+    Уже заклеймленный на стороне Twitch дроп записывается в журнал и в
+    результат не попадает (это «пустой» вызов, он считается в метрике).
+    """
+    pending = ledger.pending(drops)
+    if not pending:
+        return []
+
+    async def one(drop: Dict[str, Any]) -> Optional[Tuple[Dict[str, Any], Optional[str]]]:
+        did = str(drop["dropInstanceID"])
+        try:
+            with span("claim", cat="tick", drop=did):
+                resp = await api.claim(did)
+        except Exception as e:
+            WASTED_CLAIMS.inc("error")
+            ledger.mark_failed(did)
+            return drop, str(e)
+        status = _claim_status(resp)
+        at = ledger.clock.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+        if status == ALREADY_CLAIMED:
+            WASTED_CLAIMS.inc("already_claimed")
+            ledger.mark_claimed(did, at)
+            return None
+        if not status:
+            # пустой ответ (errors, data: null) — не клейм: повторим после паузы, как при ошибке
+            WASTED_CLAIMS.inc("no_status")
+            ledger.mark_failed(did)
+            return drop, "no claim status"
+        if status not in CLAIM_OK:
+            WASTED_CLAIMS.inc("not_claimable")
+            ledger.mark_failed(did)
+            return drop, status
+        record_claim()
+        ledger.mark_claimed(did, at)
+        return drop, None
+
+    results = await asyncio.gather(*(one(d) for d in pending))
+    return [r for r in results if r is not None]
@@ -2,9 +2,14 @@ from __future__ import annotations
 
 import asyncio
 import json
+import tempfile
 import time
 from pathlib import Path
-from typing import Tuple
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from .metrics import REQUEST_TIMEOUTS
+from .ops import ALIASES
 
 # Directories for cookies and client integrity tokens
 COOKIES_DIR = Path("cookies")
@@ -16,71 +21,331 @@ DROPS_URL = "https://www.twitch.tv/drops"
 GQL_URL = "https://gql.twitch.tv/gql"
 # Default time-to-live for stored tokens (24h)
 CI_TTL = 60 * 60 * 24
+# Client-Session-Id/Playback-Session-Id живут столько, потом ротируются (device id — постоянный)
+SESSION_TTL = 60 * 60 * 6
+# поля ci/<login>.json с ID устройства и сессии; CI-токен выдан именно этому устройству
+ID_FIELDS = ("device_id", "client_session_id", "playback_session_id", "session_started_at")
+# Pages where the Twitch web client issues the operation by itself
+OP_PAGES = {
+    "ViewerDropsDashboard": "https://www.twitch.tv/drops/campaigns",
+    "DropCampaignDetails": "https://www.twitch.tv/drops/campaigns",
+    "Inventory": "https://www.twitch.tv/drops/inventory",
+    "DropsPage_ClaimDropRewards": "https://www.twitch.tv/drops/inventory",
+}
+DISCOVERY_TIMEOUT = 60.0
+# сколько ждать первый GQL-запрос страницы с заголовками CI
+CI_TIMEOUT = 45.0
+# странице для GQL-запроса нужен только JS: остальное браузер не грузит
+BLOCKED_RESOURCES = frozenset({"image", "media", "font"})
+BLOCKED_HOSTS = (
+    "spade.twitch.tv",
+    "countess.twitch.tv",
+    "ttvnw.net",
+    "jtvnw.net",
+    "google-analytics.com",
+    "googletagmanager.com",
+    "doubleclick.net",
+    "amazon-adsystem.com",
+    "imasdk.googleapis.com",
+    "scorecardresearch.com",
+    "sentry.io",
+)
+LAUNCH_ARGS = (
+    "--disable-gpu",
+    "--disable-dev-shm-usage",
+    "--disable-extensions",
+    "--disable-background-networking",
+    "--disable-component-update",
+    "--mute-audio",
+    "--no-first-run",
+    "--blink-settings=imagesEnabled=false",
+)
+VIEWPORT = {"width": 800, "height": 600}
+
+
+def load_cookies(login: str, device_id: str = "") -> Optional[List[Dict[str, Any]]]:
+    """cookies/<login>.json; с ``device_id`` браузер работает как это устройство (cookie ``unique_id``)."""
+    try:
+        cookies = json.loads((COOKIES_DIR / f"{login}.json").read_text(encoding="utf-8"))
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    if device_id:
+        cookies = [c for c in cookies if c.get("name") != "unique_id"]
+        cookies.append({"name": "unique_id", "value": device_id, "domain": ".twitch.tv", "path": "/"})
+    return cookies
+
+
+def blocked(url: str, resource_type: str) -> bool:
+    """Запрос, без которого страница всё равно отправит GQL: картинки, видео, шрифты, аналитика."""
+    if resource_type in BLOCKED_RESOURCES:
+        return True
+    host = urlsplit(url).hostname or ""
+    return any(host == h or host.endswith("." + h) for h in BLOCKED_HOSTS)
+
+
+async def _route(route: Any) -> None:
+    req = route.request
+    try:
+        if blocked(req.url, req.resource_type):
+            await route.abort()
+        else:
+            await route.continue_()
+    except Exception:
+        pass  # контекст уже закрыт: заголовок пойман, недогруженное не нужно
+
+
+async def launch_browser(pw: Any, proxy: str = "") -> Any:
+    """Headless Chromium без GPU и фоновых сервисов — только чтобы выполнить JS страницы."""
+    launch_kwargs: Dict[str, Any] = {"headless": True, "args": list(LAUNCH_ARGS)}
+    if proxy:
+        launch_kwargs["proxy"] = {"server": proxy}
+    return await pw.chromium.launch(**launch_kwargs)
+
+
+async def light_context(browser: Any, cookies: List[Dict[str, Any]], proxy: str = "") -> Any:
+    """Маленький контекст с блокировкой лишних загрузок; ``proxy`` — свой на контекст."""
+    kwargs: Dict[str, Any] = {"viewport": VIEWPORT, "device_scale_factor": 1, "service_workers": "block"}
+    if proxy:
+        kwargs["proxy"] = {"server": proxy}
+    context = await browser.new_context(**kwargs)
+    await context.route("**/*", _route)
+    await context.add_cookies(cookies)
+    return context
+
+
+async def capture_ci(
+    browser: Any, cookies: List[Dict[str, Any]], proxy: str = "", timeout: float = CI_TIMEOUT
+) -> Tuple[str, str]:
+    """(Client-Version, Client-Integrity) из первого GQL-запроса страницы в своём контексте ``browser``.
+
+    Ждём не загрузки страницы, а самого запроса: как только заголовок пойман,
+    контекст закрывается и всё недогруженное обрывается.
+    """
+    context = await light_context(browser, cookies, proxy)
+    try:
+        page = await context.new_page()
+        fut: asyncio.Future = asyncio.get_running_loop().create_future()
+
+        def handle_request(req):
+            if req.url == GQL_URL and not fut.done() and req.headers.get("client-integrity"):
+                fut.set_result(req.headers)
+
+        def nav_done(task: asyncio.Task) -> None:
+            # прокси не пустил или страница не открылась — не ждём таймаута
+            if not task.cancelled() and task.exception() is not None and not fut.done():
+                fut.set_exception(task.exception())
+
+        page.on("request", handle_request)
+        nav = asyncio.ensure_future(page.goto(DROPS_URL, wait_until="commit"))
+        nav.add_done_callback(nav_done)
+        try:
+            headers = await asyncio.wait_for(fut, timeout)
+        except asyncio.TimeoutError:
+            REQUEST_TIMEOUTS.inc("ci")
+            return "", ""
+        except Exception:
+            return "", ""
+        finally:
+            nav.cancel()
+    finally:
+        await context.close()
+    return headers.get("client-version", ""), headers.get("client-integrity", "")
+
 
-async def fetch_ci(login: str, proxy: str = "") -> Tuple[str, str]:
+async def fetch_ci(login: str, proxy: str = "", device_id: str = "") -> Tuple[str, str]:
     """Open Drops page in headless browser and capture CI headers.
 
     Returns tuple (Client-Version, Client-Integrity). If cookies for login are
-    missing or headers cannot be captured, returns empty strings.
+    missing or headers cannot be captured, returns empty strings. With
+    ``device_id`` the browser runs as that device (``unique_id`` cookie), so
+    the token matches the X-Device-Id the worker sends.
     """
-    cookies_file = COOKIES_DIR / f"{login}.json"
-    if not cookies_file.exists():
-        return "", ""
-    try:
-        cookies = json.loads(cookies_file.read_text(encoding="utf-8"))
-    except (FileNotFoundError, json.JSONDecodeError):
+    cookies = load_cookies(login, device_id)
+    if cookies is None:
         return "", ""
 
     # Import playwright lazily so tests without the dependency still work
     from playwright.async_api import async_playwright
 
     async with async_playwright() as pw:
-        launch_kwargs = {"headless": True}
-        if proxy:
-            launch_kwargs["proxy"] = {"server": proxy}
-        browser = await pw.chromium.launch(**launch_kwargs)
-        context = await browser.new_context()
-        await context.add_cookies(cookies)
-        page = await context.new_page()
+        browser = await launch_browser(pw, proxy)
+        try:
+            return await capture_ci(browser, cookies)
+        finally:
+            await browser.close()
 
-        fut: asyncio.Future = asyncio.get_event_loop().create_future()
 
-        def handle_request(req):
-            if req.url == GQL_URL and not fut.done():
-                fut.set_result(req.headers)
+def _op_names(operation: str) -> set[str]:
+    names = {operation}
+    for k, v in ALIASES.items():
+        if operation in (k, v):
+            names.update((k, v))
+    return names
 
-        page.on("request", handle_request)
-        await page.goto(DROPS_URL)
-        headers = await fut
-        await browser.close()
 
-    cv = headers.get("client-version", "")
-    ci = headers.get("client-integrity", "")
-    return cv, ci
+def op_page(operation: str, variables: Optional[Dict[str, Any]] = None) -> str:
+    """Page that makes the browser send ``operation`` to gql.twitch.tv."""
+    names = _op_names(operation)
+    channel = (variables or {}).get("channelLogin")
+    if channel and "DropCurrentSessionContext" in names:
+        return f"https://www.twitch.tv/{channel}"
+    for name in names:
+        if name in OP_PAGES:
+            return OP_PAGES[name]
+    return DROPS_URL
 
 
-def save_ci(login: str, cv: str, ci: str, ttl: int = CI_TTL) -> None:
-    """Persist tokens for account with expiration timestamp."""
-    data = {
+def extract_hashes(post_data: Optional[str]) -> Dict[str, str]:
+    """operationName -> sha256Hash from a (possibly batched) GQL request body."""
+    try:
+        body = json.loads(post_data or "")
+    except (TypeError, ValueError):
+        return {}
+    out: Dict[str, str] = {}
+    for item in body if isinstance(body, list) else [body]:
+        if not isinstance(item, dict):
+            continue
+        name = item.get("operationName")
+        pq = (item.get("extensions") or {}).get("persistedQuery") or {}
+        h = pq.get("sha256Hash")
+        if name and h:
+            out[str(name)] = str(h)
+    return out
+
+
+async def fetch_op_hashes(
+    login: str,
+    operation: str,
+    proxy: str = "",
+    variables: Optional[Dict[str, Any]] = None,
+    timeout: float = DISCOVERY_TIMEOUT,
+) -> Dict[str, str]:
+    """Capture current persisted-query hashes the way ``fetch_ci`` captures headers.
+
+    Opens the page that issues ``operation`` and records every GQL request
+    body until the wanted operation is seen (or ``timeout``). Returns all
+    hashes observed, so other rotated operations get fixed in the same pass.
+    """
+    cookies = load_cookies(login)
+    if cookies is None:
+        return {}
+
+    from playwright.async_api import async_playwright
+
+    wanted = _op_names(operation)
+    seen: Dict[str, str] = {}
+    async with async_playwright() as pw:
+        browser = await launch_browser(pw, proxy)
+        try:
+            context = await light_context(browser, cookies)
+            page = await context.new_page()
+
+            fut: asyncio.Future = asyncio.get_event_loop().create_future()
+
+            def handle_request(req):
+                if req.url != GQL_URL or req.method != "POST":
+                    return
+                found = extract_hashes(req.post_data)
+                seen.update(found)
+                if wanted & found.keys() and not fut.done():
+                    fut.set_result(True)
+
+            page.on("request", handle_request)
+            try:
+                await page.goto(op_page(operation, variables))
+                await asyncio.wait_for(fut, timeout)
+            except Exception:
+                pass
+        finally:
+            await browser.close()
+    return seen
+
+
+def _read_ci(login: str) -> Dict[str, Any]:
+    try:
+        data = json.loads((CI_DIR / f"{login}.json").read_text(encoding="utf-8"))
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def _write_ci(login: str, data: Dict[str, Any]) -> None:
+    # через временный файл: прерванная запись не оставит битый ci/<login>.json;
+    # имя уникальное — воркер и update_ci.py могут писать один логин одновременно
+    path = CI_DIR / f"{login}.json"
+    f = tempfile.NamedTemporaryFile(
+        "w", encoding="utf-8", dir=CI_DIR, prefix=f"{login}.", suffix=".tmp", delete=False
+    )
+    tmp = Path(f.name)
+    try:
+        with f:
+            f.write(json.dumps(data, ensure_ascii=False, indent=2))
+        tmp.replace(path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+
+def ci_expires_at(login: str) -> float:
+    """Когда истекает сохранённый CI-токен (unix time); 0 — токена нет или срок неизвестен."""
+    data = _read_ci(login)
+    if not (data.get("client_integrity") or data.get("Client-Integrity")):
+        return 0.0
+    try:
+        return float(data.get("expires_at") or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def save_ci(
+    login: str,
+    cv: str,
+    ci: str,
+    ttl: int = CI_TTL,
+    now: Optional[float] = None,
+    ids: Optional[Dict[str, Any]] = None,
+) -> None:
+    """Persist tokens for account with expiration timestamp.
+
+    ID устройства и сессии из файла сохраняются; ``ids`` — те, под которые
+    выдан этот токен.
+    """
+    now = time.time() if now is None else now
+    data = {k: v for k, v in _read_ci(login).items() if k in ID_FIELDS}
+    data.update(ids or {})
+    data.update({
         "client_version": cv,
         "client_integrity": ci,
-        "expires_at": time.time() + ttl,
-    }
-    path = CI_DIR / f"{login}.json"
-    path.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+        "expires_at": now + ttl,
+    })
+    _write_ci(login, data)
 
 
-def load_ci(login: str) -> Tuple[str, str]:
+def save_ids(login: str, ids: Dict[str, Any]) -> None:
+    """Обновить ID устройства/сессии в ci/<login>.json, не трогая токены."""
+    data = _read_ci(login)
+    data.update(ids)
+    _write_ci(login, data)
+
+
+def load_ids(login: str) -> Dict[str, Any]:
+    """Сохранённые ID устройства и сессии; без них device id берётся из cookie ``unique_id``."""
+    data = _read_ci(login)
+    ids = {k: data[k] for k in ID_FIELDS if data.get(k)}
+    if "device_id" not in ids:
+        for c in load_cookies(login) or ():
+            if isinstance(c, dict) and c.get("name") == "unique_id" and c.get("value"):
+                ids["device_id"] = str(c["value"])
+    return ids
+
+
+def load_ci(login: str, now: Optional[float] = None) -> Tuple[str, str]:
     """Load tokens for account if not expired."""
-    path = CI_DIR / f"{login}.json"
-    if not path.exists():
-        return "", ""
-    try:
-        data = json.loads(path.read_text(encoding="utf-8"))
-    except (FileNotFoundError, json.JSONDecodeError):
+    data = _read_ci(login)
+    if not data:
         return "", ""
     expires = float(data.get("expires_at") or 0)
-    if expires and expires < time.time():
+    if expires and expires < (time.time() if now is None else now):
         return "", ""
     cv = (
         data.get("client_version")
@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import AsyncIterator, List, Tuple
+
+
+class Clock:
+    """Источник времени для майнера, ретраев и сроков CI (реальное время)."""
+
+    def monotonic(self) -> float:
+        return time.monotonic()
+
+    def time(self) -> float:
+        return time.time()
+
+    def utcnow(self) -> datetime:
+        return datetime.utcnow()
+
+    async def sleep(self, delay: float) -> None:
+        await asyncio.sleep(delay)
+
+    async def wait_event(self, evt: asyncio.Event, timeout: float) -> bool:
+        """Ждать ``evt`` не дольше ``timeout``; True, если событие установлено."""
+        if evt.is_set():
+            return True
+        try:
+            await asyncio.wait_for(evt.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return evt.is_set()
+
+    def timeout(self, delay: float):
+        """``async with clock.timeout(d)``: отменить тело через ``d`` секунд, снаружи — TimeoutError."""
+        return asyncio.timeout(delay)
+
+
+SYSTEM_CLOCK = Clock()
+
+
+class VirtualClock(Clock):
+    """Virtual time for simulations: sleeping costs no wall time.
+
+    ``run_until`` lets every ready task run, then jumps straight to the next
+    pending ``sleep`` deadline. Only code that waits through this clock (not
+    real sockets or ``asyncio.sleep``) is accelerated.
+    """
+
+    def __init__(self, start: float = 0.0, epoch: float = 1_700_000_000.0):
+        self._now = start
+        self.epoch = epoch
+        self._timers: List[Tuple[float, int, asyncio.Future]] = []
+        self._seq = 0
+
+    def monotonic(self) -> float:
+        return self._now
+
+    def time(self) -> float:
+        return self.epoch + self._now
+
+    def utcnow(self) -> datetime:
+        return datetime.utcfromtimestamp(self.time())
+
+    async def sleep(self, delay: float) -> None:
+        if delay <= 0:
+            await asyncio.sleep(0)
+            return
+        fut = asyncio.get_running_loop().create_future()
+        self._seq += 1
+        heapq.heappush(self._timers, (self._now + delay, self._seq, fut))
+        await fut
+
+    async def wait_event(self, evt: asyncio.Event, timeout: float) -> bool:
+        # в симуляции достаточно проверить событие после виртуального сна
+        if not evt.is_set():
+            await self.sleep(timeout)
+        return evt.is_set()
+
+    @asynccontextmanager
+    async def timeout(self, delay: float) -> AsyncIterator[None]:
+        # дедлайн в виртуальном времени: таймер в той же куче, что и sleep
+        task = asyncio.current_task()
+        fut = asyncio.get_running_loop().create_future()
+        self._seq += 1
+        heapq.heappush(self._timers, (self._now + delay, self._seq, fut))
+        active = True
+        fired = False
+
+        def expire(f: asyncio.Future) -> None:
+            nonlocal fired
+            if active and not f.cancelled() and task is not None:
+                fired = True
+                task.cancel()
+
+        fut.add_done_callback(expire)
+        try:
+            yield
+        except asyncio.CancelledError:
+            if fired and task is not None and task.uncancel() == 0:
+                raise TimeoutError from None
+            raise
+        finally:
+            active = False
+            if not fut.done():
+                fut.cancel()
+
+    async def _settle(self, max_rounds: int = 10_000) -> None:
+        """Дать отработать всем готовым задачам, пока цикл не станет «пустым»."""
+        loop = asyncio.get_running_loop()
+        ready = getattr(loop, "_ready", None)
+        for i in range(max_rounds):
+            await asyncio.sleep(0)
+            if ready is None:
+                if i >= 10:
+                    return
+            elif not ready:
+                return
+
+    async def run_until(self, deadline: float) -> None:
+        """Продвигать виртуальное время до ``deadline``, будя спящих по порядку."""
+        while True:
+            await self._settle()
+            timers = self._timers
+            while timers and timers[0][2].done():
+                heapq.heappop(timers)
+            if not timers or timers[0][0] > deadline:
+                self._now = max(self._now, deadline)
+                await self._settle()
+                return
+            when = timers[0][0]
+            self._now = max(self._now, when)
+            while timers and timers[0][0] <= when:
+                _w, _s, fut = heapq.heappop(timers)
+                if not fut.done():
+                    fut.set_result(None)
+
+    async def advance(self, delta: float) -> None:
+        await self.run_until(self._now + delta)
@@ -0,0 +1,585 @@
+from __future__ import annotations
+
+import asyncio
+import dataclasses
+import hmac
+import ipaddress
+import json
+import logging
+import os
+import signal
+import socket
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from urllib.parse import quote, unquote
+
+from .catalog import Campaign, CampaignCatalog, get_catalog
+from .clock import SYSTEM_CLOCK, Clock
+from .control_api import FILTER_FIELDS, FleetState, match
+from .events import EventBus, JsonlSink, Subscription
+from .httpd import HttpServer, Request, Response, fetch
+from .metrics import CLUSTER_AGENTS, CLUSTER_MOVES, REGISTRY, merge_rendered
+from .ops import OpsRegistry, get_registry
+from .types import Account
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 9120
+# агент отчитывается раз в HEARTBEAT секунд; без отчёта LEASE_TTL — аренда потеряна
+HEARTBEAT = 5.0
+LEASE_TTL = 20.0
+# агент останавливает аккаунты на эту долю lease_ttl раньше, чем координатор их раздаст
+FENCE_MARGIN = 0.25
+# событий в одном heartbeat; остальное уйдёт следующим
+MAX_EVENTS = 5000
+# больше не держим, пока координатор недоступен: старейшие выкидываются
+MAX_BACKLOG = 50_000
+# разница нагрузок меньше этой доли — шарды не двигаем (перезапуск аккаунтов дороже)
+BALANCE_SLACK = 0.1
+# поля Account, уходящие агенту вместе с арендой; пароль и TOTP воркеру не нужны
+LEASE_FIELDS = ("label", "login", "proxy", "client_version", "client_integrity")
+TOKEN_HEADER = "x-cluster-token"
+
+
+def parse_addr(addr: str, default_port: int = DEFAULT_PORT) -> Tuple[str, int]:
+    """'host:port' | 'host' | ':port' -> (host, port)."""
+    if ":" not in addr:
+        return addr or "127.0.0.1", default_port
+    host, _, port = addr.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+def is_loopback(host: str) -> bool:
+    """Слушать на этом адресе можно без токена: снаружи машины он недоступен."""
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host.strip("[]")).is_loopback
+    except ValueError:
+        return False
+
+
+@dataclass
+class Shard:
+    """All accounts behind one proxy: leased to one agent as a whole.
+
+    Keeping a proxy on one box keeps its rate limits, tick budget and
+    PubSub connections in one process.
+    """
+
+    proxy: str
+    logins: List[str] = field(default_factory=list)
+    owner: str = ""
+    # прежний владелец ещё не остановил аккаунты — новому шард пока не выдаём
+    releasing: str = ""
+
+
+@dataclass
+class AgentInfo:
+    id: str
+    capacity: float = 1.0
+    last_seen: float = 0.0
+    # меняется при каждом изменении аренды: список аккаунтов шлём только тогда
+    epoch: int = 0
+    running: Set[str] = field(default_factory=set)
+    metrics: str = ""
+    # какие записи каталога агент уже получил
+    campaigns: Dict[str, Campaign] = field(default_factory=dict)
+
+
+class Coordinator:
+    """Leases proxy shards of one accounts file to agents on several machines.
+
+    Agents report over HTTP every ``HEARTBEAT`` seconds; the reply carries the
+    lease. An agent that has not reported for ``lease_ttl`` is dropped and its
+    shards go to the least loaded live agents (largest shard first, scaled by
+    agent ``capacity``). The agent stops its accounts on its own timer a
+    margin before ``lease_ttl`` runs out (counted from when it sent its last
+    good heartbeat), so a shard never runs twice. Moving a shard between
+    live agents waits until the old owner reports it stopped.
+
+    Heartbeats also carry worker events (republished on ``bus``), the agent's
+    metrics and new campaign catalogue entries / ops hashes; the coordinator
+    keeps the merged catalogue and ``ops.json`` and hands them back to every
+    agent.
+    """
+
+    def __init__(
+        self,
+        accounts: List[Account],
+        port: int = DEFAULT_PORT,
+        host: str = "127.0.0.1",
+        lease_ttl: float = LEASE_TTL,
+        token: str = "",
+        events_log: str = "",
+        clock: Clock = SYSTEM_CLOCK,
+        catalog: Optional[CampaignCatalog] = None,
+        ops: Optional[OpsRegistry] = None,
+    ):
+        self.accounts = accounts
+        self.by_login = {a.login: a for a in accounts}
+        self.lease_ttl = lease_ttl
+        self.token = token
+        self.clock = clock
+        self.catalog = catalog or get_catalog()
+        self.ops = ops or get_registry()
+        self.shards: Dict[str, Shard] = {}
+        for a in accounts:
+            key = a.proxy or ""
+            self.shards.setdefault(key, Shard(key)).logins.append(a.login)
+        self.agents: Dict[str, AgentInfo] = {}
+        self.bus = EventBus(clock=clock)
+        self.fleet = FleetState(accounts)
+        self.bus.listen(self.fleet.on_event)
+        self.events_log = events_log
+        self.http = HttpServer(self._handle, host, port)
+        # после рестарта координатора агенты ещё держат свои аккаунты: сперва ждём их отчётов
+        self._recovery_until = clock.monotonic() + lease_ttl
+        self._done: Optional[asyncio.Event] = None
+
+    @property
+    def port(self) -> int:
+        return self.http.port
+
+    # ── аренда ───────────────────────────────────────────────────────────────
+    def _bump(self, aid: str) -> None:
+        ag = self.agents.get(aid)
+        if ag is not None:
+            ag.epoch += 1
+
+    def _drop(self, aid: str) -> None:
+        self.agents.pop(aid, None)
+        for s in self.shards.values():
+            if s.releasing == aid:
+                s.releasing = ""
+                self._bump(s.owner)
+            if s.owner == aid:
+                s.owner = ""
+
+    def rebalance(self) -> None:
+        """Снять аренду с пропавших агентов, раздать ничьи шарды, выровнять нагрузку."""
+        now = self.clock.monotonic()
+        for aid, ag in list(self.agents.items()):
+            if now - ag.last_seen > self.lease_ttl:
+                logger.warning("Agent %s lost: no heartbeat for %.0fs, releasing its shards", aid, now - ag.last_seen)
+                self._drop(aid)
+        if not self.agents:
+            return
+        sizes = {aid: 0 for aid in self.agents}
+        for s in self.shards.values():
+            if s.owner in sizes:
+                sizes[s.owner] += len(s.logins)
+
+        def load(aid: str, extra: int = 0) -> float:
+            return (sizes[aid] + extra) / self.agents[aid].capacity
+
+        changed: Set[str] = set()
+        if now >= self._recovery_until:
+            # ничьи шарды — крупные первыми, туда, где нагрузка после них меньше
+            for s in sorted((s for s in self.shards.values() if not s.owner), key=lambda s: -len(s.logins)):
+                aid = min(sizes, key=lambda a: load(a, len(s.logins)))
+                s.owner = aid
+                sizes[aid] += len(s.logins)
+                changed.add(aid)
+                CLUSTER_MOVES.inc("orphan")
+        # выравнивание: крупнейший шард, перенос которого уменьшает перекос
+        for _ in range(len(self.shards)):
+            src = max(sizes, key=load)
+            dst = min(sizes, key=load)
+            if load(src) - load(dst) <= BALANCE_SLACK * load(src):
+                break
+            best: Optional[Shard] = None
+            for s in self.shards.values():
+                n = len(s.logins)
+                if s.owner == src and not s.releasing and load(dst, n) < load(src):
+                    if best is None or n > len(best.logins):
+                        best = s
+            if best is None:
+                break
+            best.owner, best.releasing = dst, src
+            sizes[src] -= len(best.logins)
+            sizes[dst] += len(best.logins)
+            changed.update((src, dst))
+            CLUSTER_MOVES.inc("balance")
+        for aid in changed:
+            self._bump(aid)
+
+    def lease(self, aid: str) -> List[Dict[str, str]]:
+        out = []
+        for s in self.shards.values():
+            if s.owner == aid and not s.releasing:
+                for login in s.logins:
+                    a = self.by_login[login]
+                    out.append({f: getattr(a, f) for f in LEASE_FIELDS})
+        return out
+
+    def _campaigns_for(self, ag: AgentInfo) -> List[Dict[str, Any]]:
+        out = []
+        for c in self.catalog.all():
+            # записи неизменяемы: новая версия — новый объект
+            if ag.campaigns.get(c.id) is not c:
+                ag.campaigns[c.id] = c
+                out.append(dataclasses.asdict(c))
+        return out
+
+    def heartbeat(self, aid: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Принять отчёт агента и вернуть его аренду и обновления общих кэшей."""
+        now = self.clock.monotonic()
+        ag = self.agents.get(aid)
+        if ag is None:
+            ag = self.agents[aid] = AgentInfo(aid)
+            logger.info("Agent %s joined", aid)
+        ag.capacity = max(0.01, float(payload.get("capacity") or 1.0))
+        ag.last_seen = now
+        ag.running = set(payload.get("running") or ())
+        ag.metrics = payload.get("metrics") or ag.metrics
+        for line in payload.get("events") or ():
+            try:
+                ev = json.loads(line)
+                self.bus.publish(ev["login"], ev["kind"], ev.get("data") or {})
+            except (ValueError, KeyError, TypeError):
+                continue
+        for s in self.shards.values():
+            if s.releasing == aid and not ag.running.intersection(s.logins):
+                # старый владелец отпустил шард — можно выдавать новому
+                s.releasing = ""
+                self._bump(s.owner)
+            elif not s.owner and ag.running.intersection(s.logins):
+                # аккаунты уже крутятся у агента (рестарт координатора) — оставляем там
+                s.owner = aid
+                self._bump(aid)
+        if payload.get("campaigns"):
+            self.catalog.merge(payload["campaigns"])
+        if payload.get("ops"):
+            self.ops.update({str(k): str(v) for k, v in payload["ops"].items()})
+        self.rebalance()
+        reply: Dict[str, Any] = {
+            "lease_ttl": self.lease_ttl,
+            "epoch": ag.epoch,
+            "campaigns": self._campaigns_for(ag),
+            "ops": self.ops.ops,
+        }
+        if payload.get("epoch") != ag.epoch:
+            reply["accounts"] = self.lease(aid)
+        return reply
+
+    def leave(self, aid: str) -> None:
+        if aid in self.agents:
+            logger.info("Agent %s left", aid)
+            self._drop(aid)
+            self.rebalance()
+
+    # ── обзор фермы ──────────────────────────────────────────────────────────
+    def running(self) -> int:
+        """Аккаунтов, которые крутятся у своего нынешнего владельца (без переезжающих)."""
+        n = 0
+        for s in self.shards.values():
+            ag = self.agents.get(s.owner)
+            if ag is not None and not s.releasing:
+                n += len(ag.running.intersection(s.logins))
+        return n
+
+    def agent_rows(self) -> List[Dict[str, Any]]:
+        now = self.clock.monotonic()
+        rows = []
+        for aid, ag in self.agents.items():
+            owned = [s for s in self.shards.values() if s.owner == aid]
+            rows.append({
+                "id": aid,
+                "capacity": ag.capacity,
+                "shards": len(owned),
+                "accounts": sum(len(s.logins) for s in owned),
+                "running": len(ag.running),
+                "pending": sum(len(s.logins) for s in owned if s.releasing),
+                "last_seen_s": round(now - ag.last_seen, 1),
+            })
+        return rows
+
+    def account_rows(self) -> List[Dict[str, Any]]:
+        owner = {login: s.owner for s in self.shards.values() for login in s.logins}
+        rows = []
+        for a in self.accounts:
+            aid = owner.get(a.login, "")
+            ag = self.agents.get(aid)
+            row = self.fleet.row(a, ag is not None and a.login in ag.running)
+            row["agent"] = aid
+            rows.append(row)
+        return rows
+
+    def render_metrics(self) -> str:
+        texts = {"coordinator": REGISTRY.render()}
+        texts.update((aid, ag.metrics) for aid, ag in self.agents.items() if ag.metrics)
+        return merge_rendered(texts)
+
+    # ── HTTP ─────────────────────────────────────────────────────────────────
+    async def _handle(self, req: Request) -> Response:
+        if self.token and not hmac.compare_digest(req.headers.get(TOKEN_HEADER, ""), self.token):
+            return Response.json({"error": "bad cluster token"}, 403)
+        parts = [unquote(p) for p in req.path.strip("/").split("/") if p]
+        if req.method == "POST" and len(parts) == 3 and parts[0] == "agents":
+            if parts[2] == "leave":
+                self.leave(parts[1])
+                return Response.json({"ok": True})
+            if parts[2] == "heartbeat":
+                try:
+                    payload = req.json()
+                except ValueError:
+                    return Response.json({"error": "body is not valid JSON"}, 400)
+                if not isinstance(payload, dict):
+                    return Response.json({"error": "body must be a JSON object"}, 400)
+                return Response.json(self.heartbeat(parts[1], payload))
+            return Response.json({"error": "not found"}, 404)
+        if req.method != "GET":
+            return Response.json({"error": "method not allowed"}, 405)
+        if parts == ["agents"]:
+            return Response.json({"agents": self.agent_rows()})
+        if parts == ["accounts"]:
+            try:
+                flt = {k: v for k, v in req.query.items() if k in FILTER_FIELDS or k == "running"}
+                rows = [r for r in self.account_rows() if match(r, flt)]
+            except ValueError as e:
+                return Response.json({"error": str(e)}, 400)
+            agent = req.query.get("agent")
+            if agent is not None:
+                rows = [r for r in rows if r["agent"] == agent]
+            return Response.json({"total": len(rows), "accounts": rows})
+        if parts == ["metrics"]:
+            return Response(200, self.render_metrics().encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8")
+        if parts in ([], ["status"]):
+            return Response.json({
+                "agents": len(self.agents),
+                "accounts": len(self.accounts),
+                "shards": len(self.shards),
+                "unassigned": sum(len(s.logins) for s in self.shards.values() if not s.owner),
+                "running": self.running(),
+                **self.fleet.totals(),
+            })
+        return Response.json({"error": "not found"}, 404)
+
+    async def start(self) -> None:
+        await self.http.start()
+        CLUSTER_AGENTS.set_function(lambda: len(self.agents))
+        logger.info(
+            "Coordinator on %s:%s: %d accounts in %d proxy shards",
+            self.http.host, self.http.port, len(self.accounts), len(self.shards),
+        )
+
+    async def close(self) -> None:
+        await self.http.close()
+
+    def request_stop(self) -> None:
+        if self._done is not None:
+            self._done.set()
+
+    async def run(self) -> None:
+        self._done = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self.request_stop)
+            except (NotImplementedError, RuntimeError):
+                pass
+        sink = JsonlSink(Path(self.events_log), self.bus) if self.events_log else None
+        sink_task = asyncio.ensure_future(sink.run()) if sink else None
+        await self.start()
+        try:
+            # пропавших агентов замечаем и без чужих heartbeat
+            while not await self.clock.wait_event(self._done, self.lease_ttl / 4):
+                self.rebalance()
+        finally:
+            await self.close()
+            if sink is not None:
+                sink.close()
+                await sink_task
+
+
+class Agent:
+    """Runs on each machine: heartbeats the coordinator and runs the leased shards.
+
+    ``runner`` is a ``HeadlessRunner`` started without an accounts file; the
+    agent adds and removes its accounts as the lease changes. When the lease
+    is not renewed the agent stops everything at ``fence_at()``, shortly
+    before the coordinator may give the shards to someone else.
+    """
+
+    def __init__(
+        self,
+        runner: Any,
+        coordinator: str,
+        agent_id: str = "",
+        capacity: float = 1.0,
+        token: str = "",
+        interval: float = HEARTBEAT,
+        clock: Clock = SYSTEM_CLOCK,
+        catalog: Optional[CampaignCatalog] = None,
+        ops: Optional[OpsRegistry] = None,
+    ):
+        self.runner = runner
+        self.host, self.port = parse_addr(coordinator)
+        self.id = agent_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.capacity = capacity
+        self.token = token
+        self.interval = interval
+        self.clock = clock
+        self.catalog = catalog or get_catalog()
+        self.ops = ops or get_registry()
+        self.lease_ttl = LEASE_TTL
+        self.epoch: Optional[int] = None
+        self.leased: Set[str] = set()
+        self.last_ok: Optional[float] = None
+        self._sub: Optional[Subscription] = None
+        self._unsent: List[str] = []
+        self._sent_campaigns: Dict[str, Campaign] = {}
+        # хэши, которые координатор уже знает; None — ещё не синхронизировались
+        self._synced_ops: Optional[Dict[str, str]] = None
+
+    def _headers(self) -> Dict[str, str]:
+        h = {"Content-Type": "application/json"}
+        if self.token:
+            h[TOKEN_HEADER] = self.token
+        return h
+
+    def _collect_events(self) -> List[str]:
+        sub = self._sub
+        if sub is not None:
+            while not sub.empty():
+                self._unsent.append(sub.get_nowait().to_json())
+        if len(self._unsent) > MAX_BACKLOG:
+            lost = len(self._unsent) - MAX_BACKLOG
+            del self._unsent[:lost]
+            logger.warning("Coordinator unreachable: dropped %d oldest events", lost)
+        return self._unsent[:MAX_EVENTS]
+
+    def _payload(self) -> Tuple[Dict[str, Any], List[str], List[Campaign]]:
+        events = self._collect_events()
+        camps = [c for c in self.catalog.all() if self._sent_campaigns.get(c.id) is not c]
+        ops: Dict[str, str] = {}
+        if self._synced_ops is not None:
+            # только то, что нашли здесь: чужие старые хэши не должны затереть свежие
+            ops = {k: v for k, v in self.ops.ops.items() if self._synced_ops.get(k) != v}
+        payload = {
+            "capacity": self.capacity,
+            "epoch": self.epoch,
+            "running": [login for login, t in self.runner.tasks.items() if not t.done()],
+            "events": events,
+            "metrics": REGISTRY.render(),
+            "campaigns": [dataclasses.asdict(c) for c in camps],
+            "ops": ops,
+        }
+        return payload, events, camps
+
+    def _apply(self, accounts: Iterable[Dict[str, Any]]) -> None:
+        runner = self.runner
+        want = {str(d["login"]): d for d in accounts}
+        gone = [a.login for a in runner.accounts if a.login not in want]
+        for login in gone:
+            # без STOP_GRACE: шард уже может быть у другого агента (или будет — после фенсинга),
+            # а недоотменённый воркер не попадает в running и не держит передачу шарда
+            runner.stop_account(login, grace=0)
+        runner.accounts[:] = [a for a in runner.accounts if a.login in want]
+        have = {a.login for a in runner.accounts}
+        added = [login for login in want if login not in have]
+        for login in added:
+            d = want[login]
+            runner.accounts.append(Account(**{f: str(d.get(f) or "") for f in LEASE_FIELDS}))
+        self.leased = set(want)
+        if gone or added:
+            logger.info("Lease: +%d -%d accounts, %d total", len(added), len(gone), len(self.leased))
+
+    def fence_at(self) -> Optional[float]:
+        """Момент (clock.monotonic), когда аренда считается потерянной; None — её нет.
+
+        Отсчёт от отправки последнего удачного отчёта, то есть не позже, чем
+        его получил координатор, и с запасом FENCE_MARGIN: к тому времени,
+        когда координатор раздаст шарды другим, здесь они уже остановлены.
+        """
+        if self.last_ok is None or not self.leased:
+            return None
+        return self.last_ok + self.lease_ttl * (1 - FENCE_MARGIN)
+
+    def _fence(self) -> None:
+        deadline = self.fence_at()
+        if deadline is None or self.clock.monotonic() < deadline:
+            return
+        logger.error("Lease expired: coordinator unreachable for %.0fs, stopping %d accounts",
+                     self.clock.monotonic() - (self.last_ok or 0.0), len(self.leased))
+        self._apply(())
+        self.epoch = None
+
+    async def _fence_loop(self) -> None:
+        """Свой таймер: зависший на сети heartbeat не должен отодвигать остановку."""
+        while True:
+            deadline = self.fence_at()
+            wait = self.interval if deadline is None else deadline - self.clock.monotonic()
+            await self.clock.sleep(max(0.0, min(wait, self.interval)))
+            self._fence()
+
+    async def heartbeat(self) -> bool:
+        payload, events, camps = self._payload()
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        # аренда отсчитывается от отправки: координатор её продлит не раньше
+        sent_at = self.clock.monotonic()
+        # ответ, пришедший после остановки по аренде, уже не продлит её
+        timeout = self.lease_ttl / 2
+        deadline = self.fence_at()
+        if deadline is not None:
+            timeout = max(0.1, min(timeout, deadline - sent_at))
+        try:
+            status, raw = await fetch(
+                self.host, self.port, "POST", f"/agents/{quote(self.id, safe='')}/heartbeat",
+                body, self._headers(), timeout=timeout,
+            )
+            if status != 200:
+                raise ConnectionError(f"coordinator answered HTTP {status}")
+            reply = json.loads(raw)
+        except (OSError, asyncio.TimeoutError, ValueError) as e:
+            logger.warning("Heartbeat to %s:%s failed: %s", self.host, self.port, e)
+            self._fence()
+            return False
+        self.last_ok = sent_at
+        del self._unsent[:len(events)]
+        for c in camps:
+            self._sent_campaigns[c.id] = c
+        self.lease_ttl = float(reply.get("lease_ttl") or self.lease_ttl)
+        for c in self.catalog.merge(reply.get("campaigns") or ()):
+            self._sent_campaigns[c.id] = c
+        ops = reply.get("ops")
+        if isinstance(ops, dict):
+            self.ops.update(ops, persist=False)
+            self._synced_ops = dict(ops)
+        if "accounts" in reply:
+            self._apply(reply["accounts"])
+            self.epoch = reply.get("epoch")
+        # не запущенные (например, пока шла волна ramp-up) — добираем на каждом отчёте
+        todo = [login for login in self.leased if login not in self.runner.tasks]
+        if todo:
+            self.runner.start_many(todo)
+        return True
+
+    async def leave(self) -> None:
+        try:
+            await fetch(self.host, self.port, "POST", f"/agents/{quote(self.id, safe='')}/leave",
+                        b"", self._headers(), timeout=2.0)
+        except (OSError, asyncio.TimeoutError):
+            pass
+
+    async def run(self) -> None:
+        runner_task = asyncio.ensure_future(self.runner.run())
+        while self.runner.queue is None and not runner_task.done():
+            await asyncio.sleep(0)
+        if runner_task.done():
+            await runner_task
+            return
+        self._sub = self.runner.queue.subscribe()
+        logger.info("Agent %s: coordinator %s:%s", self.id, self.host, self.port)
+        fencer = asyncio.ensure_future(self._fence_loop())
+        try:
+            while not runner_task.done():
+                await self.heartbeat()
+                await asyncio.wait({runner_task}, timeout=self.interval)
+        finally:
+            fencer.cancel()
+            self._sub.close()
+            await self.leave()
+        await runner_task
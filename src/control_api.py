@@ -0,0 +1,405 @@
+from __future__ import annotations
+
+import asyncio
+import fnmatch
+import hmac
+import logging
+import os
+import secrets
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List, Set, Tuple
+from urllib.parse import unquote
+
+from .events import Event, Subscription
+from .httpd import HttpServer, Request, Response
+from .proxy_health import redact
+from .types import Account
+
+logger = logging.getLogger(__name__)
+
+# пустая строка в поток событий раз в столько секунд: так замечаем отвалившихся клиентов
+KEEPALIVE = 15.0
+# строковые поля, по которым фильтруют (glob, без учёта регистра)
+FILTER_FIELDS = ("login", "label", "status", "proxy", "game", "campaign")
+COMMANDS = ("campaigns", "switch")
+# TCP-порт открыт любой странице в локальном браузере: без токена в заголовке — 401
+TOKEN_HEADER = "x-control-token"
+# без --control-token токен генерируется и пишется сюда (права 0600)
+TOKEN_FILE = Path("state") / "control.token"
+LOOPBACK_HOSTS = ("127.0.0.1", "localhost", "::1")
+
+
+def _as_bool(v: Any) -> bool:
+    if isinstance(v, str):
+        return v.strip().lower() in ("1", "true", "yes", "on")
+    return bool(v)
+
+
+def _error(msg: str, status: int = 400) -> Response:
+    return Response.json({"error": msg}, status)
+
+
+def _host_name(host: str) -> str:
+    """Имя из заголовка Host без порта: ``[::1]:8080`` -> ``::1``."""
+    host = host.strip().lower()
+    if host.startswith("["):
+        return host[1:].partition("]")[0]
+    return host.rpartition(":")[0] if host.count(":") == 1 else host
+
+
+def write_token(path: Path = TOKEN_FILE) -> str:
+    """Новый случайный токен в файл, доступный только владельцу."""
+    token = secrets.token_urlsafe(24)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(token + "\n")
+    os.chmod(path, 0o600)
+    return token
+
+
+class FleetState:
+    """Last known state of every account, folded from bus events.
+
+    Subscribed with ``bus.listen(state.on_event)``; rows combine it with what
+    only the runner knows (whether the worker runs, Stopped/Idle).
+    """
+
+    def __init__(self, accounts: List[Account]):
+        self.state: Dict[str, Dict[str, Any]] = {a.login: self._initial(a) for a in accounts}
+
+    @staticmethod
+    def _initial(a: Account) -> Dict[str, Any]:
+        return {
+            "status": "",
+            "note": "",
+            "campaign": a.active_campaign,
+            "game": a.game,
+            "pct": a.progress_pct,
+            "remain": a.remaining_minutes,
+            "last_claim": a.last_claim_at,
+            "claimed": 0,
+            "errors": 0,
+            "last_error": "",
+            "proxy": a.proxy,
+        }
+
+    def on_event(self, ev: Event) -> None:
+        st = self.state.get(ev.login)
+        if st is None:
+            # аккаунт добавили после старта (аренда агента кластера)
+            st = self.state[ev.login] = self._initial(Account(ev.login, ev.login))
+        p = ev.data
+        kind = ev.kind
+        if kind == "status":
+            st["status"] = p.get("status", "") or ""
+            st["note"] = p.get("note", "") or ""
+        elif kind == "campaign":
+            st["campaign"] = p.get("camp", "") or ""
+            st["game"] = p.get("game", "") or ""
+        elif kind in ("progress", "claimed"):
+            st["pct"] = float(p.get("pct", 0) or 0)
+            st["remain"] = int(p.get("remain", 0) or 0)
+            if kind == "claimed":
+                st["claimed"] += 1
+                st["last_claim"] = p.get("at")
+        elif kind == "last_claim":
+            st["last_claim"] = p.get("at")
+        elif kind == "proxy":
+            st["proxy"] = p.get("proxy") or st["proxy"]
+        elif kind == "error":
+            st["errors"] += 1
+            st["last_error"] = p.get("msg", "") or ""
+
+    def row(self, a: Account, running: bool) -> Dict[str, Any]:
+        st = self.state.get(a.login)
+        if st is None:
+            st = self.state[a.login] = self._initial(a)
+        # Stopped/Idle знает только раннер; пока воркер жив — последний статус от него
+        status = (st["status"] or a.status) if running or a.status == "Running" else a.status
+        return {
+            "login": a.login,
+            "label": a.label,
+            "status": status,
+            "note": st["note"],
+            "running": running,
+            "proxy": redact(st["proxy"] or ""),
+            "campaign": st["campaign"],
+            "game": st["game"],
+            "progress_pct": st["pct"],
+            "remaining_minutes": st["remain"],
+            "last_claim_at": st["last_claim"],
+            "claimed": st["claimed"],
+            "errors": st["errors"],
+            "last_error": st["last_error"],
+        }
+
+    def totals(self) -> Dict[str, int]:
+        return {
+            "claimed": sum(st["claimed"] for st in self.state.values()),
+            "errors": sum(st["errors"] for st in self.state.values()),
+        }
+
+
+def match(row: Dict[str, Any], flt: Dict[str, Any]) -> bool:
+    """Строка аккаунта подходит под фильтр: glob по FILTER_FIELDS и ``running``."""
+    for key, want in flt.items():
+        if key == "running":
+            if _as_bool(want) != row["running"]:
+                return False
+        elif key in FILTER_FIELDS:
+            if not fnmatch.fnmatchcase(str(row[key] or "").lower(), str(want).lower()):
+                return False
+        else:
+            raise ValueError(f"unknown filter: {key}")
+    return True
+
+
+class ControlServer:
+    """Local JSON control plane for a runner (``HeadlessRunner`` or ``MainWindow``).
+
+    Uses only what both runners share: ``accounts``, ``tasks``, ``cmds``,
+    ``queue`` (the ``EventBus``), ``start_account``/``start_many``/
+    ``stop_account`` and ``ramp``. Account state comes from a bus listener,
+    so it is the same whether or not a GUI is drawing it.
+
+    ``GET /accounts`` lists accounts, ``POST /accounts/{start,stop,campaigns,switch}``
+    act on a selection (``logins``, ``filter`` or ``all``) in one call, and
+    ``/accounts/<login>/<action>`` does the same for one account.
+    ``GET /events`` streams events as NDJSON.
+
+    Over TCP every request needs ``X-Control-Token`` and a loopback ``Host``
+    (no DNS rebinding); without ``token`` one is generated into
+    ``state/control.token``. The Unix socket is guarded by its 0600 mode and
+    checks the token only when one is given. Request bodies must be
+    ``application/json``, so a cross-site ``text/plain`` form POST is refused.
+    """
+
+    def __init__(self, runner: Any, port: int = 0, host: str = "127.0.0.1", path: str = "", token: str = ""):
+        self.runner = runner
+        self.http = HttpServer(self._handle, host, port, path)
+        self.token = token
+        self.token_file = None
+        if not token and not path:
+            self.token = write_token()
+            self.token_file = TOKEN_FILE
+        self.fleet = FleetState(runner.accounts)
+        self._streams: Set[Subscription] = set()
+        runner.queue.listen(self.fleet.on_event)
+
+    @property
+    def port(self) -> int:
+        return self.http.port
+
+    def _running(self, login: str) -> bool:
+        task = self.runner.tasks.get(login)
+        return task is not None and not task.done()
+
+    def _row(self, a: Account) -> Dict[str, Any]:
+        return self.fleet.row(a, self._running(a.login))
+
+    # ── выборка аккаунтов ────────────────────────────────────────────────────
+    def _select(self, body: Any) -> Tuple[List[Dict[str, Any]], List[str]]:
+        """(строки выбранных аккаунтов, неизвестные логины) по ``logins``/``filter``/``all``."""
+        if not isinstance(body, dict):
+            raise ValueError("body must be a JSON object")
+        logins = body.get("logins")
+        flt = body.get("filter") or {}
+        if logins is None and not flt and not body.get("all"):
+            # пустое тело не должно значить «все»: так легко остановить ферму по ошибке
+            raise ValueError("nothing selected: pass logins, filter or all")
+        if not isinstance(flt, dict):
+            raise ValueError("filter must be an object")
+        unknown: List[str] = []
+        if logins is not None:
+            if not isinstance(logins, list):
+                raise ValueError("logins must be a list")
+            by_login = {a.login: a for a in self.runner.accounts}
+            accs = []
+            for login in dict.fromkeys(str(x) for x in logins):
+                a = by_login.get(login)
+                if a is None:
+                    unknown.append(login)
+                else:
+                    accs.append(a)
+        else:
+            accs = list(self.runner.accounts)
+        rows = [self._row(a) for a in accs]
+        if flt:
+            rows = [r for r in rows if match(r, flt)]
+        return rows, unknown
+
+    # ── действия ─────────────────────────────────────────────────────────────
+    def _start(self, rows: List[Dict[str, Any]], unknown: List[str]) -> Response:
+        todo = [r["login"] for r in rows if not r["running"]]
+        ramp = getattr(self.runner, "ramp", None)
+        if todo and ramp is not None and not ramp.done:
+            return _error("ramp-up in progress, try again later", 409)
+        for login in todo:
+            if login in self.runner.tasks:
+                # воркер уже сам завершился — убрать его, иначе повторный старт не пройдёт
+                self.runner.stop_account(login)
+        # тысячи аккаунтов — одним вызовом раннера, волнами, если включён ramp
+        self.runner.start_many(todo)
+        return Response.json({"started": len(todo), "already_running": len(rows) - len(todo), "unknown": unknown})
+
+    def _stop(self, rows: List[Dict[str, Any]], unknown: List[str]) -> Response:
+        stopped = 0
+        for r in rows:
+            if r["login"] in self.runner.tasks:
+                self.runner.stop_account(r["login"])
+                stopped += 1
+        return Response.json({"stopped": stopped, "not_running": len(rows) - stopped, "unknown": unknown})
+
+    def _command(self, action: str, body: Dict[str, Any], rows: List[Dict[str, Any]], unknown: List[str]) -> Response:
+        if action == "campaigns":
+            ids = body.get("campaigns")
+            if not isinstance(ids, list) or not all(isinstance(x, str) for x in ids):
+                return _error("campaigns must be a list of campaign ids")
+            cmd: Tuple[str, Any] = ("select_campaigns", ids)
+        else:
+            channel = body.get("channel")
+            if not isinstance(channel, str) or not channel:
+                return _error("channel is required")
+            cmd = ("switch", channel)
+        selected = getattr(self.runner, "selected_campaigns", None)
+        sent = 0
+        for r in rows:
+            if action == "campaigns" and selected is not None:
+                # GUI помнит выбор для диалога кампаний
+                selected[r["login"]] = list(cmd[1])
+            q = self.runner.cmds.get(r["login"])
+            if q is not None and r["running"]:
+                q.put_nowait(cmd)
+                sent += 1
+        return Response.json({"sent": sent, "not_running": len(rows) - sent, "unknown": unknown})
+
+    def _summary(self) -> Dict[str, Any]:
+        by_status: Dict[str, int] = {}
+        running = 0
+        for a in self.runner.accounts:
+            row = self._row(a)
+            by_status[row["status"]] = by_status.get(row["status"], 0) + 1
+            running += row["running"]
+        return {
+            "accounts": len(self.runner.accounts),
+            "running": running,
+            "by_status": by_status,
+            **self.fleet.totals(),
+        }
+
+    # ── поток событий ────────────────────────────────────────────────────────
+    async def _events(self, sub: Subscription, login: str) -> AsyncIterator[bytes]:
+        pattern = login.lower()
+        try:
+            while True:
+                try:
+                    ev = await asyncio.wait_for(sub.get(), KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield b"\n"
+                    continue
+                except asyncio.QueueEmpty:
+                    return
+                batch = [ev]
+                while not sub.empty():
+                    batch.append(sub.get_nowait())
+                lines = [e.to_json() for e in batch if not pattern or fnmatch.fnmatchcase(e.login.lower(), pattern)]
+                if lines:
+                    yield ("\n".join(lines) + "\n").encode("utf-8")
+        finally:
+            self._streams.discard(sub)
+            sub.close()
+
+    def _refuse(self, req: Request) -> Response | None:
+        """Ответ-отказ, если запрос не от владельца; None — пропускаем."""
+        if not self.http.path and _host_name(req.headers.get("host", "")) not in LOOPBACK_HOSTS:
+            return _error("host not allowed", 403)
+        if self.token and not hmac.compare_digest(req.headers.get(TOKEN_HEADER, ""), self.token):
+            return _error("missing or wrong token", 401)
+        if req.body:
+            ctype = req.headers.get("content-type", "").partition(";")[0].strip().lower()
+            if ctype != "application/json":
+                return _error("body must be application/json", 415)
+        return None
+
+    # ── маршруты ─────────────────────────────────────────────────────────────
+    async def _handle(self, req: Request) -> Response:
+        refused = self._refuse(req)
+        if refused is not None:
+            return refused
+        parts = [unquote(p) for p in req.path.strip("/").split("/") if p]
+        if parts in ([], ["status"]):
+            if req.method != "GET":
+                return _error("method not allowed", 405)
+            return Response.json(self._summary())
+        if parts == ["events"]:
+            if req.method != "GET":
+                return _error("method not allowed", 405)
+            kinds = [k for k in req.query.get("kinds", "").split(",") if k] or None
+            sub = self.runner.queue.subscribe(kinds=kinds)
+            self._streams.add(sub)
+            return Response(200, content_type="application/x-ndjson", stream=self._events(sub, req.query.get("login", "")))
+        if not parts or parts[0] != "accounts" or len(parts) > 3:
+            return _error("not found", 404)
+
+        if req.method == "GET":
+            if len(parts) == 1:
+                try:
+                    flt = {k: v for k, v in req.query.items() if k in FILTER_FIELDS or k == "running"}
+                    rows = [r for r in (self._row(a) for a in self.runner.accounts) if match(r, flt)]
+                except ValueError as e:
+                    return _error(str(e))
+                return Response.json({"total": len(rows), "accounts": rows})
+            if len(parts) == 2:
+                a = next((a for a in self.runner.accounts if a.login == parts[1]), None)
+                if a is None:
+                    return _error(f"unknown account: {parts[1]}", 404)
+                return Response.json(self._row(a))
+            return _error("method not allowed", 405)
+        if req.method != "POST" or len(parts) == 1:
+            return _error("method not allowed", 405)
+
+        try:
+            body = req.json() or {}
+        except ValueError:
+            return _error("body is not valid JSON")
+        if not isinstance(body, dict):
+            return _error("body must be a JSON object")
+        if len(parts) == 3:
+            # /accounts/<login>/<action> — то же, что выборка из одного логина
+            if not any(a.login == parts[1] for a in self.runner.accounts):
+                return _error(f"unknown account: {parts[1]}", 404)
+            body = dict(body, logins=[parts[1]])
+            body.pop("filter", None)
+        action = parts[-1]
+        if action not in ("start", "stop", *COMMANDS):
+            return _error("not found", 404)
+        try:
+            rows, unknown = self._select(body)
+        except ValueError as e:
+            return _error(str(e))
+        if action == "start":
+            return self._start(rows, unknown)
+        if action == "stop":
+            return self._stop(rows, unknown)
+        return self._command(action, body, rows, unknown)
+
+    async def start(self) -> bool:
+        try:
+            await self.http.start()
+        except OSError as exc:
+            logger.error("Control API on %s not started: %s", self.http.path or self.http.port, exc)
+            return False
+        if self.http.path:
+            logger.info("Control API on unix:%s", self.http.path)
+        else:
+            logger.info("Control API on http://%s:%s/", self.http.host, self.http.port)
+        if self.token_file is not None:
+            logger.info("Control API token (header %s) is in %s", TOKEN_HEADER, self.token_file)
+        return True
+
+    async def close(self) -> None:
+        # открытые потоки событий держат соединения — закрываем их первыми
+        for sub in list(self._streams):
+            sub.close()
+        await self.http.close()
@@ -0,0 +1,368 @@
+from __future__ import annotations
+
+import asyncio
+import dataclasses
+import json
+import logging
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, Hashable, Iterable, Iterator, List, Optional, Set, Tuple, Type
+
+from .clock import SYSTEM_CLOCK, Clock
+from .metrics import EVENTS_DROPPED, EVENTS_PUBLISHED
+
+logger = logging.getLogger(__name__)
+
+# сколько событий ждёт одного подписчика, пока он не разберёт очередь
+CAPACITY = 10_000
+# ошибки аккаунта: не больше ERROR_BURST за ERROR_WINDOW секунд, остальные — счётчиком
+ERROR_BURST = 5
+ERROR_WINDOW = 60.0
+
+# политики доставки по виду события
+LATEST = "latest"  # последнее значение на (login, kind) вытесняет неразобранное
+LIMITED = "limited"  # ограничение частоты с подсчётом подавленных
+ALWAYS = "always"  # доставляется всегда, даже сверх ёмкости
+QUEUED = "queued"  # по порядку; при переполнении вытесняется старейшее
+
+POLICIES: Dict[str, str] = {
+    "status": LATEST,
+    "progress": LATEST,
+    "campaign": LATEST,
+    "campaigns": LATEST,
+    "channels": LATEST,
+    "last_claim": LATEST,
+    "proxy": LATEST,
+    "error": LIMITED,
+    "claimed": ALWAYS,
+}
+
+
+class _Payload:
+    """Доступ к полям записи как к ключам dict — для потребителей вида ``p.get("msg")``."""
+
+    __slots__ = ()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return getattr(self, key, default)
+
+    def __getitem__(self, key: str) -> Any:
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+
+@dataclasses.dataclass(slots=True)
+class StatusData(_Payload):
+    status: str = ""
+    note: str = ""
+
+
+@dataclasses.dataclass(slots=True)
+class ProgressData(_Payload):
+    pct: float = 0.0
+    remain: int = 0
+    drop: str = ""
+
+
+@dataclasses.dataclass(slots=True)
+class ClaimedData(_Payload):
+    drop: str = ""
+    at: str = ""
+    pct: float = 100.0
+    remain: int = 0
+
+
+@dataclasses.dataclass(slots=True)
+class ErrorData(_Payload):
+    msg: str = ""
+    # сводка: сколько ошибок аккаунта ограничитель не пропустил за окно
+    suppressed: int = 0
+
+
+# типизированные данные частых видов; остальные ходят как dict
+PAYLOADS: Dict[str, Type[_Payload]] = {
+    "status": StatusData,
+    "progress": ProgressData,
+    "claimed": ClaimedData,
+    "error": ErrorData,
+}
+
+
+def payload(kind: str, data: Any) -> Any:
+    """Данные события частого вида — записью; dict (из JSON кластера, старых воркеров) переводится."""
+    cls = PAYLOADS.get(kind)
+    if cls is None or not isinstance(data, dict):
+        return data
+    names = cls.__slots__
+    return cls(**{k: v for k, v in data.items() if k in names})
+
+
+class Event:
+    """One worker event: ``(login, kind, data)`` plus publish time.
+
+    ``data`` is a typed record for the hot kinds (see ``PAYLOADS``) and a
+    plain dict for the rest.
+
+    Unpacks and indexes like the old 3-tuple, so queue consumers written as
+    ``login, kind, p = await queue.get()`` keep working.
+    """
+
+    __slots__ = ("login", "kind", "data", "ts")
+
+    def __init__(self, login: str, kind: str, data: Any, ts: float = 0.0):
+        self.login = login
+        self.kind = kind
+        self.data = data
+        self.ts = ts
+
+    def __iter__(self) -> Iterator[Any]:
+        yield self.login
+        yield self.kind
+        yield self.data
+
+    def __getitem__(self, i: int) -> Any:
+        return (self.login, self.kind, self.data)[i]
+
+    def __repr__(self) -> str:
+        return f"Event({self.login!r}, {self.kind!r}, {self.data!r})"
+
+    def to_json(self) -> str:
+        return json.dumps(
+            {"ts": self.ts, "login": self.login, "kind": self.kind, "data": self.data},
+            ensure_ascii=False,
+            default=_jsonable,
+        )
+
+
+def _jsonable(obj: Any) -> Any:
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        return dataclasses.asdict(obj)
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    return str(obj)
+
+
+class Subscription:
+    """Bounded buffer of one consumer with the per-kind delivery policies."""
+
+    def __init__(self, bus: "EventBus", capacity: int, kinds: Optional[Iterable[str]] = None):
+        self.bus = bus
+        self.capacity = capacity
+        self.kinds = frozenset(kinds) if kinds is not None else None
+        # ключ LATEST — (login, kind): новое значение встаёт на место старого
+        self._pending: "OrderedDict[Hashable, Event]" = OrderedDict()
+        self._seq = 0
+        self._waiter: Optional[asyncio.Future] = None
+        self.closed = False
+
+    def qsize(self) -> int:
+        return len(self._pending)
+
+    def empty(self) -> bool:
+        return not self._pending
+
+    def _offer(self, ev: Event, policy: str) -> None:
+        if self.closed or (self.kinds is not None and ev.kind not in self.kinds):
+            return
+        pending = self._pending
+        if policy == LATEST:
+            key: Hashable = (ev.login, ev.kind)
+            if key in pending:
+                # порядок — по последнему значению: оно не обгонит более раннее событие
+                pending[key] = ev
+                pending.move_to_end(key)
+                EVENTS_DROPPED.inc(ev.kind, "coalesced")
+                return
+        else:
+            self._seq += 1
+            key = self._seq
+        if len(pending) >= self.capacity and policy != ALWAYS and not self._evict():
+            EVENTS_DROPPED.inc(ev.kind, "overflow")
+            return
+        pending[key] = ev
+        w = self._waiter
+        if w is not None and not w.done():
+            w.set_result(None)
+
+    def _evict(self) -> bool:
+        """Освободить место: выкинуть старейшее событие, кроме гарантированных."""
+        for key, old in self._pending.items():
+            if POLICIES.get(old.kind, QUEUED) != ALWAYS:
+                del self._pending[key]
+                EVENTS_DROPPED.inc(old.kind, "overflow")
+                return True
+        return False
+
+    def get_nowait(self) -> Event:
+        if not self._pending:
+            raise asyncio.QueueEmpty
+        return self._pending.popitem(last=False)[1]
+
+    async def _wait(self) -> bool:
+        """Дождаться события; False — подписка закрыта и разобрана."""
+        while not self._pending:
+            if self.closed:
+                return False
+            self._waiter = asyncio.get_running_loop().create_future()
+            try:
+                await self._waiter
+            finally:
+                self._waiter = None
+        return True
+
+    async def get(self) -> Event:
+        if not await self._wait():
+            raise asyncio.QueueEmpty
+        return self._pending.popitem(last=False)[1]
+
+    def __aiter__(self) -> "Subscription":
+        return self
+
+    async def __anext__(self) -> Event:
+        if not await self._wait():
+            raise StopAsyncIteration
+        return self._pending.popitem(last=False)[1]
+
+    def close(self) -> None:
+        self.closed = True
+        self.bus.unsubscribe(self)
+        w = self._waiter
+        if w is not None and not w.done():
+            w.set_result(None)
+
+
+class EventBus:
+    """Fan-out of worker events to bounded, coalescing subscriber buffers.
+
+    Workers publish ``(login, kind, data)``; every subscriber (GUI, JSONL log,
+    remote sockets) gets its own buffer, so a stalled consumer only loses its
+    own stale status/progress updates. ``status``/``progress`` and friends keep
+    the last value per login, ``claimed`` is never dropped. Errors are
+    rate-limited per login; once a window that suppressed some expires,
+    subscribers get one summary ``ErrorData`` with the count — on the next
+    publish from any login or an explicit ``sweep()``. Listeners see every
+    event synchronously before any coalescing (and no summaries).
+
+    The bus also acts as the old worker queue: ``put``/``put_nowait`` publish,
+    ``get``/``qsize`` read the default subscription.
+    """
+
+    def __init__(self, capacity: int = CAPACITY, clock: Clock = SYSTEM_CLOCK):
+        self.capacity = capacity
+        self.clock = clock
+        self._subs: List[Subscription] = []
+        self._listeners: List[Callable[[Event], None]] = []
+        # login -> (начало окна, выпущено в окне, подавлено)
+        self._errors: Dict[str, List[float]] = {}
+        # логины с подавленными ошибками и ближайший конец их окон
+        self._suppressed: Set[str] = set()
+        self._sweep_at = float("inf")
+        self.default = self.subscribe()
+
+    def subscribe(self, capacity: Optional[int] = None, kinds: Optional[Iterable[str]] = None) -> Subscription:
+        sub = Subscription(self, capacity or self.capacity, kinds)
+        self._subs.append(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        if sub in self._subs:
+            self._subs.remove(sub)
+
+    def listen(self, fn: Callable[[Event], None]) -> None:
+        self._listeners.append(fn)
+
+    def _limit_error(self, ev: Event) -> bool:
+        """False — ошибку подавить (и посчитать для сводки по окну)."""
+        now = self.clock.monotonic()
+        st = self._errors.get(ev.login)
+        if st is None or now - st[0] >= ERROR_WINDOW:
+            st = self._errors[ev.login] = [now, 0, 0]
+        if st[1] >= ERROR_BURST:
+            if not st[2]:
+                self._suppressed.add(ev.login)
+                self._sweep_at = min(self._sweep_at, st[0] + ERROR_WINDOW)
+            st[2] += 1
+            EVENTS_DROPPED.inc(ev.kind, "rate_limited")
+            return False
+        st[1] += 1
+        return True
+
+    def sweep(self) -> None:
+        """Разослать сводки по истёкшим окнам, в которых ошибки подавлялись."""
+        now = self.clock.monotonic()
+        if now < self._sweep_at:
+            return
+        self._sweep_at = float("inf")
+        for login in list(self._suppressed):
+            st = self._errors[login]
+            end = st[0] + ERROR_WINDOW
+            if now < end:
+                self._sweep_at = min(self._sweep_at, end)
+                continue
+            self._suppressed.discard(login)
+            del self._errors[login]
+            n = int(st[2])
+            ev = Event(login, "error", ErrorData(f"{n} errors suppressed", n), self.clock.time())
+            for sub in self._subs:
+                sub._offer(ev, LIMITED)
+
+    def publish(self, login: str, kind: str, data: Any = None) -> None:
+        self.sweep()
+        ev = Event(login, kind, payload(kind, data if data is not None else {}), self.clock.time())
+        EVENTS_PUBLISHED.inc(kind)
+        for fn in self._listeners:
+            try:
+                fn(ev)
+            except Exception:
+                logger.exception("event listener failed on %s", kind)
+        policy = POLICIES.get(kind, QUEUED)
+        if policy == LIMITED and not self._limit_error(ev):
+            return
+        for sub in self._subs:
+            sub._offer(ev, policy)
+
+    # ── совместимость с asyncio.Queue воркеров ───────────────────────────────
+    def put_nowait(self, item: Tuple[str, str, Any]) -> None:
+        self.publish(*item)
+
+    async def put(self, item: Tuple[str, str, Any]) -> None:
+        self.publish(*item)
+
+    def qsize(self) -> int:
+        return self.default.qsize()
+
+    def empty(self) -> bool:
+        return self.default.empty()
+
+    def get_nowait(self) -> Event:
+        return self.default.get_nowait()
+
+    async def get(self) -> Event:
+        return await self.default.get()
+
+
+class JsonlSink:
+    """Подписчик, дописывающий события в JSONL-файл (по строке на событие).
+
+    ``run()`` крутится до ``close()``, потом дописывает остаток и выходит.
+    """
+
+    def __init__(self, path: Path, bus: EventBus, capacity: Optional[int] = None):
+        self.path = Path(path)
+        self.sub = bus.subscribe(capacity)
+
+    async def run(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.path.open("a", encoding="utf-8") as f:
+            async for ev in self.sub:
+                lines = [ev.to_json()]
+                # что накопилось — одной записью
+                while not self.sub.empty():
+                    lines.append(self.sub.get_nowait().to_json())
+                f.write("\n".join(lines) + "\n")
+                f.flush()
+
+    def close(self) -> None:
+        self.sub.close()
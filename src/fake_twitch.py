@@ -0,0 +1,455 @@
+"""Local stand-in for gql.twitch.tv, www.twitch.tv channel pages, spade, HLS and PubSub.
+
+``FakeTwitch`` holds the simulated backend (campaigns, per-account drop
+progress, failure injection) and has no I/O; ``FakeTwitchServer`` exposes it
+over aiohttp so unmodified ``TwitchAPI``/``run_account`` can run against it::
+
+    python -m src.fake_twitch --port 8089 --latency-ms 80 --rate-429 0.02
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import random
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from aiohttp import web
+
+
+@dataclass
+class FakeConfig:
+    latency_ms: float = 0.0
+    latency_jitter_ms: float = 0.0
+    # добавка к задержке Inventory — «медленный» GQL для проверки, что биконы его не ждут
+    inventory_latency_ms: float = 0.0
+    # вероятность ответа 429/5xx/integrity на GQL-запрос
+    rate_429: float = 0.0
+    rate_5xx: float = 0.0
+    rate_integrity: float = 0.0
+    # «пачки» 429: каждые burst_every секунд на burst_len секунд все GQL → 429
+    burst_every: float = 0.0
+    burst_len: float = 0.0
+    campaigns: int = 2
+    channels_per_campaign: int = 3
+    required_minutes: int = 15
+    # сколько дропов в кампании завершаются одновременно (все клеймятся отдельно)
+    drops_per_campaign: int = 1
+    # сколько минут засчитывает один spade-бикон
+    minutes_per_beacon: int = 1
+    # биконы чаще, чем раз в N секунд, не засчитываются (как у Twitch — раз в минуту)
+    beacon_min_interval: float = 0.0
+    # если задано — неизвестный hash даёт PersistedQueryNotFound
+    hashes: Dict[str, str] = field(default_factory=dict)
+    seed: Optional[int] = None
+
+
+@dataclass
+class _Progress:
+    current: int = 0
+    instance: int = 0
+    started_at: float = 0.0
+    last_beacon: float = float("-inf")
+    claimed: Set[str] = field(default_factory=set)
+
+
+class FakeTwitch:
+    """Simulated Twitch backend state; all handlers are plain methods."""
+
+    def __init__(self, config: Optional[FakeConfig] = None, now: Callable[[], float] = time.monotonic):
+        self.config = config or FakeConfig()
+        self.now = now
+        self.rng = random.Random(self.config.seed)
+        self.t0 = now()
+        self.base_url = ""
+        self.progress: Dict[str, _Progress] = {}
+        self.devices: Dict[str, str] = {}
+        self.requests: Dict[str, int] = {}
+        self.claims: Dict[str, int] = {}
+        self.wasted_claims = 0
+        self.time_to_claim: List[float] = []
+        self.user_ids: Dict[str, str] = {}
+        # приёмники PubSub-сообщений (topic, message) — по одному на WebSocket
+        self.listeners: List[Callable[[str, Dict[str, Any]], None]] = []
+        self.campaigns = [
+            {
+                "id": f"camp{i}",
+                "name": f"Campaign {i}",
+                "game": {"name": f"Game {i}"},
+                "channels": [
+                    {"login": f"chan{i}_{j}", "id": str(1000 * (i + 1) + j), "viewers": 100 * (j + 1)}
+                    for j in range(self.config.channels_per_campaign)
+                ],
+            }
+            for i in range(self.config.campaigns)
+        ]
+
+    # ── helpers ──────────────────────────────────────────────────────────────
+    def _count(self, key: str) -> None:
+        self.requests[key] = self.requests.get(key, 0) + 1
+
+    def _in_burst(self) -> bool:
+        c = self.config
+        if c.burst_every <= 0 or c.burst_len <= 0:
+            return False
+        return (self.now() - self.t0) % c.burst_every < c.burst_len
+
+    def _state(self, login: str) -> _Progress:
+        st = self.progress.get(login)
+        if st is None:
+            st = self.progress[login] = _Progress(started_at=self.now())
+        return st
+
+    def user_id(self, login: str) -> str:
+        uid = self.user_ids.get(login)
+        if uid is None:
+            uid = self.user_ids[login] = str(500000 + len(self.user_ids))
+        return uid
+
+    def publish(self, topic: str, message: Dict[str, Any]) -> None:
+        for sink in list(self.listeners):
+            sink(topic, message)
+
+    def stream_down(self, channel_id: str) -> None:
+        self.publish(f"video-playback-by-id.{channel_id}", {"type": "stream-down", "server_time": self.now()})
+
+    def latency(self) -> float:
+        c = self.config
+        if not c.latency_ms and not c.latency_jitter_ms:
+            return 0.0
+        return max(0.0, c.latency_ms + self.rng.uniform(-1, 1) * c.latency_jitter_ms) / 1000.0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "uptime": self.now() - self.t0,
+            "requests": dict(self.requests),
+            "requests_total": sum(self.requests.values()),
+            "claims_total": sum(self.claims.values()),
+            "claims": dict(self.claims),
+            "wasted_claims": self.wasted_claims,
+            "time_to_claim": list(self.time_to_claim),
+            "config": asdict(self.config),
+        }
+
+    # ── GQL ──────────────────────────────────────────────────────────────────
+    def gql(self, token: str, body: Any, headers: Optional[Dict[str, str]] = None) -> Tuple[int, Any]:
+        """Return (status, json-or-text) for a GQL POST."""
+        self._count("gql")
+        c = self.config
+        if self._in_burst() or (c.rate_429 and self.rng.random() < c.rate_429):
+            self._count("gql_429")
+            return 429, "Too Many Requests"
+        if c.rate_5xx and self.rng.random() < c.rate_5xx:
+            self._count("gql_5xx")
+            return 503, "Service Unavailable"
+        if c.rate_integrity and self.rng.random() < c.rate_integrity:
+            self._count("gql_integrity")
+            return 400, '{"error":"integrity check failed"}'
+        login = token
+        device = (headers or {}).get("X-Device-Id") or (headers or {}).get("x-device-id")
+        if device:
+            self.devices[device] = login
+        items = body if isinstance(body, list) else [body]
+        out = [self._gql_one(login, it or {}) for it in items]
+        return 200, out if isinstance(body, list) else out[0]
+
+    def _gql_one(self, login: str, item: Dict[str, Any]) -> Dict[str, Any]:
+        op = item.get("operationName", "")
+        self._count(f"gql:{op}")
+        h = ((item.get("extensions") or {}).get("persistedQuery") or {}).get("sha256Hash")
+        want = self.config.hashes.get(op)
+        if want and h != want:
+            return {"errors": [{"message": "PersistedQueryNotFound"}]}
+        v = item.get("variables") or {}
+        if op == "ViewerDropsDashboard":
+            camps = [
+                {"id": c["id"], "name": c["name"], "game": c["game"],
+                 "allowlistedChannels": [{"name": ch["login"]} for ch in c["channels"]]}
+                for c in self.campaigns
+            ]
+            return {"data": {"currentUser": {"dropsDashboard": {"currentCampaigns": camps}}}}
+        if op in ("DropCampaignDetails", "DropsCampaignDetails"):
+            camp = next((c for c in self.campaigns if c["id"] == v.get("campaignID")), None)
+            if camp is None:
+                return {"data": {"campaign": None}}
+            chans = [
+                {"channel": {"login": ch["login"], "id": ch["id"],
+                             "stream": {"viewersCount": ch["viewers"]}}}
+                for ch in camp["channels"]
+            ]
+            return {"data": {"campaign": {"id": camp["id"], "availableChannels": chans}}}
+        if op == "DropCurrentSessionContext":
+            return {"data": {"currentUser": {"dropCurrentSession": {"channel": {"id": v.get("channelID")}}}}}
+        if op == "Inventory":
+            st = self._state(login)
+            drops = [
+                {
+                    "id": f"drop{k}",
+                    "name": "Fake Drop" if k == 0 else f"Fake Drop {k}",
+                    "requiredMinutesWatched": self.config.required_minutes,
+                    "currentMinutesWatched": min(st.current, self.config.required_minutes),
+                    "dropInstanceID": did,
+                    "isClaimed": did in st.claimed,
+                }
+                for k, did in enumerate(self._drop_ids(login, st))
+            ]
+            return {"data": {"currentUser": {"id": self.user_id(login), "inventory": {"dropCampaignsInProgress": [
+                {"id": self.campaigns[0]["id"] if self.campaigns else "", "timeBasedDrops": drops}
+            ]}}}}
+        if op == "DropsPage_ClaimDropRewards":
+            did = ((v.get("input") or {}).get("dropInstanceID")) or ""
+            return self.claim(login, did)
+        return {"errors": [{"message": f"unknown operation {op}"}]}
+
+    def _drop_ids(self, login: str, st: _Progress) -> List[str]:
+        base = f"{login}#{st.instance}"
+        return [base if k == 0 else f"{base}.{k}" for k in range(max(1, self.config.drops_per_campaign))]
+
+    def claim(self, login: str, did: str) -> Dict[str, Any]:
+        st = self._state(login)
+        ids = self._drop_ids(login, st)
+        if did in st.claimed:
+            self.wasted_claims += 1
+            return {"data": {"claimDropRewards": {"status": "DROP_INSTANCE_ALREADY_CLAIMED"}}}
+        if did not in ids or st.current < self.config.required_minutes:
+            self.wasted_claims += 1
+            return {"data": {"claimDropRewards": {"status": "DROP_INSTANCE_NOT_CLAIMABLE"}}}
+        self.claims[login] = self.claims.get(login, 0) + 1
+        self.time_to_claim.append(self.now() - st.started_at)
+        st.claimed.add(did)
+        if len(st.claimed) >= len(ids):
+            st.claimed.clear()
+            st.current = 0
+            st.instance += 1
+            st.started_at = self.now()
+        return {"data": {"claimDropRewards": {"status": "ELIGIBLE_FOR_ALL"}}}
+
+    # ── www / spade / HLS ────────────────────────────────────────────────────
+    def channel_page(self, channel: str) -> str:
+        self._count("channel_page")
+        spade = f"{self.base_url}/spade"
+        hls = f"{self.base_url}/hls/{channel}.m3u8"
+        return f'<script>window.__cfg={{"spade_url":"{spade}","hls_url":"{hls}"}}</script>'
+
+    def beacon(self, device_id: str) -> bool:
+        """Minute-watched beacon; credited to the account that owns the device id."""
+        self._count("spade")
+        login = self.devices.get(device_id)
+        if not login:
+            return False
+        st = self._state(login)
+        now = self.now()
+        if now - st.last_beacon < self.config.beacon_min_interval:
+            self._count("spade_ignored")
+            return False
+        st.last_beacon = now
+        st.current += self.config.minutes_per_beacon
+        req = self.config.required_minutes
+        self.publish(f"user-drop-events.{self.user_id(login)}", {
+            "type": "drop-progress",
+            "data": {"drop_id": "drop0", "current_progress_min": min(st.current, req), "required_progress_min": req},
+        })
+        return True
+
+    def playlist(self, channel: str) -> str:
+        self._count("hls_playlist")
+        return "#EXTM3U\n#EXT-X-TARGETDURATION:2\n#EXTINF:2.0,\nseg0.ts\n#EXTINF:2.0,\nseg1.ts\n"
+
+
+class FakeTwitchServer:
+    """aiohttp front-end for ``FakeTwitch`` on 127.0.0.1."""
+
+    def __init__(self, fake: Optional[FakeTwitch] = None, host: str = "127.0.0.1", port: int = 0):
+        self.fake = fake or FakeTwitch()
+        self.host = host
+        self.port = port
+        self._runner: Optional[web.AppRunner] = None
+        self._sockets: Set[web.WebSocketResponse] = set()
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def _delay(self) -> None:
+        d = self.fake.latency()
+        if d:
+            await asyncio.sleep(d)
+
+    async def _gql(self, request: web.Request) -> web.StreamResponse:
+        await self._delay()
+        auth = request.headers.get("Authorization", "")
+        token = auth.split(" ", 1)[1] if " " in auth else auth
+        try:
+            body = await request.json()
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            return web.Response(status=400, text="bad json")
+        slow = self.fake.config.inventory_latency_ms
+        if slow and isinstance(body, dict) and body.get("operationName") == "Inventory":
+            await asyncio.sleep(slow / 1000.0)
+        status, data = self.fake.gql(token, body, dict(request.headers))
+        if status == 200:
+            return web.json_response(data)
+        return web.Response(status=status, text=str(data))
+
+    async def _spade(self, request: web.Request) -> web.StreamResponse:
+        await self._delay()
+        self.fake.beacon(request.query.get("X-Device-Id", ""))
+        return web.Response(status=204)
+
+    async def _playlist(self, request: web.Request) -> web.StreamResponse:
+        await self._delay()
+        return web.Response(text=self.fake.playlist(request.match_info["channel"]))
+
+    async def _segment(self, request: web.Request) -> web.StreamResponse:
+        self.fake._count("hls_segment")
+        return web.Response(body=b"", content_type="video/mp2t")
+
+    async def _stats(self, request: web.Request) -> web.StreamResponse:
+        return web.json_response(self.fake.stats())
+
+    async def _channel(self, request: web.Request) -> web.StreamResponse:
+        await self._delay()
+        return web.Response(text=self.fake.channel_page(request.match_info["channel"]), content_type="text/html")
+
+    async def _pubsub(self, request: web.Request) -> web.StreamResponse:
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        self.fake._count("pubsub_connect")
+        topics: Set[str] = set()
+
+        def sink(topic: str, message: Dict[str, Any]) -> None:
+            if topic in topics and not ws.closed:
+                data = {"topic": topic, "message": json.dumps(message)}
+                asyncio.ensure_future(ws.send_str(json.dumps({"type": "MESSAGE", "data": data})))
+
+        self.fake.listeners.append(sink)
+        self._sockets.add(ws)
+        try:
+            async for msg in ws:
+                if msg.type != web.WSMsgType.TEXT:
+                    continue
+                try:
+                    req = json.loads(msg.data)
+                except ValueError:
+                    continue
+                kind = req.get("type")
+                if kind == "PING":
+                    await ws.send_str('{"type":"PONG"}')
+                elif kind in ("LISTEN", "UNLISTEN"):
+                    data = req.get("data") or {}
+                    wanted = [str(t) for t in data.get("topics") or ()]
+                    error = ""
+                    if kind == "LISTEN":
+                        self.fake._count("pubsub_listen")
+                        uid = self.fake.user_id(str(data.get("auth_token") or ""))
+                        if any(t.startswith("user-drop-events.") and t.split(".", 1)[1] != uid for t in wanted):
+                            error = "ERR_BADAUTH"
+                        else:
+                            topics.update(wanted)
+                    else:
+                        topics.difference_update(wanted)
+                    await ws.send_str(json.dumps({"type": "RESPONSE", "nonce": req.get("nonce"), "error": error}))
+        finally:
+            self.fake.listeners.remove(sink)
+            self._sockets.discard(ws)
+        return ws
+
+    async def pubsub_reconnect(self) -> None:
+        """Попросить всех клиентов PubSub переподключиться (как при деплое у Twitch)."""
+        for ws in list(self._sockets):
+            await ws.send_str('{"type":"RECONNECT"}')
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/gql", self._gql)
+        app.router.add_route("*", "/spade", self._spade)
+        app.router.add_get("/hls/{channel}.m3u8", self._playlist)
+        app.router.add_route("*", "/hls/{segment}.ts", self._segment)
+        app.router.add_get("/_stats", self._stats)
+        app.router.add_get("/pubsub", self._pubsub)
+        app.router.add_get("/{channel}", self._channel)
+        return app
+
+    async def start(self) -> None:
+        self._runner = web.AppRunner(self.app(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        if not self.port:
+            self.port = site._server.sockets[0].getsockname()[1]  # type: ignore[union-attr]
+        self.fake.base_url = self.url
+
+    async def close(self) -> None:
+        for ws in list(self._sockets):
+            await ws.close()
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+def point_api_at(url: str) -> None:
+    """Перенаправить TwitchAPI (GQL и страницы каналов) и PubSub на фейковый сервер."""
+    from yarl import URL
+
+    from . import pubsub, twitch_api
+
+    twitch_api.GQL = URL(url) / "gql"
+    twitch_api.WWW = URL(url)
+    pubsub.PUBSUB_URL = str(URL(url).with_scheme("ws") / "pubsub")
+
+
+def _parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    ap = argparse.ArgumentParser(description="Local fake Twitch backend")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8089)
+    for f in ("latency_ms", "latency_jitter_ms", "inventory_latency_ms", "rate_429", "rate_5xx", "rate_integrity",
+              "burst_every", "burst_len"):
+        ap.add_argument("--" + f.replace("_", "-"), type=float, default=0.0)
+    ap.add_argument("--campaigns", type=int, default=2)
+    ap.add_argument("--required-minutes", type=int, default=15)
+    ap.add_argument("--drops-per-campaign", type=int, default=1)
+    ap.add_argument("--minutes-per-beacon", type=int, default=1)
+    ap.add_argument("--seed", type=int, default=None)
+    return ap.parse_args(argv)
+
+
+def config_from_args(args: argparse.Namespace) -> FakeConfig:
+    return FakeConfig(
+        latency_ms=args.latency_ms,
+        latency_jitter_ms=args.latency_jitter_ms,
+        inventory_latency_ms=args.inventory_latency_ms,
+        rate_429=args.rate_429,
+        rate_5xx=args.rate_5xx,
+        rate_integrity=args.rate_integrity,
+        burst_every=args.burst_every,
+        burst_len=args.burst_len,
+        campaigns=args.campaigns,
+        required_minutes=args.required_minutes,
+        drops_per_campaign=args.drops_per_campaign,
+        minutes_per_beacon=args.minutes_per_beacon,
+        seed=args.seed,
+    )
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = _parse_args(argv)
+
+    async def _serve() -> None:
+        server = FakeTwitchServer(FakeTwitch(config_from_args(args)), args.host, args.port)
+        await server.start()
+        print(f"fake twitch on {server.url}", flush=True)
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await server.close()
+
+    try:
+        asyncio.run(_serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import time
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, Optional, Sequence, Tuple
+
+import aiohttp
+
+from .clock import SYSTEM_CLOCK, Clock
+from .metrics import GQL_LATENCY, GQL_REQUESTS, GQL_RETRIES
+from .ops_discovery import is_pq_not_found
+from .tracing import get_tracer
+
+if TYPE_CHECKING:  # pragma: no cover
+    from .twitch_api import TwitchAPI
+
+MAX_RETRIES = 5
+# бюджет операции целиком — с ретраями, паузами и обновлением CI, секунды
+OP_DEADLINES: Dict[str, float] = {
+    "ViewerDropsDashboard": 90.0,
+    "DropCampaignDetails": 45.0,
+    "Inventory": 45.0,
+    "DropsPage_ClaimDropRewards": 45.0,
+    "DropCurrentSessionContext": 20.0,
+}
+DEFAULT_DEADLINE = 45.0
+# неизменная часть тела на (операция, хэш); хэши меняются редко, но кэш всё же ограничен
+TEMPLATE_CACHE_SIZE = 256
+
+_encode = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+_templates: Dict[Tuple[str, str], Tuple[bytes, bytes]] = {}
+
+
+def body_template(operation: str, op_hash: str) -> Tuple[bytes, bytes]:
+    """(начало тела до значения variables, готовое тело с пустыми variables)."""
+    key = (operation, op_hash)
+    tpl = _templates.get(key)
+    if tpl is None:
+        if len(_templates) >= TEMPLATE_CACHE_SIZE:
+            _templates.clear()
+        head = _encode({
+            "operationName": operation,
+            "extensions": {"persistedQuery": {"version": 1, "sha256Hash": op_hash}},
+        })
+        prefix = (head[:-1] + ',"variables":').encode("utf-8")
+        tpl = _templates[key] = (prefix, prefix + b"{}}")
+    return tpl
+
+
+class GqlCall:
+    """State of one ``TwitchAPI.gql`` call as it passes through the middleware chain."""
+
+    __slots__ = ("api", "requested", "operation", "hash", "variables", "headers", "attempt")
+
+    def __init__(self, api: "TwitchAPI", operation: str, variables: Dict[str, Any]):
+        self.api = api
+        self.requested = operation
+        self.operation = operation
+        self.hash = ""
+        self.variables = variables
+        self.headers: Dict[str, str] = {}
+        self.attempt = 0
+
+    def payload(self) -> Dict[str, Any]:
+        return {
+            "operationName": self.operation,
+            "variables": self.variables,
+            "extensions": {"persistedQuery": {"version": 1, "sha256Hash": self.hash}},
+        }
+
+    def body(self) -> bytes:
+        """``payload()`` в JSON-байтах: сериализуются только variables, остальное — из шаблона."""
+        prefix, empty = body_template(self.operation, self.hash)
+        if not self.variables:
+            return empty
+        return prefix + _encode(self.variables).encode("utf-8") + b"}"
+
+
+Handler = Callable[[GqlCall], Awaitable[Any]]
+Middleware = Callable[[GqlCall, Handler], Awaitable[Any]]
+
+
+class RetryableError(Exception):
+    """Raised by inner layers; ``retry`` decides whether to repeat the request."""
+
+    def __init__(self, cause: str, message: str, backoff: bool = True):
+        super().__init__(message)
+        self.cause = cause
+        self.backoff = backoff
+
+
+class IntegrityChallenge(Exception):
+    def __init__(self, status: int, text: str):
+        super().__init__(f"GQL {status}: {text}")
+        self.status = status
+        self.text = text
+
+
+class DeadlineExceeded(asyncio.TimeoutError):
+    def __init__(self, operation: str, budget: float):
+        super().__init__(f"{operation}: no answer within {budget:g}s")
+        self.operation = operation
+        self.budget = budget
+
+
+class GqlErrors(RuntimeError):
+    """HTTP 200 with an ``errors`` list in the body."""
+
+    def __init__(self, errors: Any):
+        super().__init__(str(errors))
+        self.errors = errors
+
+
+def compose(middlewares: Sequence[Middleware], terminal: Handler) -> Handler:
+    """Собираем цепочку: первый middleware — внешний."""
+    handler = terminal
+    for mw in reversed(middlewares):
+        handler = (lambda m, nxt: (lambda call: m(call, nxt)))(mw, handler)
+    return handler
+
+
+# ── middlewares ──────────────────────────────────────────────────────────────
+
+
+async def tracing(call: GqlCall, nxt: Handler) -> Any:
+    tracer = get_tracer()
+    if not tracer.enabled:
+        return await nxt(call)
+    with tracer.span(f"gql {call.requested}", cat="gql") as sp:
+        try:
+            return await nxt(call)
+        finally:
+            sp.set("attempts", call.attempt + 1)
+
+
+async def metrics(call: GqlCall, nxt: Handler) -> Any:
+    t0 = time.perf_counter()
+    result = "error"
+    try:
+        data = await nxt(call)
+        result = "ok"
+        return data
+    finally:
+        GQL_LATENCY.observe(time.perf_counter() - t0, call.requested)
+        GQL_REQUESTS.inc(call.requested, result)
+
+
+async def deadline(call: GqlCall, nxt: Handler) -> Any:
+    """Один бюджет на весь вызов: по его истечении всё внутри (ретраи, CI) отменяется."""
+    api = call.api
+    budget = api.deadlines.get(call.requested, DEFAULT_DEADLINE)
+    async with api._deadline(call.requested, budget):
+        return await nxt(call)
+
+
+async def retry(call: GqlCall, nxt: Handler) -> Any:
+    """Повторы на 429/5xx/integrity/сетевых ошибках с экспоненциальной задержкой."""
+    while True:
+        try:
+            return await nxt(call)
+        except RetryableError as e:
+            GQL_RETRIES.inc(e.cause)
+            call.attempt += 1
+            if call.attempt > MAX_RETRIES:
+                raise RuntimeError(f"{e}; retry limit exceeded") from None
+            if e.backoff:
+                await call.api.clock.sleep(min(60, 2 ** (call.attempt - 1)))
+        except aiohttp.ClientError:
+            GQL_RETRIES.inc("network")
+            call.attempt += 1
+            if call.attempt > MAX_RETRIES:
+                raise
+            await call.api.clock.sleep(min(60, 2 ** (call.attempt - 1)))
+
+
+async def rate_limit(call: GqlCall, nxt: Handler) -> Any:
+    limiter = call.api.limiter
+    if limiter is not None:
+        await limiter.acquire()
+    return await nxt(call)
+
+
+async def proxy_guard(call: GqlCall, nxt: Handler) -> Any:
+    """Каждая попытка через прокси учитывается в ProxyHealth; открытый breaker — ошибка без ретраев."""
+    api = call.api
+    if not api.proxy:
+        return await nxt(call)
+    with api.health.track(api.proxy):
+        return await nxt(call)
+
+
+async def integrity(call: GqlCall, nxt: Handler) -> Any:
+    api = call.api
+    expired = api.ci_expires_at and api.clock.time() >= api.ci_expires_at
+    if not api.client_version or not api.client_integrity or expired:
+        await api._refresh_ci()
+    try:
+        return await nxt(call)
+    except IntegrityChallenge as e:
+        if await api._refresh_ci():
+            raise RetryableError("integrity", "GQL integrity challenge", backoff=False) from None
+        raise RuntimeError(str(e)) from None
+
+
+async def persisted_query(call: GqlCall, nxt: Handler) -> Any:
+    """Подставляем hash из реестра; на PersistedQueryNotFound — один повтор после поиска."""
+    api = call.api
+    call.operation, call.hash = api.ops.resolve(call.requested)
+    try:
+        return await nxt(call)
+    except GqlErrors as e:
+        if not is_pq_not_found(e.errors):
+            raise
+        if not await api._recover_hash(call.requested, call.hash, call.variables):
+            raise
+    call.operation, call.hash = api.ops.resolve(call.requested)
+    return await nxt(call)
+
+
+async def headers(call: GqlCall, nxt: Handler) -> Any:
+    # блок заголовков аккаунта собран заранее (TwitchAPI.gql_headers); его не меняют
+    call.headers = call.api.gql_headers()
+    return await nxt(call)
+
+
+# снаружи внутрь: трейс → метрики → дедлайн → ретраи → лимит → прокси → integrity → PQ hash → заголовки → запрос
+DEFAULT_MIDDLEWARES: Sequence[Middleware] = (
+    tracing,
+    metrics,
+    deadline,
+    retry,
+    rate_limit,
+    proxy_guard,
+    integrity,
+    persisted_query,
+    headers,
+)
+
+
+class RateLimiter:
+    """Token bucket: не больше ``rate`` запросов в секунду с запасом ``burst``."""
+
+    def __init__(self, rate: float, burst: int = 1, clock: Clock = SYSTEM_CLOCK):
+        self.rate = float(rate)
+        self.burst = max(1, burst)
+        self.clock = clock
+        self._tokens = float(self.burst)
+        self._ts = clock.monotonic()
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def acquire(self) -> None:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            while True:
+                now = self.clock.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._ts) * self.rate)
+                self._ts = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await self.clock.sleep((1 - self._tokens) / self.rate)
@@ -1,11 +1,11 @@
 # src/gui.py
 from __future__ import annotations
 import asyncio
-import json
+import sys
 from datetime import datetime
 from pathlib import Path
+from typing import TYPE_CHECKING, Iterable, Optional
 
-import aiohttp
 from PySide6.QtWidgets import (
     QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QLabel, QPushButton,
     QTableWidget, QTableWidgetItem, QHeaderView, QTextEdit, QProgressBar,
@@ -13,18 +13,36 @@ from PySide6.QtWidgets import (
 )
 from PySide6.QtCore import QTimer
 
-# локальные модули
+# локальные модули; тяжёлые (Playwright, QtWebEngine, aiohttp через miner/pubsub/
+# proxy_health/token_check) импортируются при первом использовании — окно
+# появляется без них (см. scripts/bench_import.py)
 from .types import Account
 from .accounts import load_accounts, COOKIES_DIR
-from .onboarding import bulk_onboarding
-from .onboarding_webview import WebOnboarding, Account as WVAccount
-from .miner import run_account  # асинхронный воркер
-from .ops import load_ops, missing_ops
+from .ops import get_registry
 from .campaign_dialog import CampaignSettingsDialog
+from .events import EventBus, JsonlSink, StatusData
+from .metrics import ACTIVE_WORKERS, EVENT_QUEUE_DEPTH, MetricsServer
+from .rampup import RAMP_RATE, RampUp
+from .scheduler import TickScheduler
+from .state_store import get_state_store
+
+if TYPE_CHECKING:  # pragma: no cover
+    from .token_check import TokenResult
 
 
 class MainWindow(QMainWindow):
-    def __init__(self, accounts_file: Path):
+    def __init__(
+        self,
+        accounts_file: Path,
+        metrics_port: int = 0,
+        tick_budget: float = 0.0,
+        ramp_rate: float = RAMP_RATE,
+        pubsub: bool = False,
+        events_log: str = "",
+        control_port: int = 0,
+        control_socket: str = "",
+        control_token: str = "",
+    ):
         super().__init__()
         self.setWindowTitle("Twitch Drops — API Miner (TXT/CSV)")
         self.resize(1200, 720)
@@ -34,8 +52,7 @@ class MainWindow(QMainWindow):
 
         # проверяем наличие PQ-хэшей
         try:
-            ops = load_ops()
-            miss = missing_ops(ops)
+            miss = get_registry().missing()
             if miss:
                 QMessageBox.warning(
                     self,
@@ -50,7 +67,7 @@ class MainWindow(QMainWindow):
         self.stops: dict[str, asyncio.Event] = {}
         self.cmds: dict[str, asyncio.Queue] = {}              # команды в miner
         self.channels: dict[str, list[dict]] = {}             # каналы по аккаунту (для dbl-click switch)
-        self.available_campaigns: dict[str, list] = {}        # доступные кампании с воркера
+        self.available_campaigns: dict[str, tuple] = {}       # общий кортеж Campaign из каталога
         self.selected_campaigns: dict[str, list] = {}         # выбранные кампании пользователем
         self.metrics = {"claimed": 0, "errors": 0}
 
@@ -96,6 +113,14 @@ class MainWindow(QMainWindow):
         self.tbl.cellDoubleClicked.connect(self.cell_dbl_clicked)
         v.addWidget(self.tbl)
 
+        # здоровье прокси: задержка, доля ошибок и 429, breaker
+        self.tbl_proxies = QTableWidget(0, 7)
+        self.tbl_proxies.setHorizontalHeaderLabels([
+            "Proxy","State","Latency (ms)","Errors %","429 %","Accounts","Trips"
+        ])
+        self.tbl_proxies.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        v.addWidget(self.tbl_proxies)
+
         # фильтры и лог
         flt = QHBoxLayout()
         flt.addWidget(QLabel("Login:"))
@@ -116,14 +141,40 @@ class MainWindow(QMainWindow):
         self.log_entries: list[dict] = []
         self.max_log_entries = 500
 
+        self.store = get_state_store()
         self.populate()
+        self.render_cached_state()
         self.refresh_totals()
 
         # ── встроенный asyncio-loop ────────────────────────────────────────────
         self.loop = asyncio.new_event_loop()
         asyncio.set_event_loop(self.loop)
-        self.queue: asyncio.Queue = asyncio.Queue()  # канал miner -> GUI
+        # канал miner -> GUI: ограниченная шина, статусы/прогресс схлопываются
+        self.queue = EventBus()
         self._feeder_task = self.loop.create_task(self.feeder())
+        self.events_sink = JsonlSink(Path(events_log), self.queue) if events_log else None
+        self._sink_task = self.loop.create_task(self.events_sink.run()) if self.events_sink else None
+
+        # /metrics (Prometheus) в том же loop, 0 — выключено
+        ACTIVE_WORKERS.set_function(lambda: len(self.tasks))
+        EVENT_QUEUE_DEPTH.set_function(self.queue.qsize)
+        self.metrics_server = MetricsServer(metrics_port) if metrics_port else None
+        # общий бюджет тиков на прокси (в минуту), 0 — без ограничения
+        self.scheduler = TickScheduler(tick_budget) if tick_budget else None
+        # Start All волнами: ramp_rate воркеров на прокси в волну, 0 — все сразу
+        self.ramp_rate = ramp_rate
+        self.ramp: Optional[RampUp] = None
+        # прогресс по PubSub вместо опроса Inventory каждый тик
+        self.pubsub = pubsub
+        if self.metrics_server:
+            self.loop.create_task(self.metrics_server.start())
+        # JSON API управления (порт или Unix-сокет), грузится только если включён
+        self.control_server = None
+        if control_port or control_socket:
+            from .control_api import ControlServer
+
+            self.control_server = ControlServer(self, control_port, path=control_socket, token=control_token)
+            self.loop.create_task(self.control_server.start())
 
         # таймер: даём циклу «тикать», не блокируя Qt
         self.timer = QTimer(self)
@@ -131,6 +182,11 @@ class MainWindow(QMainWindow):
         self.timer.timeout.connect(self.pump)
         self.timer.start()
 
+        self.proxy_timer = QTimer(self)
+        self.proxy_timer.setInterval(2000)
+        self.proxy_timer.timeout.connect(self.refresh_proxies)
+        self.proxy_timer.start()
+
     # ── helpers ────────────────────────────────────────────────────────────────
     def populate(self):
         self.tbl.setRowCount(0)
@@ -162,6 +218,27 @@ class MainWindow(QMainWindow):
             btn.clicked.connect(lambda _, l=a.login: self.start_stop_account(l))
             self.tbl.setCellWidget(r, 9, btn)
 
+    def render_cached_state(self):
+        """Сразу показать последнее известное состояние из state/, не дожидаясь воркеров."""
+        # строки ищем один раз, а не row_of на каждое событие (O(n²) на тысячах аккаунтов)
+        rows = {}
+        for r in range(self.tbl.rowCount()):
+            item = self.tbl.item(r, 1)
+            if item:
+                rows[item.text()] = r
+        restored = 0
+        for a in self.accounts:
+            r = rows.get(a.login, -1)
+            st = self.store.load(a.login) if r >= 0 else None
+            if st is None:
+                continue
+            restored += 1
+            for kind, p in st.events():
+                self.apply_event(a.login, kind, p, row=r, quiet=True)
+        if restored:
+            self.log_line(f"Состояние из кэша: {restored} аккаунтов")
+            self.refresh_totals()
+
     def row_of(self, login: str) -> int:
         for r in range(self.tbl.rowCount()):
             item = self.tbl.item(r, 1)
@@ -225,8 +302,35 @@ class MainWindow(QMainWindow):
         self.lbl.setText(
             f"Аккаунтов: {len(self.accounts)} • Активных: {active} • "
             f"Клеймов: {self.metrics['claimed']} • Ошибок: {self.metrics['errors']}"
+            + self._ramp_text()
         )
 
+    def refresh_proxies(self):
+        if not self.tasks:
+            return  # прокси учитываются только у работающих воркеров
+        from .proxy_health import get_proxy_health
+
+        self.tbl_proxies.setRowCount(0)
+        for row in get_proxy_health().rows():
+            r = self.tbl_proxies.rowCount()
+            self.tbl_proxies.insertRow(r)
+            state = row["state"]
+            if row["retry_in"]:
+                state = f"{state} ({row['retry_in']:.0f}s)"
+            values = [
+                row["proxy"], state, str(row["latency_ms"]),
+                f"{100 * row['errors']:.0f}", f"{100 * row['throttled']:.0f}",
+                str(row["accounts"]), str(row["trips"]),
+            ]
+            for c, val in enumerate(values):
+                self.tbl_proxies.setItem(r, c, QTableWidgetItem(val))
+
+    def _ramp_text(self) -> str:
+        ramp = getattr(self, "ramp", None)
+        if ramp is None or ramp.done:
+            return ""
+        return f" • Запуск: {ramp.started}/{ramp.total} ({ramp.per_proxy:g}/прокси за волну)"
+
     def _remove_account_from_ui(self, login: str):
         self.stop_account(login)
         r = self.row_of(login)
@@ -262,91 +366,22 @@ class MainWindow(QMainWindow):
         self.loop.create_task(self._check_gql_async())
 
     async def _check_gql_async(self):
-        ok = exp = miss = other = 0
-
-        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=6)) as session:
-            async def _check_one(a: Account) -> str:
-                login = a.login
-                r = self.row_of(login)
-                if r < 0:
-                    return "other"
-
-                cookie_file = Path(COOKIES_DIR) / f"{login}.json"
-                if not cookie_file.exists():
-                    await self.queue.put((login, "status", {
-                        "status": "NO COOKIES",
-                        "note": f"{cookie_file} not found",
-                    }))
-                    return "miss"
-
-                token = ""
-                try:
-                    data = json.loads(cookie_file.read_text(encoding="utf-8"))
-                    for c in data:
-                        if c.get("name") == "auth-token":
-                            token = c.get("value") or ""
-                            break
-                except Exception as e:
-                    await self.queue.put((login, "status", {
-                        "status": "BAD COOKIES",
-                        "note": str(e),
-                    }))
-                    return "other"
-
-                if not token:
-                    await self.queue.put((login, "status", {
-                        "status": "NO TOKEN",
-                        "note": "NO TOKEN in cookies",
-                    }))
-                    return "miss"
-
-                try:
-                    async with session.get(
-                        "https://id.twitch.tv/oauth2/validate",
-                        headers={"Authorization": f"OAuth {token}"},
-                    ) as resp:
-                        if resp.status == 200:
-                            j = await resp.json()
-                            login_resp = j.get("login", "?")
-                            scopes = ",".join(j.get("scopes", []))
-                            await self.queue.put((login, "status", {
-                                "status": "OK",
-                                "note": f"login={login_resp} scopes=[{scopes}]",
-                            }))
-                            return "ok"
-                        elif resp.status in (401, 403):
-                            await self.queue.put((login, "status", {
-                                "status": "EXPIRED",
-                                "note": "token invalid",
-                            }))
-                            return "exp"
-                        else:
-                            text = (await resp.text())[:120]
-                            await self.queue.put((login, "status", {
-                                "status": f"HTTP {resp.status}",
-                                "note": text,
-                            }))
-                            return "other"
-                except Exception as e:
-                    await self.queue.put((login, "status", {
-                        "status": "ERROR",
-                        "note": str(e),
-                    }))
-                    return "other"
-
-            results = await asyncio.gather(*(_check_one(a) for a in self.accounts))
-
-        for res in results:
-            if res == "ok":
-                ok += 1
-            elif res == "exp":
-                exp += 1
-            elif res == "miss":
-                miss += 1
-            else:
-                other += 1
-
-        self.log_line(f"Итог: OK={ok} EXPIRED={exp} NO_COOKIES/NO_TOKEN={miss} OTHER={other}")
+        total = len(self.accounts)
+        self.log_line(f"Проверка токенов: {total} аккаунтов")
+
+        from .token_check import TokenCache, TokenValidator, summarize
+
+        def _on_result(res: "TokenResult", done: int, total: int):
+            # статус по аккаунту + прогресс приходят по мере готовности
+            self.queue.put_nowait((res.login, "status", StatusData(res.status, res.note)))
+            self.lbl.setText(f"Проверка токенов: {done}/{total}")
+
+        validator = TokenValidator(cache=TokenCache())
+        results = await validator.check(self.accounts, progress_cb=_on_result)
+        s = summarize(results)
+        self.log_line(
+            f"Итог: OK={s['ok']} EXPIRED={s['exp']} NO_COOKIES/NO_TOKEN={s['miss']} OTHER={s['other']}"
+        )
 
     def _on_onboarding_progress(self, res: dict):
         login = res.get("login", "?")
@@ -362,6 +397,8 @@ class MainWindow(QMainWindow):
     def onboarding(self):
         rows = [(a.login, a.password or "", a.totp_secret or "", a.proxy or "") for a in self.accounts]
         self.log_line(f"Onboarding: запускаю, всего аккаунтов: {len(rows)}")
+        from .onboarding import bulk_onboarding  # Playwright — только по кнопке
+
         bulk_onboarding(
             rows,
             out_dir=COOKIES_DIR,
@@ -371,6 +408,9 @@ class MainWindow(QMainWindow):
         )
 
     def onboarding_webview(self):
+        # QtWebEngine поднимает Chromium — грузим, только когда диалог действительно открыт
+        from .onboarding_webview import WebOnboarding, Account as WVAccount
+
         accs = [WVAccount(label=a.label, login=a.login, password=a.password or "", proxy=a.proxy or "") for a in self.accounts]
         dlg = WebOnboarding(cookies_dir=Path("cookies"), accounts=accs, per_acc_timeout_sec=120, parent=self)
         dlg.exec()
@@ -386,7 +426,7 @@ class MainWindow(QMainWindow):
         if not campaigns:
             self.log_line("Нет данных о кампаниях", login=login)
             return
-        selected = self.selected_campaigns.get(login, [c.get("id") for c in campaigns])
+        selected = self.selected_campaigns.get(login, [c.id for c in campaigns])
         dlg = CampaignSettingsDialog(campaigns, selected, self)
         if dlg.exec():
             ids = dlg.selected()
@@ -396,12 +436,16 @@ class MainWindow(QMainWindow):
                 q.put_nowait(("select_campaigns", ids))
 
     # ── пер-аккаунтный запуск/остановка ────────────────────────────────────────
-    def start_account(self, login: str):
+    def start_account(self, login: str, tick_phase: Optional[float] = None):
         if login in self.tasks:
             return
         acc = next((a for a in self.accounts if a.login == login), None)
         if not acc:
             return
+        # воркер тянет aiohttp — грузим при первом запуске, а не при старте окна
+        from .miner import run_account
+        from .pubsub import get_hub
+
         stop = asyncio.Event()
         self.stops[login] = stop
         cmd_q: asyncio.Queue = asyncio.Queue()
@@ -415,6 +459,10 @@ class MainWindow(QMainWindow):
                 cmd_q,
                 acc.client_version,
                 acc.client_integrity,
+                store=self.store,
+                scheduler=self.scheduler,
+                tick_phase=tick_phase,
+                pubsub=get_hub(acc.proxy or "") if self.pubsub else None,
             )
         )
         self.tasks[login] = t
@@ -429,9 +477,12 @@ class MainWindow(QMainWindow):
 
     def stop_account(self, login: str):
         evt = self.stops.pop(login, None)
-        if evt:
-            evt.set()
-        self.tasks.pop(login, None)
+        task = self.tasks.pop(login, None)
+        if task is not None:
+            from .miner import stop_worker
+
+            # воркер сам выходит по stop_evt и доводит начатый клейм; зависший отменяем через STOP_GRACE
+            stop_worker(evt, task)
         self.cmds.pop(login, None)
         acc = next((a for a in self.accounts if a.login == login), None)
         if acc:
@@ -451,10 +502,24 @@ class MainWindow(QMainWindow):
             self.start_account(login)
 
     def start_all(self):
-        for a in self.accounts:
-            self.start_account(a.login)
+        self.start_many(a.login for a in self.accounts)
+
+    def start_many(self, logins: Iterable[str]):
+        """Запустить аккаунты из списка: волнами по ramp_rate или все сразу."""
+        wanted = set(logins)
+        todo = [a for a in self.accounts if a.login in wanted and a.login not in self.tasks]
+        if not self.ramp_rate:
+            for a in todo:
+                self.start_account(a.login)
+            return
+        if self.ramp is not None and not self.ramp.done:
+            return
+        self.ramp = RampUp(self.start_account, self.ramp_rate, on_progress=lambda *_: self.refresh_totals())
+        self.loop.create_task(self.ramp.run([(a.login, a.proxy) for a in todo]))
 
     def stop_all(self):
+        if self.ramp is not None:
+            self.ramp.cancel()
         for login in list(self.tasks.keys()):
             self.stop_account(login)
 
@@ -462,74 +527,93 @@ class MainWindow(QMainWindow):
     async def feeder(self):
         while True:
             login, kind, p = await self.queue.get()
-            r = self.row_of(login)
-            if r < 0:
-                continue
-            if kind == "status":
-                self.tbl.item(r, 2).setText(p.get("status", ""))
-                note = p.get("note")
-                if note:
-                    self.log_line(note, login=login)
-            elif kind == "campaign":
-                self.tbl.item(r, 3).setText(p.get("camp", "") or "—")
-                self.tbl.item(r, 4).setText(p.get("game", "") or "—")
-            elif kind == "campaigns":
-                # список доступных кампаний (для диалога + выпадающий список)
-                camps = p.get("campaigns", [])
-                self.available_campaigns[login] = camps
-                if login not in self.selected_campaigns:
-                    self.selected_campaigns[login] = [c.get("id") for c in camps]
-                # заполним выпадающий список в таблице
-                cmb = self.cmb_campaigns.get(login)
-                if cmb is not None:
-                    cmb.blockSignals(True)
-                    cmb.clear()
-                    for c in camps:
-                        cmb.addItem(c.get("name", c.get("id", "—")), c.get("id"))
-                    cmb.blockSignals(False)
+            self.apply_event(login, kind, p)
+
+    def apply_event(self, login: str, kind: str, p: dict, row: Optional[int] = None, quiet: bool = False):
+        """Отрисовать одно событие воркера (или из кэша состояния) в таблице.
+
+        ``row`` — уже известная строка аккаунта; ``quiet`` — без строки в логе и
+        пересчёта итогов (их делает вызывающий один раз на пачку событий).
+        """
+        r = self.row_of(login) if row is None else row
+        if r < 0:
+            return
+        if kind == "status":
+            self.tbl.item(r, 2).setText(p.get("status", ""))
+            note = p.get("note")
+            if note:
+                self.log_line(note, login=login)
+        elif kind == "campaign":
+            self.tbl.item(r, 3).setText(p.get("camp", "") or "—")
+            self.tbl.item(r, 4).setText(p.get("game", "") or "—")
+        elif kind == "campaigns":
+            # список доступных кампаний (для диалога + выпадающий список)
+            camps = p.get("campaigns", ())
+            self.available_campaigns[login] = camps
+            if login not in self.selected_campaigns:
+                self.selected_campaigns[login] = [c.id for c in camps]
+            # заполним выпадающий список в таблице
+            cmb = self.cmb_campaigns.get(login)
+            if cmb is not None:
+                cmb.blockSignals(True)
+                cmb.clear()
+                for c in camps:
+                    cmb.addItem(c.name or c.id or "—", c.id)
+                cmb.blockSignals(False)
+            if not quiet:
                 self.log_line(f"Доступно кампаний: {len(camps)}", login=login)
-            elif kind == "channels":
-                items = p.get("channels", [])
+        elif kind == "channels":
+            items = p.get("channels", [])
+            self.channels[login] = items
+            txt = "\n".join(f"{c.get('name','')} ({c.get('viewers',0)})" for c in items) or "—"
+            self.tbl.setItem(r, 5, QTableWidgetItem(txt))
+        elif kind == "switch":
+            chan = p.get("channel", "")
+            items = self.channels.get(login, [])
+            if chan:
+                items = sorted(items, key=lambda c: c.get('name') != chan)
                 self.channels[login] = items
-                txt = "\n".join(f"{c.get('name','')} ({c.get('viewers',0)})" for c in items) or "—"
-                self.tbl.setItem(r, 5, QTableWidgetItem(txt))
-            elif kind == "switch":
-                chan = p.get("channel", "")
-                items = self.channels.get(login, [])
-                if chan:
-                    items = sorted(items, key=lambda c: c.get('name') != chan)
-                    self.channels[login] = items
-                txt = "\n".join(f"{c.get('name','')} ({c.get('viewers',0)})" for c in items) or "—"
-                self.tbl.setItem(r, 5, QTableWidgetItem(txt))
-                if chan:
-                    self.log_line(f"switched to {chan}", login=login)
-            elif kind == "progress":
-                # поддерживаем и старый remain, и новый next (+ опциональный drop)
-                pb = self.tbl.cellWidget(r, 6)
-                if isinstance(pb, QProgressBar):
-                    pb.setValue(int(p.get("pct", 0)))
-                    drop = p.get("drop")
-                    pb.setFormat(f"{drop} %p%" if drop else "%p%")
-                remain_secs = p.get("remain")
-                if remain_secs is None:
-                    remain_secs = p.get("next", 0)
-                self.tbl.setItem(r, 7, QTableWidgetItem(self._fmt_seconds(remain_secs)))
-            elif kind == "claimed":
-                self.metrics["claimed"] += 1
-                pb = self.tbl.cellWidget(r, 6)
-                if isinstance(pb, QProgressBar):
-                    pb.setValue(int(p.get("pct", 0)))
-                    drop = p.get("drop")
-                    pb.setFormat(f"{drop} %p%" if drop else "%p%")
-                remain_secs = p.get("remain")
-                if remain_secs is None:
-                    remain_secs = p.get("next", 0)
-                self.tbl.setItem(r, 7, QTableWidgetItem(self._fmt_seconds(remain_secs)))
-                self.tbl.item(r, 8).setText(p.get("at", ""))
-                self.log_line(f"Claimed {p.get('drop','')}", login=login)
-            elif kind == "error":
-                self.metrics["errors"] += 1
-                self.log_line(f"ERROR: {p.get('msg','')}", login=login, level="ERROR")
+            txt = "\n".join(f"{c.get('name','')} ({c.get('viewers',0)})" for c in items) or "—"
+            self.tbl.setItem(r, 5, QTableWidgetItem(txt))
+            if chan:
+                self.log_line(f"switched to {chan}", login=login)
+        elif kind == "progress":
+            # поддерживаем и старый remain, и новый next (+ опциональный drop)
+            pb = self.tbl.cellWidget(r, 6)
+            if isinstance(pb, QProgressBar):
+                pb.setValue(int(p.get("pct", 0)))
+                drop = p.get("drop")
+                pb.setFormat(f"{drop} %p%" if drop else "%p%")
+            remain_secs = p.get("remain")
+            if remain_secs is None:
+                remain_secs = p.get("next", 0)
+            self.tbl.setItem(r, 7, QTableWidgetItem(self._fmt_seconds(remain_secs)))
+        elif kind == "claimed":
+            self.metrics["claimed"] += 1
+            pb = self.tbl.cellWidget(r, 6)
+            if isinstance(pb, QProgressBar):
+                pb.setValue(int(p.get("pct", 0)))
+                drop = p.get("drop")
+                pb.setFormat(f"{drop} %p%" if drop else "%p%")
+            remain_secs = p.get("remain")
+            if remain_secs is None:
+                remain_secs = p.get("next", 0)
+            self.tbl.setItem(r, 7, QTableWidgetItem(self._fmt_seconds(remain_secs)))
+            self.tbl.item(r, 8).setText(p.get("at", ""))
+            self.log_line(f"Claimed {p.get('drop','')}", login=login)
+        elif kind == "last_claim":
+            self.tbl.item(r, 8).setText(p.get("at", ""))
+        elif kind == "proxy":
+            acc = next((a for a in self.accounts if a.login == login), None)
+            if acc is not None:
+                acc.proxy = p.get("proxy") or acc.proxy
+                from .proxy_health import redact
+
+                self.log_line(f"proxy -> {redact(acc.proxy or '')}", login=login)
+        elif kind == "error":
+            self.metrics["errors"] += 1
+            self.log_line(f"ERROR: {p.get('msg','')}", login=login, level="ERROR")
+        if not quiet:
             self.refresh_totals()
 
     # ── короткий «тик» asyncio-цикла, чтобы задачи выполнялись ────────────────
@@ -541,12 +625,11 @@ class MainWindow(QMainWindow):
 
     # ── корректное завершение приложения ──────────────────────────────────────
     def closeEvent(self, event):
-        # просим остановиться все воркеры
+        # просим остановиться все воркеры: начатые клеймы доходят, зависшие отменятся через STOP_GRACE
         running_tasks = list(self.tasks.values())
         running_tasks.append(self._feeder_task)
         self.stop_all()
-        for t in running_tasks:
-            t.cancel()
+        self._feeder_task.cancel()
         if running_tasks:
             try:
                 self.loop.run_until_complete(
@@ -554,6 +637,32 @@ class MainWindow(QMainWindow):
                 )
             except Exception:
                 pass
+        if self.events_sink is not None:
+            self.events_sink.close()
+            try:
+                self.loop.run_until_complete(self._sink_task)
+            except Exception:
+                pass
+        # закрываем только то, что успело загрузиться
+        pubsub_mod = sys.modules.get(f"{__package__}.pubsub")
+        health_mod = sys.modules.get(f"{__package__}.proxy_health")
+        try:
+            if pubsub_mod is not None:
+                self.loop.run_until_complete(pubsub_mod.close_hubs())
+            if health_mod is not None:
+                self.loop.run_until_complete(health_mod.get_proxy_health().close())
+        except Exception:
+            pass
+        if self.metrics_server:
+            try:
+                self.loop.run_until_complete(self.metrics_server.close())
+            except Exception:
+                pass
+        if self.control_server is not None:
+            try:
+                self.loop.run_until_complete(self.control_server.close())
+            except Exception:
+                pass
         self.loop.stop()
         self.loop.close()
         super().closeEvent(event)
@@ -0,0 +1,226 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import signal
+from pathlib import Path
+from typing import Iterable, Optional
+
+from .accounts import load_accounts
+from .events import EventBus, JsonlSink
+from .metrics import ACTIVE_WORKERS, EVENT_QUEUE_DEPTH, MetricsServer
+from .miner import STOP_GRACE, run_account, stop_worker
+from .proxy_health import get_proxy_health, redact
+from .pubsub import close_hubs, get_hub
+from .rampup import RAMP_RATE, RampUp
+from .scheduler import TickScheduler
+from .state_store import get_state_store
+from .types import Account
+
+logger = logging.getLogger(__name__)
+
+
+class HeadlessRunner:
+    """Майнер без GUI: те же воркеры run_account, события уходят в лог.
+
+    Держит то же состояние, что и MainWindow (accounts/tasks/stops/cmds),
+    чтобы остальные подсистемы работали одинаково в обоих режимах.
+    """
+
+    def __init__(
+        self,
+        accounts_file: Optional[Path],
+        metrics_port: int = 0,
+        tick_interval: float = 60.0,
+        tick_budget: float = 0.0,
+        ramp_rate: float = RAMP_RATE,
+        pubsub: bool = False,
+        events_log: str = "",
+        control_port: int = 0,
+        control_socket: str = "",
+        control_token: str = "",
+    ):
+        # без файла аккаунты выдаёт координатор кластера (см. cluster.Agent)
+        self.accounts_file = Path(accounts_file) if accounts_file else None
+        self.accounts: list[Account] = load_accounts(self.accounts_file) if self.accounts_file else []
+        self.tick_interval = tick_interval
+        self.metrics_port = metrics_port
+        self.tasks: dict[str, asyncio.Task] = {}
+        self.stops: dict[str, asyncio.Event] = {}
+        self.cmds: dict[str, asyncio.Queue] = {}
+        self.metrics = {"claimed": 0, "errors": 0}
+        self.store = get_state_store()
+        # общий бюджет тиков на прокси (в минуту), 0 — без ограничения
+        self.scheduler = TickScheduler(tick_budget) if tick_budget else None
+        # запуск волнами: ramp_rate воркеров на прокси в волну, 0 — все сразу
+        self.ramp_rate = ramp_rate
+        self.ramp: Optional[RampUp] = None
+        # прогресс по PubSub вместо опроса Inventory каждый тик
+        self.pubsub = pubsub
+        # события воркеров: ограниченная шина, лог событий — ещё один подписчик
+        self.events_log = events_log
+        self.queue: Optional[EventBus] = None
+        # локальный JSON API управления: TCP-порт или Unix-сокет, 0/"" — выключен
+        self.control_port = control_port
+        self.control_socket = control_socket
+        self.control_token = control_token
+        self._done: Optional[asyncio.Event] = None
+
+    def _account(self, login: str) -> Optional[Account]:
+        return next((a for a in self.accounts if a.login == login), None)
+
+    def start_account(self, login: str, tick_phase: Optional[float] = None) -> None:
+        if login in self.tasks or self.queue is None:
+            return
+        acc = self._account(login)
+        if not acc:
+            return
+        stop = asyncio.Event()
+        self.stops[login] = stop
+        cmd_q: asyncio.Queue = asyncio.Queue()
+        self.cmds[login] = cmd_q
+        self.tasks[login] = asyncio.ensure_future(
+            run_account(
+                login,
+                acc.proxy,
+                self.queue,
+                stop,
+                cmd_q,
+                acc.client_version,
+                acc.client_integrity,
+                tick_interval=self.tick_interval,
+                store=self.store,
+                scheduler=self.scheduler,
+                tick_phase=tick_phase,
+                pubsub=get_hub(acc.proxy or "") if self.pubsub else None,
+            )
+        )
+        acc.status = "Running"
+
+    def stop_account(self, login: str, grace: float = STOP_GRACE) -> None:
+        # воркер сам выходит по stop_evt и доводит начатый клейм; зависший отменяем через grace
+        stop_worker(self.stops.pop(login, None), self.tasks.pop(login, None), grace)
+        self.cmds.pop(login, None)
+        acc = self._account(login)
+        if acc:
+            acc.status = "Stopped"
+
+    def start_all(self) -> None:
+        self.start_many(a.login for a in self.accounts)
+
+    def start_many(self, logins: Iterable[str]) -> None:
+        """Запустить аккаунты из списка: волнами по ramp_rate или все сразу."""
+        wanted = set(logins)
+        todo = [a for a in self.accounts if a.login in wanted and a.login not in self.tasks]
+        if not self.ramp_rate:
+            for a in todo:
+                self.start_account(a.login)
+            return
+        if self.ramp is not None and not self.ramp.done:
+            return
+        self.ramp = RampUp(self.start_account, self.ramp_rate, on_progress=self._ramp_progress)
+        asyncio.ensure_future(self.ramp.run([(a.login, a.proxy) for a in todo]))
+
+    def _ramp_progress(self, started: int, total: int) -> None:
+        rate = self.ramp.per_proxy if self.ramp else 0.0
+        logger.info("Ramp-up: %d/%d started (%g per proxy/wave)", started, total, rate)
+
+    def stop_all(self) -> None:
+        if self.ramp is not None:
+            self.ramp.cancel()
+        for login in list(self.tasks.keys()):
+            self.stop_account(login)
+
+    def _handle_event(self, login: str, kind: str, p: dict) -> None:
+        acc = self._account(login)
+        if kind == "status":
+            if acc:
+                acc.status = p.get("status", "")
+            logger.info("[%s] %s %s", login, p.get("status", ""), p.get("note", "") or "")
+        elif kind == "campaign" and acc:
+            acc.active_campaign = p.get("camp", "") or ""
+            acc.game = p.get("game", "") or ""
+        elif kind in ("progress", "claimed") and acc:
+            acc.progress_pct = float(p.get("pct", 0) or 0)
+            acc.remaining_minutes = int(p.get("remain", 0) or 0)
+            if kind == "claimed":
+                self.metrics["claimed"] += 1
+                acc.last_claim_at = p.get("at")
+                logger.info("[%s] Claimed %s", login, p.get("drop", ""))
+        elif kind == "last_claim" and acc:
+            acc.last_claim_at = p.get("at")
+        elif kind == "proxy" and acc:
+            # воркер переехал с лежащего прокси — перезапуск пойдёт уже через новый
+            acc.proxy = p.get("proxy") or acc.proxy
+            logger.info("[%s] Proxy -> %s", login, redact(acc.proxy or ""))
+        elif kind == "error":
+            self.metrics["errors"] += 1
+            logger.error("[%s] %s", login, p.get("msg", ""))
+
+    def load_cached_state(self) -> None:
+        """Заполнить Account последним известным состоянием из state/ до старта воркеров."""
+        for a in self.accounts:
+            st = self.store.load(a.login)
+            if st is None:
+                continue
+            for kind, p in st.events():
+                if kind in ("campaign", "progress", "last_claim"):
+                    self._handle_event(a.login, kind, p)
+
+    async def consume(self) -> None:
+        assert self.queue is not None
+        while True:
+            login, kind, p = await self.queue.get()
+            try:
+                self._handle_event(login, kind, p)
+            except Exception:
+                logger.exception("event handling failed: %s %s", login, kind)
+
+    def request_stop(self) -> None:
+        if self._done is not None:
+            self._done.set()
+
+    async def run(self) -> None:
+        self.queue = EventBus()
+        sink = JsonlSink(Path(self.events_log), self.queue) if self.events_log else None
+        sink_task = asyncio.ensure_future(sink.run()) if sink else None
+        self._done = asyncio.Event()
+        ACTIVE_WORKERS.set_function(lambda: len(self.tasks))
+        EVENT_QUEUE_DEPTH.set_function(self.queue.qsize)
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self.request_stop)
+            except (NotImplementedError, RuntimeError):
+                pass
+
+        server = MetricsServer(self.metrics_port) if self.metrics_port else None
+        if server:
+            await server.start()
+        control = None
+        if self.control_port or self.control_socket:
+            from .control_api import ControlServer
+
+            control = ControlServer(self, self.control_port, path=self.control_socket, token=self.control_token)
+            await control.start()
+        consumer = asyncio.ensure_future(self.consume())
+        self.load_cached_state()
+        self.start_all()
+        logger.info("Headless: starting %d accounts", len(self.accounts))
+        try:
+            await self._done.wait()
+        finally:
+            workers = list(self.tasks.values())
+            self.stop_all()
+            if workers:
+                await asyncio.wait(workers, timeout=STOP_GRACE + 5)
+            consumer.cancel()
+            if sink is not None:
+                sink.close()
+                await sink_task
+            await close_hubs()
+            await get_proxy_health().close()
+            if server:
+                await server.close()
+            if control is not None:
+                await control.close()
@@ -0,0 +1,200 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import stat
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+logger = logging.getLogger(__name__)
+
+MAX_BODY = 16 * 1024 * 1024
+
+REASONS = {
+    200: "OK",
+    204: "No Content",
+    400: "Bad Request",
+    401: "Unauthorized",
+    403: "Forbidden",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    409: "Conflict",
+    413: "Payload Too Large",
+    415: "Unsupported Media Type",
+    500: "Internal Server Error",
+}
+
+
+@dataclass
+class Request:
+    method: str
+    path: str
+    query: Dict[str, str] = field(default_factory=dict)
+    headers: Dict[str, str] = field(default_factory=dict)
+    body: bytes = b""
+
+    def json(self) -> Any:
+        return json.loads(self.body or b"null")
+
+
+@dataclass
+class Response:
+    status: int = 200
+    body: bytes = b""
+    content_type: str = "text/plain; charset=utf-8"
+    # тело по частям (NDJSON-поток и т.п.): без Content-Length, конец — закрытие соединения
+    stream: Optional[AsyncIterator[bytes]] = None
+
+    @classmethod
+    def json(cls, data: Any, status: int = 200) -> "Response":
+        return cls(status, json.dumps(data, ensure_ascii=False).encode("utf-8"), "application/json")
+
+
+Handler = Callable[[Request], Awaitable[Response]]
+
+
+class HttpServer:
+    """Minimal HTTP/1.1 server on asyncio streams (one request per connection).
+
+    Enough for local endpoints such as ``/metrics``; no aiohttp needed, so it
+    runs inside the GUI loop and in headless mode alike. With ``path`` it
+    listens on a Unix socket (mode 0600) instead of a TCP port.
+    """
+
+    def __init__(self, handler: Handler, host: str = "127.0.0.1", port: int = 0, path: str = ""):
+        self.handler = handler
+        self.host = host
+        self.port = port
+        self.path = path
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self) -> None:
+        if self.path:
+            # сокет от прошлого запуска мешает bind — убираем, но только сокет
+            if os.path.exists(self.path) and stat.S_ISSOCK(os.stat(self.path).st_mode):
+                os.unlink(self.path)
+            # права 0600 с момента bind: chmod после него оставлял окно, когда сокет открыт всем
+            old = os.umask(0o177)
+            try:
+                self._server = await asyncio.start_unix_server(self._serve, self.path)
+            finally:
+                os.umask(old)
+            return
+        self._server = await asyncio.start_server(self._serve, self.host, self.port)
+        sock = self._server.sockets[0] if self._server.sockets else None
+        if sock is not None and isinstance(sock.getsockname(), tuple):
+            self.port = sock.getsockname()[1]
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+            if self.path and os.path.exists(self.path):
+                os.unlink(self.path)
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> Optional[Request]:
+        line = await reader.readline()
+        if not line:
+            return None
+        try:
+            method, target, _ver = line.decode("latin-1").split(" ", 2)
+        except ValueError:
+            return None
+        headers: Dict[str, str] = {}
+        while True:
+            h = await reader.readline()
+            if h in (b"\r\n", b"\n", b""):
+                break
+            k, _, v = h.decode("latin-1").partition(":")
+            headers[k.strip().lower()] = v.strip()
+        length = int(headers.get("content-length") or 0)
+        if length > MAX_BODY:
+            raise ValueError("body too large")
+        body = await reader.readexactly(length) if length else b""
+        u = urlsplit(target)
+        return Request(method.upper(), u.path or "/", dict(parse_qsl(u.query)), headers, body)
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            try:
+                req = await self._read_request(reader)
+            except ValueError:
+                req = None
+                resp = Response(413, b"too large\n")
+            else:
+                resp = Response(400, b"bad request\n")
+            if req is not None:
+                try:
+                    resp = await self.handler(req)
+                except Exception:
+                    logger.exception("HTTP handler failed for %s %s", req.method, req.path)
+                    resp = Response(500, b"internal error\n")
+            if resp.stream is not None:
+                await self._write_stream(writer, resp)
+                return
+            head = (
+                f"HTTP/1.1 {resp.status} {REASONS.get(resp.status, '')}\r\n"
+                f"Content-Type: {resp.content_type}\r\n"
+                f"Content-Length: {len(resp.body)}\r\n"
+                "Connection: close\r\n\r\n"
+            )
+            writer.write(head.encode("latin-1") + resp.body)
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _write_stream(self, writer: asyncio.StreamWriter, resp: Response) -> None:
+        assert resp.stream is not None
+        head = (
+            f"HTTP/1.1 {resp.status} {REASONS.get(resp.status, '')}\r\n"
+            f"Content-Type: {resp.content_type}\r\n"
+            "Cache-Control: no-cache\r\n"
+            "Connection: close\r\n\r\n"
+        )
+        try:
+            writer.write(head.encode("latin-1"))
+            async for chunk in resp.stream:
+                writer.write(chunk)
+                # медленный клиент притормаживает только свой поток
+                await writer.drain()
+        finally:
+            aclose = getattr(resp.stream, "aclose", None)
+            if aclose is not None:
+                await aclose()
+
+
+async def fetch(
+    host: str,
+    port: int,
+    method: str,
+    path: str,
+    body: bytes = b"",
+    headers: Optional[Dict[str, str]] = None,
+    timeout: float = 30.0,
+) -> Tuple[int, bytes]:
+    """Один запрос к такому же серверу (Connection: close) -> (статус, тело)."""
+
+    async def go() -> Tuple[int, bytes]:
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            lines = [f"{method} {path} HTTP/1.1", f"Host: {host}:{port}", f"Content-Length: {len(body)}"]
+            lines += [f"{k}: {v}" for k, v in (headers or {}).items()]
+            writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+            await writer.drain()
+            raw = await reader.read()
+        finally:
+            writer.close()
+        head, _, payload = raw.partition(b"\r\n\r\n")
+        try:
+            status = int(head.split(b" ", 2)[1])
+        except (IndexError, ValueError):
+            raise ConnectionError(f"bad HTTP response from {host}:{port}") from None
+        return status, payload
+
+    return await asyncio.wait_for(go(), timeout)
@@ -1,14 +1,18 @@
 #!/usr/bin/env python3
 from __future__ import annotations
 
+import os
 import sys
 import argparse
+import asyncio
 import csv
+import logging
 from pathlib import Path
 
-from PySide6.QtWidgets import QApplication
-from .gui import MainWindow
-from .ops import load_ops, missing_ops
+from .accounts import load_accounts
+from .metrics import DEFAULT_PORT as METRICS_PORT
+from .ops import get_registry
+from .rampup import RAMP_RATE
 
 
 def create_sample_txt(path: Path):
@@ -40,6 +44,77 @@ def create_sample_csv(path: Path):
     print(f"Создан пример CSV: {path}")
 
 
+def check_tokens(accounts_path: Path, report: str, concurrency: int, use_cache: bool) -> int:
+    """Headless-проверка auth-token всех аккаунтов; печатает прогресс и пишет отчёт."""
+    from .token_check import TokenCache, TokenValidator, summarize, write_report
+
+    accounts = load_accounts(accounts_path)
+
+    def _on_result(res, done, total):
+        src = " (cache)" if res.cached else ""
+        print(f"[{done}/{total}] {res.login}: {res.status}{src} {res.note}", file=sys.stderr)
+
+    validator = TokenValidator(
+        concurrency=concurrency, cache=TokenCache() if use_cache else None
+    )
+    results = asyncio.run(validator.check(accounts, progress_cb=_on_result))
+    text = write_report(results, Path(report) if report and report != "-" else None)
+    if text:
+        print(text)
+    s = summarize(results)
+    print(
+        f"Итог: OK={s['ok']} EXPIRED={s['exp']} NO_COOKIES/NO_TOKEN={s['miss']} OTHER={s['other']}",
+        file=sys.stderr,
+    )
+    return 0 if s["ok"] == len(results) else 1
+
+
+def run_coordinator(args) -> int:
+    from .cluster import Coordinator, is_loopback, parse_addr
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    host, port = parse_addr(args.coordinator)
+    if not args.cluster_token and not is_loopback(host):
+        print(f"Координатор на {host} виден из сети: задайте --cluster-token", file=sys.stderr)
+        return 2
+    coord = Coordinator(
+        load_accounts(Path(args.accounts)), port, host,
+        token=args.cluster_token, events_log=args.events_log,
+    )
+    asyncio.run(coord.run())
+    return 0
+
+
+def run_agent(args) -> int:
+    from .cluster import Agent
+    from .headless import HeadlessRunner
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    if args.proxy_pool:
+        from .proxy_health import get_proxy_health, load_pool
+
+        get_proxy_health().pool = load_pool(Path(args.proxy_pool))
+    # аккаунты и ops-хэши приходят от координатора
+    runner = HeadlessRunner(
+        None, metrics_port=args.metrics_port,
+        tick_budget=args.tick_budget,
+        ramp_rate=args.ramp_rate,
+        pubsub=args.pubsub,
+        events_log=args.events_log,
+        control_port=args.control_port,
+        control_socket=args.control_socket,
+        control_token=args.control_token,
+    )
+    agent = Agent(runner, args.agent, capacity=args.agent_capacity, token=args.cluster_token)
+    try:
+        asyncio.run(agent.run())
+    finally:
+        from .tracing import get_tracer
+
+        get_tracer().flush()
+    return 0
+
+
 def main():
     p = argparse.ArgumentParser(description="Twitch Drops — API Miner (TXT/CSV)")
     p.add_argument("--accounts", type=str, help="Путь к CSV или TXT (login:password)")
@@ -50,27 +125,200 @@ def main():
         action="store_true",
         help="Открыть логин-окна и сохранить cookies/<login>.json",
     )
+    p.add_argument(
+        "--check-tokens",
+        action="store_true",
+        help="Проверить auth-token всех аккаунтов без GUI и вывести отчёт",
+    )
+    p.add_argument(
+        "--report",
+        type=str,
+        default="-",
+        help="Куда писать отчёт --check-tokens: *.json, *.csv или - (stdout, JSON)",
+    )
+    p.add_argument(
+        "--concurrency",
+        type=int,
+        default=20,
+        help="Максимум одновременных проверок токенов",
+    )
+    p.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Игнорировать кэш результатов проверки токенов",
+    )
+    p.add_argument(
+        "--headless",
+        action="store_true",
+        help="Запустить майнер для всех аккаунтов без GUI (лог в stdout)",
+    )
+    p.add_argument(
+        "--metrics-port",
+        type=int,
+        default=METRICS_PORT,
+        help="Порт локального /metrics (Prometheus), 0 — выключить",
+    )
+    p.add_argument(
+        "--tick-budget",
+        type=float,
+        default=0.0,
+        help="Тиков в минуту на прокси; при нехватке первыми идут аккаунты, близкие к клейму (0 — без лимита)",
+    )
+    p.add_argument(
+        "--ramp-rate",
+        type=float,
+        default=RAMP_RATE,
+        help="Start All волнами: воркеров на прокси раз в 5 с, скорость подстраивается под 429 (0 — все сразу)",
+    )
+    p.add_argument(
+        "--pubsub",
+        action="store_true",
+        help="Получать прогресс дропов и падения стримов по PubSub; Inventory — только для сверки",
+    )
+    p.add_argument(
+        "--proxy-pool",
+        type=str,
+        default="",
+        help="Файл с запасными прокси (по одному на строку): аккаунты с лежащего прокси переезжают на здоровые",
+    )
+    p.add_argument(
+        "--events-log",
+        type=str,
+        default="",
+        help="Дописывать события воркеров (статусы, прогресс, клеймы, ошибки) в JSONL-файл",
+    )
+    p.add_argument(
+        "--control-port",
+        type=int,
+        default=0,
+        help="Порт локального JSON API управления на 127.0.0.1 (список, старт/стоп, кампании, события), 0 — выключить",
+    )
+    p.add_argument(
+        "--control-socket",
+        type=str,
+        default="",
+        help="Unix-сокет для JSON API управления вместо TCP-порта (доступ только владельцу)",
+    )
+    p.add_argument(
+        "--control-token",
+        type=str,
+        default=os.environ.get("MINER_CONTROL_TOKEN", ""),
+        help="Токен для заголовка X-Control-Token API управления; без него для TCP-порта "
+        "токен генерируется в state/control.token",
+    )
+    p.add_argument(
+        "--coordinator",
+        type=str,
+        default="",
+        metavar="HOST:PORT",
+        help="Режим координатора кластера: раздавать аккаунты из --accounts агентам (шардами по прокси)",
+    )
+    p.add_argument(
+        "--agent",
+        type=str,
+        default="",
+        metavar="HOST:PORT",
+        help="Режим агента кластера: брать аккаунты у координатора по этому адресу и майнить без GUI",
+    )
+    p.add_argument(
+        "--agent-capacity",
+        type=float,
+        default=1.0,
+        help="Относительная мощность машины агента: доля аккаунтов пропорциональна ей",
+    )
+    p.add_argument(
+        "--cluster-token",
+        type=str,
+        default="",
+        help="Общий секрет координатора и агентов (нужен, если координатор слушает не 127.0.0.1)",
+    )
+    p.add_argument(
+        "--trace",
+        type=str,
+        default="",
+        help="Писать спаны тиков/GQL в JSONL (см. scripts/trace_view.py)",
+    )
     args = p.parse_args()
 
+    if args.trace:
+        from . import tracing
+
+        tracing.configure(Path(args.trace))
+
     if args.create_sample_txt:
         create_sample_txt(Path("accounts.txt"))
         return
     if args.create_sample_csv:
         create_sample_csv(Path("accounts.csv"))
         return
+    if args.agent:
+        sys.exit(run_agent(args))
     if not args.accounts:
         print("Укажите --accounts путь (CSV или TXT)")
         sys.exit(2)
+    if args.coordinator:
+        sys.exit(run_coordinator(args))
+
+    if args.check_tokens:
+        sys.exit(
+            check_tokens(
+                Path(args.accounts), args.report, args.concurrency, not args.no_cache
+            )
+        )
 
-    miss = missing_ops(load_ops())
+    miss = get_registry().missing()
     if miss:
         print(f"Отсутствуют хэши GQL для: {', '.join(miss)}")
         sys.exit(1)
 
+    if args.proxy_pool:
+        from .proxy_health import get_proxy_health, load_pool
+
+        get_proxy_health().pool = load_pool(Path(args.proxy_pool))
+
+    if args.headless:
+        from .headless import HeadlessRunner
+
+        logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+        runner = HeadlessRunner(
+            Path(args.accounts), metrics_port=args.metrics_port,
+            tick_budget=args.tick_budget,
+            ramp_rate=args.ramp_rate,
+            pubsub=args.pubsub,
+            events_log=args.events_log,
+            control_port=args.control_port,
+            control_socket=args.control_socket,
+            control_token=args.control_token,
+        )
+        try:
+            asyncio.run(runner.run())
+        finally:
+            from .tracing import get_tracer
+
+            get_tracer().flush()
+        return
+
+    from PySide6.QtWidgets import QApplication
+    from .gui import MainWindow
+
     app = QApplication(sys.argv)
-    win = MainWindow(Path(args.accounts))
+    win = MainWindow(
+        Path(args.accounts),
+        metrics_port=args.metrics_port,
+        tick_budget=args.tick_budget,
+        ramp_rate=args.ramp_rate,
+        pubsub=args.pubsub,
+        events_log=args.events_log,
+        control_port=args.control_port,
+        control_socket=args.control_socket,
+        control_token=args.control_token,
+    )
     win.show()
-    sys.exit(app.exec())
+    code = app.exec()
+    from .tracing import get_tracer
+
+    get_tracer().flush()
+    sys.exit(code)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,359 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from bisect import bisect_left
+from collections import deque
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from .httpd import HttpServer, Request, Response
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 9108
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(v: str) -> str:
+    return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _num(v: float) -> str:
+    return str(int(v)) if float(v).is_integer() else repr(float(v))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str = "", labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], object] = {}
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self) -> List[str]:
+        out = self._header()
+        for labels, v in sorted(self._values.items()):
+            out.append(f"{self.name}{_labels(self.labelnames, labels)} {_num(v)}")
+        return out
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0.0)  # type: ignore[return-value]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        # горячий путь: одна операция со словарём
+        d = self._values
+        d[labels] = d.get(labels, 0.0) + amount
+
+    def total(self) -> float:
+        return float(sum(self._values.values()))  # type: ignore[arg-type]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str = "", labelnames: Iterable[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._fn: Optional[Callable[[], float]] = None
+
+    def set(self, value: float, *labels: str) -> None:
+        self._values[labels] = value
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        d = self._values
+        d[labels] = d.get(labels, 0.0) + amount
+
+    def dec(self, *labels: str, amount: float = 1.0) -> None:
+        self.inc(*labels, amount=-amount)
+
+    def remove(self, *labels: str) -> None:
+        self._values.pop(labels, None)
+
+    def set_function(self, fn: Optional[Callable[[], float]]) -> None:
+        """Значение вычисляется при отдаче /metrics (без затрат между запросами)."""
+        self._fn = fn
+
+    def value(self, *labels: str) -> float:
+        if self._fn is not None and not labels:
+            return float(self._fn())
+        return super().value(*labels)
+
+    def render(self) -> List[str]:
+        if self._fn is not None:
+            try:
+                self._values[()] = float(self._fn())
+            except Exception:
+                pass
+        return super().render()
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str = "",
+        labelnames: Iterable[str] = (),
+        buckets: Iterable[float] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels: str) -> None:
+        st = self._values.get(labels)
+        if st is None:
+            st = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        st[0][bisect_left(self.buckets, value)] += 1  # type: ignore[index]
+        st[1] += value  # type: ignore[index]
+        st[2] += 1  # type: ignore[index]
+
+    def count(self, *labels: str) -> int:
+        st = self._values.get(labels)
+        return st[2] if st else 0  # type: ignore[index]
+
+    def render(self) -> List[str]:
+        out = self._header()
+        for labels, (counts, total, n) in sorted(self._values.items()):  # type: ignore[misc]
+            acc = 0
+            for b, c in zip(self.buckets, counts):
+                acc += c
+                le = _labels(self.labelnames, labels, f'le="{_num(b)}"')
+                out.append(f"{self.name}_bucket{le} {acc}")
+            le = _labels(self.labelnames, labels, 'le="+Inf"')
+            out.append(f"{self.name}_bucket{le} {n}")
+            out.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_num(total)}")
+            out.append(f"{self.name}_count{_labels(self.labelnames, labels)} {n}")
+        return out
+
+
+class RecentEvents:
+    """Счётчик событий в скользящем окне (например, клеймы за последний час)."""
+
+    def __init__(self, window: float = 3600.0):
+        self.window = window
+        self._ts: deque = deque()
+
+    def mark(self, now: Optional[float] = None) -> None:
+        self._ts.append(time.monotonic() if now is None else now)
+
+    def count(self, now: Optional[float] = None) -> int:
+        now = time.monotonic() if now is None else now
+        while self._ts and self._ts[0] < now - self.window:
+            self._ts.popleft()
+        return len(self._ts)
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str = "", labelnames: Iterable[str] = ()) -> Counter:
+        return self.register(Counter(name, help, labelnames))  # type: ignore[return-value]
+
+    def gauge(self, name: str, help: str = "", labelnames: Iterable[str] = ()) -> Gauge:
+        return self.register(Gauge(name, help, labelnames))  # type: ignore[return-value]
+
+    def histogram(
+        self,
+        name: str,
+        help: str = "",
+        labelnames: Iterable[str] = (),
+        buckets: Iterable[float] = LATENCY_BUCKETS,
+    ) -> Histogram:
+        return self.register(Histogram(name, help, labelnames, buckets))  # type: ignore[return-value]
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for m in self._metrics.values():
+            lines.extend(m.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# ── GQL ──────────────────────────────────────────────────────────────────────
+GQL_REQUESTS = REGISTRY.counter(
+    "twitch_gql_requests_total", "GQL calls by operation and result", ("operation", "result")
+)
+GQL_LATENCY = REGISTRY.histogram(
+    "twitch_gql_latency_seconds", "GQL call latency including retries", ("operation",)
+)
+GQL_RETRIES = REGISTRY.counter(
+    "twitch_gql_retries_total", "GQL retries by cause (429, 5xx, integrity, network)", ("cause",)
+)
+REQUEST_TIMEOUTS = REGISTRY.counter(
+    "twitch_request_timeouts_total", "Calls cut by their deadline (GQL operation, spade, hls, ci)", ("operation",)
+)
+PUBSUB_CONNECTIONS = REGISTRY.gauge("twitch_pubsub_connections", "Open PubSub WebSocket connections")
+PUBSUB_RECONNECTS = REGISTRY.counter("twitch_pubsub_reconnects_total", "PubSub reconnect attempts")
+PUBSUB_EVENTS = REGISTRY.counter("twitch_pubsub_events_total", "PubSub messages by type", ("type",))
+# ── proxies ──────────────────────────────────────────────────────────────────
+PROXY_UP = REGISTRY.gauge("miner_proxy_up", "1 while the proxy circuit breaker is closed", ("proxy",))
+PROXY_LATENCY = REGISTRY.gauge("miner_proxy_latency_seconds", "Smoothed request latency per proxy", ("proxy",))
+PROXY_ERROR_RATIO = REGISTRY.gauge(
+    "miner_proxy_error_ratio", "Share of failed or throttled attempts in the recent window", ("proxy",)
+)
+PROXY_TRIPS = REGISTRY.counter("miner_proxy_breaker_trips_total", "Circuit breaker openings per proxy", ("proxy",))
+# ── fleet ────────────────────────────────────────────────────────────────────
+ACTIVE_WORKERS = REGISTRY.gauge("miner_active_workers", "Running account workers")
+EVENT_QUEUE_DEPTH = REGISTRY.gauge("miner_event_queue_depth", "Pending worker events")
+EVENTS_PUBLISHED = REGISTRY.counter("miner_events_total", "Worker events published, by kind", ("kind",))
+EVENTS_DROPPED = REGISTRY.counter(
+    "miner_events_dropped_total",
+    "Events not delivered to a subscriber (coalesced, rate_limited, overflow)",
+    ("kind", "reason"),
+)
+LOOP_LAG = REGISTRY.gauge("miner_event_loop_lag_seconds", "Last measured asyncio loop lag")
+LOOP_LAG_HIST = REGISTRY.histogram(
+    "miner_event_loop_lag_hist_seconds",
+    "asyncio loop lag distribution",
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0),
+)
+# ── cluster ──────────────────────────────────────────────────────────────────
+CLUSTER_AGENTS = REGISTRY.gauge("miner_cluster_agents", "Agents holding a live lease (coordinator)")
+CLUSTER_MOVES = REGISTRY.counter(
+    "miner_cluster_shard_moves_total", "Proxy shards (re)assigned by the coordinator (orphan, balance)", ("reason",)
+)
+# ── mining ───────────────────────────────────────────────────────────────────
+BEACON_JITTER = REGISTRY.histogram(
+    "miner_beacon_jitter_seconds",
+    "How late minute-watched beacons start relative to their schedule",
+    buckets=(0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0),
+)
+TICK_QUEUE_WAIT = REGISTRY.histogram(
+    "miner_tick_queue_seconds",
+    "How long due ticks wait for a TickScheduler slot",
+    buckets=(0.01, 0.1, 0.5, 1.0, 5.0, 15.0, 30.0, 60.0, 120.0),
+)
+CLAIMS = REGISTRY.counter("miner_claims_total", "Successful drop claims")
+RECENT_CLAIMS = RecentEvents(3600.0)
+CLAIMS_LAST_HOUR = REGISTRY.gauge("miner_claims_last_hour", "Claims in the last 60 minutes")
+CLAIMS_LAST_HOUR.set_function(lambda: RECENT_CLAIMS.count())
+CLAIM_LATENCY = REGISTRY.histogram(
+    "miner_claim_latency_seconds",
+    "Time from a drop first seen complete in Inventory to its successful claim",
+    buckets=(1.0, 5.0, 15.0, 60.0, 120.0, 300.0, 900.0, 3600.0),
+)
+WASTED_CLAIMS = REGISTRY.counter(
+    "miner_claims_wasted_total",
+    "Claim calls that did not claim anything (already_claimed, not_claimable, no_status, error)",
+    ("reason",),
+)
+CI_REFRESHES = REGISTRY.counter(
+    "twitch_ci_refresh_total", "Client-Integrity refreshes by result", ("result",)
+)
+SESSION_ROTATIONS = REGISTRY.counter(
+    "twitch_session_rotations_total", "Client/Playback session id rotations by reason", ("reason",)
+)
+
+
+def record_claim() -> None:
+    CLAIMS.inc()
+    RECENT_CLAIMS.mark()
+
+
+async def monitor_loop_lag(interval: float = 1.0) -> None:
+    """Меряем задержку event loop: насколько позже запланированного просыпается sleep."""
+    loop = asyncio.get_running_loop()
+    while True:
+        t0 = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(0.0, loop.time() - t0 - interval)
+        LOOP_LAG.set(lag)
+        LOOP_LAG_HIST.observe(lag)
+
+
+def merge_rendered(texts: Dict[str, str], label: str = "agent") -> str:
+    """Склеить выводы render() нескольких процессов, пометив сэмплы ``label="<ключ>"``.
+
+    Сэмплы одной метрики остаются под одним HELP/TYPE, как требует формат.
+    """
+    families: Dict[str, List[str]] = {}
+    meta: Dict[str, List[str]] = {}
+    for key, text in texts.items():
+        tag = f'{label}="{_escape(key)}"'
+        family = ""
+        for line in text.splitlines():
+            if not line:
+                continue
+            if line.startswith("#"):
+                parts = line.split(" ", 3)
+                if len(parts) >= 3 and parts[1] in ("HELP", "TYPE"):
+                    family = parts[2]
+                    m = meta.setdefault(family, [])
+                    if len(m) < 2 and line not in m:
+                        m.append(line)
+                    families.setdefault(family, [])
+                continue
+            name, brace, rest = line.partition("{")
+            if brace:
+                line = f"{name}{{{tag},{rest}" if not rest.startswith("}") else f"{name}{{{tag}{rest}"
+            else:
+                name, _, value = line.partition(" ")
+                line = f"{name}{{{tag}}} {value}"
+            families.setdefault(family or name, []).append(line)
+    out: List[str] = []
+    for family, samples in families.items():
+        out.extend(meta.get(family, ()))
+        out.extend(samples)
+    return "\n".join(out) + "\n"
+
+
+class MetricsServer:
+    """Serves ``REGISTRY`` as Prometheus text on http://host:port/metrics."""
+
+    def __init__(self, port: int = DEFAULT_PORT, host: str = "127.0.0.1", registry: Registry = REGISTRY):
+        self.registry = registry
+        self.http = HttpServer(self._handle, host, port)
+        self._lag_task: Optional[asyncio.Task] = None
+
+    @property
+    def port(self) -> int:
+        return self.http.port
+
+    async def _handle(self, req: Request) -> Response:
+        if req.path != "/metrics":
+            return Response(404, b"not found\n")
+        if req.method != "GET":
+            return Response(405, b"method not allowed\n")
+        body = self.registry.render().encode("utf-8")
+        return Response(200, body, "text/plain; version=0.0.4; charset=utf-8")
+
+    async def start(self) -> bool:
+        try:
+            await self.http.start()
+        except OSError as exc:
+            logger.error("Metrics endpoint on port %s not started: %s", self.http.port, exc)
+            return False
+        self._lag_task = asyncio.ensure_future(monitor_loop_lag())
+        logger.info("Metrics on http://%s:%s/metrics", self.http.host, self.http.port)
+        return True
+
+    async def close(self) -> None:
+        if self._lag_task is not None:
+            self._lag_task.cancel()
+            self._lag_task = None
+        await self.http.close()
@@ -2,25 +2,58 @@
 from __future__ import annotations
 
 import asyncio
+import logging
+import math
 from datetime import datetime
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Callable, Dict, FrozenSet, List, Optional, Sequence, Tuple
 
 from .accounts import auth_token_from_cookies
+from .allocator import WatchAllocator, finished_campaigns, get_allocator
+from .catalog import Campaign, get_catalog
+from .clock import SYSTEM_CLOCK, Clock
+from .metrics import BEACON_JITTER, TICK_QUEUE_WAIT
+from .events import ClaimedData, ErrorData, ProgressData, StatusData
+from .claims import ClaimLedger, claim_all, drop_name, is_claimed, time_based_drops
+from .proxy_health import get_proxy_health, redact
+from .pubsub import PubSubHub, Subscription
+from .scheduler import TickScheduler
+from .state_store import AccountState, StateStore
+from .tracing import current_login, span
 from .twitch_api import TwitchAPI
 
+logger = logging.getLogger(__name__)
 
-async def _safe_put(queue: asyncio.Queue, payload: Tuple[str, str, Dict[str, Any]]):
-    """Кладём сообщение в GUI-очередь, не роняя воркер из-за случайной ошибки."""
+
+# сколько лучших каналов показывать в GUI
+CHANNELS_SHOWN = 10
+# с живым PubSub Inventory опрашивается только для сверки — раз в столько секунд
+RECONCILE_INTERVAL = 15 * 60.0
+# сколько после stop_evt ждём, пока воркер сам допишет начатый клейм, прежде чем отменить
+STOP_GRACE = 10.0
+
+
+async def _safe_put(queue: asyncio.Queue, payload: Tuple[str, str, Any]):
+    """Кладём сообщение в шину событий (или очередь), не роняя воркер из-за случайной ошибки."""
     try:
         await queue.put(payload)
     except Exception:
-        pass
+        logger.exception("event %s for %s lost", payload[1], payload[0])
+
+
+def _epoch(value: Any) -> float:
+    """ISO-время Twitch ("2024-05-01T00:00:00Z") -> unix time; 0.0, если не разобрать."""
+    if not value:
+        return 0.0
+    try:
+        return datetime.fromisoformat(str(value).replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return 0.0
 
 
 def _parse_campaigns_from_dashboard(data: Any) -> List[Dict[str, Any]]:
     """
     Выдёргиваем список кампаний из ответа ViewerDropsDashboard.
-    Возвращаем список словарей: {id, name, game, channels(str[])}.
+    Возвращаем список словарей: {id, name, game, channels(str[]), ends_at}.
     """
     out: List[Dict[str, Any]] = []
     try:
@@ -60,54 +93,178 @@ def _parse_campaigns_from_dashboard(data: Any) -> List[Dict[str, Any]]:
                     if channels:
                         break
 
-            out.append({"id": cid, "name": cname, "game": gname, "channels": channels})
+            out.append(
+                {"id": cid, "name": cname, "game": gname, "channels": channels, "ends_at": _epoch(c.get("endAt"))}
+            )
     except Exception:
         pass
     return out
 
 
-async def _initial_channels(api: TwitchAPI, campaign_id: str) -> List[Dict[str, Any]]:
+async def _resolve_watch(
+    api: TwitchAPI,
+    selected: Sequence[Campaign],
+    done: FrozenSet[str],
+    allocator: WatchAllocator,
+    now: float,
+) -> Tuple[str, List[Dict[str, Any]], Optional[Tuple[str, str]], str, str]:
     """
-    Получаем живые каналы по кампании через DropCampaignDetails
-    (или DropsCampaignDetails).
-    Возвращаем список словарей: {name, viewers, live}.
+    Выбор канала по всем выбранным кампаниям (см. allocator.WatchAllocator):
+    основная кампания, список для GUI {name, viewers, live, campaigns},
+    канал (login, id) для DropCurrentSessionContext и его spade/HLS URL.
     """
-    try:
-        chans = await api.get_live_channels(campaign_id)  # List[tuple[login, id, viewers, live]]
-        chans.sort(key=lambda x: x[2], reverse=True)
-        items: List[Dict[str, Any]] = []
-        for clogin, _cid, viewers, live in chans:
-            items.append(
-                {"name": str(clogin) or "unknown", "viewers": int(viewers or 0), "live": bool(live)}
-            )
-        return items
-    except Exception:
-        return []
+    await allocator.refresh([c.id for c in selected], api.get_live_channels, now)
+    ranked = allocator.rank(selected, done, now)
+    items: List[Dict[str, Any]] = [
+        {
+            "name": ch.channel.login or "unknown",
+            "viewers": ch.channel.viewers,
+            "live": True,
+            "campaigns": len(ch.campaigns),
+        }
+        for ch in ranked[:CHANNELS_SHOWN]
+    ]
+    open_camps = [c for c in selected if c.id not in done] or list(selected)
+    primary = ranked[0].campaigns[0] if ranked else (open_camps[0].id if open_camps else "")
+    if not items:
+        camp = next((c for c in open_camps if c.channels), None)
+        if camp is not None:
+            items = [{"name": n, "viewers": 0, "live": False} for n in camp.channels]
+
+    increment_channel: Optional[Tuple[str, str]] = None
+    spade_url = hls_url = ""
+    if ranked:
+        increment_channel = (ranked[0].channel.login, ranked[0].channel.id)
+        try:
+            spade_url, hls_url = await api.get_spade_and_hls(increment_channel[0])
+        except Exception:
+            spade_url = hls_url = ""
+    return primary, items, increment_channel, spade_url, hls_url
+
+
+def _display_drop(drops: List[Dict[str, Any]], ledger: ClaimLedger) -> Optional[Dict[str, Any]]:
+    """Дроп для строки прогресса: первый ещё не заклеймленный, иначе первый."""
+    for d in drops:
+        if not is_claimed(d) and str(d.get("dropInstanceID") or "") not in ledger.claimed:
+            return d
+    return drops[0] if drops else None
 
 
-def _extract_time_based_drop(inv: Any) -> Optional[Dict[str, Any]]:
+def _next_slot(slot: float, interval: float, now: float) -> float:
+    """Следующая точка сетки ``slot + k*interval`` после ``now``: расписание не дрейфует."""
+    return slot + max(1, math.floor((now - slot) / interval) + 1) * interval
+
+
+async def _beacon(
+    api: TwitchAPI,
+    login: str,
+    queue: asyncio.Queue,
+    increment_channel: Optional[tuple[str, str]],
+    spade_url: str,
+    hls_url: str,
+) -> bool:
+    """Минутный бикон: increment, spade и HLS одновременно (каждый — свой спан).
+
+    Возвращает True, если increment или spade упали и канал пора выбрать заново.
     """
-    Ищем тайм-бейзд дроп в ответе Inventory:
-    ожидаем поля requiredMinutesWatched/currentMinutesWatched/dropInstanceID (+ name).
-    Возвращаем узел drop или None.
+
+    async def step(name: str, what: str, call: Callable[[], Any], reassign: bool) -> bool:
+        try:
+            with span(name, cat="tick"):
+                await call()
+        except Exception as e:
+            await _safe_put(queue, (login, "error", ErrorData(f"{what} error: {e}")))
+            return reassign
+        return False
+
+    steps = []
+    if increment_channel:
+        clogin, cid = increment_channel
+        steps.append(step("session_context", "increment",
+                          lambda: api.drop_current_session_context(clogin, cid), True))
+    if spade_url:
+        steps.append(step("spade", "spade", lambda: api.spade_minute_watched(spade_url), True))
+    if hls_url:
+        steps.append(step("hls", "hls", lambda: api.head_hls(hls_url), False))
+    return any(await asyncio.gather(*steps))
+
+
+async def _check_progress(
+    api: TwitchAPI,
+    login: str,
+    queue: asyncio.Queue,
+    clock: Clock = SYSTEM_CLOCK,
+    state: Optional[AccountState] = None,
+    ledger: Optional[ClaimLedger] = None,
+) -> bool:
+    """Inventory и клеймы: прогресс в GUI, все готовые дропы — за один проход.
+
+    Возвращает True, если канал пора выбрать заново, не дожидаясь TTL кэша:
+    что-то заклеймлено или кампания завершена.
     """
-    def walk(obj: Any) -> Optional[Dict[str, Any]]:
-        if isinstance(obj, dict):
-            keys = set(obj.keys())
-            if {"requiredMinutesWatched", "currentMinutesWatched", "dropInstanceID"} <= keys:
-                return obj
-            for v in obj.values():
-                r = walk(v)
-                if r:
-                    return r
-        elif isinstance(obj, list):
-            for v in obj:
-                r = walk(v)
-                if r:
-                    return r
-        return None
-
-    return walk(inv)
+    reassign = False
+    if ledger is None:
+        ledger = ClaimLedger(state.claimed if state is not None else None, clock)
+    try:
+        with span("inventory", cat="tick"):
+            inv = await api.inventory()
+        if state is not None:
+            user = ((inv or {}).get("data") or {}).get("currentUser") or {}
+            state.user_id = str(user.get("id") or state.user_id)
+        drops = time_based_drops(inv)
+        drop = _display_drop(drops, ledger)
+        if drop:
+            req = int(drop.get("requiredMinutesWatched") or 0)
+            cur = int(drop.get("currentMinutesWatched") or 0)
+            pct = (cur / req * 100) if req else 0.0
+            remain = max(0, req - cur)
+            progress = {"pct": pct, "remain": remain, "drop": drop_name(drop)}
+            if state is not None:
+                state.progress = progress
+            await _safe_put(queue, (login, "progress", ProgressData(**progress)))
+
+        # все готовые дропы за один проход, параллельно; журнал не даёт клеймить дважды
+        for claimed, err in await claim_all(api, drops, ledger):
+            name = drop_name(claimed)
+            if err is not None:
+                await _safe_put(queue, (login, "error", ErrorData(f"claim error: {err}")))
+                continue
+            reassign = True
+            ts = ledger.claimed.get(str(claimed["dropInstanceID"]), "")
+            if state is not None:
+                state.last_claim = {"drop": name, "at": ts}
+            await _safe_put(queue, (login, "claimed", ClaimedData(name, ts)))
+        if state is not None:
+            done = sorted(finished_campaigns(inv, ledger.claimed))
+            if done != state.done:
+                state.done = done
+                reassign = True
+    except Exception as e:
+        await _safe_put(queue, (login, "error", ErrorData(f"inventory error: {e}")))
+    return reassign
+
+
+async def _load_campaigns(api: TwitchAPI) -> Tuple[Campaign, ...]:
+    with span("dashboard", cat="startup"):
+        dashboard = await api.viewer_dashboard()
+    # общий для всех воркеров кортеж Campaign — у аккаунта только ссылка на него
+    return get_catalog().intern(_parse_campaigns_from_dashboard(dashboard))
+
+
+def stop_worker(stop_evt: Optional[asyncio.Event], task: Optional[asyncio.Future], grace: float = STOP_GRACE) -> None:
+    """Остановить воркер: сразу stop_evt, отмена — только если за ``grace`` секунд не завершился сам.
+
+    ``grace=0`` — отмена сразу (кластер: аренда ушла, аккаунт может уже работать на другом узле).
+    """
+    if stop_evt is not None:
+        stop_evt.set()
+    if task is None or task.done():
+        return
+    if grace <= 0:
+        task.cancel()
+        return
+    timer = asyncio.get_event_loop().call_later(grace, task.cancel)
+    task.add_done_callback(lambda _t: timer.cancel())
 
 
 async def run_account(
@@ -119,175 +276,325 @@ async def run_account(
     client_version: str = "",
     client_integrity: str = "",
     tick_interval: float = 60.0,
+    clock: Clock = SYSTEM_CLOCK,
+    api_factory: Optional[Callable[..., TwitchAPI]] = None,
+    token_loader: Optional[Callable[[str], Optional[str]]] = None,
+    store: Optional[StateStore] = None,
+    allocator: Optional[WatchAllocator] = None,
+    scheduler: Optional[TickScheduler] = None,
+    tick_phase: Optional[float] = None,
+    pubsub: Optional[PubSubHub] = None,
+    progress_interval: Optional[float] = None,
 ):
     """
     Воркер для одного аккаунта:
       1) читает cookies/<login>.json -> auth-token
       2) запрашивает ViewerDropsDashboard и публикует список кампаний
-      3) публикует активную кампанию и список каналов по ней (если удаётся)
-      4) периодически опрашивает Inventory и отправляет прогресс/клеймы
+      3) выбирает канал сразу под все выбранные кампании (allocator) и публикует его
+      4) шлёт минутные биконы по точной сетке tick_interval, а Inventory и
+         клеймы проверяет отдельной задачей раз в progress_interval
       5) ждёт команды из cmd_q: 'select_campaigns', 'switch'
+
+    С ``pubsub`` прогресс дропа и падение стрима приходят событиями, а
+    Inventory опрашивается только для сверки (RECONCILE_INTERVAL), при
+    завершении дропа или если подписка PubSub не работает.
+
+    ``tick_phase`` (0..1) закрепляет тики за долей интервала, чтобы флот,
+    запущенный волнами (см. rampup.RampUp), не тикал одновременно.
+
+    Со ``scheduler`` каждый тик ждёт слота в общем бюджете запросов: раньше
+    получают аккаунты, которым меньше всего осталось до клейма.
+
+    С ``store`` шаги 2–3 берутся из state/<login>.json, пока не истёк TTL,
+    а кэш обновляется лениво по ходу работы — рестарт не даёт всплеска запросов.
+
+    clock/api_factory/token_loader позволяют гонять воркер в виртуальном
+    времени против симулятора (см. src/sim.py).
     """
-    await _safe_put(queue, (login, "status", {"status": "Starting", "note": "Init worker"}))
+    # спаны этого воркера попадают в «дорожку» аккаунта на таймлайне
+    current_login.set(login)
+    await _safe_put(queue, (login, "status", StatusData("Starting", "Init worker")))
 
-    token = auth_token_from_cookies(login)
+    token = (token_loader or auth_token_from_cookies)(login)
     if not token:
-        await _safe_put(queue, (login, "error", {"msg": "no cookies/auth-token"}))
-        await _safe_put(queue, (login, "status", {"status": "Stopped"}))
+        await _safe_put(queue, (login, "error", ErrorData("no cookies/auth-token")))
+        await _safe_put(queue, (login, "status", StatusData("Stopped")))
         return
 
-    api = TwitchAPI(
+    api = (api_factory or TwitchAPI)(
         token,
         proxy=proxy or "",
         client_version=client_version or "",
         client_integrity=client_integrity or "",
         login=login,
+        clock=clock,
     )
     await api.start()
-    await _safe_put(queue, (login, "status", {"status": "Querying", "note": "Fetching campaigns"}))
+    health = getattr(api, "health", None) or get_proxy_health()
+    # текущий прокси воркера: после переезда с лежащего он меняется
+    current_proxy = proxy or ""
+    health.attach(current_proxy)
+    state = (store.load(login) if store else None) or AccountState()
+    ledger = ClaimLedger(state.claimed, clock)
+
+    def persist() -> None:
+        if store is not None:
+            store.save(login, state)
+
+    async def announce(primary_id: str) -> None:
+        camp = next((c for c in selected if c.id == primary_id), None)
+        if camp is not None:
+            extra = sum(1 for c in selected if c.id not in state.done) - 1
+            name = f"{camp.name} (+{extra})" if extra > 0 else camp.name
+            await _safe_put(queue, (login, "campaign", {"camp": name, "game": camp.game}))
+
+    async def publish_channel(force: bool = False) -> None:
+        """Канал под выбранные кампании: из кэша состояния или заново через аллокатор."""
+        nonlocal increment_channel, spade_url, hls_url
+        if not selected:
+            return
+        # бикон и проверка прогресса идут параллельно — канал выбирает кто-то один
+        async with channel_lock:
+            ids = [c.id for c in selected]
+            if force or not state.channel_fresh(ids, clock.time()):
+                primary, *watch = await _resolve_watch(
+                    api, selected, frozenset(state.done), allocator, clock.time()
+                )
+                state.set_channel(ids, primary, *watch, now=clock.time())
+            increment_channel = state.increment_channel
+            spade_url, hls_url = state.spade_url, state.hls_url
+        await announce(state.campaign_id)
+        await _safe_put(queue, (login, "channels", {"channels": state.channels}))
+
+    def select(ids: List[str]) -> List[Campaign]:
+        return [c for c in campaigns if c.id in ids]
+
+    def on_pubsub(topic: str, msg: Dict[str, Any]) -> None:
+        nonlocal inventory_due, channel_down
+        kind = msg.get("type")
+        data = msg.get("data") or {}
+        if kind == "drop-progress":
+            req = int(data.get("required_progress_min") or 0)
+            cur = int(data.get("current_progress_min") or 0)
+            progress = {
+                "pct": (cur / req * 100) if req else 0.0,
+                "remain": max(0, req - cur),
+                "drop": state.progress.get("drop", "") if state.progress else "",
+            }
+            state.progress = progress
+            try:
+                queue.put_nowait((login, "progress", ProgressData(**progress)))
+            except Exception:
+                pass
+            if req and cur >= req:
+                inventory_due = True
+        elif kind == "drop-claim":
+            inventory_due = True
+        elif kind == "stream-down":
+            channel_down = True
+
+    def resubscribe() -> None:
+        """Топики PubSub аккаунта: его дропы и канал, который сейчас смотрим."""
+        nonlocal subscription
+        if pubsub is None:
+            return
+        topics = [f"user-drop-events.{state.user_id}"] if state.user_id else []
+        if increment_channel:
+            topics.append(f"video-playback-by-id.{increment_channel[1]}")
+        if subscription is not None:
+            if list(subscription.topics) == topics:
+                return
+            pubsub.unsubscribe(subscription)
+        subscription = pubsub.subscribe(topics, token, on_pubsub) if topics else None
+
+    async def proxy_ready() -> bool:
+        """False — breaker прокси открыт: тик пропускаем; с пулом — переезжаем на здоровый прокси."""
+        nonlocal paused, current_proxy
+        current = current_proxy
+        if health.available(current):
+            if paused:
+                paused = False
+                await _safe_put(queue, (login, "status", StatusData("Running", "Proxy recovered")))
+            return True
+        moved = health.replacement(current)
+        if moved:
+            api.proxy = current_proxy = moved
+            paused = False
+            await _safe_put(queue, (login, "proxy", {"proxy": moved}))
+            note = f"Moved from {redact(current)} to {redact(moved)}"
+            await _safe_put(queue, (login, "status", StatusData("Running", note)))
+            return True
+        if not paused:
+            paused = True
+            note = f"Proxy {redact(current)} unavailable, waiting for recovery"
+            await _safe_put(queue, (login, "status", StatusData("Paused", note)))
+        return False
+
+    async def check_progress() -> None:
+        """Inventory, клеймы и ленивая перепроверка кэша — своим шагом, мимо биконов."""
+        nonlocal inventory_due, last_inventory, campaigns, selected
+        try:
+            reassign = False
+            if inventory_needed():
+                inventory_due = False
+                last_inventory = clock.monotonic()
+                with span("progress", cat="worker"):
+                    reassign = await _check_progress(api, login, queue, clock, state, ledger)
+            # кампании — по TTL; канал — по TTL, после клейма или завершения кампании
+            if not state.campaigns_fresh(clock.time()):
+                campaigns = await _load_campaigns(api)
+                state.set_campaigns(campaigns, clock.time())
+                await _safe_put(queue, (login, "campaigns", {"campaigns": campaigns}))
+                selected = select([c.id for c in selected]) or list(campaigns)
+            if reassign or not state.channel_fresh([c.id for c in selected], clock.time()):
+                await publish_channel(force=True)
+            resubscribe()
+            persist()
+        except Exception as e:
+            await _safe_put(queue, (login, "error", ErrorData(f"tick error: {e}")))
+
+    def inventory_needed() -> bool:
+        if pubsub is None or inventory_due or not pubsub.healthy(subscription):
+            return True
+        if state.progress and int(state.progress.get("remain", 1) or 0) <= 0:
+            return True
+        return clock.monotonic() - last_inventory >= RECONCILE_INTERVAL
+
+    allocator = allocator or get_allocator()
+    increment_channel: Optional[tuple[str, str]] = None
+    spade_url = ""
+    hls_url = ""
+    subscription: Optional[Subscription] = None
+    inventory_due = True
+    channel_down = False
+    last_inventory = float("-inf")
+    paused = False
+    channel_lock = asyncio.Lock()
+    progress_interval = progress_interval or tick_interval
+    progress_task: Optional[asyncio.Future] = None
 
     try:
-        # 1) Дашборд дропсов
-        dashboard = await api.viewer_dashboard()
-        campaigns = _parse_campaigns_from_dashboard(dashboard)
+        # 1) Дашборд дропсов (или кэш)
+        # из кэша — только если записи кампаний есть в каталоге (их туда кладёт StateStore.load)
+        campaigns = state.campaigns() if state.campaigns_fresh(clock.time()) else ()
+        if campaigns:
+            note = "Campaigns from cache"
+        else:
+            await _safe_put(queue, (login, "status", StatusData("Querying", "Fetching campaigns")))
+            campaigns = await _load_campaigns(api)
+            state.set_campaigns(campaigns, clock.time())
+            note = "Campaigns discovered"
         await _safe_put(queue, (login, "campaigns", {"campaigns": campaigns}))
 
-        # выберем первую как активную по умолчанию
-        active_ids: List[str] = [campaigns[0]["id"]] if campaigns else []
-        selected_campaign = campaigns[0] if campaigns else None
-        if selected_campaign:
-            await _safe_put(
-                queue,
-                (login, "campaign", {"camp": selected_campaign["name"], "game": selected_campaign["game"]}),
-            )
-
-            # 2) список живых каналов
-            ch_items = await _initial_channels(api, selected_campaign["id"])
-            if not ch_items and selected_campaign.get("channels"):
-                ch_items = [{"name": n, "viewers": 0, "live": False} for n in selected_campaign["channels"]]
-            await _safe_put(queue, (login, "channels", {"channels": ch_items}))
+        # выбранные кампании: сохранённые, иначе все (как в диалоге GUI по умолчанию)
+        selected: List[Campaign] = select(state.active_ids) or list(campaigns)
+        # 2) канал для increment и его spade/HLS — лучший сразу по всем выбранным кампаниям
+        await publish_channel()
+        resubscribe()
+        persist()
 
-        await _safe_put(queue, (login, "status", {"status": "Ready", "note": "Campaigns discovered"}))
+        await _safe_put(queue, (login, "status", StatusData("Ready", note)))
 
         # 3) периодика: increment + inventory
-        loop = asyncio.get_event_loop()
-        next_tick = loop.time() + tick_interval
+        next_tick = clock.monotonic() + tick_interval
+        if tick_phase is not None:
+            offset = tick_phase * tick_interval
+            next_tick = offset + math.ceil((clock.monotonic() - offset) / tick_interval) * tick_interval
+        next_progress = next_tick
 
-        # данные канала (login, id) для DropCurrentSessionContext
-        increment_channel: Optional[tuple[str, str]] = None
-        spade_url = ""
-        hls_url = ""
-        try:
-            if selected_campaign:
-                live = await api.get_live_channels(selected_campaign["id"])
-                for clogin, cid, _v, _live in live:
-                    if isinstance(cid, str) and cid.isdigit():
-                        increment_channel = (clogin, cid)
-                        break
-        except Exception:
-            increment_channel = None
-
-        if increment_channel:
-            try:
-                spade_url, hls_url = await api.get_spade_and_hls(increment_channel[0])
-            except Exception:
-                spade_url = ""
-                hls_url = ""
         # 4) цикл
         while not stop_evt.is_set():
-            now = loop.time()
+            now = clock.monotonic()
 
             # команды из GUI
             if cmd_q is not None:
                 try:
                     cmd, arg = cmd_q.get_nowait()
                     if cmd == "select_campaigns" and isinstance(arg, list):
-                        ids = [cid for cid in arg if any(c["id"] == cid for c in campaigns)]
-                        if ids:
-                            active_ids = ids
-                            selected_campaign = next((c for c in campaigns if c["id"] == active_ids[0]), selected_campaign)
-                            if selected_campaign:
-                                await _safe_put(queue, (login, "campaign", {
-                                    "camp": selected_campaign["name"], "game": selected_campaign["game"]
-                                }))
-                                ch_items = await _initial_channels(api, selected_campaign["id"])
-                                if not ch_items and selected_campaign.get("channels"):
-                                    ch_items = [{"name": n, "viewers": 0, "live": False} for n in selected_campaign["channels"]]
-                                await _safe_put(queue, (login, "channels", {"channels": ch_items}))
-                                # переопределим increment канал
-                                increment_channel = None
-                                try:
-                                    live = await api.get_live_channels(selected_campaign["id"])
-                                    for clogin, cid, _v, _live in live:
-                                        if isinstance(cid, str) and cid.isdigit():
-                                            increment_channel = (clogin, cid)
-                                            break
-                                except Exception:
-                                    pass
+                        chosen = select(arg)
+                        if chosen:
+                            selected = chosen
+                            # переопределим increment канал
+                            await publish_channel()
+                            persist()
                     elif cmd == "switch":
                         await _safe_put(queue, (login, "switch", {"channel": str(arg or "")}))
                 except asyncio.QueueEmpty:
                     pass
                 except Exception as e:
-                    await _safe_put(queue, (login, "error", {"msg": f"cmd_q error: {e}"}))
+                    await _safe_put(queue, (login, "error", ErrorData(f"cmd_q error: {e}")))
 
             if now >= next_tick:
-                if increment_channel:
-                    try:
-                        clogin, cid = increment_channel
-                        await api.drop_current_session_context(clogin, cid)
-                    except Exception as e:
-                        await _safe_put(queue, (login, "error", {"msg": f"increment error: {e}"}))
-
-                if spade_url:
-                    try:
-                        await api.spade_minute_watched(spade_url)
-                    except Exception as e:
-                        await _safe_put(queue, (login, "error", {"msg": f"spade error: {e}"}))
-
-                if hls_url:
-                    try:
-                        await api.head_hls(hls_url)
-                    except Exception as e:
-                        await _safe_put(queue, (login, "error", {"msg": f"hls error: {e}"}))
-
+                if not await proxy_ready():
+                    delay = max(1.0, min(health.retry_in(current_proxy), tick_interval))
+                    if cmd_q is not None:
+                        await clock.sleep(min(delay, 0.5))
+                    else:
+                        await clock.wait_event(stop_evt, delay)
+                    continue
+                # биконы идут по сетке tick_interval; насколько опоздали — в метрику
+                BEACON_JITTER.observe(max(0.0, now - next_tick))
+                if scheduler is not None:
+                    primary = get_catalog().get(state.campaign_id)
+                    granted = await scheduler.acquire(
+                        login,
+                        current_proxy,
+                        state.progress.get("remain") if state.progress else None,
+                        primary.ends_at if primary else 0.0,
+                        stop_evt,
+                    )
+                    # ожидание слота — отдельно от опоздания: это очередь, а не лаг воркера
+                    TICK_QUEUE_WAIT.observe(clock.monotonic() - now)
+                    if not granted:
+                        break
+                    # следующий тик — не раньше чем через интервал от фактического
+                    now = clock.monotonic()
+                if now >= next_progress and (progress_task is None or progress_task.done()):
+                    # Inventory и клеймы — отдельной задачей: медленный ответ не сдвигает биконы
+                    progress_task = asyncio.ensure_future(check_progress())
+                    next_progress = _next_slot(next_progress, progress_interval, now)
                 try:
-                    inv = await api.inventory()
-                    drop = _extract_time_based_drop(inv)
-                    if drop:
-                        req = int(drop.get("requiredMinutesWatched") or 0)
-                        cur = int(drop.get("currentMinutesWatched") or 0)
-                        did = str(drop.get("dropInstanceID") or "")
-                        drop_name = (
-                            drop.get("name")
-                            or (drop.get("benefit") or {}).get("name")
-                            or drop.get("id")
-                            or ""
-                        )
-                        pct = (cur / req * 100) if req else 0.0
-                        remain = max(0, req - cur)
-                        await _safe_put(queue, (login, "progress", {"pct": pct, "remain": remain, "drop": drop_name}))
-
-                        if req and cur >= req and did:
-                            try:
-                                await api.claim(did)
-                                ts = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
-                                await _safe_put(queue, (login, "claimed", {"drop": drop_name, "at": ts, "pct": 100, "remain": 0}))
-                            except Exception as e:
-                                await _safe_put(queue, (login, "error", {"msg": f"claim error: {e}"}))
+                    if channel_down:
+                        # стрим упал (PubSub) — списки каналов устарели, выбираем заново
+                        channel_down = False
+                        for c in selected:
+                            allocator.invalidate(c.id)
+                        await publish_channel(force=True)
+                    with span("tick", cat="worker"):
+                        reassign = await _beacon(api, login, queue, increment_channel, spade_url, hls_url)
+                    if reassign:
+                        await publish_channel(force=True)
+                    resubscribe()
                 except Exception as e:
-                    await _safe_put(queue, (login, "error", {"msg": f"inventory error: {e}"}))
+                    await _safe_put(queue, (login, "error", ErrorData(f"tick error: {e}")))
                 finally:
-                    next_tick = now + tick_interval
+                    if scheduler is not None:
+                        next_tick = now + tick_interval
+                    else:
+                        next_tick = _next_slot(next_tick, tick_interval, clock.monotonic())
 
-            await asyncio.sleep(0.5)
+            # спим до следующего тика; с cmd_q — просыпаемся раз в 0.5 с за командами
+            delay = max(0.0, next_tick - clock.monotonic())
+            if cmd_q is not None:
+                await clock.sleep(min(delay, 0.5))
+            else:
+                await clock.wait_event(stop_evt, delay)
 
-        await _safe_put(queue, (login, "status", {"status": "Stopped"}))
+        if progress_task is not None:
+            # начатую проверку доводим до конца: клейм не должен оборваться на полпути
+            await progress_task
+        await _safe_put(queue, (login, "status", StatusData("Stopped")))
 
     except Exception as e:
-        await _safe_put(queue, (login, "error", {"msg": f"GQL error: {e}"}))
-        await _safe_put(queue, (login, "status", {"status": "Stopped"}))
+        await _safe_put(queue, (login, "error", ErrorData(f"GQL error: {e}")))
+        await _safe_put(queue, (login, "status", StatusData("Stopped")))
     finally:
+        if progress_task is not None and not progress_task.done():
+            progress_task.cancel()
+        health.detach(current_proxy)
+        if pubsub is not None and subscription is not None:
+            pubsub.unsubscribe(subscription)
+        persist()
         try:
             await api.close()
         except Exception:
@@ -1,7 +1,9 @@
 from __future__ import annotations
 import json
 import logging
-from typing import Dict
+import threading
+import time
+from typing import Dict, Optional
 from pathlib import Path
 
 OPS_PATH = Path("ops/ops.json")
@@ -24,14 +26,15 @@ REQUIRED = [
 logger = logging.getLogger(__name__)
 
 
-def load_ops() -> Dict[str, str]:
+def load_ops(path: Optional[Path] = None) -> Dict[str, str]:
+    path = OPS_PATH if path is None else path
     try:
-        return json.loads(OPS_PATH.read_text(encoding="utf-8"))
+        return json.loads(path.read_text(encoding="utf-8"))
     except FileNotFoundError:
-        logger.error("OPS file not found at %s", OPS_PATH)
+        logger.error("OPS file not found at %s", path)
         return {}
     except json.JSONDecodeError as exc:
-        logger.error("Failed to decode OPS file %s: %s", OPS_PATH, exc)
+        logger.error("Failed to decode OPS file %s: %s", path, exc)
         return {}
 
 def get_hash(ops: dict, op: str) -> tuple[str, str]:
@@ -56,3 +59,147 @@ def missing_ops(ops: dict) -> list[str]:
         except RuntimeError:
             miss.append(k)
     return miss
+
+
+def resolve_all(ops: dict) -> Dict[str, tuple[str, str]]:
+    """Заранее разрешённые алиасы: op -> (имя операции, hash) для всех известных имён."""
+    out: Dict[str, tuple[str, str]] = {}
+    for name in {*ops, *ALIASES, *ALIASES.values(), *REQUIRED}:
+        try:
+            out[name] = get_hash(ops, name)
+        except RuntimeError:
+            pass
+    return out
+
+
+class _Snapshot:
+    """Immutable view of one ops.json version; replaced as a whole on reload."""
+
+    __slots__ = ("path", "mtime", "ops", "resolved")
+
+    def __init__(self, path: Path, mtime: float, ops: Dict[str, str]):
+        self.path = path
+        self.mtime = mtime
+        self.ops = ops
+        self.resolved = resolve_all(ops)
+
+
+class OpsRegistry:
+    """Process-wide ops hashes shared by all TwitchAPI instances.
+
+    ops.json is parsed once; afterwards its mtime is polled at most every
+    ``poll_interval`` seconds and a changed file is swapped in atomically
+    (workers simply see the new snapshot on their next call).
+    """
+
+    def __init__(self, path: Optional[Path] = None, poll_interval: float = 5.0):
+        self._path = path
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._checked_at = 0.0
+        self._snap = self._load(self.path)
+
+    @property
+    def path(self) -> Path:
+        # None -> модульный OPS_PATH (его подменяют тесты)
+        return OPS_PATH if self._path is None else self._path
+
+    @property
+    def ops(self) -> Dict[str, str]:
+        self.maybe_reload()
+        return self._snap.ops
+
+    def _load(self, path: Path) -> _Snapshot:
+        try:
+            mtime = path.stat().st_mtime
+        except OSError:
+            mtime = 0.0
+        return _Snapshot(path, mtime, load_ops(path))
+
+    def maybe_reload(self) -> bool:
+        now = time.monotonic()
+        if now - self._checked_at < self.poll_interval:
+            return False
+        self._checked_at = now
+        return self.reload(force=False)
+
+    def reload(self, force: bool = True) -> bool:
+        """Re-read ops.json if it changed (or always with ``force``)."""
+        path = self.path
+        try:
+            mtime = path.stat().st_mtime
+        except OSError:
+            mtime = 0.0
+        snap = self._snap
+        if not force and path == snap.path and mtime == snap.mtime:
+            return False
+        new = self._load(path)
+        if not new.ops and snap.ops and path == snap.path:
+            # битый/недописанный файл — продолжаем работать на старых хэшах, но mtime
+            # запоминаем: иначе его перечитывали бы на каждом опросе до следующей записи
+            with self._lock:
+                self._snap = _Snapshot(path, new.mtime, snap.ops)
+            logger.warning("OPS file %s is unreadable; keeping %d known operations", path, len(snap.ops))
+            return False
+        with self._lock:
+            self._snap = new
+        logger.info("OPS reloaded from %s (%d operations)", path, len(new.ops))
+        return True
+
+    def resolve(self, op: str) -> tuple[str, str]:
+        self.maybe_reload()
+        res = self._snap.resolved.get(op)
+        if res is None:
+            return get_hash(self._snap.ops, op)
+        return res
+
+    def missing(self) -> list[str]:
+        return missing_ops(self.ops)
+
+    def update(self, hashes: Dict[str, str], persist: bool = True) -> bool:
+        """Merge new hashes, swap them in and (optionally) write ops.json atomically."""
+        with self._lock:
+            snap = self._snap
+            path = self.path
+            try:
+                mtime = path.stat().st_mtime
+            except OSError:
+                mtime = 0.0
+            if path != snap.path or mtime != snap.mtime:
+                # файл правили после последнего опроса — сливаем в свежие хэши, а не затираем правку
+                fresh = self._load(path)
+                if fresh.ops or not snap.ops or path != snap.path:
+                    snap = fresh
+            ops = dict(snap.ops)
+            changed = {k: v for k, v in hashes.items() if v and ops.get(k) != v}
+            if not changed:
+                if snap is not self._snap:
+                    self._snap = snap
+                return False
+            ops.update(changed)
+            mtime = snap.mtime
+            if persist:
+                try:
+                    path.parent.mkdir(parents=True, exist_ok=True)
+                    tmp = path.with_suffix(".tmp")
+                    tmp.write_text(json.dumps(ops, ensure_ascii=False, indent=2), encoding="utf-8")
+                    tmp.replace(path)
+                    mtime = path.stat().st_mtime
+                except OSError as exc:
+                    logger.error("Failed to write OPS file %s: %s", path, exc)
+            self._snap = _Snapshot(path, mtime, ops)
+        logger.info("OPS updated: %s", ", ".join(sorted(changed)))
+        return True
+
+
+_registry: Optional[OpsRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> OpsRegistry:
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = OpsRegistry()
+    return _registry
@@ -0,0 +1,116 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from . import client_integrity
+from .ops import OpsRegistry, get_registry
+
+logger = logging.getLogger(__name__)
+
+# после неудачного поиска не запускаем браузер заново для той же операции
+FAILED_COOLDOWN = 300.0
+
+Fetcher = Callable[..., Awaitable[Dict[str, str]]]
+
+
+def is_pq_not_found(errors: Any) -> bool:
+    """True if a GQL ``errors`` list reports an unknown persisted query hash."""
+    if not isinstance(errors, list):
+        return False
+    for e in errors:
+        msg = e.get("message") if isinstance(e, dict) else e
+        if "PersistedQueryNotFound" in str(msg):
+            return True
+    return False
+
+
+class HashDiscovery:
+    """Single-flight recovery of rotated persisted-query hashes.
+
+    All workers that hit PersistedQueryNotFound for the same operation await
+    one shared browser capture; once it updates the registry they retry with
+    the new hash.
+    """
+
+    def __init__(
+        self,
+        registry: Optional[OpsRegistry] = None,
+        fetch: Optional[Fetcher] = None,
+        cooldown: float = FAILED_COOLDOWN,
+    ):
+        self.registry = registry or get_registry()
+        self._fetch = fetch
+        self.cooldown = cooldown
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._failed_at: Dict[str, float] = {}
+
+    def _current(self, operation: str) -> str:
+        try:
+            return self.registry.resolve(operation)[1]
+        except RuntimeError:
+            return ""
+
+    async def _discover(
+        self, operation: str, login: str, proxy: str, variables: Optional[Dict[str, Any]]
+    ) -> bool:
+        fetch = self._fetch or client_integrity.fetch_op_hashes
+        t0 = time.monotonic()
+        before = self._current(operation)
+        try:
+            found = await fetch(login, operation, proxy, variables)
+        except Exception as exc:
+            logger.error("Hash discovery for %s failed: %s", operation, exc)
+            found = {}
+        self.registry.update(found)
+        ok = bool(self._current(operation)) and self._current(operation) != before
+        if ok:
+            self._failed_at.pop(operation, None)
+            logger.info("Hash for %s recovered in %.1fs", operation, time.monotonic() - t0)
+        else:
+            self._failed_at[operation] = time.monotonic()
+            logger.error("Hash for %s not found (%d captured)", operation, len(found))
+        return ok
+
+    async def recover(
+        self,
+        operation: str,
+        failed_hash: str,
+        login: str,
+        proxy: str = "",
+        variables: Optional[Dict[str, Any]] = None,
+    ) -> bool:
+        """Make sure the registry holds a hash other than ``failed_hash``.
+
+        Returns True when the caller should retry its request.
+        """
+        if self._current(operation) not in ("", failed_hash):
+            # уже обновлено другим воркером или правкой ops.json
+            return True
+        task = self._inflight.get(operation)
+        if task is None:
+            failed = self._failed_at.get(operation)
+            if failed is not None and time.monotonic() - failed < self.cooldown:
+                return False
+            if not login:
+                return False
+            task = asyncio.ensure_future(self._discover(operation, login, proxy, variables))
+            self._inflight[operation] = task
+            task.add_done_callback(lambda _t, op=operation: self._inflight.pop(op, None))
+        try:
+            # shield: отмена одного воркера не должна срывать общий поиск
+            return await asyncio.shield(task)
+        except Exception:
+            return False
+
+
+_discovery: Optional[HashDiscovery] = None
+
+
+def get_discovery() -> HashDiscovery:
+    global _discovery
+    if _discovery is None:
+        _discovery = HashDiscovery()
+    return _discovery
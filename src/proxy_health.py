@@ -0,0 +1,298 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from collections import deque
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Deque, Dict, Iterator, List, Optional, Sequence
+
+import aiohttp
+from yarl import URL
+
+from .clock import SYSTEM_CLOCK, Clock
+from .metrics import PROXY_ERROR_RATIO, PROXY_LATENCY, PROXY_TRIPS, PROXY_UP
+
+logger = logging.getLogger(__name__)
+
+# окно последних попыток, по которому считаем долю ошибок
+WINDOW = 50
+MIN_SAMPLES = 10
+ERROR_THRESHOLD = 0.5
+# столько неудач подряд — breaker открывается сразу, не дожидаясь окна
+FAILS_TO_OPEN = 5
+# пауза до проверки: 30 с, 60 с, ... не больше 10 минут
+COOLDOWN = 30.0
+COOLDOWN_MAX = 600.0
+# прокси лежит дольше — аккаунты переезжают на здоровые из пула
+MOVE_AFTER = 120.0
+LATENCY_ALPHA = 0.2
+PROBE_URL = "https://gql.twitch.tv/"
+PROBE_TIMEOUT = 10.0
+
+OK, ERROR, THROTTLED = "ok", "error", "throttled"
+CLOSED, OPEN = "closed", "open"
+
+Probe = Callable[[str], Awaitable[bool]]
+
+
+class CircuitOpen(RuntimeError):
+    def __init__(self, proxy: str, retry_in: float):
+        super().__init__(f"proxy {redact(proxy)} unavailable, retry in {retry_in:.0f}s")
+        self.proxy = proxy
+        self.retry_in = retry_in
+
+
+def redact(proxy: str) -> str:
+    """Прокси без логина/пароля — для GUI, логов и меток метрик."""
+    if "://" not in proxy:
+        return proxy.rsplit("@", 1)[-1]
+    try:
+        u = URL(proxy)
+    except (ValueError, TypeError):
+        return proxy
+    if u.user or u.password:
+        return str(u.with_user(None))
+    return proxy
+
+
+def outcome_of(exc: Optional[BaseException]) -> str:
+    """Чья это ошибка: прокси/сети (error), лимита Twitch (throttled) или ничья (ok)."""
+    if exc is None:
+        return OK
+    cause = getattr(exc, "cause", None)
+    if cause == "429":
+        return THROTTLED
+    if cause in ("5xx", "network"):
+        return ERROR
+    if isinstance(exc, (aiohttp.ClientError, asyncio.TimeoutError, OSError)):
+        return ERROR
+    return OK
+
+
+async def http_probe(proxy: str) -> bool:
+    """Жив ли прокси: любой HTTP-ответ от Twitch через него (кроме 5xx)."""
+    timeout = aiohttp.ClientTimeout(total=PROBE_TIMEOUT)
+    try:
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            async with session.get(PROBE_URL, proxy=proxy) as r:
+                return r.status < 500
+    except Exception:
+        return False
+
+
+def load_pool(path: Path) -> List[str]:
+    """Файл пула: один прокси на строку, # — комментарий."""
+    out: List[str] = []
+    for raw in Path(path).read_text(encoding="utf-8").splitlines():
+        line = raw.strip()
+        if line and not line.startswith("#"):
+            out.append(line)
+    return out
+
+
+class ProxyStats:
+    __slots__ = (
+        "proxy", "latency", "outcomes", "fails", "state", "opened_at", "retry_at", "streak", "trips", "accounts",
+    )
+
+    def __init__(self, proxy: str):
+        self.proxy = proxy
+        self.latency = 0.0
+        self.outcomes: Deque[str] = deque(maxlen=WINDOW)
+        self.fails = 0
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.retry_at = 0.0
+        # сколько проверок подряд провалено — от этого растёт пауза
+        self.streak = 0
+        self.trips = 0
+        self.accounts = 0
+
+    def rate(self, outcome: str) -> float:
+        n = len(self.outcomes)
+        return sum(1 for o in self.outcomes if o == outcome) / n if n else 0.0
+
+    @property
+    def cost(self) -> float:
+        """Чем меньше, тем лучше прокси: задержка с поправкой на ошибки и 429."""
+        return (self.latency or 1.0) * (1 + 4 * self.rate(ERROR) + 2 * self.rate(THROTTLED))
+
+
+class ProxyHealth:
+    """Latency, error and throttling stats per proxy with circuit breakers.
+
+    Every request attempt through a proxy is recorded. Five failures in a row,
+    or half of the last ``WINDOW`` attempts failing, open the proxy's breaker:
+    requests through it fail at once with ``CircuitOpen`` instead of burning
+    retries, and workers on it pause. Throttling (429) is per account, not a
+    proxy fault: it lowers the proxy's score but never opens the breaker.
+    A background probe re-checks the proxy
+    after a cooldown that doubles on each failed probe and closes the breaker
+    once it answers. With a ``pool``, accounts whose proxy stays down longer
+    than ``MOVE_AFTER`` move to the healthiest, least loaded pool proxy.
+    """
+
+    def __init__(
+        self,
+        clock: Clock = SYSTEM_CLOCK,
+        probe: Optional[Probe] = None,
+        pool: Sequence[str] = (),
+    ):
+        self.clock = clock
+        self.probe = probe or http_probe
+        self.pool: List[str] = list(pool)
+        self._stats: Dict[str, ProxyStats] = {}
+        self._probes: Dict[str, asyncio.Task] = {}
+
+    def stats(self, proxy: str) -> ProxyStats:
+        st = self._stats.get(proxy)
+        if st is None:
+            st = self._stats[proxy] = ProxyStats(proxy)
+            PROXY_UP.set(1, redact(proxy))
+        return st
+
+    # ── accounting ───────────────────────────────────────────────────────────
+    def attach(self, proxy: str) -> None:
+        if proxy:
+            self.stats(proxy).accounts += 1
+
+    def detach(self, proxy: str) -> None:
+        if proxy and proxy in self._stats:
+            st = self._stats[proxy]
+            st.accounts = max(0, st.accounts - 1)
+
+    # ── breaker ──────────────────────────────────────────────────────────────
+    def available(self, proxy: str) -> bool:
+        st = self._stats.get(proxy) if proxy else None
+        return st is None or st.state == CLOSED
+
+    def retry_in(self, proxy: str) -> float:
+        st = self._stats.get(proxy)
+        if st is None or st.state == CLOSED:
+            return 0.0
+        return max(0.0, st.retry_at - self.clock.monotonic())
+
+    def check(self, proxy: str) -> None:
+        if not self.available(proxy):
+            raise CircuitOpen(proxy, self.retry_in(proxy))
+
+    @contextmanager
+    def track(self, proxy: str) -> Iterator[None]:
+        """Обернуть одну попытку запроса через ``proxy``: проверка breaker и учёт результата."""
+        self.check(proxy)
+        t0 = self.clock.monotonic()
+        try:
+            yield
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.record(proxy, self.clock.monotonic() - t0, outcome_of(e))
+            raise
+        self.record(proxy, self.clock.monotonic() - t0, OK)
+
+    def record(self, proxy: str, latency: float, outcome: str) -> None:
+        st = self.stats(proxy)
+        st.outcomes.append(outcome)
+        label = redact(proxy)
+        if outcome == OK:
+            st.fails = 0
+            st.latency = latency if not st.latency else st.latency + LATENCY_ALPHA * (latency - st.latency)
+            PROXY_LATENCY.set(st.latency, label)
+        elif outcome == ERROR:
+            st.fails += 1
+        PROXY_ERROR_RATIO.set(1.0 - st.rate(OK), label)
+        # 429 — лимит аккаунта/токена, а не мёртвый прокси: он только в оценке (cost) и метриках,
+        # иначе всплеск троттлинга на рампе ставил бы на паузу всех на здоровом прокси
+        if st.state == CLOSED and (
+            st.fails >= FAILS_TO_OPEN
+            or (len(st.outcomes) >= MIN_SAMPLES and st.rate(ERROR) >= ERROR_THRESHOLD)
+        ):
+            self._open(st)
+
+    def _open(self, st: ProxyStats) -> None:
+        now = self.clock.monotonic()
+        st.state = OPEN
+        st.opened_at = now
+        st.retry_at = now + COOLDOWN
+        st.trips += 1
+        PROXY_TRIPS.inc(redact(st.proxy))
+        PROXY_UP.set(0, redact(st.proxy))
+        logger.warning("Proxy %s: circuit open (%d fails, %.0f%% errors)", redact(st.proxy), st.fails,
+                       100 * st.rate(ERROR))
+        task = self._probes.get(st.proxy)
+        if task is None or task.done():
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:  # нет event loop — проверки не будет, breaker закрывать некому
+                return
+            self._probes[st.proxy] = loop.create_task(self._probe_loop(st))
+
+    def _close(self, st: ProxyStats) -> None:
+        st.state = CLOSED
+        st.fails = 0
+        st.streak = 0
+        st.outcomes.clear()
+        PROXY_UP.set(1, redact(st.proxy))
+        logger.info("Proxy %s: recovered", redact(st.proxy))
+
+    async def _probe_loop(self, st: ProxyStats) -> None:
+        while st.state == OPEN:
+            await self.clock.sleep(max(0.0, st.retry_at - self.clock.monotonic()))
+            try:
+                alive = await self.probe(st.proxy)
+            except Exception:
+                alive = False
+            if alive:
+                self._close(st)
+                return
+            st.streak += 1
+            st.retry_at = self.clock.monotonic() + min(COOLDOWN_MAX, COOLDOWN * 2 ** st.streak)
+
+    # ── pool ─────────────────────────────────────────────────────────────────
+    def replacement(self, proxy: str) -> Optional[str]:
+        """Здоровый прокси из пула вместо лежащего ``proxy`` (или None, если рано или некуда)."""
+        st = self._stats.get(proxy)
+        if st is None or st.state == CLOSED or not self.pool:
+            return None
+        if self.clock.monotonic() - st.opened_at < MOVE_AFTER:
+            return None
+        candidates = [p for p in self.pool if p != proxy and self.available(p)]
+        if not candidates:
+            return None
+        best = min(candidates, key=lambda p: (self.stats(p).accounts, self.stats(p).cost))
+        self.detach(proxy)
+        self.attach(best)
+        return best
+
+    def rows(self) -> List[Dict[str, Any]]:
+        """Сводка для GUI: по строке на прокси."""
+        now = self.clock.monotonic()
+        out = []
+        for st in self._stats.values():
+            out.append({
+                "proxy": redact(st.proxy),
+                "state": st.state,
+                "latency_ms": round(st.latency * 1000),
+                "errors": st.rate(ERROR),
+                "throttled": st.rate(THROTTLED),
+                "accounts": st.accounts,
+                "trips": st.trips,
+                "retry_in": max(0.0, st.retry_at - now) if st.state == OPEN else 0.0,
+            })
+        return sorted(out, key=lambda r: (r["state"] == CLOSED, r["proxy"]))
+
+    async def close(self) -> None:
+        for task in self._probes.values():
+            task.cancel()
+        self._probes.clear()
+
+
+_health: Optional[ProxyHealth] = None
+
+
+def get_proxy_health() -> ProxyHealth:
+    global _health
+    if _health is None:
+        _health = ProxyHealth()
+    return _health
@@ -0,0 +1,395 @@
+"""Shared Twitch PubSub listener.
+
+Many workers' topics (``user-drop-events.<user id>``,
+``video-playback-by-id.<channel id>``) are multiplexed over a few WebSocket
+connections, at most ``TOPICS_PER_CONNECTION`` topics each. Dropped
+connections come back with exponential backoff and re-LISTEN everything they
+carried. The socket comes from an injectable ``connect`` factory, so tests and
+the fake backend can stand in for wss://pubsub-edge.twitch.tv.
+"""
+from __future__ import annotations
+
+import asyncio
+import itertools
+import json
+import logging
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Protocol, Set
+
+import aiohttp
+
+from .clock import SYSTEM_CLOCK, Clock
+from .metrics import PUBSUB_CONNECTIONS, PUBSUB_EVENTS, PUBSUB_RECONNECTS
+
+logger = logging.getLogger(__name__)
+
+PUBSUB_URL = "wss://pubsub-edge.twitch.tv/v1"
+# лимит Twitch — 50 топиков на соединение
+TOPICS_PER_CONNECTION = 50
+# PING не реже раза в 5 минут; нет PONG за 10 с — переподключаемся
+PING_INTERVAL = 240.0
+PONG_TIMEOUT = 10.0
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 120.0
+
+Callback = Callable[[str, Dict[str, Any]], None]
+
+
+class Socket(Protocol):
+    async def send(self, text: str) -> None: ...
+
+    async def recv(self) -> Optional[str]:
+        """Следующее текстовое сообщение; None — соединение закрыто."""
+        ...
+
+    async def close(self) -> None: ...
+
+
+Connect = Callable[[str], Awaitable[Socket]]
+
+
+class _AiohttpSocket:
+    def __init__(self, session: Any, ws: Any):
+        self._session = session
+        self._ws = ws
+
+    async def send(self, text: str) -> None:
+        await self._ws.send_str(text)
+
+    async def recv(self) -> Optional[str]:
+        while True:
+            msg = await self._ws.receive()
+            if msg.type == aiohttp.WSMsgType.TEXT:
+                return msg.data
+            if msg.type in (aiohttp.WSMsgType.CLOSE, aiohttp.WSMsgType.CLOSING,
+                            aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
+                return None
+
+    async def close(self) -> None:
+        try:
+            await self._ws.close()
+        finally:
+            await self._session.close()
+
+
+def aiohttp_connect(proxy: str = "") -> Connect:
+    """Фабрика соединений поверх aiohttp (через прокси аккаунтов, если задан)."""
+
+    async def connect(url: str) -> Socket:
+        session = aiohttp.ClientSession()
+        try:
+            ws = await session.ws_connect(url, proxy=proxy or None, heartbeat=None)
+        except BaseException:
+            await session.close()
+            raise
+        return _AiohttpSocket(session, ws)
+
+    return connect
+
+
+class Subscription:
+    """Handle returned by ``PubSubHub.subscribe``."""
+
+    __slots__ = ("topics", "token", "callback")
+
+    def __init__(self, topics: Iterable[str], token: str, callback: Callback):
+        self.topics = tuple(dict.fromkeys(topics))
+        self.token = token
+        self.callback = callback
+
+
+class _Connection:
+    def __init__(self, hub: "PubSubHub", idx: int):
+        self.hub = hub
+        self.idx = idx
+        # топик -> токен, с которым его слушаем
+        self.topics: Dict[str, str] = {}
+        self.confirmed: Set[str] = set()
+        self.ws: Optional[Socket] = None
+        self.task: Optional[asyncio.Task] = None
+        self._nonces: Dict[str, List[str]] = {}
+        self._pong = True
+        self.attempt = 0
+
+    @property
+    def connected(self) -> bool:
+        return self.ws is not None
+
+    def start(self) -> None:
+        if self.task is None or self.task.done():
+            self.task = asyncio.ensure_future(self._run())
+
+    async def _send(self, msg: Dict[str, Any]) -> None:
+        ws = self.ws
+        if ws is None:
+            return
+        try:
+            await ws.send(json.dumps(msg))
+        except Exception as e:
+            logger.debug("pubsub#%d send failed: %s", self.idx, e)
+
+    def listen(self, topics: List[str]) -> None:
+        if self.ws is not None and topics:
+            asyncio.ensure_future(self._listen(topics))
+
+    async def _listen(self, topics: List[str]) -> None:
+        by_token: Dict[str, List[str]] = {}
+        for t in topics:
+            if t in self.topics:
+                by_token.setdefault(self.topics[t], []).append(t)
+        for token, group in by_token.items():
+            nonce = self.hub._nonce()
+            self._nonces[nonce] = group
+            data: Dict[str, Any] = {"topics": group}
+            if token:
+                data["auth_token"] = token
+            await self._send({"type": "LISTEN", "nonce": nonce, "data": data})
+
+    def unlisten(self, topics: List[str]) -> None:
+        self.confirmed.difference_update(topics)
+        if self.ws is not None and topics:
+            msg = {"type": "UNLISTEN", "nonce": self.hub._nonce(), "data": {"topics": topics}}
+            asyncio.ensure_future(self._send(msg))
+
+    async def _pinger(self) -> None:
+        clock = self.hub.clock
+        while self.ws is not None:
+            await clock.sleep(self.hub.ping_interval)
+            self._pong = False
+            await self._send({"type": "PING"})
+            await clock.sleep(self.hub.pong_timeout)
+            if not self._pong and self.ws is not None:
+                logger.info("pubsub#%d: no PONG, reconnecting", self.idx)
+                await self.ws.close()
+                return
+
+    def _handle(self, text: str) -> bool:
+        """Разобрать сообщение сервера; False — сервер просит переподключиться."""
+        try:
+            msg = json.loads(text)
+        except ValueError:
+            return True
+        kind = msg.get("type")
+        if kind == "PONG":
+            self._pong = True
+        elif kind == "RECONNECT":
+            return False
+        elif kind == "RESPONSE":
+            topics = self._nonces.pop(str(msg.get("nonce") or ""), [])
+            err = msg.get("error") or ""
+            if err:
+                for t in topics:
+                    self.hub._listen_failed(t, err)
+            else:
+                self.confirmed.update(t for t in topics if t in self.topics)
+        elif kind == "MESSAGE":
+            data = msg.get("data") or {}
+            topic = str(data.get("topic") or "")
+            try:
+                payload = json.loads(data.get("message") or "{}")
+            except ValueError:
+                payload = {}
+            self.hub._dispatch(topic, payload if isinstance(payload, dict) else {})
+        return True
+
+    async def _run(self) -> None:
+        hub = self.hub
+        while self.topics and not hub.closed:
+            try:
+                self.ws = await hub.connect(hub.url)
+            except Exception as e:
+                logger.info("pubsub#%d connect failed: %s", self.idx, e)
+                await self._backoff()
+                continue
+            PUBSUB_CONNECTIONS.inc()
+            self._pong = True
+            asked = False
+            pinger = asyncio.ensure_future(self._pinger())
+            try:
+                await self._listen(list(self.topics))
+                while True:
+                    text = await self.ws.recv()
+                    if text is None:
+                        break
+                    if not self._handle(text):
+                        asked = True
+                        break
+                    if self.confirmed:
+                        self.attempt = 0
+            except Exception as e:
+                logger.info("pubsub#%d dropped: %s", self.idx, e)
+            finally:
+                pinger.cancel()
+                ws, self.ws = self.ws, None
+                self.confirmed.clear()
+                self._nonces.clear()
+                PUBSUB_CONNECTIONS.dec()
+                try:
+                    await ws.close()
+                except Exception:
+                    pass
+            if asked:
+                # RECONNECT от сервера — плановый переезд, переподключаемся сразу
+                PUBSUB_RECONNECTS.inc()
+            elif self.topics and not hub.closed:
+                await self._backoff()
+
+    async def _backoff(self) -> None:
+        PUBSUB_RECONNECTS.inc()
+        hub = self.hub
+        delay = min(hub.backoff_max, hub.backoff_base * 2 ** self.attempt)
+        self.attempt += 1
+        await hub.clock.sleep(delay)
+
+    async def close(self) -> None:
+        self.topics.clear()
+        ws = self.ws
+        if ws is not None:
+            try:
+                await ws.close()
+            except Exception:
+                pass
+        if self.task is not None:
+            self.task.cancel()
+
+
+class PubSubHub:
+    """Multiplexes workers' PubSub topics over a few shared connections.
+
+    A topic several workers subscribe to (the same channel) is listened to
+    once; callbacks run in the event loop for every ``MESSAGE`` on it with the
+    decoded ``message`` payload. A refused LISTEN is reported to the
+    subscribers as ``{"type": "listen-error", "error": ...}``.
+    """
+
+    def __init__(
+        self,
+        url: str = "",
+        connect: Optional[Connect] = None,
+        topic_limit: int = TOPICS_PER_CONNECTION,
+        clock: Clock = SYSTEM_CLOCK,
+        ping_interval: float = PING_INTERVAL,
+        pong_timeout: float = PONG_TIMEOUT,
+        backoff_base: float = BACKOFF_BASE,
+        backoff_max: float = BACKOFF_MAX,
+    ):
+        self.url = url or PUBSUB_URL
+        self.connect = connect or aiohttp_connect()
+        self.topic_limit = topic_limit
+        self.clock = clock
+        self.ping_interval = ping_interval
+        self.pong_timeout = pong_timeout
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.closed = False
+        self.connections: List[_Connection] = []
+        self._routes: Dict[str, List[Subscription]] = {}
+        self._where: Dict[str, _Connection] = {}
+        self._ids = itertools.count()
+        self._nonce_seq = itertools.count()
+
+    def _nonce(self) -> str:
+        return f"n{next(self._nonce_seq)}"
+
+    def _slot(self) -> _Connection:
+        for conn in self.connections:
+            if len(conn.topics) < self.topic_limit:
+                return conn
+        conn = _Connection(self, next(self._ids))
+        self.connections.append(conn)
+        return conn
+
+    def subscribe(self, topics: Iterable[str], token: str, callback: Callback) -> Subscription:
+        sub = Subscription(topics, token, callback)
+        new: Dict[_Connection, List[str]] = {}
+        for topic in sub.topics:
+            subs = self._routes.setdefault(topic, [])
+            subs.append(sub)
+            if topic in self._where:
+                continue
+            conn = self._slot()
+            conn.topics[topic] = token
+            self._where[topic] = conn
+            new.setdefault(conn, []).append(topic)
+        for conn, added in new.items():
+            if conn.connected:
+                conn.listen(added)
+            else:
+                conn.start()
+        return sub
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        gone: Dict[_Connection, List[str]] = {}
+        for topic in sub.topics:
+            subs = self._routes.get(topic)
+            if not subs or sub not in subs:
+                continue
+            subs.remove(sub)
+            if subs:
+                continue
+            del self._routes[topic]
+            conn = self._where.pop(topic, None)
+            if conn is not None:
+                conn.topics.pop(topic, None)
+                gone.setdefault(conn, []).append(topic)
+        for conn, topics in gone.items():
+            if conn.topics:
+                conn.unlisten(topics)
+            else:
+                self.connections.remove(conn)
+                asyncio.ensure_future(conn.close())
+
+    def healthy(self, sub: Optional[Subscription]) -> bool:
+        """Все топики подписки подтверждены на живых соединениях."""
+        if sub is None or not sub.topics:
+            return False
+        for topic in sub.topics:
+            conn = self._where.get(topic)
+            if conn is None or not conn.connected or topic not in conn.confirmed:
+                return False
+        return True
+
+    def _dispatch(self, topic: str, payload: Dict[str, Any]) -> None:
+        PUBSUB_EVENTS.inc(str(payload.get("type") or "unknown"))
+        for sub in list(self._routes.get(topic, ())):
+            try:
+                sub.callback(topic, payload)
+            except Exception:
+                logger.exception("pubsub callback failed for %s", topic)
+
+    def _listen_failed(self, topic: str, error: str) -> None:
+        logger.warning("pubsub LISTEN %s refused: %s", topic, error)
+        subs = self._routes.pop(topic, [])
+        conn = self._where.pop(topic, None)
+        if conn is not None:
+            conn.topics.pop(topic, None)
+        for sub in subs:
+            try:
+                sub.callback(topic, {"type": "listen-error", "error": error})
+            except Exception:
+                logger.exception("pubsub callback failed for %s", topic)
+
+    async def close(self) -> None:
+        self.closed = True
+        conns, self.connections = self.connections, []
+        self._routes.clear()
+        self._where.clear()
+        for conn in conns:
+            await conn.close()
+
+
+_hubs: Dict[str, PubSubHub] = {}
+
+
+async def close_hubs() -> None:
+    hubs = list(_hubs.values())
+    _hubs.clear()
+    for hub in hubs:
+        await hub.close()
+
+
+def get_hub(proxy: str = "") -> PubSubHub:
+    """Общий хаб на прокси: соединения PubSub идут с того же адреса, что и GQL."""
+    hub = _hubs.get(proxy)
+    if hub is None or hub.closed:
+        hub = _hubs[proxy] = PubSubHub(connect=aiohttp_connect(proxy))
+    return hub
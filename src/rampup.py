@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import asyncio
+from collections import OrderedDict, deque
+from typing import Callable, Deque, Dict, Optional, Sequence, Tuple
+
+from .clock import SYSTEM_CLOCK, Clock
+from .metrics import GQL_REQUESTS, GQL_RETRIES
+
+# волна запусков раз в WAVE_INTERVAL секунд, по RAMP_RATE воркеров на прокси
+WAVE_INTERVAL = 5.0
+RAMP_RATE = 2.0
+RAMP_MAX = 50.0
+# доля 429/integrity за волну: выше — замедляемся вдвое, ниже — ускоряемся в 1.5 раза
+SLOW_DOWN = 0.05
+SPEED_UP = 0.01
+# меньше запросов за волну — статистике не верим, скорость не меняем
+MIN_SAMPLE = 20
+
+
+def throttle_counts() -> Tuple[float, float]:
+    """(GQL-попыток всего, из них 429 и integrity) — по счётчикам metrics."""
+    retries = GQL_RETRIES.total()
+    return GQL_REQUESTS.total() + retries, GQL_RETRIES.value("429") + GQL_RETRIES.value("integrity")
+
+
+class RampUp:
+    """Starts a fleet in waves instead of all at once.
+
+    Every ``wave_interval`` seconds up to ``per_proxy`` new workers start on
+    each proxy. Worker ``i`` of ``n`` gets tick phase ``i / n``, so steady-state
+    ticks are spread over the whole tick interval and do not stick together
+    by wave. After each wave the share of 429 and integrity retries since the
+    previous wave sets the pace: above ``SLOW_DOWN`` the rate halves, below
+    ``SPEED_UP`` it grows 1.5x up to ``max_per_proxy``.
+    """
+
+    def __init__(
+        self,
+        start: Callable[[str, float], None],
+        per_proxy: float = RAMP_RATE,
+        wave_interval: float = WAVE_INTERVAL,
+        max_per_proxy: float = RAMP_MAX,
+        clock: Clock = SYSTEM_CLOCK,
+        errors: Callable[[], Tuple[float, float]] = throttle_counts,
+        on_progress: Optional[Callable[[int, int], None]] = None,
+    ):
+        self.start = start
+        self.per_proxy = per_proxy
+        self.wave_interval = wave_interval
+        self.max_per_proxy = max_per_proxy
+        self.clock = clock
+        self.errors = errors
+        self.on_progress = on_progress
+        self.total = 0
+        self.started = 0
+        self.waves = 0
+        self._cancelled = False
+
+    @property
+    def done(self) -> bool:
+        return self._cancelled or self.started >= self.total
+
+    def cancel(self) -> None:
+        self._cancelled = True
+
+    def _adapt(self, before: Tuple[float, float]) -> None:
+        attempts, throttled = self.errors()
+        attempts -= before[0]
+        throttled -= before[1]
+        if attempts < MIN_SAMPLE:
+            return
+        rate = throttled / attempts
+        if rate > SLOW_DOWN:
+            self.per_proxy = max(1.0, self.per_proxy / 2)
+        elif rate < SPEED_UP:
+            self.per_proxy = min(self.max_per_proxy, self.per_proxy * 1.5)
+
+    async def run(self, accounts: Sequence[Tuple[str, Optional[str]]]) -> int:
+        """Запустить ``(login, proxy)`` волнами; вернуть число запущенных."""
+        queues: Dict[str, Deque[str]] = OrderedDict()
+        for login, proxy in accounts:
+            queues.setdefault(proxy or "", deque()).append(login)
+        self.total = len(accounts)
+        self.started = 0
+        while not self._cancelled:
+            before = self.errors()
+            per_wave = max(1, int(self.per_proxy))
+            for q in queues.values():
+                for _ in range(min(per_wave, len(q))):
+                    self.start(q.popleft(), self.started / self.total)
+                    self.started += 1
+            self.waves += 1
+            if self.on_progress is not None:
+                self.on_progress(self.started, self.total)
+            if self.started >= self.total:
+                break
+            await self.clock.sleep(self.wave_interval)
+            self._adapt(before)
+        return self.started
@@ -0,0 +1,194 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+from typing import Dict, List, Optional, Tuple
+
+from .clock import SYSTEM_CLOCK, Clock
+
+# ценность тика аккаунта, чей прогресс ещё неизвестен (как у ~15 минут до клейма)
+UNKNOWN_REMAINING = 15
+# запас по времени до конца кампании, при котором тик начинает цениться выше (до 2x)
+URGENT_SLACK = 6 * 3600.0
+
+
+def tick_value(remaining: Optional[float], ends_at: float = 0.0, now: float = 0.0) -> float:
+    """Сколько стоит тик: чем ближе клейм, тем дороже; не успевающие к концу кампании — почти ничего.
+
+    ``remaining`` — минуты до завершения дропа (None — неизвестно), ``ends_at``/``now`` —
+    unix time конца кампании и текущее (0 — конец неизвестен).
+    """
+    rem = UNKNOWN_REMAINING if remaining is None else max(0.0, float(remaining))
+    value = 1.0 / (1.0 + rem)
+    if ends_at:
+        slack = ends_at - now - rem * 60.0
+        if slack < 0:
+            return value * 0.001
+        if slack < URGENT_SLACK:
+            value *= 2.0 - slack / URGENT_SLACK
+    return value
+
+
+class _Bucket:
+    __slots__ = ("rate", "burst", "tokens", "ts")
+
+    def __init__(self, per_minute: float, burst: float, now: float):
+        self.rate = per_minute / 60.0
+        self.burst = max(1.0, burst)
+        self.tokens = self.burst
+        self.ts = now
+
+    def refill(self, now: float) -> None:
+        if now > self.ts:
+            self.tokens = min(self.burst, self.tokens + (now - self.ts) * self.rate)
+            self.ts = now
+
+    def ready(self) -> bool:
+        return self.tokens >= 1.0
+
+    def wait(self) -> float:
+        return 0.0 if self.tokens >= 1.0 else (1.0 - self.tokens) / self.rate
+
+    @property
+    def fill(self) -> float:
+        return self.tokens / self.burst
+
+
+class TickScheduler:
+    """Fleet-wide tick slots handed out by value under a fixed request budget.
+
+    Each proxy gets ``per_proxy`` ticks per minute (one tick ≈ session context,
+    spade, HLS and Inventory requests), optionally capped by ``total`` for the
+    whole fleet. Workers ask for a slot before every tick with their predicted
+    minutes to a claim and campaign end. A free slot goes to the most valuable
+    waiter among proxies that still have budget, scaled by how full that
+    proxy's bucket is. Accounts a minute from a claim therefore do not queue
+    behind accounts with hours left. ``policy="fifo"`` gives plain round-robin
+    for comparison.
+    """
+
+    def __init__(
+        self,
+        per_proxy: float,
+        total: float = 0.0,
+        burst: float = 1.0,
+        clock: Clock = SYSTEM_CLOCK,
+        policy: str = "value",
+    ):
+        if policy not in ("value", "fifo"):
+            raise ValueError(f"unknown policy {policy!r}")
+        self.per_proxy = per_proxy
+        self.burst = burst
+        self.clock = clock
+        self.policy = policy
+        self._total = _Bucket(total, max(burst, total / 60.0), clock.monotonic()) if total else None
+        self._buckets: Dict[str, _Bucket] = {}
+        self._waiting: Dict[str, List[Tuple[float, int, asyncio.Future]]] = {}
+        self._seq = itertools.count()
+        self._pump: Optional[asyncio.Task] = None
+        self.granted = 0
+
+    def _bucket(self, proxy: str) -> _Bucket:
+        b = self._buckets.get(proxy)
+        if b is None:
+            b = self._buckets[proxy] = _Bucket(self.per_proxy, self.burst, self.clock.monotonic())
+        return b
+
+    def waiting(self) -> int:
+        return sum(len(h) for h in self._waiting.values())
+
+    async def acquire(
+        self,
+        login: str,
+        proxy: str = "",
+        remaining: Optional[float] = None,
+        ends_at: float = 0.0,
+        stop_evt: Optional[asyncio.Event] = None,
+    ) -> bool:
+        """Дождаться слота на тик; False — если раньше выставили ``stop_evt``."""
+        value = 1.0 if self.policy == "fifo" else tick_value(remaining, ends_at, self.clock.time())
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiting.setdefault(proxy, []), (-value, next(self._seq), fut))
+        self._dispatch()
+        if not fut.done():
+            self._ensure_pump()
+        if fut.done():
+            return True
+        try:
+            if stop_evt is None:
+                await fut
+                return True
+            stopper = asyncio.ensure_future(stop_evt.wait())
+            try:
+                await asyncio.wait({fut, stopper}, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                stopper.cancel()
+            return fut.done() and not fut.cancelled()
+        finally:
+            # stop_evt или отмена ждущей задачи: место в очереди освобождаем сразу
+            if not fut.done():
+                fut.cancel()
+                self._forget(proxy, fut)
+
+    def _forget(self, proxy: str, fut: asyncio.Future) -> None:
+        heap = self._waiting.get(proxy)
+        if heap is None:
+            return
+        heap[:] = [w for w in heap if w[2] is not fut]
+        heapq.heapify(heap)
+        if not heap:
+            del self._waiting[proxy]
+
+    def _dispatch(self) -> None:
+        now = self.clock.monotonic()
+        total = self._total
+        if total is not None:
+            total.refill(now)
+        while total is None or total.ready():
+            best: Optional[Tuple[float, str]] = None
+            for proxy, heap in self._waiting.items():
+                while heap and heap[0][2].done():
+                    heapq.heappop(heap)
+                if not heap:
+                    continue
+                bucket = self._bucket(proxy)
+                bucket.refill(now)
+                if not bucket.ready():
+                    continue
+                # при равной ценности отдаём слот прокси с большим запасом бюджета
+                if self.policy == "fifo":
+                    key = -heap[0][1]
+                else:
+                    key = -heap[0][0] * (0.5 + 0.5 * bucket.fill)
+                if best is None or key > best[0]:
+                    best = (key, proxy)
+            if best is None:
+                break
+            proxy = best[1]
+            _v, _s, fut = heapq.heappop(self._waiting[proxy])
+            self._buckets[proxy].tokens -= 1.0
+            if total is not None:
+                total.tokens -= 1.0
+            self.granted += 1
+            fut.set_result(None)
+        for proxy in [p for p, h in self._waiting.items() if not h]:
+            del self._waiting[proxy]
+
+    def _next_wait(self) -> float:
+        waits = [self._buckets[p].wait() for p, h in self._waiting.items() if h]
+        if not waits:
+            return 0.0
+        wait = min(waits)
+        if self._total is not None:
+            wait = max(wait, self._total.wait())
+        return max(wait, 0.001)
+
+    def _ensure_pump(self) -> None:
+        if self._pump is None or self._pump.done():
+            self._pump = asyncio.ensure_future(self._run_pump())
+
+    async def _run_pump(self) -> None:
+        while self.waiting():
+            await self.clock.sleep(self._next_wait())
+            self._dispatch()
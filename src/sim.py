@@ -0,0 +1,212 @@
+"""Accelerated-time fleet simulation on top of ``FakeTwitch``.
+
+Unmodified ``run_account`` workers and ``TwitchAPI`` (middleware, retries,
+CI expiry) run on a ``VirtualClock``; HTTP is replaced by an in-process
+session that calls ``FakeTwitch`` directly. A 24h campaign for 1,000
+accounts therefore takes seconds instead of a day.
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+from json import dumps, loads
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from yarl import URL
+
+from .allocator import WatchAllocator
+from .clock import VirtualClock
+from .fake_twitch import FakeConfig, FakeTwitch
+from .miner import run_account
+from .proxy_health import ProxyHealth
+from .twitch_api import TwitchAPI
+
+SIM_BASE = "https://sim.invalid"
+
+
+class _SimResponse:
+    __slots__ = ("status", "_body", "_clock", "_delay")
+
+    def __init__(self, status: int, body: Any, clock: VirtualClock, delay: float):
+        self.status = status
+        self._body = body
+        self._clock = clock
+        self._delay = delay
+
+    async def json(self) -> Any:
+        return self._body
+
+    async def text(self) -> str:
+        return self._body if isinstance(self._body, str) else dumps(self._body)
+
+    async def __aenter__(self) -> "_SimResponse":
+        if self._delay:
+            await self._clock.sleep(self._delay)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        pass
+
+
+class SimSession:
+    """Stands in for ``aiohttp.ClientSession``: routes requests to ``FakeTwitch``."""
+
+    closed = False
+
+    def __init__(self, fake: FakeTwitch, clock: VirtualClock):
+        self.fake = fake
+        self.clock = clock
+
+    def _resp(self, status: int, body: Any) -> _SimResponse:
+        return _SimResponse(status, body, self.clock, self.fake.latency())
+
+    def post(self, url, json=None, data=None, proxy=None, headers=None, **kw) -> _SimResponse:
+        headers = headers or {}
+        auth = headers.get("Authorization", "")
+        token = auth.split(" ", 1)[1] if " " in auth else auth
+        body = json if json is not None else loads(data or b"null")
+        status, out = self.fake.gql(token, body, headers)
+        return self._resp(status, out)
+
+    def get(self, url, proxy=None, **kw) -> _SimResponse:
+        u = URL(str(url))
+        if u.path == "/spade":
+            self.fake.beacon(u.query.get("X-Device-Id", ""))
+            return self._resp(204, "")
+        if u.path.startswith("/hls/"):
+            return self._resp(200, self.fake.playlist(u.path[5:].rsplit(".", 1)[0]))
+        return self._resp(200, self.fake.channel_page(u.path.strip("/")))
+
+    def head(self, url, proxy=None, **kw) -> _SimResponse:
+        self.fake._count("hls_segment")
+        return self._resp(200, "")
+
+    async def close(self) -> None:
+        pass
+
+
+@dataclass
+class Strategy:
+    """Вариант опроса для сравнения: параметры, передаваемые в run_account."""
+
+    name: str
+    tick_interval: float = 60.0
+    extra: Dict[str, Any] = field(default_factory=dict)
+    # доп. параметры, которые надо создать на часах прогона (например, TickScheduler)
+    setup: Optional[Callable[[VirtualClock], Dict[str, Any]]] = None
+
+
+@dataclass
+class SimResult:
+    strategy: str
+    accounts: int
+    hours: float
+    claims: int
+    requests: int
+    wall_s: float
+    claims_per_hour: float = 0.0
+    requests_per_claim: float = 0.0
+    requests_by_kind: Dict[str, int] = field(default_factory=dict)
+
+    def __post_init__(self) -> None:
+        self.claims_per_hour = self.claims / self.hours if self.hours else 0.0
+        self.requests_per_claim = self.requests / self.claims if self.claims else float("inf")
+
+
+async def simulate(
+    strategy: Strategy,
+    accounts: int = 100,
+    hours: float = 24.0,
+    config: Optional[FakeConfig] = None,
+    proxies: int = 0,
+) -> SimResult:
+    """Прогнать ``accounts`` воркеров ``hours`` виртуальных часов и собрать итоги.
+
+    ``proxies`` > 0 раскладывает аккаунты по стольким (фиктивным) прокси по кругу.
+    """
+    clock = VirtualClock()
+    cfg = config or FakeConfig(required_minutes=60, beacon_min_interval=60.0, seed=1)
+    fake = FakeTwitch(cfg, now=clock.monotonic)
+    fake.base_url = SIM_BASE
+
+    async def probe(proxy: str) -> bool:
+        return True
+
+    # свои breaker'ы на прогон: статистика прокси живёт в виртуальном времени
+    health = ProxyHealth(clock, probe=probe)
+
+    async def fake_ci(login: str, proxy: str = "", **kw: Any) -> Tuple[str, str]:
+        await clock.sleep(5.0)  # Playwright в симуляции не запускаем
+        return "sim", f"sim-{clock.monotonic():.0f}"
+
+    def api_factory(token: str, **kw: Any) -> TwitchAPI:
+        # фейковый бэкенд — параметрами API, без подмены глобалов twitch_api
+        api = TwitchAPI(
+            token,
+            health=health,
+            gql_url=URL(SIM_BASE) / "gql",
+            www_url=URL(SIM_BASE),
+            ci_fetcher=fake_ci,
+            persist_ids=False,
+            **kw,
+        )
+        api.session = SimSession(fake, clock)  # type: ignore[assignment]
+        return api
+
+    queue: asyncio.Queue = asyncio.Queue()
+    stop = asyncio.Event()
+    # свой аллокатор на прогон: общий кэш каналов живёт в виртуальном времени этого прогона
+    allocator = WatchAllocator()
+    extra = {"allocator": allocator, **(strategy.setup(clock) if strategy.setup else {}), **strategy.extra}
+
+    async def drain() -> None:
+        while True:
+            await queue.get()
+
+    t0 = time.perf_counter()
+    drainer = asyncio.ensure_future(drain())
+    workers = [
+        asyncio.ensure_future(
+            run_account(
+                f"sim{i:05d}",
+                f"http://proxy{i % proxies}.sim:3128" if proxies else None,
+                queue,
+                stop,
+                client_version="sim",
+                client_integrity="sim",
+                tick_interval=strategy.tick_interval,
+                clock=clock,
+                api_factory=api_factory,
+                token_loader=lambda login: login,
+                **extra,
+            )
+        )
+        for i in range(accounts)
+    ]
+    try:
+        await clock.run_until(hours * 3600.0)
+        stop.set()
+        await clock.advance(strategy.tick_interval + 1)
+        await asyncio.wait(workers, timeout=5)
+    finally:
+        for w in workers:
+            w.cancel()
+        drainer.cancel()
+    st = fake.stats()
+    return SimResult(
+        strategy=strategy.name,
+        accounts=accounts,
+        hours=hours,
+        claims=st["claims_total"],
+        requests=st["requests_total"],
+        wall_s=time.perf_counter() - t0,
+        requests_by_kind=st["requests"],
+    )
+
+
+DEFAULT_STRATEGIES: List[Strategy] = [
+    Strategy("tick30", tick_interval=30.0),
+    Strategy("tick60", tick_interval=60.0),
+    Strategy("tick120", tick_interval=120.0),
+]
@@ -0,0 +1,173 @@
+from __future__ import annotations
+
+import json
+import logging
+import zlib
+from dataclasses import asdict, dataclass, field, fields
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .catalog import Campaign, get_catalog
+
+logger = logging.getLogger(__name__)
+
+STATE_DIR = Path("state")
+# через сколько перепроверять кэш: список кампаний меняется редко,
+# а канал может уйти в офлайн — его держим недолго
+CAMPAIGNS_TTL = 6 * 3600
+CHANNEL_TTL = 30 * 60
+
+
+@dataclass(slots=True)
+class AccountState:
+    """Last known mining state of one account (state/<login>.json)."""
+
+    # только id кампаний дашборда: сами записи — в общем каталоге (catalog.get_catalog()),
+    # полностью они пишутся лишь в файл состояния
+    campaign_ids: Tuple[str, ...] = ()
+    campaigns_at: float = 0.0
+    # основная кампания (для GUI) и все выбранные, под которые подобран канал
+    campaign_id: str = ""
+    active_ids: List[str] = field(default_factory=list)
+    # кампании, у которых всё заклеймлено
+    done: List[str] = field(default_factory=list)
+    channels: List[Dict[str, Any]] = field(default_factory=list)
+    increment_channel: Optional[Tuple[str, str]] = None
+    spade_url: str = ""
+    hls_url: str = ""
+    channel_at: float = 0.0
+    progress: Dict[str, Any] = field(default_factory=dict)
+    last_claim: Dict[str, Any] = field(default_factory=dict)
+    # журнал клеймов: dropInstanceID -> время (см. claims.ClaimLedger)
+    claimed: Dict[str, str] = field(default_factory=dict)
+    # id пользователя Twitch (из Inventory) — для топиков PubSub
+    user_id: str = ""
+
+    def campaigns(self) -> Tuple[Campaign, ...]:
+        return get_catalog().lookup(self.campaign_ids)
+
+    def campaigns_fresh(self, now: float, ttl: float = CAMPAIGNS_TTL) -> bool:
+        return bool(self.campaign_ids) and now - self.campaigns_at < ttl
+
+    def channel_fresh(self, active_ids: List[str], now: float, ttl: float = CHANNEL_TTL) -> bool:
+        # «живых каналов нет» (increment_channel None) тоже кэшируем до TTL, иначе перебор на каждом тике
+        return self.active_ids == list(active_ids) and now - self.channel_at < ttl
+
+    def set_campaigns(self, campaigns: Iterable[Campaign], now: float) -> None:
+        self.campaign_ids = tuple(c.id for c in campaigns)
+        self.campaigns_at = now
+
+    def set_channel(
+        self,
+        active_ids: List[str],
+        campaign_id: str,
+        channels: List[Dict[str, Any]],
+        increment_channel: Optional[Tuple[str, str]],
+        spade_url: str,
+        hls_url: str,
+        now: float,
+    ) -> None:
+        self.active_ids = list(active_ids)
+        self.campaign_id = campaign_id
+        self.channels = channels
+        self.increment_channel = increment_channel
+        self.spade_url = spade_url
+        self.hls_url = hls_url
+        self.channel_at = now
+
+    def events(self) -> List[Tuple[str, Dict[str, Any]]]:
+        """Состояние в виде тех же событий, что шлёт воркер, — для мгновенной отрисовки."""
+        out: List[Tuple[str, Dict[str, Any]]] = []
+        camps = self.campaigns()
+        if camps:
+            out.append(("campaigns", {"campaigns": camps}))
+            cur = next((c for c in camps if c.id == self.campaign_id), None)
+            if cur is not None:
+                out.append(("campaign", {"camp": cur.name, "game": cur.game}))
+        if self.channels:
+            out.append(("channels", {"channels": self.channels}))
+        if self.progress:
+            out.append(("progress", dict(self.progress)))
+        if self.last_claim:
+            out.append(("last_claim", dict(self.last_claim)))
+        return out
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Снимок для файла: кампании записаны целиком, чтобы рестарт восстановил каталог."""
+        data = asdict(self)
+        del data["campaign_ids"]
+        data["campaigns"] = [
+            {"id": c.id, "name": c.name, "game": c.game, "channels": list(c.channels), "ends_at": c.ends_at}
+            for c in self.campaigns()
+        ]
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "AccountState":
+        known = {f.name for f in fields(cls)} - {"campaign_ids"}
+        st = cls(**{k: v for k, v in data.items() if k in known})
+        # записи кампаний — в общий каталог, в состоянии остаются только их id
+        st.campaign_ids = tuple(c.id for c in get_catalog().intern(data.get("campaigns") or ()))
+        if st.increment_channel:
+            st.increment_channel = (str(st.increment_channel[0]), str(st.increment_channel[1]))
+        return st
+
+
+class StateStore:
+    """Per-login JSON files with the last known state; writes are atomic.
+
+    ``save`` skips the write when nothing changed since the last one, so
+    calling it after every tick costs a serialisation, not a disk write.
+    """
+
+    def __init__(self, root: Path = STATE_DIR):
+        self.root = Path(root)
+        self._written: Dict[str, int] = {}
+
+    def path(self, login: str) -> Path:
+        return self.root / f"{login}.json"
+
+    def load(self, login: str) -> Optional[AccountState]:
+        path = self.path(login)
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+            return AccountState.from_dict(data)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, TypeError, IndexError) as exc:
+            logger.error("Failed to load state %s: %s", path, exc)
+            return None
+
+    def save(self, login: str, state: AccountState) -> bool:
+        text = json.dumps(state.to_dict(), ensure_ascii=False, indent=2)
+        crc = zlib.crc32(text.encode("utf-8"))
+        if self._written.get(login) == crc:
+            return False
+        path = self.path(login)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(".tmp")
+            tmp.write_text(text, encoding="utf-8")
+            tmp.replace(path)
+        except OSError as exc:
+            logger.error("Failed to save state %s: %s", path, exc)
+            return False
+        self._written[login] = crc
+        return True
+
+    def forget(self, login: str) -> None:
+        self._written.pop(login, None)
+        try:
+            self.path(login).unlink()
+        except FileNotFoundError:
+            pass
+
+
+_store: Optional[StateStore] = None
+
+
+def get_state_store() -> StateStore:
+    global _store
+    if _store is None:
+        _store = StateStore()
+    return _store
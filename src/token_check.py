@@ -0,0 +1,257 @@
+from __future__ import annotations
+
+import asyncio
+import csv
+import hashlib
+import json
+import logging
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import aiohttp
+
+from .client_integrity import COOKIES_DIR
+from .types import Account
+
+VALIDATE_URL = "https://id.twitch.tv/oauth2/validate"
+TOKEN_CACHE_PATH = Path("cache/tokens.json")
+# Twitch просит валидировать токены не реже раза в час
+CACHE_TTL = 60 * 60
+
+logger = logging.getLogger(__name__)
+
+# status -> итоговая категория для сводки
+KIND_BY_STATUS = {
+    "OK": "ok",
+    "EXPIRED": "exp",
+    "NO COOKIES": "miss",
+    "NO TOKEN": "miss",
+}
+
+
+@dataclass
+class TokenResult:
+    login: str
+    status: str
+    note: str = ""
+    expires_in: int = 0
+    checked_at: float = 0.0
+    cached: bool = False
+
+    @property
+    def kind(self) -> str:
+        return KIND_BY_STATUS.get(self.status, "other")
+
+
+ProgressCb = Callable[[TokenResult, int, int], None]
+
+
+def _read_token(cookies_dir: Path, login: str) -> Tuple[str, Optional[TokenResult]]:
+    """Return (token, None) or ("", result describing why there is no token)."""
+    cookie_file = Path(cookies_dir) / f"{login}.json"
+    if not cookie_file.exists():
+        return "", TokenResult(login, "NO COOKIES", f"{cookie_file} not found")
+    try:
+        data = json.loads(cookie_file.read_text(encoding="utf-8"))
+        for c in data:
+            if c.get("name") == "auth-token":
+                token = c.get("value") or ""
+                if token:
+                    return token, None
+                break
+    except Exception as e:
+        return "", TokenResult(login, "BAD COOKIES", str(e))
+    return "", TokenResult(login, "NO TOKEN", "NO TOKEN in cookies")
+
+
+def _fingerprint(token: str) -> str:
+    # в кэш кладём только хэш: сам токен хранится лишь в cookies/<login>.json
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()[:16]
+
+
+class TokenCache:
+    """Validation results keyed by login and token fingerprint."""
+
+    def __init__(self, path: Path = TOKEN_CACHE_PATH, ttl: int = CACHE_TTL):
+        self.path = Path(path)
+        self.ttl = ttl
+        self._data: Dict[str, dict] = {}
+        self._dirty = False
+        try:
+            self._data = json.loads(self.path.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            pass
+        except (OSError, json.JSONDecodeError) as exc:
+            logger.error("Failed to load token cache %s: %s", self.path, exc)
+
+    def get(self, login: str, token: str, now: Optional[float] = None) -> Optional[TokenResult]:
+        entry = self._data.get(login)
+        if not entry or entry.get("token") != _fingerprint(token):
+            return None
+        now = time.time() if now is None else now
+        if float(entry.get("expires_at") or 0) <= now:
+            return None
+        return TokenResult(
+            login,
+            entry.get("status", ""),
+            entry.get("note", ""),
+            int(entry.get("expires_in") or 0),
+            float(entry.get("checked_at") or 0),
+            cached=True,
+        )
+
+    def put(self, res: TokenResult, token: str) -> None:
+        # кэшируем только однозначные ответы; сетевые ошибки перепроверяем
+        if res.status not in ("OK", "EXPIRED"):
+            return
+        ttl = self.ttl
+        if res.status == "OK" and res.expires_in > 0:
+            ttl = min(ttl, res.expires_in)
+        self._data[res.login] = {
+            "token": _fingerprint(token),
+            "status": res.status,
+            "note": res.note,
+            "expires_in": res.expires_in,
+            "checked_at": res.checked_at,
+            "expires_at": res.checked_at + ttl,
+        }
+        self._dirty = True
+
+    def save(self) -> None:
+        if not self._dirty:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self._data, ensure_ascii=False, indent=2), encoding="utf-8")
+        tmp.replace(self.path)
+        self._dirty = False
+
+
+class TokenValidator:
+    """Bulk auth-token validation via id.twitch.tv with bounded concurrency.
+
+    Requests go through the account's own proxy; one ClientSession is shared
+    by all checks so connections (per proxy) are reused.
+    """
+
+    def __init__(
+        self,
+        concurrency: int = 20,
+        per_proxy: int = 4,
+        timeout: float = 10.0,
+        cookies_dir: Path = COOKIES_DIR,
+        cache: Optional[TokenCache] = None,
+    ):
+        self.concurrency = max(1, concurrency)
+        self.per_proxy = max(1, per_proxy)
+        self.timeout = timeout
+        self.cookies_dir = Path(cookies_dir)
+        self.cache = cache
+
+    async def _validate(
+        self, session: aiohttp.ClientSession, login: str, token: str, proxy: str
+    ) -> TokenResult:
+        now = time.time()
+        try:
+            async with session.get(
+                VALIDATE_URL,
+                headers={"Authorization": f"OAuth {token}"},
+                proxy=proxy or None,
+            ) as resp:
+                if resp.status == 200:
+                    j = await resp.json()
+                    login_resp = j.get("login", "?")
+                    scopes = ",".join(j.get("scopes", []))
+                    return TokenResult(
+                        login,
+                        "OK",
+                        f"login={login_resp} scopes=[{scopes}]",
+                        int(j.get("expires_in") or 0),
+                        now,
+                    )
+                if resp.status in (401, 403):
+                    return TokenResult(login, "EXPIRED", "token invalid", 0, now)
+                text = (await resp.text())[:120]
+                return TokenResult(login, f"HTTP {resp.status}", text, 0, now)
+        except Exception as e:
+            return TokenResult(login, "ERROR", str(e) or type(e).__name__, 0, now)
+
+    async def check(
+        self, accounts: Iterable[Account], progress_cb: Optional[ProgressCb] = None
+    ) -> List[TokenResult]:
+        """Validate all accounts; results keep the input order."""
+        accs = list(accounts)
+        total = len(accs)
+        results: List[Optional[TokenResult]] = [None] * total
+        done = 0
+        sem = asyncio.Semaphore(self.concurrency)
+        proxy_sems: Dict[str, asyncio.Semaphore] = {}
+
+        def _finish(i: int, res: TokenResult) -> None:
+            nonlocal done
+            results[i] = res
+            done += 1
+            if progress_cb:
+                try:
+                    progress_cb(res, done, total)
+                except Exception:
+                    logger.exception("token check progress callback failed")
+
+        connector = aiohttp.TCPConnector(limit=self.concurrency)
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+
+            async def _one(i: int, a: Account) -> None:
+                token, res = _read_token(self.cookies_dir, a.login)
+                if res is None and self.cache is not None:
+                    res = self.cache.get(a.login, token)
+                if res is not None:
+                    _finish(i, res)
+                    return
+                proxy = a.proxy or ""
+                psem = proxy_sems.setdefault(proxy, asyncio.Semaphore(self.per_proxy))
+                # сначала слот прокси, потом общий: ждущие занятый прокси не держат глобальные слоты
+                async with psem, sem:
+                    res = await self._validate(session, a.login, token, proxy)
+                if self.cache is not None:
+                    self.cache.put(res, token)
+                _finish(i, res)
+
+            await asyncio.gather(*(_one(i, a) for i, a in enumerate(accs)))
+
+        if self.cache is not None:
+            try:
+                self.cache.save()
+            except OSError as exc:
+                logger.error("Failed to save token cache: %s", exc)
+        return [r for r in results if r is not None]
+
+
+def summarize(results: Iterable[TokenResult]) -> Dict[str, int]:
+    out = {"ok": 0, "exp": 0, "miss": 0, "other": 0}
+    for r in results:
+        out[r.kind] += 1
+    return out
+
+
+REPORT_FIELDS = ["login", "status", "note", "expires_in", "checked_at", "cached"]
+
+
+def write_report(results: List[TokenResult], path: Optional[Path]) -> str:
+    """Write results as CSV (by .csv suffix) or JSON; return text if path is None."""
+    rows = [asdict(r) for r in results]
+    if path is not None and Path(path).suffix.lower() == ".csv":
+        with Path(path).open("w", encoding="utf-8", newline="") as f:
+            w = csv.DictWriter(f, fieldnames=REPORT_FIELDS)
+            w.writeheader()
+            w.writerows(rows)
+        return ""
+    text = json.dumps(
+        {"summary": summarize(results), "results": rows}, ensure_ascii=False, indent=2
+    )
+    if path is not None:
+        Path(path).write_text(text, encoding="utf-8")
+        return ""
+    return text
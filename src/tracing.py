@@ -0,0 +1,173 @@
+from __future__ import annotations
+
+import contextvars
+import json
+import os
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+# env-переменная включает трейсинг без флагов CLI
+TRACE_ENV = "TWDROPS_TRACE"
+
+# логин аккаунта, в контексте которого выполняется текущая корутина
+current_login: contextvars.ContextVar[str] = contextvars.ContextVar("current_login", default="")
+
+
+def _tid(login: str) -> int:
+    return zlib.crc32(login.encode("utf-8")) & 0x7FFFFFFF
+
+
+class Span:
+    """One timed phase; written as a Chrome trace "complete" event on exit."""
+
+    __slots__ = ("tracer", "name", "cat", "args", "login", "t0")
+
+    def __init__(self, tracer: "Tracer", name: str, cat: str, args: Dict[str, Any]):
+        self.tracer = tracer
+        self.name = name
+        self.cat = cat
+        self.args = args
+        self.login = ""
+        self.t0 = 0.0
+
+    def __enter__(self) -> "Span":
+        self.login = current_login.get()
+        self.t0 = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        dur = time.time() - self.t0
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        self.tracer._emit(self, dur)
+
+    def set(self, key: str, value: Any) -> None:
+        self.args[key] = value
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        pass
+
+    def set(self, key: str, value: Any) -> None:
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+class Tracer:
+    """Writes spans to a JSONL file in Chrome trace-event format.
+
+    Each line is one ``"ph": "X"`` event; ``scripts/trace_view.py`` turns the
+    file into a timeline for chrome://tracing / ui.perfetto.dev (one row per
+    account) and prints the slowest phase per account.
+    """
+
+    def __init__(self, path: Optional[Path] = None, flush_every: int = 256):
+        self.path = Path(path) if path else None
+        self.flush_every = flush_every
+        self._buf: List[str] = []
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    @property
+    def enabled(self) -> bool:
+        return self.path is not None
+
+    def span(self, name: str, cat: str = "miner", **args: Any):
+        if self.path is None:
+            return _NOOP
+        return Span(self, name, cat, args)
+
+    def _emit(self, span: Span, dur: float) -> None:
+        args = span.args
+        if span.login:
+            args["login"] = span.login
+        ev = {
+            "name": span.name,
+            "cat": span.cat,
+            "ph": "X",
+            "ts": int(span.t0 * 1e6),
+            "dur": int(dur * 1e6),
+            "pid": self._pid,
+            "tid": _tid(span.login),
+            "args": args,
+        }
+        line = json.dumps(ev, ensure_ascii=False, default=str)
+        with self._lock:
+            self._buf.append(line)
+            if len(self._buf) >= self.flush_every:
+                self._flush_locked()
+
+    def _flush_locked(self) -> None:
+        if not self._buf or self.path is None:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.path.open("a", encoding="utf-8") as f:
+            f.write("\n".join(self._buf) + "\n")
+        self._buf.clear()
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush_locked()
+
+
+_tracer = Tracer(Path(os.environ[TRACE_ENV]) if os.environ.get(TRACE_ENV) else None)
+
+
+def get_tracer() -> Tracer:
+    return _tracer
+
+
+def configure(path: Optional[Path]) -> Tracer:
+    """Включить (path) или выключить (None) запись спанов для всего процесса."""
+    global _tracer
+    _tracer.flush()
+    _tracer = Tracer(path)
+    return _tracer
+
+
+def span(name: str, cat: str = "miner", **args: Any):
+    return _tracer.span(name, cat, **args)
+
+
+def load_events(path: Path) -> List[Dict[str, Any]]:
+    events: List[Dict[str, Any]] = []
+    for line in Path(path).read_text(encoding="utf-8").splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            events.append(json.loads(line))
+        except json.JSONDecodeError:
+            continue
+    return events
+
+
+def slowest_phases(events: List[Dict[str, Any]], cat: str = "tick") -> Dict[str, Dict[str, Any]]:
+    """login -> самый долгий в среднем спан категории ``cat`` (имя, среднее и max, мс)."""
+    acc: Dict[str, Dict[str, List[int]]] = {}
+    for ev in events:
+        if ev.get("cat") != cat:
+            continue
+        login = (ev.get("args") or {}).get("login") or "?"
+        acc.setdefault(login, {}).setdefault(ev.get("name", ""), []).append(int(ev.get("dur") or 0))
+    out: Dict[str, Dict[str, Any]] = {}
+    for login, phases in acc.items():
+        name, durs = max(phases.items(), key=lambda kv: sum(kv[1]) / len(kv[1]))
+        out[login] = {
+            "phase": name,
+            "avg_ms": sum(durs) / len(durs) / 1000.0,
+            "max_ms": max(durs) / 1000.0,
+            "count": len(durs),
+        }
+    return out
@@ -4,16 +4,42 @@ from __future__ import annotations
 import asyncio
 import re
 import uuid
-from typing import Any, Dict, Optional, Tuple
+from contextlib import asynccontextmanager, nullcontext
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, Sequence, Tuple
 
 import aiohttp
 from yarl import URL
 
-from .ops import load_ops, get_hash
-from .client_integrity import fetch_ci, save_ci
+from .ops import OpsRegistry, get_registry
+from .ops_discovery import HashDiscovery, get_discovery
+from .client_integrity import CI_TTL, SESSION_TTL, fetch_ci, load_ids, save_ci, save_ids
+from .clock import SYSTEM_CLOCK, Clock
+from .gql_middleware import (
+    DEFAULT_MIDDLEWARES,
+    MAX_RETRIES,
+    OP_DEADLINES,
+    DeadlineExceeded,
+    GqlCall,
+    GqlErrors,
+    IntegrityChallenge,
+    Middleware,
+    RateLimiter,
+    RetryableError,
+    compose,
+)
+from .metrics import CI_REFRESHES, REQUEST_TIMEOUTS, SESSION_ROTATIONS
+from .proxy_health import ERROR, ProxyHealth, get_proxy_health
 
 GQL = URL("https://gql.twitch.tv/gql")
-MAX_RETRIES = 5
+WWW = URL("https://www.twitch.tv")
+
+# бюджеты запросов мимо GQL, секунды: они дешёвые, висеть им незачем
+PAGE_TIMEOUT = 20.0
+SPADE_TIMEOUT = 10.0
+HLS_TIMEOUT = 15.0
+# страховка на уровне сессии: зависшее соединение без данных
+SOCK_CONNECT_TIMEOUT = 15.0
+SOCK_READ_TIMEOUT = 60.0
 
 
 class TwitchAPI:
@@ -28,6 +54,19 @@ class TwitchAPI:
         x_device_id: str = "",
         client_session_id: str = "",
         playback_session_id: str = "",
+        ops: Optional[OpsRegistry] = None,
+        discovery: Optional[HashDiscovery] = None,
+        middlewares: Optional[Sequence[Middleware]] = None,
+        limiter: Optional[RateLimiter] = None,
+        clock: Clock = SYSTEM_CLOCK,
+        ci_expires_at: float = 0.0,
+        health: Optional[ProxyHealth] = None,
+        deadlines: Optional[Dict[str, float]] = None,
+        session_ttl: float = SESSION_TTL,
+        gql_url: Optional[URL] = None,
+        www_url: Optional[URL] = None,
+        ci_fetcher: Optional[Callable[..., Awaitable[Tuple[str, str]]]] = None,
+        persist_ids: bool = True,
     ):
         self.auth = auth_token
         self.client_id = client_id
@@ -35,129 +74,208 @@ class TwitchAPI:
         self.client_version = client_version
         self.client_integrity = client_integrity
         self.login = login
-        self.x_device_id = x_device_id or uuid.uuid4().hex
-        self.client_session_id = client_session_id or uuid.uuid4().hex
-        self.playback_session_id = playback_session_id or uuid.uuid4().hex
+        self.clock = clock
+        # куда ходить и чем брать CI — для фейкового бэкенда (sim, стенды); None — боевые
+        self.gql_url = gql_url
+        self.www_url = www_url
+        self.ci_fetcher = ci_fetcher
+        # False — ci/<login>.json не читаем и не пишем (симуляция)
+        self.persist_ids = persist_ids
+        # device id постоянен для логина (ci/<login>.json): CI-токен выдан под него,
+        # новый device на каждом рестарте — лишние integrity-челленджи
+        stored = load_ids(login) if persist_ids and login and not x_device_id else {}
+        self.x_device_id = x_device_id or stored.get("device_id") or uuid.uuid4().hex
+        # ID сессии переживают рестарт, пока не старше session_ttl; дальше — ротация в gql()
+        self.session_ttl = session_ttl
+        self.session_started_at = clock.time()
+        if client_session_id or playback_session_id:
+            stored = {}
+        else:
+            self.session_started_at = float(stored.get("session_started_at") or self.session_started_at)
+        self.client_session_id = client_session_id or stored.get("client_session_id") or uuid.uuid4().hex
+        self.playback_session_id = playback_session_id or stored.get("playback_session_id") or uuid.uuid4().hex
         self.session: Optional[aiohttp.ClientSession] = None
-        self.ops = load_ops()
+        # один реестр хэшей на процесс, без копии ops.json на воркер
+        self.ops = ops or get_registry()
+        self.discovery = discovery
+        self.limiter = limiter
+        # когда истекает Client-Integrity (по clock.time()); 0 — неизвестно
+        self.ci_expires_at = ci_expires_at
+        # общая статистика и breaker'ы прокси (см. proxy_health)
+        self.health = health or get_proxy_health()
+        # бюджет на GQL-операцию целиком (см. gql_middleware.deadline)
+        self.deadlines = {**OP_DEADLINES, **(deadlines or {})}
+        self._ci_task: Optional[asyncio.Task] = None
+        # заголовки GQL пересобираются, только когда меняется что-то из ключа
+        self._headers_key: Tuple[str, ...] = ()
+        self._headers: Dict[str, str] = {}
+        self._pipeline = compose(
+            DEFAULT_MIDDLEWARES if middlewares is None else middlewares, self._send
+        )
         self.ua = (
             "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
             "AppleWebKit/537.36 (KHTML, like Gecko) "
             "Chrome/124.0.0.0 Safari/537.36"
         )
 
-    def reset_session_ids(self) -> None:
-        """Generate new device and session identifiers."""
-        self.x_device_id = uuid.uuid4().hex
+    def session_ids(self) -> Dict[str, Any]:
+        """ID устройства и сессии в формате ci/<login>.json."""
+        return {
+            "device_id": self.x_device_id,
+            "client_session_id": self.client_session_id,
+            "playback_session_id": self.playback_session_id,
+            "session_started_at": self.session_started_at,
+        }
+
+    def reset_session_ids(self, device: bool = False, reason: str = "manual") -> None:
+        """Generate new session identifiers (and a new device with ``device=True``).
+
+        Новые ID сразу сохраняются в ci/<login>.json, чтобы рестарт их не потерял.
+        Новый device требует и нового CI-токена: старый выдан другому устройству.
+        """
+        if device:
+            self.x_device_id = uuid.uuid4().hex
+            self.client_integrity = ""
         self.client_session_id = uuid.uuid4().hex
         self.playback_session_id = uuid.uuid4().hex
+        self.session_started_at = self.clock.time()
+        SESSION_ROTATIONS.inc(reason)
+        if self.login and self.persist_ids:
+            save_ids(self.login, self.session_ids())
+
+    def session_expired(self) -> bool:
+        return bool(self.session_ttl) and self.clock.time() - self.session_started_at >= self.session_ttl
+
+    def gql_headers(self) -> Dict[str, str]:
+        """Заголовки GQL этого аккаунта; общий словарь на все вызовы, пока не сменились токены/ID."""
+        key = (
+            self.auth, self.client_version, self.client_integrity,
+            self.x_device_id, self.client_session_id, self.playback_session_id,
+        )
+        if key != self._headers_key:
+            h = {
+                "Client-ID": self.client_id,
+                "Authorization": f"OAuth {self.auth}",
+                "Content-Type": "application/json",
+                "X-Device-Id": self.x_device_id,
+                "Client-Session-Id": self.client_session_id,
+                "Playback-Session-Id": self.playback_session_id,
+            }
+            if self.client_version:
+                h["Client-Version"] = self.client_version
+            if self.client_integrity:
+                h["Client-Integrity"] = self.client_integrity
+            self._headers_key = key
+            self._headers = h
+        return self._headers
+
+    def _tracked(self) -> Any:
+        """Учёт запроса мимо GQL-цепочки (страница канала, spade, HLS) в здоровье прокси."""
+        return self.health.track(self.proxy) if self.proxy else nullcontext()
+
+    @asynccontextmanager
+    async def _deadline(self, operation: str, budget: float) -> AsyncIterator[None]:
+        """Отменить всё внутри через ``budget`` секунд; таймаут считается в метриках и против прокси.
+
+        Вложенный ``DeadlineExceeded`` уже посчитан своим уровнем и проходит как есть.
+        """
+        try:
+            async with self.clock.timeout(budget):
+                yield
+        except DeadlineExceeded:
+            raise
+        except TimeoutError:
+            REQUEST_TIMEOUTS.inc(operation)
+            if self.proxy:
+                self.health.record(self.proxy, budget, ERROR)
+            raise DeadlineExceeded(operation, budget) from None
 
     async def start(self) -> None:
         if not self.session or self.session.closed:
             # В aiohttp нет глобального параметра proxy у ClientSession.
             # Используем proxy=... в каждом запросе (см. self.gql()).
-            self.session = aiohttp.ClientSession(headers={"User-Agent": self.ua})
+            timeout = aiohttp.ClientTimeout(sock_connect=SOCK_CONNECT_TIMEOUT, sock_read=SOCK_READ_TIMEOUT)
+            self.session = aiohttp.ClientSession(headers={"User-Agent": self.ua}, timeout=timeout)
 
     async def close(self) -> None:
+        if self._ci_task is not None and not self._ci_task.done():
+            self._ci_task.cancel()
         if self.session and not self.session.closed:
             await self.session.close()
 
     async def _refresh_ci(self) -> bool:
-        """Fetch and save new Client-Version/Client-Integrity."""
+        """Fetch and save new Client-Version/Client-Integrity.
+
+        Одно обновление на клиента за раз. Дедлайн вызова отменяет только
+        ожидание: браузер доделает своё, и токены достанутся следующему запросу.
+        """
         if not self.login:
             return False
-        cv, ci = await fetch_ci(self.login, self.proxy or "")
+        if self._ci_task is None or self._ci_task.done():
+            self._ci_task = asyncio.ensure_future(self._fetch_ci())
+        return await asyncio.shield(self._ci_task)
+
+    async def _fetch_ci(self) -> bool:
+        # браузер работает под тем же device id, что и воркер
+        fetcher = self.ci_fetcher or fetch_ci
+        cv, ci = await fetcher(self.login, self.proxy or "", device_id=self.x_device_id)
         if cv and ci:
             self.client_version = cv
             self.client_integrity = ci
-            save_ci(self.login, cv, ci)
+            self.ci_expires_at = self.clock.time() + CI_TTL
+            if self.persist_ids:
+                save_ci(self.login, cv, ci, now=self.clock.time(), ids=self.session_ids())
+            CI_REFRESHES.inc("ok")
             return True
+        CI_REFRESHES.inc("failed")
         return False
 
+    async def _recover_hash(self, operation: str, failed_hash: str, variables: Dict[str, Any]) -> bool:
+        """PersistedQueryNotFound: ждём общий для всего процесса поиск нового хэша."""
+        discovery = self.discovery or get_discovery()
+        return await discovery.recover(
+            operation, failed_hash, self.login, self.proxy or "", variables
+        )
+
     async def gql(self, operation: str, variables: Dict[str, Any]) -> Any:
-        """Вызов Twitch GQL с persistedQuery hash из ops.json, с ретраями на 429/сетевых ошибках."""
+        """Вызов Twitch GQL с persistedQuery hash из ops.json, с ретраями на 429/сетевых ошибках.
+
+        Сам запрос проходит через цепочку middleware (см. gql_middleware):
+        трейсинг, метрики, ретраи, rate limit, integrity, PQ hash, заголовки.
+        """
         if not self.session or self.session.closed:
             raise RuntimeError("Session not started; call start() first")
+        if self.session_expired():
+            self.reset_session_ids(reason="ttl")
+        return await self._pipeline(GqlCall(self, operation, variables))
 
-        operation, h = get_hash(self.ops, operation)
+    async def _send(self, call: GqlCall) -> Any:
+        """Последнее звено цепочки: один POST и классификация ответа."""
+        async with self.session.post(
+            self.gql_url or GQL,
+            data=call.body(),  # готовые байты: aiohttp не сериализует payload заново
+            proxy=self.proxy,  # прокси на уровне запроса
+            headers=call.headers,
+        ) as r:
+            if r.status == 429:
+                raise RetryableError("429", "GQL 429: Too Many Requests")
 
-        payload = {
-            "operationName": operation,
-            "variables": variables,
-            "extensions": {"persistedQuery": {"version": 1, "sha256Hash": h}},
-        }
+            if 500 <= r.status < 600:
+                raise RetryableError("5xx", f"GQL {r.status}: Server error")
 
-        attempt = 0
-        while True:
-            if not self.client_version or not self.client_integrity:
-                await self._refresh_ci()
-            try:
-                headers = {
-                    "Client-ID": self.client_id,
-                    "Authorization": f"OAuth {self.auth}",
-                    "Content-Type": "application/json",
-                }
-                headers["X-Device-Id"] = self.x_device_id
-                headers["Client-Session-Id"] = self.client_session_id
-                headers["Playback-Session-Id"] = self.playback_session_id
-                if self.client_version:
-                    headers["Client-Version"] = self.client_version
-                if self.client_integrity:
-                    headers["Client-Integrity"] = self.client_integrity
-                async with self.session.post(
-                    GQL,
-                    json=payload,
-                    proxy=self.proxy,  # прокси на уровне запроса
-                    headers=headers,
-                ) as r:
-                    if r.status == 429:
-                        attempt += 1
-                        if attempt > MAX_RETRIES:
-                            raise RuntimeError(
-                                "GQL 429: Too Many Requests; retry limit exceeded"
-                            )
-                        await asyncio.sleep(min(60, 2 ** (attempt - 1)))
-                        continue
-
-                    if 500 <= r.status < 600:
-                        attempt += 1
-                        if attempt > MAX_RETRIES:
-                            raise RuntimeError(
-                                f"GQL {r.status}: Server error; retry limit exceeded"
-                            )
-                        await asyncio.sleep(min(60, 2 ** (attempt - 1)))
-                        continue
-
-                    if 200 <= r.status < 300:
-                        data = await r.json()
-                        # иногда приходит список с единственным объектом
-                        if isinstance(data, list):
-                            data = data[0]
-                        if isinstance(data, dict) and data.get("errors"):
-                            raise RuntimeError(str(data["errors"]))
-                        return data
-
-                    if 400 <= r.status < 500:
-                        text = await r.text()
-                        if "integrity" in text.lower():
-                            refreshed = await self._refresh_ci()
-                            if refreshed:
-                                attempt += 1
-                                if attempt > MAX_RETRIES:
-                                    raise RuntimeError(
-                                        "GQL integrity challenge; retry limit exceeded"
-                                    )
-                                continue
-                        raise RuntimeError(f"GQL {r.status}: {text}")
-
-                    text = await r.text()
-                    raise RuntimeError(f"GQL {r.status}: {text}")
-
-            except aiohttp.ClientError:
-                attempt += 1
-                if attempt > MAX_RETRIES:
-                    raise
-                await asyncio.sleep(min(60, 2 ** (attempt - 1)))
+            if 200 <= r.status < 300:
+                data = await r.json()
+                # иногда приходит список с единственным объектом
+                if isinstance(data, list):
+                    data = data[0]
+                if isinstance(data, dict) and data.get("errors"):
+                    raise GqlErrors(data["errors"])
+                return data
+
+            text = await r.text()
+            if 400 <= r.status < 500 and "integrity" in text.lower():
+                raise IntegrityChallenge(r.status, text)
+            raise RuntimeError(f"GQL {r.status}: {text}")
 
     # ----------------- Удобные обёртки -----------------
 
@@ -215,12 +333,14 @@ class TwitchAPI:
 
     async def get_spade_and_hls(self, channel_login: str) -> Tuple[str, str]:
         await self.start()
-        url = URL(f"https://www.twitch.tv/{channel_login}")
+        url = (self.www_url or WWW) / channel_login
         spade = ""
         hls = ""
         try:
-            async with self.session.get(url, proxy=self.proxy) as r:
-                text = await r.text()
+            async with self._deadline("channel_page", PAGE_TIMEOUT):
+                with self._tracked():
+                    async with self.session.get(url, proxy=self.proxy) as r:
+                        text = await r.text()
             m = re.search(r"\"spade_url\"\s*:\s*\"([^\"]+)\"", text)
             if m:
                 spade = m.group(1).encode().decode("unicode_escape")
@@ -241,13 +361,20 @@ class TwitchAPI:
         qs.setdefault("Client-Session-Id", self.client_session_id)
         qs.setdefault("Playback-Session-Id", self.playback_session_id)
         u = u.update_query(qs)
-        async with self.session.get(u, proxy=self.proxy):
-            pass
+        async with self._deadline("spade", SPADE_TIMEOUT):
+            with self._tracked():
+                async with self.session.get(u, proxy=self.proxy):
+                    pass
 
     async def head_hls(self, playlist_url: str) -> None:
         await self.start()
-        async with self.session.get(URL(playlist_url), proxy=self.proxy) as r:
-            text = await r.text()
+        async with self._deadline("hls", HLS_TIMEOUT):
+            await self._head_hls(playlist_url)
+
+    async def _head_hls(self, playlist_url: str) -> None:
+        with self._tracked():
+            async with self.session.get(URL(playlist_url), proxy=self.proxy) as r:
+                text = await r.text()
         last = ""
         for line in text.splitlines():
             line = line.strip()
@@ -1,8 +1,9 @@
 from __future__ import annotations
+import sys
 from dataclasses import dataclass
 from typing import Optional
 
-@dataclass
+@dataclass(slots=True)
 class Account:
     label: str
     login: str
@@ -21,3 +22,8 @@ class Account:
     progress_pct: float = 0.0
     remaining_minutes: int = 0
     last_claim_at: Optional[str] = None
+
+    def __post_init__(self) -> None:
+        # у тысяч аккаунтов одни и те же прокси/версии клиента — храним одну копию строки
+        self.proxy = sys.intern(self.proxy)
+        self.client_version = sys.intern(self.client_version)
@@ -0,0 +1,102 @@
+import asyncio
+import random
+
+from src.allocator import WatchAllocator, finished_campaigns
+from src.catalog import Campaign
+
+NOW = 1_700_000_000.0
+
+
+def _camp(cid, ends_in=0.0):
+    return Campaign(cid, cid, "Game", (), NOW + ends_in if ends_in else 0.0)
+
+
+def test_overlapping_channel_advances_both_campaigns():
+    alloc = WatchAllocator()
+    a, b = _camp("A"), _camp("B")
+    alloc.update("A", [("big", "1", 9000, True), ("shared", "2", 10, True)], NOW)
+    alloc.update("B", [("shared", "2", 10, True), ("other", "3", 5000, True)], NOW)
+
+    best = alloc.choose([a, b], now=NOW)
+    assert best.channel.login == "shared"
+    assert best.campaigns == ("A", "B")
+
+    # A завершена — смотрим лучший канал B по зрителям
+    best = alloc.choose([a, b], frozenset({"A"}), NOW)
+    assert best.channel.login == "other"
+    assert best.campaigns == ("B",)
+
+
+def test_ending_campaign_and_live_status():
+    alloc = WatchAllocator()
+    soon, later = _camp("soon", ends_in=3600), _camp("later", ends_in=3 * 86400)
+    alloc.update("soon", [("s", "10", 1, True), ("off", "11", 99999, False), ("noid", "x", 99999, True)], NOW)
+    alloc.update("later", [("l", "20", 5000, True)], NOW)
+    best = alloc.choose([later, soon], now=NOW)
+    assert best.channel.login == "s"
+    assert [c.channel.login for c in alloc.rank([later, soon], now=NOW)] == ["s", "l"]
+    ended = _camp("ended", ends_in=-1)
+    alloc.update("ended", [("e", "30", 1, True)], NOW)
+    assert alloc.choose([ended], now=NOW) is None
+
+
+def test_refresh_is_single_flight():
+    calls = []
+
+    async def fetch(cid):
+        calls.append(cid)
+        await asyncio.sleep(0.01)
+        return [("c", "1", 1, True)]
+
+    async def main():
+        alloc = WatchAllocator(ttl=60)
+        await asyncio.gather(*(alloc.refresh(["A", "B"], fetch, NOW) for _ in range(50)))
+        assert sorted(calls) == ["A", "B"]
+        await alloc.refresh(["A"], fetch, NOW + 30)
+        assert len(calls) == 2
+        await alloc.refresh(["A"], fetch, NOW + 61)
+        assert len(calls) == 3
+
+    asyncio.run(main())
+
+
+def test_finished_campaigns_from_inventory():
+    inv = {"data": {"currentUser": {"inventory": {"dropCampaignsInProgress": [
+        {"id": "A", "timeBasedDrops": [{"dropInstanceID": "a1", "isClaimed": True},
+                                       {"dropInstanceID": "a2"}]},
+        {"id": "B", "timeBasedDrops": [{"dropInstanceID": "b1"}]},
+    ]}}}}
+    assert finished_campaigns(inv, {}) == frozenset()
+    assert finished_campaigns(inv, {"a2": "t"}) == frozenset({"A"})
+
+
+def test_warm_solve_is_memoised(monkeypatch):
+    from src import allocator
+
+    rng = random.Random(1)
+    alloc = WatchAllocator()
+    camps = [_camp(f"c{i}", ends_in=rng.uniform(3600, 7 * 86400)) for i in range(20)]
+    for c in camps:
+        alloc.update(c.id, [(f"ch{n}", str(n), rng.randrange(10000), rng.random() < 0.8)
+                            for n in rng.sample(range(2000), 300)], NOW)
+    accounts = []
+    for _ in range(500):
+        sel = rng.sample(camps, rng.randint(1, 6))
+        accounts.append((sel, frozenset(c.id for c in sel if rng.random() < 0.2)))
+
+    weights = []
+    weight = allocator.campaign_weight
+    monkeypatch.setattr(allocator, "campaign_weight", lambda c, now: weights.append(c.id) or weight(c, now))
+
+    cold = [alloc.rank(sel, done, NOW) for sel, done in accounts]
+    assert weights
+    # повторный проход в ту же минуту — только поиск в словаре: без пересчёта весов, те же объекты
+    weights.clear()
+    warm = [alloc.rank(sel, done, NOW) for sel, done in accounts]
+    assert weights == []
+    assert all(a is b for a, b in zip(cold, warm))
+    # одинаковый выбор у разных аккаунтов решается один раз
+    assert len(alloc._solved) == len({(tuple(c.id for c in sel), done) for sel, done in accounts})
+    # новая минута — веса пересчитываются
+    alloc.rank(*accounts[0], NOW + 60)
+    assert weights
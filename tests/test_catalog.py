@@ -0,0 +1,75 @@
+import gc
+import tracemalloc
+
+from src.catalog import Campaign, CampaignCatalog, get_catalog
+from src.miner import _parse_campaigns_from_dashboard
+from src.state_store import AccountState
+from src.types import Account
+
+# бюджет памяти на аккаунт (Account + AccountState воркера с его кампаниями)
+BYTES_PER_ACCOUNT_BUDGET = 1024
+
+
+def _dashboard(n=5, channels=20):
+    camps = [
+        {
+            "id": f"camp-{i:04d}",
+            "name": f"Campaign {i}",
+            "game": {"name": f"Game {i % 3}"},
+            "allowlistedChannels": [{"name": f"chan{i}_{j}"} for j in range(channels)],
+        }
+        for i in range(n)
+    ]
+    return {"data": {"currentUser": {"dropsDashboard": {"campaigns": camps}}}}
+
+
+def test_catalog_shares_campaign_objects():
+    cat = CampaignCatalog()
+    a = cat.intern(_parse_campaigns_from_dashboard(_dashboard()))
+    b = cat.intern(_parse_campaigns_from_dashboard(_dashboard()))
+    assert a is b
+    assert isinstance(a[0], Campaign)
+    assert a[0].channels[0] == "chan0_0"
+    assert len(cat) == 5
+    # более полный список каналов заменяет запись, неполный — нет
+    c = cat.intern([{"id": "camp-0000", "name": "Campaign 0", "game": "Game 0", "channels": ["x"]}])
+    assert c[0].channels == ("x",)
+    assert cat.intern([{"id": "camp-0000", "channels": []}])[0] is c[0]
+
+
+def test_account_has_no_instance_dict():
+    acc = Account(label="a", login="a")
+    assert not hasattr(acc, "__dict__")
+    assert not hasattr(AccountState(), "__dict__")
+
+
+def test_bytes_per_account_at_10k():
+    n = 10_000
+    dashboard = _dashboard()
+    get_catalog().clear()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        accounts, states = [], []
+        for i in range(n):
+            accounts.append(
+                Account(
+                    label=f"user{i:05d}",
+                    login=f"user{i:05d}",
+                    password="secret-pass",
+                    proxy=f"http://u:p@10.0.0.{i % 50}:8080",
+                )
+            )
+            # как воркер: свой разбор дашборда, в состоянии — только id из общего каталога
+            st = AccountState()
+            st.set_campaigns(get_catalog().intern(_parse_campaigns_from_dashboard(dashboard)), 0.0)
+            states.append(st)
+        gc.collect()
+        current, _peak = tracemalloc.get_traced_memory()
+        campaigns = [st.campaigns() for st in states]
+    finally:
+        tracemalloc.stop()
+        get_catalog().clear()
+    per_account = current / n
+    assert per_account < BYTES_PER_ACCOUNT_BUDGET
+    assert all(c is campaigns[0] for c in campaigns)
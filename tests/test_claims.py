@@ -0,0 +1,115 @@
+import asyncio
+
+import pytest
+
+from src.claims import ClaimLedger, claim_all, time_based_drops
+from src.clock import VirtualClock
+from src.metrics import WASTED_CLAIMS
+
+
+def _inv(*drops):
+    return {"data": {"currentUser": {"inventory": {"dropCampaignsInProgress": [
+        {"id": "c", "timeBasedDrops": list(drops)}
+    ]}}}}
+
+
+def _drop(did, cur=10, req=10, claimed=False):
+    return {"dropInstanceID": did, "requiredMinutesWatched": req,
+            "currentMinutesWatched": cur, "isClaimed": claimed, "name": did}
+
+
+class ClaimAPI:
+    def __init__(self, statuses):
+        self.statuses = statuses
+        self.calls = []
+        self.inflight = 0
+        self.max_inflight = 0
+
+    async def claim(self, did):
+        self.calls.append(did)
+        self.inflight += 1
+        self.max_inflight = max(self.max_inflight, self.inflight)
+        await asyncio.sleep(0.01)
+        self.inflight -= 1
+        st = self.statuses.get(did, "ELIGIBLE_FOR_ALL")
+        if isinstance(st, Exception):
+            raise st
+        return {"data": {"claimDropRewards": {"status": st}}}
+
+
+def test_claims_every_finished_drop_once_and_concurrently():
+    inv = _inv(_drop("a"), _drop("b"), _drop("c", cur=3), _drop("d", claimed=True), _drop("e"))
+    drops = time_based_drops(inv)
+    assert [d["dropInstanceID"] for d in drops] == ["a", "b", "c", "d", "e"]
+
+    async def main():
+        api = ClaimAPI({"e": "DROP_INSTANCE_ALREADY_CLAIMED"})
+        ledger = ClaimLedger()
+        wasted = WASTED_CLAIMS.value("already_claimed")
+        res = await claim_all(api, drops, ledger)
+        assert sorted(d["dropInstanceID"] for d, err in res if err is None) == ["a", "b"]
+        assert api.max_inflight == 3
+        assert set(ledger.claimed) == {"a", "b", "e"}
+        assert WASTED_CLAIMS.value("already_claimed") == wasted + 1
+        # повторный проход: всё уже в журнале — запросов нет
+        assert await claim_all(api, drops, ledger) == []
+        assert len(api.calls) == 3
+
+    asyncio.run(main())
+
+
+def test_failed_claim_backs_off():
+    drops = [_drop("x")]
+
+    async def main():
+        clock = VirtualClock()
+        api = ClaimAPI({"x": RuntimeError("boom")})
+        ledger = ClaimLedger(clock=clock)
+        res = await claim_all(api, drops, ledger)
+        assert res[0][1] == "boom"
+        await clock.advance(30)
+        assert await claim_all(api, drops, ledger) == []
+        await clock.advance(31)
+        api.statuses = {}
+        res = await claim_all(api, drops, ledger)
+        assert res[0][1] is None
+        assert api.calls == ["x", "x"]
+
+    asyncio.run(main())
+
+
+def test_missing_claim_status_is_a_failure():
+    drops = [_drop("x")]
+
+    async def main():
+        clock = VirtualClock()
+        api = ClaimAPI({"x": None})
+        ledger = ClaimLedger(clock=clock)
+        wasted = WASTED_CLAIMS.value("no_status")
+        res = await claim_all(api, drops, ledger)
+        assert res[0][1] == "no claim status"
+        assert "x" not in ledger.claimed
+        assert WASTED_CLAIMS.value("no_status") == wasted + 1
+        # пауза как после любой ошибки
+        assert await claim_all(api, drops, ledger) == []
+        await clock.advance(61)
+        api.statuses = {}
+        res = await claim_all(api, drops, ledger)
+        assert res[0][1] is None
+        assert api.calls == ["x", "x"]
+
+    asyncio.run(main())
+
+
+def test_simulated_worker_claims_simultaneous_drops_in_one_tick(monkeypatch):
+    aiohttp = pytest.importorskip("aiohttp")
+    from src import gql_middleware, twitch_api
+    from src.fake_twitch import FakeConfig
+    from src.sim import Strategy, simulate
+
+    monkeypatch.setattr(twitch_api, "aiohttp", aiohttp)
+    monkeypatch.setattr(gql_middleware, "aiohttp", aiohttp)
+    cfg = FakeConfig(required_minutes=10, drops_per_campaign=3, beacon_min_interval=60, seed=1)
+    res = asyncio.run(simulate(Strategy("t60", tick_interval=60), accounts=2, hours=1, config=cfg))
+    assert res.claims >= 2 * 3 * 4
+    assert res.requests_by_kind["gql:DropsPage_ClaimDropRewards"] == res.claims
@@ -0,0 +1,117 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+from src import client_integrity
+from src.client_integrity import GQL_URL, blocked, capture_ci
+
+
+def test_blocked_resources_and_hosts():
+    assert blocked("https://static-cdn.jtvnw.net/a.png", "image")
+    assert blocked("https://video-weaver.fra05.hls.ttvnw.net/v1/playlist.m3u8", "xhr")
+    assert blocked("https://spade.twitch.tv/track", "fetch")
+    assert not blocked("https://static.twitchcdn.net/assets/core.js", "script")
+    assert not blocked(GQL_URL, "fetch")
+    assert not blocked("https://www.twitch.tv/drops", "document")
+
+
+class FakeRoute:
+    def __init__(self, url, kind):
+        self.request = SimpleNamespace(url=url, resource_type=kind)
+        self.result = None
+
+    async def abort(self):
+        self.result = "abort"
+
+    async def continue_(self):
+        self.result = "continue"
+
+
+class FakeBrowser:
+    """Страница шлёт GQL без CI, картинку, GQL с CI — и дальше «грузится» бесконечно."""
+
+    def __init__(self):
+        self.routes = []
+        self.closed = False
+        self.context_kw = None
+
+    async def new_context(self, **kw):
+        self.context_kw = kw
+        browser = self
+
+        class Page:
+            def on(self, event, cb):
+                self.cb = cb
+
+            async def goto(self, url, wait_until="load"):
+                assert wait_until == "commit"
+                for url, kind in (("https://static-cdn.jtvnw.net/x.png", "image"), (GQL_URL, "fetch")):
+                    route = FakeRoute(url, kind)
+                    await browser.handler(route)
+                    browser.routes.append(route)
+                self.cb(SimpleNamespace(url=GQL_URL, headers={"client-version": "cv"}))
+                self.cb(SimpleNamespace(url=GQL_URL, headers={"client-version": "cv", "client-integrity": "ci"}))
+                await asyncio.sleep(100)
+
+        class Context:
+            async def route(self, pattern, handler):
+                browser.handler = handler
+
+            async def add_cookies(self, cookies):
+                pass
+
+            async def new_page(self):
+                return Page()
+
+            async def close(self):
+                browser.closed = True
+
+        return Context()
+
+
+def test_capture_stops_on_first_integrity_header():
+    browser = FakeBrowser()
+    t0 = time.perf_counter()
+    res = asyncio.run(capture_ci(browser, [], proxy="http://p:1", timeout=5))
+    assert res == ("cv", "ci") and time.perf_counter() - t0 < 1
+    assert browser.closed
+    assert [r.result for r in browser.routes] == ["abort", "continue"]
+    assert browser.context_kw["viewport"] == client_integrity.VIEWPORT
+    assert browser.context_kw["proxy"] == {"server": "http://p:1"}
+
+
+def test_ci_expiry_for_skip_fresh(monkeypatch, tmp_path):
+    monkeypatch.setattr(client_integrity, "CI_DIR", tmp_path)
+    assert client_integrity.ci_expires_at("acc") == 0
+    client_integrity.save_ids("acc", {"device_id": "d"})
+    assert client_integrity.ci_expires_at("acc") == 0
+    client_integrity.save_ci("acc", "cv", "ci", ttl=100, now=1000)
+    assert client_integrity.ci_expires_at("acc") == 1100
+    assert [p.name for p in tmp_path.iterdir()] == ["acc.json"]
+
+
+def test_concurrent_ci_writes_use_private_temp_files(monkeypatch, tmp_path):
+    import threading
+
+    monkeypatch.setattr(client_integrity, "CI_DIR", tmp_path)
+    seen = set()
+    real = client_integrity.tempfile.NamedTemporaryFile
+
+    def spy(*a, **kw):
+        f = real(*a, **kw)
+        seen.add(f.name)
+        return f
+
+    monkeypatch.setattr(client_integrity.tempfile, "NamedTemporaryFile", spy)
+    # воркер и update_ci.py пишут один логин одновременно
+    threads = [
+        threading.Thread(target=client_integrity.save_ci, args=("acc", f"cv{i}", f"ci{i}"))
+        for i in range(8)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(seen) == 8
+    assert client_integrity.load_ci("acc")[0].startswith("cv")
+    assert [p.name for p in tmp_path.iterdir()] == ["acc.json"]
@@ -0,0 +1,82 @@
+import asyncio
+import time
+
+import pytest
+
+from src.clock import VirtualClock
+
+
+def test_virtual_clock_wakes_sleepers_in_order():
+    async def main():
+        clock = VirtualClock()
+        woke = []
+
+        async def sleeper(name, delay):
+            await clock.sleep(delay)
+            woke.append((name, clock.monotonic()))
+
+        tasks = [asyncio.ensure_future(sleeper(n, d)) for n, d in (("b", 20), ("a", 5), ("c", 3600))]
+        t0 = time.perf_counter()
+        await clock.run_until(60)
+        assert woke == [("a", 5), ("b", 20)]
+        assert clock.monotonic() == 60
+        await clock.advance(3600)
+        assert woke[-1] == ("c", 3600)
+        assert time.perf_counter() - t0 < 1.0
+        await asyncio.gather(*tasks)
+
+    asyncio.run(main())
+
+
+def test_virtual_clock_wait_event():
+    async def main():
+        clock = VirtualClock()
+        evt = asyncio.Event()
+        task = asyncio.ensure_future(clock.wait_event(evt, 30))
+        await clock.advance(10)
+        assert not task.done()
+        evt.set()
+        await clock.advance(30)
+        assert await task is True
+
+    asyncio.run(main())
+
+
+def test_simulation_runs_hours_of_mining_in_seconds(monkeypatch):
+    aiohttp = pytest.importorskip("aiohttp")
+    from src import gql_middleware, twitch_api
+    from src.fake_twitch import FakeConfig
+    from src.sim import Strategy, simulate
+
+    monkeypatch.setattr(twitch_api, "aiohttp", aiohttp)
+    monkeypatch.setattr(gql_middleware, "aiohttp", aiohttp)
+    cfg = FakeConfig(latency_ms=50, rate_429=0.05, required_minutes=30, beacon_min_interval=60, seed=3)
+    res = asyncio.run(simulate(Strategy("tick60", tick_interval=60), accounts=3, hours=2, config=cfg))
+    assert res.claims >= 3 * 3
+    assert res.wall_s < 10
+    assert res.requests_by_kind.get("gql_429", 0) > 0
+
+
+def test_virtual_clock_timeout():
+    async def main():
+        clock = VirtualClock()
+
+        async def slow():
+            async with clock.timeout(5):
+                await clock.sleep(60)
+
+        async def quick():
+            async with clock.timeout(5):
+                await clock.sleep(1)
+            # таймер снят — дальше тело живёт без дедлайна
+            await clock.sleep(30)
+            return "ok"
+
+        t_slow = asyncio.ensure_future(slow())
+        t_quick = asyncio.ensure_future(quick())
+        await clock.run_until(100)
+        with pytest.raises(TimeoutError):
+            t_slow.result()
+        assert t_quick.result() == "ok"
+
+    asyncio.run(main())
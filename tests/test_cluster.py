@@ -0,0 +1,200 @@
+import asyncio
+import json
+
+from src.catalog import CampaignCatalog
+from src.cluster import HEARTBEAT, LEASE_TTL, Agent, Coordinator, is_loopback
+from src.clock import VirtualClock
+from src.events import EventBus
+from src.httpd import fetch
+from src.ops import OpsRegistry
+from src.types import Account
+
+# 4 прокси: 30 + 20 + 10 + 10 аккаунтов
+SIZES = {"http://p1:1": 30, "http://p2:1": 20, "http://p3:1": 10, "http://p4:1": 10}
+
+
+def _accounts():
+    return [Account(f"{proxy[7:9]}-{i}", f"{proxy[7:9]}u{i}", proxy=proxy) for proxy, n in SIZES.items() for i in range(n)]
+
+
+def _ops(tmp_path, name, hashes):
+    path = tmp_path / f"{name}.json"
+    path.write_text(json.dumps(hashes), encoding="utf-8")
+    return OpsRegistry(path)
+
+
+class FakeRunner:
+    """HeadlessRunner без воркеров: запуск — незавершённый future."""
+
+    def __init__(self):
+        self.accounts = []
+        self.tasks = {}
+        self.cmds = {}
+        self.queue = EventBus()
+
+    def start_many(self, logins):
+        loop = asyncio.get_running_loop()
+        for login in logins:
+            self.tasks.setdefault(login, loop.create_future())
+
+    def stop_account(self, login, grace=0):
+        fut = self.tasks.pop(login, None)
+        if fut is not None:
+            fut.cancel()
+
+
+def _beat(coord, aid, running=(), epoch=None, capacity=1.0):
+    return coord.heartbeat(aid, {"running": list(running), "epoch": epoch, "capacity": capacity})
+
+
+def _proxies(coord, reply):
+    return {coord.by_login[d["login"]].proxy for d in reply.get("accounts", ())}
+
+
+def test_shards_by_proxy_rebalance_on_death_and_handoff_on_join(tmp_path):
+    clock = VirtualClock()
+    coord = Coordinator(_accounts(), clock=clock, ops=_ops(tmp_path, "c", {}), catalog=CampaignCatalog())
+    # первые LEASE_TTL после старта ждём отчётов уже работающих агентов, ничего не раздаём
+    assert _beat(coord, "a")["accounts"] == [] and _beat(coord, "b")["accounts"] == []
+    asyncio.run(clock.advance(LEASE_TTL / 2))
+    _beat(coord, "a")
+    _beat(coord, "b")
+    asyncio.run(clock.advance(LEASE_TTL / 2 + 1))
+    ra = _beat(coord, "a")
+    rb = _beat(coord, "b")
+    # каждый прокси целиком у одного агента, вместе — все аккаунты
+    pa, pb = _proxies(coord, ra), _proxies(coord, rb)
+    assert pa.isdisjoint(pb) and pa | pb == set(SIZES)
+    assert sorted(sum(SIZES[p] for p in x) for x in (pa, pb)) == [30, 40]
+
+    # b пропал: через LEASE_TTL его шарды у a
+    running_a = [d["login"] for d in ra["accounts"]]
+    for _ in range(5):
+        asyncio.run(clock.advance(LEASE_TTL / 4))
+        ra2 = _beat(coord, "a", running=running_a, epoch=ra["epoch"])
+    assert "b" not in coord.agents and _proxies(coord, ra2) == set(SIZES)
+    running_a = [d["login"] for d in ra2["accounts"]]
+
+    # c присоединился: часть шардов уходит к нему, но только после того, как a их остановил
+    rc = _beat(coord, "c")
+    assert rc["accounts"] == []
+    ra3 = _beat(coord, "a", running=running_a, epoch=ra2["epoch"])
+    kept = _proxies(coord, ra3)
+    assert kept and kept != set(SIZES)
+    rc = _beat(coord, "c", epoch=rc["epoch"])
+    assert "accounts" not in rc
+    still = [d["login"] for d in ra3["accounts"]]
+    _beat(coord, "a", running=still, epoch=ra3["epoch"])
+    rc = _beat(coord, "c", epoch=rc["epoch"])
+    assert _proxies(coord, rc) == set(SIZES) - kept
+
+
+def test_agents_sync_events_caches_and_metrics_over_http(tmp_path):
+    async def main():
+        clock = VirtualClock()
+        coord_ops = _ops(tmp_path, "coord", {"Inventory": "h-inv"})
+        coord = Coordinator(_accounts(), port=0, clock=clock, token="s3cret",
+                            ops=coord_ops, catalog=CampaignCatalog())
+        await clock.advance(LEASE_TTL + 1)
+        await coord.start()
+        addr = f"127.0.0.1:{coord.port}"
+        agents = []
+        for name in ("n1", "n2"):
+            runner = FakeRunner()
+            agent = Agent(runner, addr, agent_id=name, token="s3cret",
+                          ops=_ops(tmp_path, name, {"Inventory": "old"}), catalog=CampaignCatalog())
+            agent._sub = runner.queue.subscribe()
+            agents.append(agent)
+        try:
+            # n1 пришёл первым и взял всё; часть переезжает к n2 после того, как n1 её остановит
+            for _ in range(3):
+                for agent in agents:
+                    assert await agent.heartbeat()
+            n1, n2 = agents
+            assert len(n1.leased) + len(n2.leased) == sum(SIZES.values())
+            assert set(n1.runner.tasks) == n1.leased and not n1.leased & n2.leased
+            # ops.json координатора важнее старых локальных хэшей
+            assert n1.ops.ops["Inventory"] == "h-inv"
+
+            login = sorted(n1.leased)[0]
+            n1.runner.queue.put_nowait((login, "claimed", {"pct": 100, "remain": 0, "at": "t1", "drop": "D"}))
+            n1.catalog.intern([{"id": "camp1", "name": "Camp", "game": "G", "channels": ["ch1"]}])
+            n1.ops.update({"Inventory": "h-new"}, persist=False)
+            await n1.heartbeat()
+            await n2.heartbeat()
+            assert n2.catalog.get("camp1").channels == ("ch1",)
+            assert n2.ops.ops["Inventory"] == "h-new"
+            assert json.loads(coord_ops.path.read_text())["Inventory"] == "h-new"
+
+            status, raw = await fetch("127.0.0.1", coord.port, "GET", f"/accounts?login={login}",
+                                      headers={"x-cluster-token": "s3cret"})
+            row, = json.loads(raw)["accounts"]
+            assert (row["agent"], row["claimed"], row["running"]) == ("n1", 1, True)
+            status, raw = await fetch("127.0.0.1", coord.port, "GET", "/metrics",
+                                      headers={"x-cluster-token": "s3cret"})
+            text = raw.decode()
+            assert 'agent="n1"' in text and 'agent="n2"' in text
+            assert text.count("# TYPE miner_events_total counter") == 1
+            status, _ = await fetch("127.0.0.1", coord.port, "GET", "/agents")
+            assert status == 403
+        finally:
+            await coord.close()
+        # координатор пропал: агент сам останавливает аккаунты по истечении аренды
+        n1.clock = clock
+        n1.last_ok = clock.monotonic()
+        assert not await n1.heartbeat() and n1.runner.tasks
+        await clock.advance(LEASE_TTL + 1)
+        assert not await n1.heartbeat()
+        assert not n1.runner.tasks and not n1.runner.accounts
+
+    asyncio.run(main())
+
+
+def test_agent_fences_on_its_own_timer_before_coordinator_reassigns(tmp_path):
+    async def main():
+        clock = VirtualClock()
+        runner = FakeRunner()
+        agent = Agent(runner, "127.0.0.1:9", agent_id="n1", clock=clock, interval=HEARTBEAT,
+                      ops=_ops(tmp_path, "a", {}), catalog=CampaignCatalog())
+        agent._apply([{"login": "x-1", "proxy": "http://p:1"}])
+        runner.start_many(["x-1"])
+        agent.last_ok = clock.monotonic()
+        fencer = asyncio.ensure_future(agent._fence_loop())
+        # сеть висит: heartbeat не возвращается, но таймер останавливает аккаунты
+        await clock.advance(agent.fence_at() - clock.monotonic() - 0.5)
+        assert runner.tasks
+        await clock.advance(1)
+        assert not runner.tasks and not agent.leased
+        # координатор снял бы аренду только через LEASE_TTL
+        assert clock.monotonic() - agent.last_ok < LEASE_TTL
+        fencer.cancel()
+
+    asyncio.run(main())
+
+
+def test_fenced_workers_are_gone_before_lease_ttl(tmp_path):
+    from src.headless import HeadlessRunner
+
+    async def main():
+        clock = VirtualClock()
+        runner = HeadlessRunner(None)
+        agent = Agent(runner, "127.0.0.1:9", agent_id="n1", clock=clock, interval=HEARTBEAT,
+                      ops=_ops(tmp_path, "a", {}), catalog=CampaignCatalog())
+        agent._apply([{"login": "x-1", "proxy": "http://p:1"}])
+        # воркер посреди клейма: на stop_evt сам не выходит
+        stop = runner.stops["x-1"] = asyncio.Event()
+        worker = runner.tasks["x-1"] = asyncio.ensure_future(clock.sleep(3600))
+        agent.last_ok = clock.monotonic()
+        fencer = asyncio.ensure_future(agent._fence_loop())
+        await clock.advance(LEASE_TTL)
+        await asyncio.sleep(0)
+        # к моменту, когда координатор раздаст шард, здесь ничего не работает
+        assert stop.is_set() and worker.done()
+        fencer.cancel()
+
+    asyncio.run(main())
+
+
+def test_loopback_detection():
+    assert is_loopback("127.0.0.1") and is_loopback("localhost") and is_loopback("::1")
+    assert not is_loopback("0.0.0.0") and not is_loopback("coord.example")
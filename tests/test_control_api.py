@@ -0,0 +1,183 @@
+import asyncio
+import json
+
+from src.control_api import ControlServer
+from src.events import EventBus
+from src.types import Account
+
+N = 2000
+TOKEN = "s3cret"
+
+
+class FakeRunner:
+    """То, что ControlServer берёт у HeadlessRunner/MainWindow, без настоящих воркеров."""
+
+    def __init__(self, n):
+        self.accounts = [
+            Account(f"Farm {i}", f"farm{i:04d}" if i % 2 == 0 else f"alt{i:04d}", proxy="http://u:pw@p1.example:3128")
+            for i in range(n)
+        ]
+        self.tasks = {}
+        self.stops = {}
+        self.cmds = {}
+        self.queue = EventBus()
+        self.ramp = None
+        self.selected_campaigns = {}
+        self.start_calls = 0
+
+    def start_account(self, login, tick_phase=None):
+        if login in self.tasks:
+            return
+        self.tasks[login] = asyncio.get_running_loop().create_future()
+        self.cmds[login] = asyncio.Queue()
+        next(a for a in self.accounts if a.login == login).status = "Running"
+
+    def start_many(self, logins):
+        self.start_calls += 1
+        for login in logins:
+            self.start_account(login)
+
+    def stop_account(self, login):
+        fut = self.tasks.pop(login, None)
+        if fut is not None:
+            fut.cancel()
+        self.cmds.pop(login, None)
+        next(a for a in self.accounts if a.login == login).status = "Stopped"
+
+
+async def _call(server, method, path, body=None, headers=None):
+    if server.http.path:
+        reader, writer = await asyncio.open_unix_connection(server.http.path)
+    else:
+        reader, writer = await asyncio.open_connection("127.0.0.1", server.port)
+    data = json.dumps(body).encode() if body is not None else b""
+    h = {"Host": f"127.0.0.1:{server.port}", "X-Control-Token": TOKEN, "Content-Type": "application/json"}
+    h.update(headers or {})
+    head = "".join(f"{k}: {v}\r\n" for k, v in h.items() if v is not None)
+    writer.write(f"{method} {path} HTTP/1.1\r\n{head}Content-Length: {len(data)}\r\n\r\n".encode() + data)
+    await writer.drain()
+    raw = await reader.read()
+    writer.close()
+    head, _, payload = raw.partition(b"\r\n\r\n")
+    return int(head.split()[1]), json.loads(payload)
+
+
+def test_bulk_start_stop_thousands_in_one_call():
+    async def main():
+        runner = FakeRunner(N)
+        server = ControlServer(runner, token=TOKEN)
+        await server.start()
+        try:
+            status, res = await _call(server, "POST", "/accounts/start", {"filter": {"login": "farm*"}})
+            assert status == 200 and res["started"] == N // 2 and runner.start_calls == 1
+
+            status, res = await _call(server, "GET", "/accounts?running=true")
+            assert res["total"] == N // 2
+            row = res["accounts"][0]
+            assert row["status"] == "Running" and row["proxy"] == "http://p1.example:3128"
+
+            logins = [f"farm{i:04d}" for i in range(0, N, 4)] + ["ghost"]
+            status, res = await _call(server, "POST", "/accounts/stop", {"logins": logins})
+            assert res == {"stopped": N // 4, "not_running": 0, "unknown": ["ghost"]}
+            assert len(runner.tasks) == N // 4
+
+            status, res = await _call(server, "GET", "/status")
+            assert res["running"] == N // 4 and res["by_status"]["Stopped"] == N // 4
+            # без выборки ничего не делаем
+            status, res = await _call(server, "POST", "/accounts/stop", {})
+            assert status == 400 and len(runner.tasks) == N // 4
+        finally:
+            await server.close()
+
+    asyncio.run(main())
+
+
+def test_commands_reach_worker_queues_and_state_follows_events():
+    async def main():
+        runner = FakeRunner(4)
+        server = ControlServer(runner, token=TOKEN)
+        await server.start()
+        try:
+            await _call(server, "POST", "/accounts/start", {"logins": ["farm0000", "alt0001"]})
+            status, res = await _call(server, "POST", "/accounts/campaigns", {"all": True, "campaigns": ["c1", "c2"]})
+            assert res["sent"] == 2 and res["not_running"] == 2
+            assert runner.cmds["farm0000"].get_nowait() == ("select_campaigns", ["c1", "c2"])
+            assert runner.selected_campaigns["farm0002"] == ["c1", "c2"]
+
+            status, res = await _call(server, "POST", "/accounts/alt0001/switch", {"channel": "streamer"})
+            assert status == 200 and res["sent"] == 1
+            q = runner.cmds["alt0001"]
+            assert [q.get_nowait() for _ in range(q.qsize())][-1] == ("switch", "streamer")
+            status, _ = await _call(server, "POST", "/accounts/nobody/switch", {"channel": "x"})
+            assert status == 404
+
+            runner.queue.put_nowait(("farm0000", "status", {"status": "Watching", "note": "ch"}))
+            runner.queue.put_nowait(("farm0000", "claimed", {"pct": 100, "remain": 0, "at": "now"}))
+            status, row = await _call(server, "GET", "/accounts/farm0000")
+            assert (row["status"], row["claimed"], row["last_claim_at"]) == ("Watching", 1, "now")
+            status, res = await _call(server, "GET", "/accounts?status=watch*")
+            assert [r["login"] for r in res["accounts"]] == ["farm0000"]
+        finally:
+            await server.close()
+
+    asyncio.run(main())
+
+
+def test_event_stream_over_unix_socket(tmp_path):
+    async def main():
+        runner = FakeRunner(2)
+        server = ControlServer(runner, path=str(tmp_path / "ctl.sock"))
+        await server.start()
+        assert (tmp_path / "ctl.sock").stat().st_mode & 0o777 == 0o600
+        reader, writer = await asyncio.open_unix_connection(server.http.path)
+        writer.write(b"GET /events?kinds=claimed&login=farm* HTTP/1.1\r\n\r\n")
+        await writer.drain()
+        while (await reader.readline()) not in (b"\r\n", b""):
+            pass
+        await asyncio.sleep(0.05)
+        runner.queue.put_nowait(("alt0001", "claimed", {"drop": "skip"}))
+        runner.queue.put_nowait(("farm0000", "progress", {"pct": 5}))
+        runner.queue.put_nowait(("farm0000", "claimed", {"drop": "Drop"}))
+        line = await asyncio.wait_for(reader.readline(), 2)
+        ev = json.loads(line)
+        assert (ev["login"], ev["kind"], ev["data"]["drop"]) == ("farm0000", "claimed", "Drop")
+        # закрытие сервера завершает поток
+        await server.close()
+        assert await asyncio.wait_for(reader.read(), 2) == b""
+        writer.close()
+        assert not (tmp_path / "ctl.sock").exists()
+
+    asyncio.run(main())
+
+
+def test_tcp_requires_token_loopback_host_and_json_body():
+    async def main():
+        runner = FakeRunner(2)
+        server = ControlServer(runner, token=TOKEN)
+        await server.start()
+        try:
+            stop_all = ("POST", "/accounts/stop", {"all": True})
+            status, _ = await _call(server, *stop_all, headers={"X-Control-Token": None})
+            assert status == 401
+            status, _ = await _call(server, *stop_all, headers={"X-Control-Token": "wrong"})
+            assert status == 401
+            # DNS rebinding: чужое имя в Host
+            status, _ = await _call(server, "GET", "/accounts", headers={"Host": "evil.example:8080"})
+            assert status == 403
+            # «простой» cross-site POST без preflight
+            status, _ = await _call(server, *stop_all, headers={"Content-Type": "text/plain"})
+            assert status == 415
+            status, _ = await _call(server, "GET", "/accounts", headers={"Host": "localhost"})
+            assert status == 200
+        finally:
+            await server.close()
+
+    asyncio.run(main())
+
+
+def test_tcp_without_token_generates_private_token_file(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    server = ControlServer(FakeRunner(1))
+    path = tmp_path / "state" / "control.token"
+    assert path.read_text().strip() == server.token and len(server.token) >= 24
+    assert path.stat().st_mode & 0o777 == 0o600
@@ -0,0 +1,103 @@
+import asyncio
+import json
+
+from src.clock import VirtualClock
+from src.events import ERROR_BURST, ERROR_WINDOW, ErrorData, EventBus, JsonlSink, ProgressData, StatusData
+
+
+def _drain(sub):
+    out = []
+    while not sub.empty():
+        out.append(tuple(sub.get_nowait()))
+    return out
+
+
+def test_status_and_progress_keep_last_value_per_login():
+    bus = EventBus()
+    for i in range(10_000):
+        bus.put_nowait((f"u{i % 3}", "progress", {"pct": i}))
+        bus.put_nowait((f"u{i % 3}", "status", {"status": f"s{i}"}))
+    # застрявший потребитель держит по одному значению на аккаунт и вид
+    assert bus.qsize() == 6
+    got = _drain(bus)
+    assert ("u0", "progress", ProgressData(pct=9999)) in got
+    assert ("u2", "status", StatusData("s9998")) in got
+
+
+def test_errors_rate_limited_with_suppressed_count():
+    clock = VirtualClock()
+    bus = EventBus(clock=clock)
+    for i in range(20):
+        bus.put_nowait(("u1", "error", {"msg": f"boom {i}"}))
+    bus.put_nowait(("u2", "error", {"msg": "other"}))
+    got = _drain(bus)
+    assert [p["msg"] for login, _k, p in got if login == "u1"] == [f"boom {i}" for i in range(ERROR_BURST)]
+    assert ("u2", "error", ErrorData("other")) in got
+
+    # окно истекло: сначала сводка по подавленным, потом новая ошибка как есть
+    asyncio.run(clock.advance(ERROR_WINDOW))
+    bus.put_nowait(("u1", "error", {"msg": "again"}))
+    summary, again = _drain(bus)
+    assert summary == ("u1", "error", ErrorData(f"{20 - ERROR_BURST} errors suppressed", 20 - ERROR_BURST))
+    assert again == ("u1", "error", ErrorData("again"))
+
+
+def test_suppressed_errors_reported_when_login_goes_quiet():
+    clock = VirtualClock()
+    bus = EventBus(clock=clock)
+    seen = []
+    bus.listen(lambda ev: seen.append(ev.kind))
+    for i in range(ERROR_BURST + 3):
+        bus.put_nowait(("u1", "error", {"msg": f"boom {i}"}))
+    _drain(bus)
+    bus.sweep()
+    assert bus.empty()
+
+    # u1 больше не падает — сводку выпускает публикация другого аккаунта
+    asyncio.run(clock.advance(ERROR_WINDOW))
+    bus.put_nowait(("u2", "status", {"status": "Running"}))
+    got = _drain(bus)
+    assert ("u1", "error", ErrorData("3 errors suppressed", 3)) in got
+    # слушатели видели каждую ошибку и сводку не получают
+    assert seen.count("error") == ERROR_BURST + 3
+    # сводка одна на окно
+    asyncio.run(clock.advance(ERROR_WINDOW))
+    bus.sweep()
+    assert bus.empty()
+
+
+def test_claims_survive_overflow_and_subscribers_are_independent():
+    bus = EventBus(capacity=5)
+    slow = bus.subscribe(capacity=3, kinds=("claimed", "switch"))
+    for i in range(4):
+        bus.put_nowait(("u1", "claimed", {"drop": f"d{i}"}))
+    for i in range(10):
+        bus.put_nowait(("u1", "switch", {"channel": f"c{i}"}))
+    # на переполнении вытесняются старые switch, клеймы остаются все
+    assert [p["drop"] for _l, k, p in _drain(slow) if k == "claimed"] == ["d0", "d1", "d2", "d3"]
+    main = _drain(bus)
+    assert [k for _l, k, _p in main].count("claimed") == 4
+    assert [p["channel"] for _l, k, p in main if k == "switch"] == ["c9"]
+
+
+def test_async_get_and_jsonl_sink(tmp_path):
+    path = tmp_path / "events.jsonl"
+
+    async def main():
+        bus = EventBus()
+        sink = JsonlSink(path, bus)
+        task = asyncio.ensure_future(sink.run())
+        getter = asyncio.ensure_future(bus.get())
+        await asyncio.sleep(0)
+        bus.put_nowait(("u1", "claimed", {"drop": "Drop", "at": "now"}))
+        login, kind, p = await getter
+        assert (login, kind, p["drop"]) == ("u1", "claimed", "Drop")
+        await bus.put(("u1", "campaigns", {"campaigns": ({"id": "c1"},)}))
+        await asyncio.sleep(0)
+        sink.close()
+        await task
+
+    asyncio.run(main())
+    lines = [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+    assert [(e["login"], e["kind"]) for e in lines] == [("u1", "claimed"), ("u1", "campaigns")]
+    assert lines[1]["data"] == {"campaigns": [{"id": "c1"}]}
@@ -0,0 +1,74 @@
+import asyncio
+
+import pytest
+
+web = pytest.importorskip("aiohttp.web")
+aiohttp = pytest.importorskip("aiohttp")
+
+from src import fake_twitch, gql_middleware, miner, twitch_api
+from src.fake_twitch import FakeConfig, FakeTwitch, FakeTwitchServer
+
+
+def _gql(fake, login, op, variables=None):
+    return fake.gql(login, {"operationName": op, "variables": variables or {}},
+                    {"X-Device-Id": f"dev-{login}"})
+
+
+def test_fake_accrues_progress_and_claims():
+    now = [0.0]
+    fake = FakeTwitch(FakeConfig(required_minutes=2), now=lambda: now[0])
+    assert _gql(fake, "u", "Inventory")[0] == 200
+    fake.beacon("dev-u")
+    now[0] = 60.0
+    fake.beacon("dev-u")
+    status, data = _gql(fake, "u", "Inventory")
+    drop = data["data"]["currentUser"]["inventory"]["dropCampaignsInProgress"][0]["timeBasedDrops"][0]
+    assert drop["currentMinutesWatched"] == 2
+    _gql(fake, "u", "DropsPage_ClaimDropRewards", {"input": {"dropInstanceID": "u#0"}})
+    _gql(fake, "u", "DropsPage_ClaimDropRewards", {"input": {"dropInstanceID": "u#0"}})
+    assert fake.claims == {"u": 1}
+    assert fake.wasted_claims == 1
+    assert fake.time_to_claim == [60.0]
+
+
+def test_fake_failure_injection():
+    fake = FakeTwitch(FakeConfig(rate_429=1.0))
+    assert _gql(fake, "u", "Inventory")[0] == 429
+    fake = FakeTwitch(FakeConfig(hashes={"Inventory": "good"}))
+    body = {"operationName": "Inventory",
+            "extensions": {"persistedQuery": {"sha256Hash": "bad"}}}
+    assert fake.gql("u", body)[1]["errors"][0]["message"] == "PersistedQueryNotFound"
+
+
+def test_run_account_against_fake_server(monkeypatch):
+    # другие тесты подменяют aiohttp заглушками — возвращаем настоящий модуль
+    monkeypatch.setattr(twitch_api, "aiohttp", aiohttp)
+    monkeypatch.setattr(gql_middleware, "aiohttp", aiohttp)
+    monkeypatch.setattr(miner, "auth_token_from_cookies", lambda login: login)
+    monkeypatch.setattr(twitch_api, "GQL", twitch_api.GQL)
+    monkeypatch.setattr(twitch_api, "WWW", twitch_api.WWW)
+
+    async def _run():
+        server = FakeTwitchServer(FakeTwitch(FakeConfig(required_minutes=2)))
+        await server.start()
+        fake_twitch.point_api_at(server.url)
+        q = asyncio.Queue()
+        stop = asyncio.Event()
+        tasks = [
+            asyncio.create_task(miner.run_account(f"u{i}", None, q, stop, client_version="cv",
+                                                  client_integrity="ci", tick_interval=0.05))
+            for i in range(3)
+        ]
+        await asyncio.sleep(2.0)
+        stop.set()
+        await asyncio.gather(*tasks)
+        await server.close()
+        msgs = []
+        while not q.empty():
+            msgs.append(q.get_nowait())
+        return server.fake, msgs
+
+    fake, msgs = asyncio.run(_run())
+    assert not [m for m in msgs if m[1] == "error"]
+    assert {m[0] for m in msgs if m[1] == "claimed"} == {"u0", "u1", "u2"}
+    assert fake.requests["spade"] >= 6
@@ -0,0 +1,73 @@
+import asyncio
+
+from src import metrics
+
+
+def test_registry_renders_prometheus_text():
+    reg = metrics.Registry()
+    c = reg.counter("req_total", "requests", ("operation", "result"))
+    h = reg.histogram("lat_seconds", "latency", ("operation",), buckets=(0.1, 1.0))
+    g = reg.gauge("workers", "workers")
+    c.inc("Inventory", "ok")
+    c.inc("Inventory", "ok")
+    h.observe(0.05, "Inventory")
+    h.observe(0.5, "Inventory")
+    h.observe(5, "Inventory")
+    g.set_function(lambda: 7)
+
+    text = reg.render()
+    assert '# TYPE req_total counter' in text
+    assert 'req_total{operation="Inventory",result="ok"} 2' in text
+    assert 'lat_seconds_bucket{operation="Inventory",le="0.1"} 1' in text
+    assert 'lat_seconds_bucket{operation="Inventory",le="1"} 2' in text
+    assert 'lat_seconds_bucket{operation="Inventory",le="+Inf"} 3' in text
+    assert 'lat_seconds_count{operation="Inventory"} 3' in text
+    assert "workers 7" in text
+
+
+def test_recent_events_window():
+    r = metrics.RecentEvents(window=60)
+    r.mark(0)
+    r.mark(30)
+    assert r.count(50) == 2
+    assert r.count(80) == 1
+
+
+def test_hot_path_counts_every_call():
+    # стоимость вызова меряет scripts/bench_metrics.py; здесь — только поведение
+    c = metrics.Counter("x", "", ("op", "result"))
+    h = metrics.Histogram("y", "", ("op",), buckets=(0.1, 1.0))
+    n = 10_000
+    for _ in range(n):
+        c.inc("Inventory", "ok")
+        h.observe(0.2, "Inventory")
+    assert c.value("Inventory", "ok") == n
+    assert h.count("Inventory") == n
+    assert 'y_bucket{op="Inventory",le="0.1"} 0' in h.render()
+    assert f'y_bucket{{op="Inventory",le="1"}} {n}' in h.render()
+
+
+def test_metrics_endpoint_serves_registry():
+    async def _run():
+        metrics.GQL_REQUESTS.inc("TestOp", "ok")
+        server = metrics.MetricsServer(port=0)
+        assert await server.start()
+        try:
+            reader, writer = await asyncio.open_connection("127.0.0.1", server.port)
+            writer.write(b"GET /metrics HTTP/1.1\r\nHost: x\r\n\r\n")
+            await writer.drain()
+            raw = await reader.read()
+            writer.close()
+            reader, writer = await asyncio.open_connection("127.0.0.1", server.port)
+            writer.write(b"GET /nope HTTP/1.1\r\n\r\n")
+            missing = await reader.read()
+            writer.close()
+        finally:
+            await server.close()
+        return raw.decode(), missing.decode()
+
+    raw, missing = asyncio.run(_run())
+    assert raw.startswith("HTTP/1.1 200")
+    assert 'twitch_gql_requests_total{operation="TestOp",result="ok"}' in raw
+    assert "miner_claims_last_hour" in raw
+    assert missing.startswith("HTTP/1.1 404")
@@ -1,3 +1,4 @@
+import os
 import json
 import pytest
 import src.ops as ops
@@ -40,3 +41,57 @@ def test_get_hash_accepts_alias(tmp_path, monkeypatch):
         "DropsPage_ClaimDropRewards",
         "h5",
     )
+
+
+def test_registry_resolves_aliases_and_hot_reloads(tmp_path, monkeypatch):
+    data = {k: "old" for k in ops.REQUIRED}
+    path = tmp_path / "ops.json"
+    path.write_text(json.dumps(data), encoding="utf-8")
+
+    reg = ops.OpsRegistry(path, poll_interval=0)
+    assert reg.missing() == []
+    assert reg.resolve("ClaimDropReward") == ("DropsPage_ClaimDropRewards", "old")
+    snap = reg._snap
+
+    # без изменений файла снапшот не пересобирается
+    assert reg.maybe_reload() is False
+    assert reg._snap is snap
+
+    data["DropsPage_ClaimDropRewards"] = "new"
+    path.write_text(json.dumps(data), encoding="utf-8")
+    os.utime(path, (snap.mtime + 10, snap.mtime + 10))
+    assert reg.resolve("ClaimDropReward") == ("DropsPage_ClaimDropRewards", "new")
+
+    # битый файл не ломает работающих воркеров
+    path.write_text("{", encoding="utf-8")
+    os.utime(path, (snap.mtime + 20, snap.mtime + 20))
+    assert reg.resolve("ClaimDropReward") == ("DropsPage_ClaimDropRewards", "new")
+    # и не перечитывается на каждом опросе, пока файл не изменится снова
+    loads = []
+    load = reg._load
+    monkeypatch.setattr(reg, "_load", lambda p: loads.append(p) or load(p))
+    assert reg.maybe_reload() is False
+    assert loads == []
+    assert reg.resolve("ClaimDropReward") == ("DropsPage_ClaimDropRewards", "new")
+
+    with pytest.raises(RuntimeError):
+        reg.resolve("UnknownOp")
+
+
+def test_update_keeps_external_edit_made_between_polls(tmp_path):
+    data = {k: "old" for k in ops.REQUIRED}
+    path = tmp_path / "ops.json"
+    path.write_text(json.dumps(data), encoding="utf-8")
+    reg = ops.OpsRegistry(path, poll_interval=3600)
+    snap = reg._snap
+
+    # файл поправили руками, а опрос ещё не прошёл
+    data["Inventory"] = "edited"
+    path.write_text(json.dumps(data), encoding="utf-8")
+    os.utime(path, (snap.mtime + 10, snap.mtime + 10))
+
+    assert reg.update({"ViewerDropsDashboard": "found"}) is True
+    on_disk = json.loads(path.read_text(encoding="utf-8"))
+    assert on_disk["Inventory"] == "edited"
+    assert on_disk["ViewerDropsDashboard"] == "found"
+    assert reg.ops["Inventory"] == "edited"
@@ -0,0 +1,66 @@
+import asyncio
+import json
+
+import src.ops as ops
+from src.client_integrity import extract_hashes, op_page
+from src.ops_discovery import HashDiscovery, is_pq_not_found
+
+
+def _registry(tmp_path):
+    path = tmp_path / "ops.json"
+    path.write_text(json.dumps({k: "old" for k in ops.REQUIRED}), encoding="utf-8")
+    return ops.OpsRegistry(path, poll_interval=3600)
+
+
+def test_single_flight_discovery_updates_registry(tmp_path):
+    reg = _registry(tmp_path)
+    calls = []
+
+    async def fake_fetch(login, operation, proxy, variables):
+        calls.append((login, operation))
+        await asyncio.sleep(0.05)
+        return {"Inventory": "new", "ViewerDropsDashboard": "new2"}
+
+    disc = HashDiscovery(reg, fetch=fake_fetch)
+
+    async def _run():
+        return await asyncio.gather(
+            *(disc.recover("Inventory", "old", f"user{i}") for i in range(50))
+        )
+
+    assert all(asyncio.run(_run()))
+    assert len(calls) == 1
+    assert reg.resolve("Inventory") == ("Inventory", "new")
+    # заодно подхвачены и другие увиденные хэши; файл обновлён на диске
+    assert json.loads((tmp_path / "ops.json").read_text())["ViewerDropsDashboard"] == "new2"
+
+    # повторная ошибка со старым хэшем не запускает браузер
+    assert asyncio.run(disc.recover("Inventory", "old", "user")) is True
+    assert len(calls) == 1
+
+
+def test_failed_discovery_has_cooldown(tmp_path):
+    reg = _registry(tmp_path)
+    calls = []
+
+    async def fake_fetch(*a):
+        calls.append(a)
+        return {}
+
+    disc = HashDiscovery(reg, fetch=fake_fetch)
+    assert asyncio.run(disc.recover("Inventory", "old", "user")) is False
+    assert asyncio.run(disc.recover("Inventory", "old", "user")) is False
+    assert len(calls) == 1
+
+
+def test_helpers():
+    assert is_pq_not_found([{"message": "PersistedQueryNotFound"}])
+    assert not is_pq_not_found([{"message": "service timeout"}])
+    body = json.dumps([
+        {"operationName": "Inventory", "extensions": {"persistedQuery": {"sha256Hash": "h1"}}},
+        {"operationName": "NoHash"},
+    ])
+    assert extract_hashes(body) == {"Inventory": "h1"}
+    assert extract_hashes("not json") == {}
+    assert op_page("IncrementDropCurrentSessionProgress", {"channelLogin": "chan"}).endswith("/chan")
+    assert op_page("Inventory").endswith("/drops/inventory")
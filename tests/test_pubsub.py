@@ -0,0 +1,204 @@
+import asyncio
+import json
+
+import pytest
+
+aiohttp = pytest.importorskip("aiohttp")
+
+from src.clock import VirtualClock
+from src.pubsub import PubSubHub
+
+
+class MemorySocket:
+    def __init__(self, server):
+        self.server = server
+        self.inbox = asyncio.Queue()
+        self.closed = False
+        self.topics = set()
+
+    async def send(self, text):
+        self.server.handle(self, json.loads(text))
+
+    async def recv(self):
+        return await self.inbox.get()
+
+    async def close(self):
+        if not self.closed:
+            self.closed = True
+            self.inbox.put_nowait(None)
+
+    def push(self, msg):
+        self.inbox.put_nowait(json.dumps(msg))
+
+
+class MemoryServer:
+    """Стенд PubSub в памяти: отвечает на LISTEN/PING, пишет всё, что пришло."""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.sockets = []
+        self.connects = []
+        self.fail_connects = 0
+        self.pong = True
+        self.received = []
+
+    async def connect(self, url):
+        self.connects.append(self.clock.monotonic())
+        if self.fail_connects:
+            self.fail_connects -= 1
+            raise OSError("refused")
+        sock = MemorySocket(self)
+        self.sockets.append(sock)
+        return sock
+
+    def handle(self, sock, msg):
+        self.received.append((sock, msg))
+        if msg["type"] == "PING" and self.pong:
+            sock.push({"type": "PONG"})
+        elif msg["type"] == "LISTEN":
+            bad = msg["data"].get("auth_token") == "bad"
+            if not bad:
+                sock.topics.update(msg["data"]["topics"])
+            sock.push({"type": "RESPONSE", "nonce": msg["nonce"], "error": "ERR_BADAUTH" if bad else ""})
+
+    def listens(self, sock=None):
+        return [m["data"] for s, m in self.received if m["type"] == "LISTEN" and sock in (None, s)]
+
+    def publish(self, topic, payload):
+        for sock in self.sockets:
+            if not sock.closed and topic in sock.topics:
+                sock.push({"type": "MESSAGE", "data": {"topic": topic, "message": json.dumps(payload)}})
+
+
+def _hub(clock, server, **kw):
+    return PubSubHub("ws://memory", connect=server.connect, clock=clock, **kw)
+
+
+def test_topics_packed_within_limit_and_routed():
+    async def main():
+        clock = VirtualClock()
+        server = MemoryServer(clock)
+        hub = _hub(clock, server, topic_limit=2)
+        got = []
+        subs = [
+            hub.subscribe([f"user-drop-events.{i}", "video-playback-by-id.7"], f"tok{i}",
+                          lambda t, m, i=i: got.append((i, t, m["type"])))
+            for i in range(3)
+        ]
+        await clock.run_until(1.0)
+        assert all(hub.healthy(s) for s in subs)
+        # 4 разных топика при лимите 2 — два соединения; общий канал слушается один раз
+        assert len(server.sockets) == 2
+        topics = [t for d in server.listens() for t in d["topics"]]
+        assert sorted(topics) == sorted({t for s in subs for t in s.topics})
+        assert {d.get("auth_token") for d in server.listens()} == {"tok0", "tok1", "tok2"}
+
+        server.publish("video-playback-by-id.7", {"type": "stream-down"})
+        server.publish("user-drop-events.1", {"type": "drop-progress"})
+        await clock.run_until(2.0)
+        assert sorted(got) == [
+            (0, "video-playback-by-id.7", "stream-down"),
+            (1, "user-drop-events.1", "drop-progress"),
+            (1, "video-playback-by-id.7", "stream-down"),
+            (2, "video-playback-by-id.7", "stream-down"),
+        ]
+
+        for s in subs:
+            hub.unsubscribe(s)
+        await clock.run_until(3.0)
+        assert hub.connections == []
+        assert all(s.closed for s in server.sockets)
+
+    asyncio.run(main())
+
+
+def test_reconnect_with_backoff_and_relisten():
+    async def main():
+        clock = VirtualClock()
+        server = MemoryServer(clock)
+        server.fail_connects = 3
+        hub = _hub(clock, server, ping_interval=60.0, pong_timeout=5.0)
+        sub = hub.subscribe(["user-drop-events.1"], "tok", lambda t, m: None)
+        await clock.run_until(10.0)
+        # 1 с, 2 с, 4 с между попытками
+        assert server.connects == [0.0, 1.0, 3.0, 7.0]
+        assert hub.healthy(sub)
+
+        # сервер просит переподключиться — топики слушаются заново
+        server.sockets[-1].push({"type": "RECONNECT"})
+        await clock.run_until(20.0)
+        assert len(server.sockets) == 2 and server.sockets[0].closed
+        assert server.listens(server.sockets[1]) == [{"topics": ["user-drop-events.1"], "auth_token": "tok"}]
+
+        # нет PONG — соединение считается мёртвым
+        server.pong = False
+        await clock.run_until(200.0)
+        assert len(server.sockets) >= 3
+        await hub.close()
+
+    asyncio.run(main())
+
+
+def test_refused_listen_is_reported():
+    async def main():
+        clock = VirtualClock()
+        server = MemoryServer(clock)
+        hub = _hub(clock, server)
+        got = []
+        sub = hub.subscribe(["user-drop-events.1"], "bad", lambda t, m: got.append(m))
+        await clock.run_until(1.0)
+        assert got == [{"type": "listen-error", "error": "ERR_BADAUTH"}]
+        assert not hub.healthy(sub)
+        await hub.close()
+
+    asyncio.run(main())
+
+
+def test_workers_use_pubsub_against_fake_server(monkeypatch):
+    from src import fake_twitch, gql_middleware, miner, pubsub, twitch_api
+    from src.fake_twitch import FakeConfig, FakeTwitch, FakeTwitchServer
+
+    # другие тесты подменяют aiohttp заглушками — возвращаем настоящий модуль
+    for mod in (twitch_api, gql_middleware, pubsub):
+        monkeypatch.setattr(mod, "aiohttp", aiohttp)
+    monkeypatch.setattr(miner, "auth_token_from_cookies", lambda login: login)
+    monkeypatch.setattr(twitch_api, "GQL", twitch_api.GQL)
+    monkeypatch.setattr(twitch_api, "WWW", twitch_api.WWW)
+    monkeypatch.setattr(pubsub, "PUBSUB_URL", pubsub.PUBSUB_URL)
+
+    async def _run():
+        server = FakeTwitchServer(FakeTwitch(FakeConfig(required_minutes=10)))
+        await server.start()
+        fake_twitch.point_api_at(server.url)
+        hub = PubSubHub()
+        q = asyncio.Queue()
+        stop = asyncio.Event()
+        tasks = [
+            asyncio.create_task(miner.run_account(f"u{i}", None, q, stop, client_version="cv",
+                                                  client_integrity="ci", tick_interval=0.05, pubsub=hub))
+            for i in range(3)
+        ]
+        await asyncio.sleep(1.0)
+        details = server.fake.requests.get("gql:DropCampaignDetails", 0)
+        for cid in ("1002", "2002"):
+            server.fake.stream_down(cid)
+        await asyncio.sleep(0.5)
+        await server.pubsub_reconnect()
+        await asyncio.sleep(0.5)
+        stop.set()
+        await asyncio.gather(*tasks)
+        await hub.close()
+        await server.close()
+        msgs = []
+        while not q.empty():
+            msgs.append(q.get_nowait())
+        return server.fake, msgs, details
+
+    fake, msgs, details = asyncio.run(_run())
+    assert not [m for m in msgs if m[1] == "error"]
+    assert {m[0] for m in msgs if m[1] == "claimed"} == {"u0", "u1", "u2"}
+    # прогресс идёт по PubSub, Inventory — только на сверку и перед клеймом
+    assert fake.requests["gql:Inventory"] < fake.requests["spade"] / 2
+    assert fake.requests["pubsub_connect"] >= 2
+    # падение стрима — каналы выбраны заново
+    assert fake.requests["gql:DropCampaignDetails"] > details
@@ -0,0 +1,64 @@
+import asyncio
+
+from src.clock import VirtualClock
+from src.rampup import RampUp
+
+
+def _run(accounts, errors=None, **kw):
+    async def main():
+        clock = VirtualClock()
+        started = []
+        ramp = RampUp(
+            lambda login, phase: started.append((login, phase, clock.monotonic())),
+            clock=clock,
+            errors=errors or (lambda: (0.0, 0.0)),
+            **kw,
+        )
+        task = asyncio.ensure_future(ramp.run(accounts))
+        await clock.run_until(600.0)
+        await task
+        return ramp, started
+
+    return asyncio.run(main())
+
+
+def test_waves_per_proxy_and_even_phases():
+    accounts = [(f"a{i}", "p1") for i in range(4)] + [(f"b{i}", "p2") for i in range(4)]
+    ramp, started = _run(accounts, per_proxy=2, wave_interval=5.0, max_per_proxy=2)
+    assert ramp.done and ramp.waves == 2
+    times = [t for _l, _p, t in started]
+    assert times == [0.0] * 4 + [5.0] * 4
+    # в первой волне поровну с каждого прокси
+    assert sorted(login[0] for login, _p, _t in started[:4]) == ["a", "a", "b", "b"]
+    assert [p for _l, p, _t in started] == [i / 8 for i in range(8)]
+
+
+def test_rate_adapts_to_throttling():
+    counts = {"attempts": 0.0, "bad": 0.0}
+
+    def errors():
+        # каждая волна даёт 100 запросов, из них 20% — 429
+        counts["attempts"] += 50
+        counts["bad"] += 10
+        return counts["attempts"], counts["bad"]
+
+    ramp, _started = _run([(f"a{i}", "p") for i in range(40)], errors=errors, per_proxy=8)
+    assert ramp.per_proxy == 1.0
+
+    ramp, _started = _run([(f"a{i}", "p") for i in range(40)], errors=lambda: (0.0, 0.0), per_proxy=2)
+    assert ramp.per_proxy == 2  # мало запросов — скорость не трогаем
+
+
+def test_cancel_stops_ramp():
+    async def main():
+        clock = VirtualClock()
+        started = []
+        ramp = RampUp(lambda login, phase: started.append(login), per_proxy=1, clock=clock, errors=lambda: (0.0, 0.0))
+        task = asyncio.ensure_future(ramp.run([(f"a{i}", None) for i in range(10)]))
+        await clock.run_until(7.0)
+        ramp.cancel()
+        await clock.run_until(60.0)
+        await task
+        return started
+
+    assert len(asyncio.run(main())) == 2
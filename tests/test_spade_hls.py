@@ -13,6 +13,7 @@ aiohttp.ClientError = ClientError
 sys.modules.setdefault("aiohttp", aiohttp)
 
 from src import miner
+from src.events import StatusData
 
 class StubAPI:
     last = None
@@ -84,3 +85,83 @@ def test_spade_hls_synced(monkeypatch):
         assert api.hls_calls == len(progress)
 
     asyncio.run(_run())
+
+
+def test_slow_inventory_does_not_shift_beacons(monkeypatch):
+    from src.clock import VirtualClock
+
+    clock = VirtualClock()
+    beacons = []
+
+    class SlowInventoryAPI(StubAPI):
+        async def spade_minute_watched(self, url):
+            beacons.append(clock.monotonic())
+
+        async def inventory(self):
+            # Inventory отвечает 90 с — дольше интервала тика
+            await clock.sleep(90)
+            return await super().inventory()
+
+    async def _run():
+        monkeypatch.setattr(miner, "get_allocator", lambda: miner.WatchAllocator())
+        q = asyncio.Queue()
+        stop = asyncio.Event()
+        task = asyncio.ensure_future(miner.run_account(
+            "user", None, q, stop, tick_interval=60.0, clock=clock,
+            api_factory=SlowInventoryAPI, token_loader=lambda login: "token",
+        ))
+        await clock.run_until(605)
+        stop.set()
+        await clock.advance(200)
+        await task
+
+    asyncio.run(_run())
+    # биконы ровно по сетке, без дрейфа от медленного Inventory
+    assert beacons[:10] == [60.0 * k for k in range(1, 11)]
+
+
+def test_stop_lets_started_claim_finish(monkeypatch):
+    claimed = []
+
+    class SlowClaimAPI(StubAPI):
+        async def inventory(self):
+            drop = {"dropInstanceID": "d1", "name": "Drop", "requiredMinutesWatched": 2,
+                    "currentMinutesWatched": 2, "isClaimed": False}
+            return {"data": {"currentUser": {"inventory": {"dropCampaignsInProgress": [
+                {"id": "camp1", "timeBasedDrops": [drop]}
+            ]}}}}
+
+        async def claim(self, did):
+            started.set()
+            await asyncio.sleep(0.2)
+            claimed.append(did)
+            return {"data": {"claimDropRewards": {"status": "ELIGIBLE_FOR_ALL"}}}
+
+    async def _run():
+        monkeypatch.setattr(miner, "get_allocator", lambda: miner.WatchAllocator())
+        q = asyncio.Queue()
+        stop = asyncio.Event()
+        task = asyncio.ensure_future(miner.run_account(
+            "user", None, q, stop, tick_interval=0.05,
+            api_factory=SlowClaimAPI, token_loader=lambda login: "token",
+        ))
+        await started.wait()
+        # остановка посреди клейма: воркер дописывает его и сообщает Stopped
+        miner.stop_worker(stop, task, grace=5.0)
+        await asyncio.wait_for(task, 2.0)
+        assert not task.cancelled()
+        msgs = []
+        while not q.empty():
+            msgs.append((await q.get())[1:])
+        assert "claimed" in [kind for kind, _ in msgs]
+        assert msgs[-1] == ("status", StatusData("Stopped"))
+
+        # зависший воркер отменяется по истечении grace
+        hung = asyncio.ensure_future(asyncio.sleep(10))
+        miner.stop_worker(asyncio.Event(), hung, grace=0.05)
+        await asyncio.sleep(0.1)
+        assert hung.cancelled()
+
+    started = asyncio.Event()
+    asyncio.run(_run())
+    assert claimed == ["d1"]
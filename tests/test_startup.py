@@ -0,0 +1,12 @@
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def test_cli_import_does_not_load_heavy_stacks():
+    # aiohttp/Playwright нужны только воркерам и онбордингу — не для старта
+    code = "import sys, src.main; print(sorted(m for m in ('aiohttp', 'playwright', 'pyotp') if m in sys.modules))"
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == "[]"
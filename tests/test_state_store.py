@@ -0,0 +1,87 @@
+import asyncio
+import json
+
+import pytest
+
+from src.state_store import CHANNEL_TTL, AccountState, StateStore
+
+
+def test_state_roundtrip_and_skip_unchanged(tmp_path):
+    store = StateStore(tmp_path)
+    st = AccountState()
+    st.set_channel(["c1"], "c1", [{"name": "chan", "viewers": 5, "live": True}], ("chan", "123"),
+                   "https://spade", "https://hls", now=1000.0)
+    st.progress = {"pct": 50.0, "remain": 30, "drop": "Drop"}
+    assert store.save("u", st) is True
+    assert store.save("u", st) is False  # ничего не изменилось — не пишем
+
+    loaded = StateStore(tmp_path).load("u")
+    assert loaded.increment_channel == ("chan", "123")
+    assert loaded.channel_fresh(["c1"], 1000.0 + CHANNEL_TTL - 1)
+    assert not loaded.channel_fresh(["c1"], 1000.0 + CHANNEL_TTL)
+    assert not loaded.channel_fresh(["c1", "c2"], 1000.0)
+    kinds = [k for k, _ in loaded.events()]
+    assert kinds == ["channels", "progress"]
+
+
+def test_state_keeps_campaign_ids_and_file_keeps_records(tmp_path):
+    from src.catalog import get_catalog
+
+    camps = get_catalog().intern([
+        {"id": "c1", "name": "One", "game": "G", "channels": ["a", "b"], "ends_at": 5.0},
+        {"id": "c2", "name": "Two", "game": "G"},
+    ])
+    st = AccountState()
+    st.set_campaigns(camps, 1000.0)
+    assert st.campaign_ids == ("c1", "c2")
+    assert st.campaigns() is camps
+    store = StateStore(tmp_path)
+    store.save("u", st)
+    on_disk = json.loads(store.path("u").read_text(encoding="utf-8"))
+    assert on_disk["campaigns"][0] == {"id": "c1", "name": "One", "game": "G", "channels": ["a", "b"], "ends_at": 5.0}
+    assert "campaign_ids" not in on_disk
+
+    # рестарт: каталог пуст, записи возвращаются в него из файла
+    get_catalog().clear()
+    loaded = store.load("u")
+    assert loaded.campaign_ids == ("c1", "c2")
+    assert loaded.campaigns_fresh(1000.0)
+    assert loaded.campaigns()[0] is get_catalog().get("c1")
+    assert loaded.campaigns()[0].channels == ("a", "b")
+
+
+def test_no_live_channel_is_cached_until_ttl():
+    st = AccountState()
+    assert not st.channel_fresh(["c1"], 1000.0)
+    st.set_channel(["c1"], "c1", [], None, "", "", now=1000.0)
+    assert st.channel_fresh(["c1"], 1000.0 + CHANNEL_TTL - 1)
+    assert not st.channel_fresh(["c1"], 1000.0 + CHANNEL_TTL)
+
+
+def test_broken_state_file_is_ignored(tmp_path):
+    (tmp_path / "u.json").write_text("{not json", encoding="utf-8")
+    assert StateStore(tmp_path).load("u") is None
+
+
+def test_warm_restart_skips_discovery_requests(tmp_path, monkeypatch):
+    aiohttp = pytest.importorskip("aiohttp")
+    from src import gql_middleware, twitch_api
+    from src.fake_twitch import FakeConfig
+    from src.sim import Strategy, simulate
+
+    monkeypatch.setattr(twitch_api, "aiohttp", aiohttp)
+    monkeypatch.setattr(gql_middleware, "aiohttp", aiohttp)
+    store = StateStore(tmp_path)
+    strategy = Strategy("warm", tick_interval=60, extra={"store": store})
+    cfg = FakeConfig(required_minutes=30, beacon_min_interval=60, seed=1)
+
+    cold = asyncio.run(simulate(strategy, accounts=3, hours=0.5, config=cfg))
+    assert cold.requests_by_kind.get("gql:ViewerDropsDashboard") == 3
+    assert store.load("sim00000").progress
+
+    warm = asyncio.run(simulate(strategy, accounts=3, hours=0.5, config=cfg))
+    kinds = warm.requests_by_kind
+    assert "gql:ViewerDropsDashboard" not in kinds
+    assert "gql:DropCampaignDetails" not in kinds
+    assert "channel_page" not in kinds
+    assert kinds.get("gql:Inventory", 0) > 0
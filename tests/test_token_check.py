@@ -0,0 +1,135 @@
+import asyncio
+import csv
+import json
+import types
+
+import src.token_check as token_check
+from src.types import Account
+
+
+class DummyResp:
+    def __init__(self, status, body):
+        self.status = status
+        self._body = body
+
+    async def json(self):
+        return self._body
+
+    async def text(self):
+        return json.dumps(self._body)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        pass
+
+
+def _stub_aiohttp(monkeypatch, stats):
+    class DummySession:
+        def __init__(self, *a, **kw):
+            pass
+
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, exc_type, exc, tb):
+            pass
+
+        def get(self, url, headers=None, proxy=None):
+            stats["calls"].append((headers["Authorization"], proxy))
+            token = headers["Authorization"].split()[-1]
+
+            class _Ctx(DummyResp):
+                async def __aenter__(inner):
+                    stats["inflight"] += 1
+                    stats["peak"] = max(stats["peak"], stats["inflight"])
+                    await asyncio.sleep(0.01)
+                    stats["inflight"] -= 1
+                    return inner
+
+            if token.startswith("bad"):
+                return _Ctx(401, {})
+            return _Ctx(200, {"login": token, "scopes": [], "expires_in": 3600})
+
+    stub = types.SimpleNamespace(
+        ClientSession=DummySession,
+        TCPConnector=lambda **kw: None,
+        ClientTimeout=lambda **kw: None,
+    )
+    monkeypatch.setattr(token_check, "aiohttp", stub)
+
+
+def _write_cookies(path, login, token):
+    (path / f"{login}.json").write_text(
+        json.dumps([{"name": "auth-token", "value": token}]), encoding="utf-8"
+    )
+
+
+def test_bounded_concurrency_cache_and_report(tmp_path, monkeypatch):
+    stats = {"calls": [], "inflight": 0, "peak": 0}
+    _stub_aiohttp(monkeypatch, stats)
+    cookies = tmp_path / "cookies"
+    cookies.mkdir()
+    accounts = []
+    for i in range(30):
+        login = f"u{i}"
+        _write_cookies(cookies, login, ("bad" if i % 10 == 0 else "tok") + str(i))
+        accounts.append(Account(label=login, login=login, proxy=f"http://p{i % 3}:1"))
+    accounts.append(Account(label="nocookie", login="nocookie"))
+
+    cache = token_check.TokenCache(tmp_path / "cache.json")
+    progress = []
+    validator = token_check.TokenValidator(
+        concurrency=5, per_proxy=2, cookies_dir=cookies, cache=cache
+    )
+    results = asyncio.run(
+        validator.check(accounts, progress_cb=lambda r, d, t: progress.append((d, t)))
+    )
+
+    assert [r.login for r in results] == [a.login for a in accounts]
+    assert token_check.summarize(results) == {"ok": 27, "exp": 3, "miss": 1, "other": 0}
+    assert stats["peak"] <= 5
+    assert len(stats["calls"]) == 30
+    assert progress[-1] == (31, 31)
+    assert {p for _a, p in stats["calls"]} == {"http://p0:1", "http://p1:1", "http://p2:1"}
+
+    # повторная проверка обслуживается из кэша
+    stats["calls"].clear()
+    cache2 = token_check.TokenCache(tmp_path / "cache.json")
+    validator = token_check.TokenValidator(cookies_dir=cookies, cache=cache2)
+    again = asyncio.run(validator.check(accounts))
+    assert stats["calls"] == []
+    assert all(r.cached for r in again if r.kind in ("ok", "exp"))
+
+    # новый токен инвалидирует запись кэша
+    _write_cookies(cookies, "u1", "fresh")
+    asyncio.run(validator.check(accounts[:2]))
+    assert len(stats["calls"]) == 1
+
+    out = tmp_path / "report.csv"
+    token_check.write_report(results, out)
+    rows = list(csv.DictReader(out.open(encoding="utf-8")))
+    assert rows[0]["login"] == "u0" and rows[0]["status"] == "EXPIRED"
+    data = json.loads(token_check.write_report(results, None))
+    assert data["summary"]["ok"] == 27
+
+
+def test_busy_proxy_does_not_hold_global_slots(tmp_path, monkeypatch):
+    stats = {"calls": [], "inflight": 0, "peak": 0}
+    _stub_aiohttp(monkeypatch, stats)
+    cookies = tmp_path / "cookies"
+    cookies.mkdir()
+    accounts = []
+    for i in range(10):
+        login = f"a{i}"
+        _write_cookies(cookies, login, f"tok{i}")
+        # восемь аккаунтов на одном прокси впереди очереди, два — на другом в конце
+        accounts.append(Account(label=login, login=login, proxy="http://slow:1" if i < 8 else "http://free:1"))
+
+    validator = token_check.TokenValidator(concurrency=4, per_proxy=1, cookies_dir=cookies)
+    asyncio.run(validator.check(accounts))
+
+    # второй прокси проверяется сразу, а не после очереди первого
+    assert [p for _a, p in stats["calls"][:2]] == ["http://slow:1", "http://free:1"]
+    assert stats["peak"] == 2
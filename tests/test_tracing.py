@@ -0,0 +1,55 @@
+import asyncio
+
+from src import tracing
+from src.gql_middleware import compose
+
+
+def test_spans_written_per_account_and_slowest_phase(tmp_path):
+    path = tmp_path / "trace.jsonl"
+    tracer = tracing.Tracer(path)
+
+    async def worker(login, slow):
+        tracing.current_login.set(login)
+        with tracer.span("spade", cat="tick"):
+            await asyncio.sleep(0.001)
+        with tracer.span("inventory", cat="tick"):
+            await asyncio.sleep(0.03 if slow else 0.001)
+
+    async def _run():
+        await asyncio.gather(worker("a", True), worker("b", False))
+
+    asyncio.run(_run())
+    tracer.flush()
+    events = tracing.load_events(path)
+    assert len(events) == 4
+    assert {e["ph"] for e in events} == {"X"}
+    tids = {e["args"]["login"]: e["tid"] for e in events}
+    assert tids["a"] != tids["b"]
+    slow = tracing.slowest_phases(events)
+    assert slow["a"]["phase"] == "inventory"
+    assert slow["a"]["avg_ms"] >= 25
+
+
+def test_disabled_tracer_is_noop(tmp_path):
+    tracer = tracing.Tracer(None)
+    with tracer.span("x") as sp:
+        sp.set("k", 1)
+    assert not tracer.enabled
+
+
+def test_compose_runs_outermost_first():
+    order = []
+
+    def mw(name):
+        async def _m(call, nxt):
+            order.append(name)
+            return await nxt(call)
+        return _m
+
+    async def terminal(call):
+        order.append("send")
+        return call
+
+    handler = compose([mw("a"), mw("b")], terminal)
+    assert asyncio.run(handler("call")) == "call"
+    assert order == ["a", "b", "send"]
@@ -1,4 +1,5 @@
 import asyncio
+import json
 import sys
 import types
 
@@ -53,7 +54,7 @@ def test_headers_include_ci_tokens(monkeypatch):
         class DummySession:
             closed = False
 
-            def post(self, url, json=None, proxy=None, headers=None):
+            def post(self, url, data=None, proxy=None, headers=None):
                 captured.update(headers)
                 return DummyResp()
 
@@ -121,7 +122,7 @@ def test_challenge_refreshes_tokens(monkeypatch):
         async def __aexit__(self, exc_type, exc, tb):
             pass
 
-    def post(url, json=None, proxy=None, headers=None):
+    def post(url, data=None, proxy=None, headers=None):
         calls.append(headers)
         if len(calls) == 1:
             return DummyResp(400, "integrity challenge")
@@ -136,7 +137,7 @@ def test_challenge_refreshes_tokens(monkeypatch):
     async def fake_start():
         api.session = DummySession()
 
-    async def fake_fetch_ci(login, proxy=""):
+    async def fake_fetch_ci(login, proxy="", **kw):
         return "cv2", "ci2"
 
     monkeypatch.setattr(api, "start", fake_start)
@@ -147,3 +148,312 @@ def test_challenge_refreshes_tokens(monkeypatch):
 
     assert calls[1]["Client-Version"] == "cv2"
     assert calls[1]["Client-Integrity"] == "ci2"
+
+
+def test_backend_and_ci_fetcher_are_per_instance(monkeypatch, tmp_path):
+    from yarl import URL
+
+    from src import client_integrity
+
+    monkeypatch.setattr(client_integrity, "CI_DIR", tmp_path)
+    urls = []
+    fetched = []
+
+    class DummyResp:
+        def __init__(self, status, text=""):
+            self.status = status
+            self._text = text
+
+        async def json(self):
+            return {}
+
+        async def text(self):
+            return self._text
+
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, exc_type, exc, tb):
+            pass
+
+    class DummySession:
+        closed = False
+
+        def post(self, url, data=None, proxy=None, headers=None):
+            urls.append(str(url))
+            if len(urls) == 1:
+                return DummyResp(400, "integrity challenge")
+            return DummyResp(200, "{}")
+
+    async def fake_fetch_ci(login, proxy="", device_id="", **kw):
+        fetched.append(device_id)
+        return "cv2", "ci2"
+
+    api = TwitchAPI(
+        "token", login="acc", client_version="old", client_integrity="bad",
+        gql_url=URL("http://fake.test/gql"), www_url=URL("http://fake.test"),
+        ci_fetcher=fake_fetch_ci, persist_ids=False,
+    )
+    api.session = DummySession()
+    asyncio.run(api.gql("Inventory", {}))
+
+    assert urls == ["http://fake.test/gql"] * 2
+    assert fetched == [api.x_device_id]
+    assert api.client_integrity == "ci2"
+    # ничего не записано на диск, глобалы модуля не тронуты
+    assert list(tmp_path.iterdir()) == []
+    assert twitch_api.fetch_ci is client_integrity.fetch_ci
+
+
+def test_pq_not_found_retries_with_discovered_hash(monkeypatch):
+    sent = []
+
+    class Registry:
+        h = "old"
+
+        def resolve(self, op):
+            return op, self.h
+
+    class Discovery:
+        async def recover(self, operation, failed_hash, login, proxy="", variables=None):
+            assert failed_hash == "old"
+            reg.h = "new"
+            return True
+
+    reg = Registry()
+    api = TwitchAPI("token", login="user", client_version="cv", client_integrity="ci",
+                    ops=reg, discovery=Discovery())
+
+    class DummyResp:
+        status = 200
+
+        def __init__(self, body):
+            self._body = body
+
+        async def json(self):
+            return self._body
+
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, exc_type, exc, tb):
+            pass
+
+    class DummySession:
+        closed = False
+
+        def post(self, url, data=None, proxy=None, headers=None):
+            h = json.loads(data)["extensions"]["persistedQuery"]["sha256Hash"]
+            sent.append(h)
+            if h == "old":
+                return DummyResp({"errors": [{"message": "PersistedQueryNotFound"}]})
+            return DummyResp({"data": {"ok": True}})
+
+    async def fake_start():
+        api.session = DummySession()
+
+    monkeypatch.setattr(api, "start", fake_start)
+    data = asyncio.run(api.inventory())
+    assert data == {"data": {"ok": True}}
+    assert sent == ["old", "new"]
+
+
+def test_429_retried_through_middleware(monkeypatch):
+    statuses = [429, 503, 200]
+    sleeps = []
+    api = TwitchAPI("token", client_version="cv", client_integrity="ci")
+
+    class DummyResp:
+        def __init__(self, status):
+            self.status = status
+
+        async def json(self):
+            return {"data": {}}
+
+        async def text(self):
+            return ""
+
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, exc_type, exc, tb):
+            pass
+
+    class DummySession:
+        closed = False
+
+        def post(self, url, data=None, proxy=None, headers=None):
+            return DummyResp(statuses.pop(0))
+
+    async def fake_start():
+        api.session = DummySession()
+
+    async def fake_sleep(d):
+        sleeps.append(d)
+
+    import src.gql_middleware as gm
+
+    monkeypatch.setattr(api, "start", fake_start)
+    monkeypatch.setattr(gm.asyncio, "sleep", fake_sleep)
+    assert asyncio.run(api.inventory()) == {"data": {}}
+    assert sleeps == [1, 2]
+
+
+def test_deadline_covers_retries_and_ci_refresh(monkeypatch):
+    from src.clock import VirtualClock
+    from src.gql_middleware import DeadlineExceeded
+    from src.metrics import REQUEST_TIMEOUTS
+
+    clock = VirtualClock()
+    api = TwitchAPI("token", login="user", clock=clock, deadlines={"Inventory": 10.0})
+    fetches = []
+
+    class HangingResp:
+        status = 200
+
+        async def json(self):
+            return {"data": {}}
+
+        async def __aenter__(self):
+            await clock.sleep(3600)
+            return self
+
+        async def __aexit__(self, exc_type, exc, tb):
+            pass
+
+    class DummySession:
+        closed = False
+
+        def post(self, url, data=None, proxy=None, headers=None):
+            return HangingResp()
+
+    async def fake_fetch_ci(login, proxy="", **kw):
+        fetches.append(clock.monotonic())
+        await clock.sleep(15)
+        return "cv", "ci"
+
+    async def fake_start():
+        api.session = DummySession()
+
+    monkeypatch.setattr(api, "start", fake_start)
+    monkeypatch.setattr(twitch_api, "fetch_ci", fake_fetch_ci)
+    monkeypatch.setattr(twitch_api, "save_ci", lambda *a, **kw: None)
+    before = REQUEST_TIMEOUTS.value("Inventory")
+
+    async def main():
+        # CI нет — вызов упирается в обновление дольше своего бюджета
+        first = asyncio.ensure_future(api.inventory())
+        await clock.run_until(11)
+        assert isinstance(first.exception(), DeadlineExceeded)
+        # обновление CI не отменено вместе с вызовом и достаётся следующему
+        await clock.run_until(16)
+        assert api.client_integrity == "ci"
+        second = asyncio.ensure_future(api.inventory())
+        await clock.run_until(30)
+        assert isinstance(second.exception(), DeadlineExceeded)
+
+    asyncio.run(main())
+    assert fetches == [0.0]
+    assert REQUEST_TIMEOUTS.value("Inventory") - before == 2
+
+
+def test_nested_deadline_counted_once():
+    from src.clock import VirtualClock
+    from src.gql_middleware import DeadlineExceeded
+    from src.metrics import REQUEST_TIMEOUTS
+    from src.proxy_health import ProxyHealth
+
+    clock = VirtualClock()
+    health = ProxyHealth(clock=clock)
+    api = TwitchAPI("token", login="user", proxy="http://p1:8080", clock=clock, health=health)
+    before = REQUEST_TIMEOUTS.value("Inventory"), REQUEST_TIMEOUTS.value("hls")
+
+    async def call():
+        # внешний бюджет GQL-вызова, внутри — свой, более короткий
+        async with api._deadline("Inventory", 10.0):
+            async with api._deadline("hls", 2.0):
+                await clock.sleep(3600)
+
+    async def main():
+        task = asyncio.ensure_future(call())
+        await clock.run_until(3)
+        exc = task.exception()
+        assert isinstance(exc, DeadlineExceeded) and exc.operation == "hls"
+
+    asyncio.run(main())
+    assert REQUEST_TIMEOUTS.value("hls") - before[1] == 1
+    assert REQUEST_TIMEOUTS.value("Inventory") - before[0] == 0
+    assert list(health.stats("http://p1:8080").outcomes) == ["error"]
+
+
+def test_gql_body_template_and_header_cache():
+    from src.gql_middleware import GqlCall
+
+    call = GqlCall(None, "Op", {"channelLogin": "стример", "n": [1, 2]})
+    call.hash = "h1"
+    assert json.loads(call.body()) == call.payload()
+    call.variables = {}
+    assert json.loads(call.body()) == call.payload()
+    # пустые variables — один и тот же готовый объект
+    assert call.body() is call.body()
+
+    api = TwitchAPI("token")
+    h = api.gql_headers()
+    assert api.gql_headers() is h and h["Authorization"] == "OAuth token"
+    api.client_version = "cv2"
+    h2 = api.gql_headers()
+    assert h2 is not h and h2["Client-Version"] == "cv2"
+    api.reset_session_ids()
+    h3 = api.gql_headers()
+    assert h3["Client-Session-Id"] == api.client_session_id != h2["Client-Session-Id"]
+    assert h3["X-Device-Id"] == h2["X-Device-Id"]
+
+
+def test_device_id_persisted_and_sessions_rotated(monkeypatch, tmp_path):
+    from src import client_integrity
+    from src.clock import VirtualClock
+
+    monkeypatch.setattr(client_integrity, "CI_DIR", tmp_path)
+    monkeypatch.setattr(client_integrity, "COOKIES_DIR", tmp_path)
+    (tmp_path / "acc.json").write_text(json.dumps([{"name": "unique_id", "value": "dev-cookie"}]))
+    clock = VirtualClock()
+
+    # первый запуск: device из cookie браузера, CI сохраняется вместе с ID
+    api = TwitchAPI("token", login="acc", clock=clock)
+    assert api.x_device_id == "dev-cookie"
+    client_integrity.save_ci("acc", "cv", "ci", now=clock.time(), ids=api.session_ids())
+    client_integrity.save_ci("acc", "cv2", "ci2", now=clock.time())
+    assert client_integrity.load_ci("acc", now=clock.time()) == ("cv2", "ci2")
+
+    # рестарт: тот же device и та же сессия
+    again = TwitchAPI("token", login="acc", clock=clock)
+    assert again.session_ids() == api.session_ids()
+
+    class DummyResp:
+        status = 200
+
+        async def json(self):
+            return {"data": {}}
+
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, exc_type, exc, tb):
+            pass
+
+    class DummySession:
+        closed = False
+
+        def post(self, url, data=None, proxy=None, headers=None):
+            return DummyResp()
+
+    again.session = DummySession()
+    again.client_version, again.client_integrity = "cv2", "ci2"
+    asyncio.run(clock.advance(again.session_ttl + 1))
+    asyncio.run(again.gql("Inventory", {}))
+    # сессия ротирована по возрасту, device остался; новые ID уже на диске
+    assert again.client_session_id != api.client_session_id
+    assert again.x_device_id == "dev-cookie"
+    assert client_integrity.load_ids("acc")["client_session_id"] == again.client_session_id
+    later = TwitchAPI("token", login="acc", clock=clock)
+    assert later.session_ids() == again.session_ids()